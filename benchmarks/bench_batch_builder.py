@@ -0,0 +1,75 @@
+"""Benchmark of building create shipment XML in a process pool
+
+Builds XML of shipments with ShipmentBatchBuilder at 1, 4 and 16 workers, and optionally sends them to the local
+stand-in server. Speed-up depends on the number of CPU cores, which is printed with the results.
+
+Usage: python -m benchmarks.bench_batch_builder [number of shipments] [parcels per shipment] [--send]
+"""
+from __future__ import absolute_import, print_function
+
+import os
+import sys
+import time
+
+from pakettikauppa.batch_builder import ShipmentBatchBuilder
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.standin import StandInServer
+from pakettikauppa.transport import HttpTransport
+
+from benchmarks.suite import _shipment_data
+
+
+def run(count=2000, parcel_count=10, levels=(1, 4, 16), send=False):
+    """
+    Run benchmark and return results.
+
+    :param count: number of shipments
+    :param parcel_count: number of parcels per shipment
+    :param levels: tuple of worker counts
+    :param send: if True, shipments are also sent to the stand-in server
+    :return dict_data: shipments per second by number of workers
+    """
+    merchant = PkMerchant(1, transport=HttpTransport(pool_maxsize=16))
+    shipments = [_shipment_data(merchant, parcel_count) for _ in range(count)]
+    results = {}
+    try:
+        server = StandInServer().start() if send else None
+        if server is not None:
+            merchant.set_api_end_point(server.url)
+        try:
+            for workers in levels:
+                with ShipmentBatchBuilder(merchant, workers=workers) as builder:
+                    # Start worker processes before timing
+                    list(builder.build(shipments[:workers]))
+                    start = time.time()
+                    if send:
+                        failed = sum(1 for result in builder.create_shipments(shipments, 16) if not result.ok)
+                    else:
+                        failed = sum(1 for result in builder.build(shipments) if not result.ok)
+                    elapsed = time.time() - start
+                if failed:
+                    raise AssertionError("{} shipments failed".format(failed))
+                results[workers] = count / elapsed
+        finally:
+            if server is not None:
+                server.stop()
+    finally:
+        merchant.get_transport().close()
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    send = '--send' in argv
+    argv = [arg for arg in argv if arg != '--send']
+    count = int(argv[0]) if argv else 2000
+    parcel_count = int(argv[1]) if len(argv) > 1 else 10
+    results = run(count, parcel_count, send=send)
+    print("{} shipments XML, {} shipments with {} parcels, {} CPUs".format(
+        "Build and send" if send else "Build", count, parcel_count, os.cpu_count()))
+    for workers in sorted(results):
+        print("  workers={:<3} {:8.1f} shipments/s".format(workers, results[workers]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark of concurrent shipment creation against the local stand-in server
+
+Creates shipments with PkMerchant.create_shipments_bulk() at several concurrency levels. The stand-in server adds
+fixed latency to every response, so the results show how well requests overlap.
+
+Usage: python -m benchmarks.bench_concurrency [number of shipments] [latency in seconds]
+"""
+from __future__ import absolute_import, print_function
+
+import sys
+import time
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.standin import StandInServer
+from pakettikauppa.transport import HttpTransport
+
+
+def run(count=200, latency=0.02, levels=(1, 4, 16)):
+    """
+    Run benchmark and return results.
+
+    :param count: number of shipments per concurrency level
+    :param latency: seconds of server latency per request
+    :param levels: tuple of max_in_flight values
+    :return dict_data: shipments per second by max_in_flight value
+    """
+    results = {}
+    with StandInServer(latency=latency) as server:
+        for max_in_flight in levels:
+            merchant = PkMerchant(1, transport=HttpTransport(pool_maxsize=max_in_flight))
+            merchant.set_api_end_point(server.url)
+            shipments = [merchant.get_create_shipment_test_data() for _ in range(count)]
+            try:
+                start = time.time()
+                failed = sum(1 for result in merchant.create_shipments_bulk(shipments, max_in_flight)
+                             if not result.ok)
+                elapsed = time.time() - start
+            finally:
+                merchant.get_transport().close()
+            if failed:
+                raise AssertionError("{} shipments failed".format(failed))
+            results[max_in_flight] = count / elapsed
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 200
+    latency = float(argv[1]) if len(argv) > 1 else 0.02
+    results = run(count, latency)
+    print("Create shipments, {} shipments, {:.0f} ms server latency".format(count, latency * 1000))
+    for max_in_flight in sorted(results):
+        print("  max_in_flight={:<3} {:8.1f} shipments/s".format(max_in_flight, results[max_in_flight]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark of customer list decoding against the local stand-in server
+
+Compares PkReseller.get_customer_list(), which decodes the whole response at once, with iter_customers(), which
+decodes customers while the response is received. Shows time to the first customer, total time and peak memory
+allocated by the client while the list is processed. The server runs in a child process, so its memory is not
+included.
+
+Usage: python -m benchmarks.bench_customer_list [number of customers]
+"""
+from __future__ import absolute_import, print_function
+
+import multiprocessing
+import sys
+import time
+import tracemalloc
+
+from pakettikauppa.reseller import PkReseller
+from pakettikauppa.standin import StandInServer
+
+from benchmarks.suite import CUSTOMER_DATA
+
+
+def _measure(function):
+    tracemalloc.start()
+    try:
+        start = time.time()
+        first, count = function()
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'first_ms': (first - start) * 1000, 'total_ms': elapsed * 1000, 'peak_kb': peak / 1024.0,
+            'count': count}
+
+
+def _serve(count, queue, stop_event):
+    with StandInServer() as server:
+        server._customers = [dict(CUSTOMER_DATA, customer_id=i + 1, api_key='key-{}'.format(i), active=True)
+                             for i in range(count)]
+        queue.put(server.url)
+        stop_event.wait()
+
+
+def run(count=20000):
+    """
+    Run benchmark and return results.
+
+    :param count: number of customers in the list
+    :return dict_data: results by function name
+    """
+    def whole_list():
+        customers = reseller.get_customer_list()
+        first = time.time()
+        return first, sum(1 for _ in customers)
+
+    def streamed():
+        first = None
+        number = 0
+        for _ in reseller.iter_customers():
+            if first is None:
+                first = time.time()
+            number += 1
+        return first, number
+
+    queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    process = multiprocessing.Process(target=_serve, args=(count, queue, stop_event))
+    process.start()
+    try:
+        url = queue.get(timeout=60)
+        with PkReseller(1) as reseller:
+            reseller.set_api_end_point(url)
+            return {'get_customer_list': _measure(whole_list), 'iter_customers': _measure(streamed)}
+    finally:
+        stop_event.set()
+        process.join()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 20000
+    results = run(count)
+    print("Customer list, {} customers".format(count))
+    for name, result in sorted(results.items()):
+        print("  {:<18} first {:8.1f} ms  total {:8.1f} ms  peak {:10.1f} KB".format(
+            name, result['first_ms'], result['total_ms'], result['peak_kb']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark of logging cost in shipment building
+
+Builds create shipment XML request data with package logging disabled and with debug logging enabled. Enabled
+debug logging formats every message, which is the cost the builders paid on every call before messages were
+formatted lazily.
+
+Usage: python -m benchmarks.bench_logging [number of shipments]
+"""
+from __future__ import absolute_import, print_function
+
+import logging
+import sys
+import timeit
+
+from pakettikauppa.log import get_logger, set_log_level
+from pakettikauppa.merchant import PkMerchant
+
+
+class _FormattingHandler(logging.Handler):
+    """Handler which formats records and drops the output."""
+
+    def emit(self, record):
+        self.format(record)
+
+
+def build_shipments(merchant, shipment_data, count):
+    for _ in range(count):
+        merchant.get_xml_shipment_req_data(**shipment_data)
+
+
+def measure(merchant, shipment_data, count, repeat=5):
+    """
+    Measure shipment building time.
+
+    :return seconds: best time per shipment in seconds
+    """
+    timer = timeit.Timer(lambda: build_shipments(merchant, shipment_data, count))
+    return min(timer.repeat(repeat, 1)) / count
+
+
+def run(count=500):
+    """
+    Run benchmark and return results.
+
+    :param count: number of shipments built per measurement
+    :return dict_data: time per shipment in microseconds with 'disabled' and 'debug' keys and their 'ratio'
+    """
+    merchant = PkMerchant(1)
+    shipment_data = merchant.get_create_shipment_test_data()
+    logger = get_logger()
+    handler = _FormattingHandler()
+    try:
+        set_log_level(logging.WARNING)
+        disabled = measure(merchant, shipment_data, count)
+
+        logger.addHandler(handler)
+        set_log_level(logging.DEBUG)
+        debug = measure(merchant, shipment_data, count)
+    finally:
+        logger.removeHandler(handler)
+        set_log_level(None)
+        merchant.close()
+
+    return {
+        'disabled': disabled * 1e6,
+        'debug': debug * 1e6,
+        'ratio': debug / disabled,
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 500
+    results = run(count)
+    print("Shipment XML building, {} shipments".format(count))
+    print("  logging disabled: {:8.1f} us/shipment".format(results['disabled']))
+    print("  debug formatted:  {:8.1f} us/shipment".format(results['debug']))
+    print("  saved by lazy logging: {:.1f}x".format(results['ratio']))
+
+
+if __name__ == '__main__':
+    main()
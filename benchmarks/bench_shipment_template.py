@@ -0,0 +1,66 @@
+"""Benchmark of shipment templates
+
+Builds create shipment XML request data with PkMerchant.get_xml_shipment_req_data() and with a ShipmentTemplate
+of the same sender and product, and compares throughput.
+
+Usage: python -m benchmarks.bench_shipment_template [number of shipments]
+"""
+from __future__ import absolute_import, print_function
+
+import sys
+import timeit
+
+from pakettikauppa.merchant import PkMerchant
+
+
+def run(count=1000, repeat=5):
+    """
+    Run benchmark and return results.
+
+    :param count: number of shipments built per measurement
+    :param repeat: number of measurements, the best one is used
+    :return dict_data: shipments per second with 'builder' and 'template' keys and their 'speedup'
+    """
+    merchant = PkMerchant(1)
+    try:
+        dict_data = merchant.get_create_shipment_test_data()
+        shipment = dict_data['eChannel']['Shipment']
+        routing = dict_data['eChannel']['ROUTING']
+        template = merchant.get_shipment_template(shipment['Shipment.Sender'],
+                                                  shipment['Shipment.Consignment']['Consignment.Product'])
+        if template.render_request(**dict_data) != merchant.get_xml_shipment_req_data(**dict_data):
+            raise AssertionError("Template output differs from builder output")
+
+        def build():
+            for _ in range(count):
+                merchant.get_xml_shipment_req_data(**dict_data)
+
+        def render():
+            for _ in range(count):
+                template.render(routing['Routing.Id'], routing['Routing.Name'], shipment['Shipment.Recipient'],
+                                shipment['Shipment.Consignment'], routing['Routing.Time'])
+
+        builder = count / min(timeit.Timer(build).repeat(repeat, 1))
+        templated = count / min(timeit.Timer(render).repeat(repeat, 1))
+    finally:
+        merchant.close()
+
+    return {
+        'builder': builder,
+        'template': templated,
+        'speedup': templated / builder,
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 1000
+    results = run(count)
+    print("Create shipment XML, {} shipments".format(count))
+    print("  get_xml_shipment_req_data: {:10.0f} shipments/s".format(results['builder']))
+    print("  ShipmentTemplate.render:   {:10.0f} shipments/s".format(results['template']))
+    print("  speedup: {:.1f}x".format(results['speedup']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark of request signing
+
+Compares the signing code used before Signer (a new HMAC object and re-encoded secret for each request, MD5 of the
+whole routing key data) with Signer.sign(), Signer.sign_many() and cached Signer.get_routing_key().
+
+Usage: python -m benchmarks.bench_signer [number of requests]
+"""
+from __future__ import absolute_import, print_function
+
+import hashlib
+import hmac
+import sys
+import timeit
+
+from pakettikauppa.signer import Signer
+
+API_KEY = '00000000-0000-0000-0000-000000000000'
+SECRET = '1234567890ABCDEF'
+
+
+def legacy_hash_sha256(secret_key, **kwargs):
+    # Signing code of Pakettikauppa.get_hash_sha256() before Signer
+    secret_key = str(secret_key)
+    plain_text = '&'.join(map(str, [str(kwargs[key]) for key in sorted(kwargs)]))
+    return str(hmac.new(secret_key.encode('utf-8'), plain_text.encode('utf-8'), hashlib.sha256).hexdigest())
+
+
+def legacy_md5_hash(api_key, secret_key, routing_id):
+    # Signing code of Pakettikauppa.get_md5_hash() before Signer
+    return hashlib.md5((str(api_key) + str(routing_id) + str(secret_key)).encode('utf-8')).hexdigest()
+
+
+def make_payloads(count):
+    return [{'api_key': API_KEY, 'timestamp': 1700000000 + i, 'postcode': '33100', 'country': 'FI',
+             'service_provider': '', 'max_results': 20} for i in range(count)]
+
+
+def run(count=10000, repeat=5, routing_ids=100):
+    """
+    Run benchmark and return results.
+
+    :param count: number of signatures per measurement
+    :param repeat: number of measurements, the best one is used
+    :param routing_ids: number of distinct routing IDs, each is signed count / routing_ids times
+    :return dict_data: signatures per second and speedups of Signer
+    """
+    signer = Signer(API_KEY, SECRET)
+    payloads = make_payloads(count)
+    ids = [str(1464524676 + i % routing_ids) for i in range(count)]
+    if signer.sign_many(payloads) != [legacy_hash_sha256(SECRET, **payload) for payload in payloads]:
+        raise AssertionError("Signer output differs from legacy output")
+    if [signer.get_routing_key(routing_id) for routing_id in ids] != \
+            [legacy_md5_hash(API_KEY, SECRET, routing_id) for routing_id in ids]:
+        raise AssertionError("Routing key differs from legacy routing key")
+
+    def best(function):
+        return count / min(timeit.Timer(function).repeat(repeat, 1))
+
+    results = {
+        'legacy_sha256': best(lambda: [legacy_hash_sha256(SECRET, **payload) for payload in payloads]),
+        'sign': best(lambda: [signer.sign(payload) for payload in payloads]),
+        'sign_many': best(lambda: signer.sign_many(payloads)),
+        'legacy_md5': best(lambda: [legacy_md5_hash(API_KEY, SECRET, routing_id) for routing_id in ids]),
+        'routing_key': best(lambda: [signer.get_routing_key(routing_id) for routing_id in ids]),
+    }
+    results['sign_speedup'] = results['sign_many'] / results['legacy_sha256']
+    results['routing_key_speedup'] = results['routing_key'] / results['legacy_md5']
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 10000
+    results = run(count)
+    print("Request signing, {} requests".format(count))
+    print("  get_hash_sha256 (legacy): {:10.0f} signatures/s".format(results['legacy_sha256']))
+    print("  Signer.sign:              {:10.0f} signatures/s".format(results['sign']))
+    print("  Signer.sign_many:         {:10.0f} signatures/s".format(results['sign_many']))
+    print("  speedup: {:.1f}x".format(results['sign_speedup']))
+    print("  get_md5_hash (legacy):    {:10.0f} keys/s".format(results['legacy_md5']))
+    print("  Signer.get_routing_key:   {:10.0f} keys/s".format(results['routing_key']))
+    print("  speedup: {:.1f}x".format(results['routing_key_speedup']))
+
+
+if __name__ == '__main__':
+    main()
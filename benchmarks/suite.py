@@ -0,0 +1,362 @@
+"""Benchmark suite of request building, signing and response parsing
+
+Measures throughput and peak memory allocation of the functions which build request data and parse responses:
+    1. get_xml_shipment_req_data() with 1, 10 and 500 parcels
+    2. get_xml_shipping_label_req_data() with 1, 100 and 5000 tracking codes
+    3. get_hash_sha256()
+    4. parse_xml_create_shipment_res()
+    5. parse_xml_get_shipping_label_res() with 1 MB and 3 MB PDF content
+    6. get_create_customer_req_data()
+    7. parse_res_to_list() of customer list with 2000 customers, as dictionaries and as records
+
+All cases run offline. Results are written as JSON and compared with a stored baseline. The command exits with
+status 1 if a case is slower or allocates more memory than the tolerance allows, so it can be used as a CI step.
+Baseline depends on the machine, store it with --save-baseline on the machine where the suite is compared.
+
+Usage: python -m benchmarks.suite [--output FILE] [--baseline FILE] [--save-baseline] [--tolerance 0.25]
+                                  [--repeat 5] [--min-time 0.2] [--filter TEXT]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import base64
+import copy
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from pakettikauppa.json_decoder import JsonDecoder
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.reseller import PkReseller
+
+RESULT_VERSION = 1
+
+# Memory growth below this is not reported as regression, small allocations vary between runs
+MEMORY_SLACK_KB = 4.0
+
+
+class BenchmarkCase(object):
+    """
+    One measured function call.
+    """
+
+    def __init__(self, name, setup):
+        """
+        :param name: unique name of the case, used as key in result JSON
+        :param setup: function which returns the measured function without arguments
+        """
+        self.name = name
+        self.setup = setup
+
+
+def _shipment_data(merchant, parcel_count):
+    dict_data = merchant.get_create_multi_parcels_shipment_test_data()
+    consignment = dict_data['eChannel']['Shipment']['Shipment.Consignment']
+    parcel = consignment['Consignment.Parcel'][0]
+    parcels = []
+    for i in range(parcel_count):
+        one_parcel = copy.deepcopy(parcel)
+        one_parcel['Parcel.Reference'] = str(100000 + i)
+        parcels.append(one_parcel)
+    consignment['Consignment.Parcel'] = parcels
+    return dict_data
+
+
+def _shipping_label_data(merchant, code_count):
+    dict_data = merchant.get_shipping_label_req_test_data()
+    dict_data['eChannel']['PrintLabel']['content']['TrackingCode'] = [
+        {'Code': 'JJFI{:014d}'.format(i)} for i in range(code_count)]
+    return dict_data
+
+
+def _shipping_label_response(pdf_size):
+    pdf = b'%PDF-1.4\n' + bytes(bytearray(range(256))) * (pdf_size // 256)
+    return (b'<?xml version="1.0" encoding="UTF-8"?>\n<Response><response.status>0</response.status>'
+            b'<response.message></response.message><response.file>' + base64.b64encode(pdf) +
+            b'</response.file></Response>')
+
+
+CREATE_SHIPMENT_RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Response><response.status>0</response.status><response.message></response.message>
+<response.reference uuid="8dfd5ad5-1a30-4f2b-b3e2-2a6b1e4ba2c5">123</response.reference>
+<response.trackingcode tracking_url="https://www.pakettikauppa.fi/seuranta/?JJFI1">JJFI1</response.trackingcode>
+</Response>"""
+
+CUSTOMER_DATA = {
+    'name': 'Vilkas Group Oy',
+    'business_id': '12345678-9',
+    'payment_service_provider': '',
+    'psp_merchant_id': '',
+    'marketing_name': '',
+    'street_address': 'Finlaysoninkuja 19',
+    'post_office': 'Tampere',
+    'postcode': '33210',
+    'country': 'Finland',
+    'phone': '+358 12 345 678',
+    'email': 'tipi@vilkas.fi',
+    'contact_person_name': 'Porntip Chaibamrung',
+    'contact_person_phone': '+358-123-456-789',
+    'contact_person_email': 'tipi+test@vilkas.fi',
+    'customer_service_phone': '',
+    'customer_service_email': '',
+}
+
+
+class _Response(object):
+    def __init__(self, content):
+        self.content = content
+
+
+def _customer_list_response(count):
+    list_customers = []
+    for i in range(count):
+        customer = dict(CUSTOMER_DATA, customer_id=i + 1, api_key='00000000-0000-0000-0000-{:012d}'.format(i),
+                        active=True)
+        list_customers.append(customer)
+    return _Response(json.dumps(list_customers).encode('utf-8'))
+
+
+def get_cases(merchant, reseller):
+    """
+    Get all benchmark cases.
+
+    :param merchant: PkMerchant object
+    :param reseller: PkReseller object
+    :return list_cases: list of BenchmarkCase objects
+    """
+    def shipment_xml(parcel_count):
+        def setup():
+            dict_data = _shipment_data(merchant, parcel_count)
+            return lambda: merchant.get_xml_shipment_req_data(**dict_data)
+        return setup
+
+    def shipping_label_xml(code_count):
+        def setup():
+            dict_data = _shipping_label_data(merchant, code_count)
+            return lambda: merchant.get_xml_shipping_label_req_data(**dict_data)
+        return setup
+
+    def hash_sha256():
+        dict_data = {'api_key': merchant._api_key, 'timestamp': 1700000000, 'postcode': '33100', 'country': 'FI',
+                     'service_provider': '', 'max_results': 20}
+        return lambda: merchant.get_hash_sha256(merchant._secret, **dict_data)
+
+    def parse_create_shipment_res():
+        return lambda: merchant.parse_xml_create_shipment_res(CREATE_SHIPMENT_RESPONSE)
+
+    def parse_shipping_label_res(pdf_size):
+        def setup():
+            xml_string = _shipping_label_response(pdf_size)
+            return lambda: merchant.parse_xml_get_shipping_label_res(xml_string)
+        return setup
+
+    def create_customer_req_data():
+        return lambda: reseller.get_create_customer_req_data(**CUSTOMER_DATA)
+
+    def parse_customer_list(records):
+        def setup():
+            client = PkReseller(1)
+            client.set_json_decoder(JsonDecoder(records=records))
+            res_obj = _customer_list_response(2000)
+            return lambda: client.parse_res_to_list(res_obj)
+        return setup
+
+    return [
+        BenchmarkCase('shipment_xml_1_parcel', shipment_xml(1)),
+        BenchmarkCase('shipment_xml_10_parcels', shipment_xml(10)),
+        BenchmarkCase('shipment_xml_500_parcels', shipment_xml(500)),
+        BenchmarkCase('shipping_label_xml_1_code', shipping_label_xml(1)),
+        BenchmarkCase('shipping_label_xml_100_codes', shipping_label_xml(100)),
+        BenchmarkCase('shipping_label_xml_5000_codes', shipping_label_xml(5000)),
+        BenchmarkCase('hash_sha256', hash_sha256),
+        BenchmarkCase('parse_create_shipment_res', parse_create_shipment_res),
+        BenchmarkCase('parse_shipping_label_res_1mb', parse_shipping_label_res(1 << 20)),
+        BenchmarkCase('parse_shipping_label_res_3mb', parse_shipping_label_res(3 << 20)),
+        BenchmarkCase('create_customer_req_data', create_customer_req_data),
+        BenchmarkCase('parse_customer_list_2000', parse_customer_list(False)),
+        BenchmarkCase('parse_customer_list_2000_records', parse_customer_list(True)),
+    ]
+
+
+def _calibrate(timer, min_time):
+    # Double number of calls until one measurement takes at least 'min_time' seconds
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return number
+
+
+def measure(case, repeat=5, min_time=0.2):
+    """
+    Measure one case. Throughput is taken from the best of 'repeat' measurements, peak memory from one extra call.
+
+    :param case: BenchmarkCase object
+    :param repeat: number of measurements
+    :param min_time: minimum duration of one measurement in seconds
+    :return dict_data: 'ops_per_sec', 'us_per_op' and 'peak_kb' keys. 'peak_kb' is None without tracemalloc.
+    """
+    function = case.setup()
+    timer = timeit.Timer(function)
+    number = _calibrate(timer, min_time)
+    best = min(timer.repeat(repeat, number)) / number
+
+    peak_kb = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        peak_kb = (peak - before) / 1024.0
+
+    return {
+        'ops_per_sec': 1.0 / best,
+        'us_per_op': best * 1e6,
+        'peak_kb': peak_kb,
+    }
+
+
+def run(repeat=5, name_filter=None, min_time=0.2):
+    """
+    Run benchmark cases.
+
+    :param repeat: number of measurements per case
+    :param min_time: minimum duration of one measurement in seconds
+    :param name_filter: run only cases whose name contains this string
+    :return dict_data: result data, see RESULT_VERSION
+    """
+    merchant = PkMerchant(1)
+    reseller = PkReseller(1)
+    try:
+        cases = {}
+        for case in get_cases(merchant, reseller):
+            if name_filter and name_filter not in case.name:
+                continue
+            cases[case.name] = measure(case, repeat, min_time)
+    finally:
+        merchant.close()
+        reseller.close()
+
+    return {
+        'version': RESULT_VERSION,
+        'created': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': cases,
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compare results with baseline. Cases missing from either side are skipped.
+
+    :param results: result data of run() function
+    :param baseline: result data of earlier run
+    :param tolerance: allowed relative change, 0.25 = 25 % slower or 25 % more memory
+    :return list_regressions: list of messages, empty if no case regressed
+    """
+    if baseline.get('version') != RESULT_VERSION:
+        raise ValueError("Unsupported baseline version: {}".format(baseline.get('version')))
+
+    regressions = []
+    for name in sorted(results['cases']):
+        if name not in baseline['cases']:
+            continue
+        result = results['cases'][name]
+        base = baseline['cases'][name]
+
+        if result['ops_per_sec'] < base['ops_per_sec'] * (1.0 - tolerance):
+            regressions.append("{}: {:.0f} ops/s, baseline {:.0f} ops/s".format(
+                name, result['ops_per_sec'], base['ops_per_sec']))
+
+        if result['peak_kb'] is not None and base['peak_kb'] is not None and \
+                result['peak_kb'] > base['peak_kb'] * (1.0 + tolerance) + MEMORY_SLACK_KB:
+            regressions.append("{}: peak {:.1f} KB, baseline {:.1f} KB".format(
+                name, result['peak_kb'], base['peak_kb']))
+    return regressions
+
+
+def load_results(path):
+    with open(path, 'r') as file_object:
+        return json.load(file_object)
+
+
+def save_results(results, path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as file_object:
+        json.dump(results, file_object, indent=2, sort_keys=True)
+        file_object.write('\n')
+
+
+def print_results(results, baseline=None):
+    base_cases = baseline['cases'] if baseline else {}
+    print("{:<32} {:>12} {:>12} {:>10} {:>9}".format('case', 'ops/s', 'us/op', 'peak KB', 'change'))
+    for name in sorted(results['cases']):
+        result = results['cases'][name]
+        change = ''
+        if name in base_cases:
+            change = '{:+.1f}%'.format((result['ops_per_sec'] / base_cases[name]['ops_per_sec'] - 1.0) * 100)
+        peak = '-' if result['peak_kb'] is None else '{:.1f}'.format(result['peak_kb'])
+        line = "{:<32} {:>12.0f} {:>12.1f} {:>10} {:>9}".format(name, result['ops_per_sec'], result['us_per_op'],
+                                                                peak, change)
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark suite of request building, signing and parsing")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="compare results with this JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="write results to --baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument('--repeat', type=int, default=5, help="measurements per case")
+    parser.add_argument('--min-time', type=float, default=0.2, help="minimum seconds per measurement")
+    parser.add_argument('--filter', dest='name_filter', help="run only cases whose name contains this text")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline requires --baseline")
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        # Comparing with nothing would pass every run, baseline is stored per machine and not committed
+        print("Baseline {} not found, store one with --save-baseline".format(args.baseline))
+        return 2
+
+    results = run(args.repeat, args.name_filter, args.min_time)
+    if args.output:
+        save_results(results, args.output)
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print_results(results)
+        print("Baseline saved to {}".format(args.baseline))
+        return 0
+
+    baseline = load_results(args.baseline) if args.baseline else None
+
+    print_results(results, baseline)
+    if baseline is None:
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nREGRESSION, tolerance {:.0f}%:".format(args.tolerance * 100))
+        for message in regressions:
+            print("  " + message)
+        return 1
+    print("\nNo regressions, tolerance {:.0f}%".format(args.tolerance * 100))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
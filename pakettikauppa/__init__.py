@@ -5,3 +5,8 @@
 __author__ = """Porntip Chaibamrung"""
 __email__ = 'tipi@vilkas.fi'
 __version__ = '0.1.6'
+
+import logging
+
+# Library must not print anything unless the application configures logging
+logging.getLogger(__name__).addHandler(logging.NullHandler())
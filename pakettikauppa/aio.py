@@ -0,0 +1,794 @@
+"""This is a module for Pakettikauppa integration with asyncio
+
+The module provides awaitable versions of the client classes:
+    1. AsyncPkMerchant - awaitable API calls of PkMerchant
+    2. AsyncPkReseller - awaitable API calls of PkReseller
+    3. AsyncHttpTransport - connection pooled transport built on top of aiohttp
+    4. run_bounded_async() - run coroutine function for each item with bounded concurrency
+    5. AsyncSingleFlight - identical concurrent coroutine calls share one request, see coalesce module
+
+Request data is constructed with the same functions as in PkMerchant and PkReseller, only sending the request and
+reading the response is awaited. Every function which sends requests is a coroutine or an async generator. Response,
+pickup point and label caches work as in PkMerchant. Responses are read completely before they are parsed, and
+resilience policy and instrumentation hooks are not supported. The module requires aiohttp package and Python 3.6 or
+newer.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import json
+from collections import deque
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .pakettikauppa import PakettikauppaException
+from .merchant import PkMerchant
+from .reseller import PkReseller
+from .bulk import BulkResult, split_evenly
+from .coalesce import SingleFlightBase
+from .json_stream import iter_json_array
+from .onboarding import CREATED, FAILED, STARTED, CustomerCheckpoint
+from .tracking import parse_status_events
+from .transport import DEFAULT_TIMEOUT
+
+
+class AsyncResponse(object):
+    """
+    Response data of AsyncHttpTransport. The body is read completely before the object is created, so the object
+    offers the same attributes as requests response object which are used by the clients.
+    """
+
+    def __init__(self, status_code, content, headers=None, url=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers if headers is not None else {}
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        """
+        Decode response body as JSON data.
+
+        :return data: decoded JSON data
+        """
+        return json.loads(self.text)
+
+
+class AsyncHttpTransport(object):
+    """
+    Connection pooled HTTP transport for asyncio. Requires aiohttp package.
+
+    All coroutines of one event loop share the same connector, so hundreds of requests can be in flight at the same
+    time without opening a new connection for each of them.
+    """
+
+    def __init__(self, limit=100, limit_per_host=0, keep_alive=True, keepalive_timeout=15.0, timeout=DEFAULT_TIMEOUT):
+        """
+        Constructor for AsyncHttpTransport class.
+
+        :param limit: maximum number of simultaneous connections
+        :param limit_per_host: maximum number of simultaneous connections to one host. Zero means no limit.
+        :param keep_alive: if False, connections are closed after each response
+        :param keepalive_timeout: seconds an idle connection is kept open
+        :param timeout: (connect, read) timeout tuple or one timeout for both in seconds. None waits forever.
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncHttpTransport requires aiohttp package")
+
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keep_alive = keep_alive
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = timeout
+        self._session = None
+        self._closed = False
+
+    def get_session(self):
+        """
+        Get aiohttp session object. Session is created on first use, so it must be called inside running event loop.
+
+        :return session: aiohttp ClientSession object
+        """
+        if self._closed:
+            raise RuntimeError("Transport is closed")
+
+        if self._session is None:
+            if self._keep_alive:
+                connector = aiohttp.TCPConnector(limit=self._limit, limit_per_host=self._limit_per_host,
+                                                 keepalive_timeout=self._keepalive_timeout)
+            else:
+                connector = aiohttp.TCPConnector(limit=self._limit, limit_per_host=self._limit_per_host,
+                                                 force_close=True)
+            if self._timeout is None:
+                timeout = aiohttp.ClientTimeout(total=None)
+            elif isinstance(self._timeout, (tuple, list)):
+                timeout = aiohttp.ClientTimeout(total=None, sock_connect=self._timeout[0], sock_read=self._timeout[1])
+            else:
+                timeout = aiohttp.ClientTimeout(total=None, sock_connect=self._timeout, sock_read=self._timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def request(self, method, url, data=None, headers=None, params=None):
+        """
+        Send a request through the connection pool.
+
+        :param method: HTTP method name i.e. 'POST'
+        :param url: string of request URL
+        :param data: request body, dictionary of form data, bytes or async iterable of bytes, which is sent with \
+                     chunked transfer encoding
+        :param headers: dictionary of header data
+        :param params: dictionary of query string parameters
+        :return res_obj: AsyncResponse object
+        """
+        session = self.get_session()
+        async with session.request(method, url, data=data, headers=headers, params=params) as response:
+            content = await response.read()
+            return AsyncResponse(response.status, content, response.headers, str(response.url))
+
+    async def close(self):
+        """
+        Close all pooled connections. Transport can't be used after closing.
+
+        :return:
+        """
+        self._closed = True
+        if self._session is not None:
+            session = self._session
+            self._session = None
+            await session.close()
+
+    def is_closed(self):
+        """
+        Check whether transport is closed.
+
+        :return boolean: True if transport is closed
+        """
+        return self._closed
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def _iter_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _call(func, index, item):
+    try:
+        return BulkResult(index, item, result=await func(item))
+    except Exception as e:
+        return BulkResult(index, item, error=e)
+
+
+async def run_bounded_async(func, items, max_in_flight=10, ordered=True):
+    """
+    Await coroutine function for each item and yield BulkResult objects. Same as bulk.run_bounded() but for asyncio.
+
+    :param func: coroutine function which takes one item
+    :param items: iterable of input items
+    :param max_in_flight: maximum number of coroutines running at the same time
+    :param ordered: True = yield results in input order, False = yield results in completion order
+    :return: async generator of BulkResult objects
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+
+    pending = deque() if ordered else set()
+    try:
+        if ordered:
+            semaphore = asyncio.Semaphore(max_in_flight)
+
+            async def limited(index, item):
+                async with semaphore:
+                    return await _call(func, index, item)
+
+            for index, item in enumerate(items):
+                pending.append(asyncio.ensure_future(limited(index, item)))
+                if len(pending) >= max_in_flight * 2:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        else:
+            for index, item in enumerate(items):
+                pending.add(asyncio.ensure_future(_call(func, index, item)))
+                if len(pending) >= max_in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class AsyncSingleFlight(SingleFlightBase):
+    """
+    Coalescing of identical concurrent coroutine calls. Calls must come from one event loop.
+    """
+
+    def __init__(self):
+        super(AsyncSingleFlight, self).__init__()
+        self._tasks = {}
+
+    async def do(self, key, func):
+        """
+        Await coroutine function unless a call with the same key is in flight, in which case wait for its result.
+        Cancelling a waiting call doesn't cancel the shared request.
+
+        :param key: hashable key of the call
+        :param func: coroutine function without parameters
+        :return value: return value of the coroutine
+        """
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(key)
+            if task is not None:
+                self.saved += 1
+            else:
+                task = self._tasks[key] = asyncio.ensure_future(func())
+                task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def get_in_flight(self):
+        """
+        Get number of keys in flight.
+
+        :return count: integer
+        """
+        with self._lock:
+            return len(self._tasks)
+
+
+class _AsyncClientMixin(object):
+    """
+    Awaitable request sending for client classes. Must be placed before the client class in base class list.
+    """
+
+    async def send_request(self, send_method='POST', _api_post_url=None, req_input=None, **headers):
+        """
+        Send a request to Pakettikauppa. Unlike Pakettikauppa.send_request(), the request is sent once without
+        resilience policy and no instrumentation events are emitted. Use timeout of AsyncHttpTransport instead.
+
+        :param send_method: type of request method. Possible value are 'POST' and 'GET', 'POST' is default value.
+        :param _api_post_url: string of post URL
+        :param req_input: request input data
+        :param headers: dictionary of header data
+        :return res_obj: AsyncResponse object
+        """
+        if _api_post_url is None or _api_post_url == '':
+            raise ValueError("Need post URL data")
+
+        if send_method == 'POST':
+            res_obj = await self._transport.request('POST', _api_post_url, data=req_input, headers=headers)
+        else:
+            res_obj = await self._transport.request('GET', _api_post_url, data=req_input, headers=headers,
+                                                    params=req_input)
+
+        return self.check_response(res_obj)
+
+    async def close(self):
+        """
+        Close pooled connections of own transport. Transport given to the constructor is left open because it may be
+        shared with other objects.
+
+        :return:
+        """
+        if self._owns_transport:
+            await self._transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class AsyncPkMerchant(_AsyncClientMixin, PkMerchant):
+    """
+    Merchant class for asyncio. API calls are coroutines, other functions are same as in PkMerchant.
+    """
+
+    def __init__(self, is_test_mode=0, api_key=None, secret=None, transport=None, cache=None,
+                 pickup_point_cache=None, pickup_point_index=None, single_flight=None, label_store=None):
+        """
+        Constructor for the class.
+
+        :param is_test_mode: integer value to identify test mode operation. See PkMerchant class.
+        :param api_key: string of API key
+        :param secret: string of secret key
+        :param transport: AsyncHttpTransport object shared with other objects. If not given, own connection pool is\
+        created and it is closed in close() function.
+        :param cache: ResponseCache object for shipping method list and additional service list. Stale entries are\
+        refreshed in a task of the event loop.
+        :param pickup_point_cache: PickupPointCache object for pickup point searches
+        :param pickup_point_index: PickupPointIndex object. See PkMerchant class.
+        :param single_flight: AsyncSingleFlight object. Identical concurrent list requests and pickup point searches\
+        share one request and its result.
+        :param label_store: LabelStore object. See PkMerchant class.
+        """
+        owns_transport = transport is None
+        if owns_transport:
+            transport = AsyncHttpTransport()
+
+        super(AsyncPkMerchant, self).__init__(is_test_mode, api_key, secret, transport, cache=cache,
+                                              pickup_point_cache=pickup_point_cache,
+                                              pickup_point_index=pickup_point_index, single_flight=single_flight,
+                                              label_store=label_store)
+        self._owns_transport = owns_transport
+
+    async def search_pickup_points(self, **kwargs):
+        """
+        Search pickup points. See PkMerchant.search_pickup_points() function.
+
+        :param kwargs: see get_pickup_point_req_data() function
+        :return: list of pickup point data
+        """
+        if self._pickup_point_index is not None:
+            list_data = self._pickup_point_index.search_pickup_points(**kwargs)
+            if list_data:
+                return list_data
+        key = self.get_pickup_point_key(**kwargs) if self._single_flight is not None else None
+        if self._pickup_point_cache is not None:
+            return await self._pickup_point_cache.get_async(
+                self._api_key, lambda: self._coalesce(key, self._search_pickup_points, **kwargs), **kwargs)
+        return await self._coalesce(key, self._search_pickup_points, **kwargs)
+
+    async def _search_pickup_points(self, **kwargs):
+        _api_config = self.get_api_config('search_pickup_points')
+
+        dict_req_data = self.get_pickup_point_req_data(_api_config['api_key'], **kwargs)
+
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], dict_req_data)
+        return self.parse_res_to_list(res_obj)
+
+    async def get_shipping_method_list(self, language_code2='EN'):
+        """
+        Get list of available shipping method for the account
+
+        :param language_code2: 2 letters of language code. Default value is 'EN'
+        :return list_data: list of response data
+        """
+        key = self.get_list_cache_key('get_shipping_method_list', language_code2)
+        if self._cache is not None:
+            return await self._cache.get_async(
+                key, lambda: self._coalesce(key, self._get_shipping_method_list, language_code2))
+        return await self._coalesce(key, self._get_shipping_method_list, language_code2)
+
+    async def _get_shipping_method_list(self, language_code2):
+        _api_config = self.get_api_config('get_shipping_method_list')
+
+        dict_req_data = self.get_shipping_method_list_req_data(language_code2)
+
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], dict_req_data)
+        return self.parse_res_to_list(res_obj)
+
+    async def get_additional_service_list(self, language_code2='EN'):
+        """
+        Get list of additional service for the account
+
+        :param language_code2: 2 letters of language code. Default value is 'EN'
+        :return list_data: list of response data
+        """
+        key = self.get_list_cache_key('get_additional_service_list', language_code2)
+        if self._cache is not None:
+            return await self._cache.get_async(
+                key, lambda: self._coalesce(key, self._get_additional_service_list, language_code2))
+        return await self._coalesce(key, self._get_additional_service_list, language_code2)
+
+    async def _get_additional_service_list(self, language_code2):
+        _api_config = self.get_api_config('get_additional_service_list')
+
+        dict_req_data = self.get_additional_service_list_req_data(language_code2)
+
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], dict_req_data)
+        return self.parse_res_to_list(res_obj)
+
+    async def create_shipment(self, **kwargs):
+        """
+        Send a request to Pakettikauppa to create shipment.
+
+        :param kwargs: See get_xml_shipment_req_data() function
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        return await self.create_shipment_from_xml(self.get_create_shipment_req_data(**kwargs))
+
+    async def create_shipment_streamed(self, chunk_size=65536, **kwargs):
+        """
+        Same as create_shipment() but the request data is written while it is sent with chunked transfer encoding.
+        See PkMerchant.create_shipment_streamed() function.
+
+        :param chunk_size: minimum number of bytes in a chunk
+        :param kwargs: See get_xml_shipment_req_data() function
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        return await self.create_shipment_from_xml(self.iter_xml_shipment_req_data(chunk_size, **kwargs))
+
+    async def create_shipment_from_xml(self, xml_req_data, routing_id=None):
+        """
+        Send create shipment request with ready XML request data. Routing ID is not used because the object has no
+        resilience policy.
+
+        :param xml_req_data: bytes of XML request data or iterable of bytes, which is sent with chunked transfer\
+        encoding
+        :param routing_id: not used, for compatibility with PkMerchant.create_shipment_from_xml()
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        _api_config = self.get_api_config('create_shipment')
+
+        if not isinstance(xml_req_data, (bytes, str)):
+            xml_req_data = _iter_chunks(xml_req_data)
+
+        headers = {
+            'Content-Encoding': 'utf-8',
+            'Content-Type': 'application/xml'
+        }
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], xml_req_data, **headers)
+        return self.parse_xml_create_shipment_res(res_obj.content)
+
+    async def create_shipment_from_model(self, shipment):
+        """
+        Send create shipment request with data of model objects.
+
+        :param shipment: Shipment object, see pakettikauppa.models module
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        return await self.create_shipment_from_xml(self.get_xml_shipment_model_req_data(shipment))
+
+    async def create_shipment_with_simple_data(self, **kwargs):
+        """
+        Same as create_shipment() function. In test mode, simple test data is used if no input is given.
+
+        :param kwargs: See get_xml_shipment_req_data() function
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        if self._isInTestMode and len(kwargs) == 0:
+            kwargs = self.get_proper_req_data_create_shipment(**self.get_simple_test_data_create_shipment())
+        return await self.create_shipment_from_xml(self.get_xml_shipment_req_data(**kwargs))
+
+    def create_shipments_bulk(self, shipments, max_in_flight=10, ordered=True):
+        """
+        Create many shipments concurrently. See PkMerchant.create_shipments_bulk() function.
+
+        :param shipments: iterable of dictionaries of request data, see get_xml_shipment_req_data() function
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: async generator of BulkResult objects
+        """
+        return run_bounded_async(self._create_one_bulk_shipment, shipments, max_in_flight, ordered)
+
+    async def _create_one_bulk_shipment(self, shipment):
+        dict_res = await self.create_shipment(**shipment)
+        if dict_res['status'] != 1:
+            raise PakettikauppaException(dict_res['message'])
+        return dict_res
+
+    async def get_shipment_status(self, tracking_code):
+        """
+        Get shipment status from Pakettikauppa.
+
+        :param tracking_code: string of tracking code for checking
+        :return res_obj: AsyncResponse object
+        """
+        _api_config = self.get_api_config('get_shipment_status')
+        dict_req_data = self.get_shipment_status_req_data(tracking_code)
+        return await self.send_request('POST', _api_config['api_post_url'], dict_req_data)
+
+    async def get_shipment_status_events(self, tracking_code):
+        """
+        Get shipment status as parsed records.
+
+        :param tracking_code: string of tracking code
+        :return list_data: list of StatusEvent records, oldest first, see pakettikauppa.tracking module
+        """
+        res_obj = await self.get_shipment_status(tracking_code)
+        return parse_status_events(self.parse_res_to_list(res_obj), tracking_code)
+
+    def get_shipment_statuses(self, tracking_codes, max_in_flight=10, ordered=True):
+        """
+        Get status of many shipments concurrently. See PkMerchant.get_shipment_statuses() function.
+
+        :param tracking_codes: iterable of tracking code strings
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: async generator of BulkResult objects
+        """
+        return run_bounded_async(self.get_shipment_status_events, tracking_codes, max_in_flight, ordered)
+
+    async def get_shipping_label(self, **kwargs):
+        """
+        Get shipping labels from Pakettikauppa. Labels of one tracking code are read from and stored to label store
+        of the object, see PkMerchant.get_shipping_label() function.
+
+        :param kwargs: See get_xml_shipping_label_req_data() function
+        :return: See parse_xml_get_shipping_label_res() function
+        """
+        tracking_code = self._get_single_label_code(kwargs) if self._label_store is not None else None
+        if tracking_code is not None:
+            dict_data = self._get_stored_label_res(tracking_code)
+            if dict_data is not None:
+                return dict_data
+
+        dict_data = await self._get_shipping_label(**kwargs)
+        if tracking_code is not None:
+            self._store_label_res(tracking_code, dict_data)
+        return dict_data
+
+    async def _get_shipping_label(self, **kwargs):
+        _api_config = self.get_api_config('get_shipping_label')
+
+        xml_req_data = self.get_xml_shipping_label_req_data(**kwargs)
+
+        headers = {
+            'Content-Encoding': 'utf-8',
+            'Content-Type': 'application/xml'
+        }
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], xml_req_data, **headers)
+        return self.parse_xml_get_shipping_label_res(res_obj.content)
+
+    async def write_shipping_label(self, target, chunk_size=65536, **kwargs):
+        """
+        Get shipping labels from Pakettikauppa and write decoded PDF content to file. See
+        PkMerchant.write_shipping_label() function. The response is read completely before it is decoded. Stored label
+        of one tracking code is written from label store of the object.
+
+        :param target: file path string or file-like object with write() function
+        :param chunk_size: not used, for compatibility with PkMerchant.write_shipping_label()
+        :param kwargs: See get_xml_shipping_label_req_data() function
+        :return: See stream_shipping_label_res() function
+        """
+        dict_data = self._write_stored_label(kwargs, target)
+        if dict_data is not None:
+            return dict_data
+
+        _api_config = self.get_api_config('get_shipping_label')
+
+        xml_req_data = self.get_xml_shipping_label_req_data(**kwargs)
+
+        headers = {
+            'Content-Encoding': 'utf-8',
+            'Content-Type': 'application/xml'
+        }
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], xml_req_data, **headers)
+        return self._write_shipping_label_res([res_obj.content], target)
+
+    def get_shipping_labels(self, tracking_codes, chunk_size=50, max_in_flight=4, routing_id=None,
+                            routing_name=None, ordered=True):
+        """
+        Get shipping labels of many tracking codes concurrently. See PkMerchant.get_shipping_labels() function.
+
+        :param tracking_codes: iterable of tracking code strings
+        :param chunk_size: maximum number of tracking codes in one request
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param routing_id: string of routing ID. Default is current timestamp.
+        :param routing_name: string of routing name. Default is routing ID.
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: async generator of BulkResult objects
+        """
+        tracking_codes = list(tracking_codes)
+        min_chunks = min(max_in_flight, len(tracking_codes) // self._min_label_chunk_size)
+        chunks = split_evenly(tracking_codes, chunk_size, min_chunks)
+
+        async def get_one_chunk(codes):
+            dict_data = self.get_shipping_label_req_data(codes, routing_id, routing_name)
+            return self._decode_shipping_label_res(await self.get_shipping_label(**dict_data))
+
+        return run_bounded_async(get_one_chunk, chunks, max_in_flight, ordered)
+
+    def get_shipping_label_pdfs(self, tracking_codes, only_missing=True, max_in_flight=4, routing_id=None,
+                                routing_name=None, ordered=True):
+        """
+        Get a separate label PDF of each tracking code concurrently. See PkMerchant.get_shipping_label_pdfs()
+        function.
+
+        :param tracking_codes: iterable of tracking code strings
+        :param only_missing: True = labels in the label store are read from it and only missing labels are fetched
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param routing_id: string of routing ID. Default is current timestamp.
+        :param routing_name: string of routing name. Default is routing ID.
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: async generator of BulkResult objects
+        """
+        store = self._label_store
+
+        async def get_one_label(tracking_code):
+            if only_missing and store is not None:
+                pdf_content = store.get(tracking_code)
+                if pdf_content is not None:
+                    return pdf_content
+            dict_data = self.get_shipping_label_req_data([tracking_code], routing_id, routing_name)
+            pdf_content = self._decode_shipping_label_res(await self._get_shipping_label(**dict_data))
+            if store is not None:
+                store.put(tracking_code, pdf_content)
+            return pdf_content
+
+        return run_bounded_async(get_one_label, tracking_codes, max_in_flight, ordered)
+
+
+class AsyncPkReseller(_AsyncClientMixin, PkReseller):
+    """
+    Reseller class for asyncio. API calls are coroutines, other functions are same as in PkReseller.
+    """
+
+    def __init__(self, is_test_mode=0, api_key=None, secret=None, transport=None):
+        """
+        Constructor for the class.
+
+        :param is_test_mode: integer value to identify test mode. See PkReseller class.
+        :param api_key: API key string
+        :param secret: secret key string
+        :param transport: AsyncHttpTransport object shared with other objects. If not given, own connection pool is \
+                          created and it is closed in close() function.
+        """
+        owns_transport = transport is None
+        if owns_transport:
+            transport = AsyncHttpTransport()
+
+        super(AsyncPkReseller, self).__init__(is_test_mode, api_key, secret, transport)
+        self._owns_transport = owns_transport
+
+    async def get_customer_list(self):
+        """
+        Get list of customer for your account.
+
+        :return list_data: list of response data
+        """
+        _api_config = self.get_api_config('list_customer')
+
+        input_req_data = self.get_customer_list_req_data()
+
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], input_req_data)
+        return self.parse_res_to_list(res_obj)
+
+    async def iter_customers(self, chunk_size=65536):
+        """
+        Yield customers of your account. See PkReseller.iter_customers() function. The response is read completely
+        before customers are decoded.
+
+        :param chunk_size: not used, for compatibility with PkReseller.iter_customers()
+        :return: async generator of customer data
+        """
+        _api_config = self.get_api_config('list_customer')
+
+        input_req_data = self.get_customer_list_req_data()
+
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], input_req_data)
+        try:
+            customers = list(iter_json_array([res_obj.content], self._json_decoder))
+        except ValueError as e:
+            raise PakettikauppaException("Unable to parse JSON data: {}".format(e))
+        for customer in customers:
+            yield customer
+
+    async def iter_customer_changes(self, snapshot, chunk_size=65536):
+        """
+        Yield customers which were added, changed or removed since the previous call with the same snapshot. See
+        PkReseller.iter_customer_changes() function. Customers are collected before they are compared.
+
+        :param snapshot: CustomerSnapshot object, see customer_snapshot module
+        :param chunk_size: see iter_customers() function
+        :return: async generator of CustomerChange tuples
+        """
+        customers = [customer async for customer in self.iter_customers(chunk_size)]
+        for change in snapshot.diff(customers):
+            yield change
+
+    async def create_customers_bulk(self, records, max_in_flight=10, checkpoint=None, key_field='business_id'):
+        """
+        Create many customers concurrently. See PkReseller.create_customers_bulk() function. Customer list of
+        recovery is read completely before it is compared with the checkpoint.
+
+        :param records: list of dictionaries of customer data, see get_create_customer_req_data() function
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param checkpoint: string of checkpoint file path or CustomerCheckpoint object, see onboarding module
+        :param key_field: field which identifies a customer in the checkpoint and in the customer list
+        :return report: OnboardingReport object, 'results' contains create customer responses by key
+        """
+        records, report = self._validate_bulk_customers(records, key_field)
+        own_checkpoint = checkpoint is not None and not isinstance(checkpoint, CustomerCheckpoint)
+        if own_checkpoint:
+            checkpoint = CustomerCheckpoint(checkpoint)
+        try:
+            if checkpoint is not None and checkpoint.get_in_doubt_keys():
+                customers = [customer async for customer in self.iter_customers()]
+                self._recover_customers(checkpoint, key_field, report, customers)
+
+            pending = self._get_pending_customers(records, key_field, checkpoint, report)
+            async for bulk_result in run_bounded_async(lambda item: self._create_one_bulk_customer(item, checkpoint),
+                                                       pending, max_in_flight, ordered=False):
+                self._add_bulk_customer_result(bulk_result, report)
+        finally:
+            if own_checkpoint:
+                checkpoint.close()
+            report.finish()
+
+        self.mylogger.info("Bulk customer creation: %s", report.format(0))
+        return report
+
+    async def _create_one_bulk_customer(self, item, checkpoint):
+        _, key, record = item
+        if checkpoint is not None:
+            checkpoint.record(key, STARTED)
+        try:
+            # Records are validated by create_customers_bulk()
+            dict_res = self._check_bulk_customer_res(
+                await self._send_create_customer(self._build_create_customer_req_data(record)))
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.record(key, FAILED, error=str(e))
+            raise
+        if checkpoint is not None:
+            checkpoint.record(key, CREATED, customer_id=dict_res.get('customer_id'))
+        return dict_res
+
+    async def create_customer(self, **kwargs):
+        """
+        Create customer in Pakettikauppa's system.
+
+        :param kwargs: See get_create_customer_req_data() function
+        :return list_data: list of response data
+        """
+        _hInputData = self.get_create_customer_req_data(**kwargs)
+
+        return await self._send_create_customer(_hInputData)
+
+    async def _send_create_customer(self, req_data):
+        h_config = self.get_api_config('create_customer')
+
+        res_obj = await self.send_request('POST', h_config['api_post_url'], req_data)
+        return self.parse_res_to_list(res_obj)
+
+    async def update_customer(self, customer_id=None, **kwargs):
+        """
+        Update customer details in Pakettikauppa's system.
+
+        :param customer_id: Pakettikauppa's customer id
+        :param kwargs: attributes that you wish to update. See possible keys from get_create_customer_req_data()
+        :return list_data: list of response data
+        """
+        if customer_id is None or str(customer_id) == '':
+            raise PakettikauppaException("Customer id is empty")
+
+        if len(kwargs) == 0:
+            return None
+
+        _api_config = self.get_api_config('update_customer')
+
+        update_req_data = self.get_update_customer_req_data(str(customer_id), **kwargs)
+
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], update_req_data)
+        return self.parse_res_to_list(res_obj)
+
+    async def deactivate_customer(self, customer_id):
+        """
+        De-activate customer account in Pakettikauppa's system.
+
+        :param customer_id: Pakettikauppa's customer id
+        :return list_data: list of response data
+        """
+        if customer_id is None or str(customer_id) == '':
+            raise ValueError("Require customer id")
+
+        _api_config = self.get_api_config('deactivate_customer')
+
+        input_req_data = self.get_deactivate_customer_req_data(str(customer_id))
+
+        res_obj = await self.send_request('POST', _api_config['api_post_url'], input_req_data)
+        return self.parse_res_to_list(res_obj)
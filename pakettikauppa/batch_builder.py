@@ -0,0 +1,171 @@
+"""Batch builder module for Pakettikauppa integration
+
+The module spreads building of create shipment XML over several processes:
+    1. ShipmentBatchBuilder - build XML of many shipments in a process pool, results in input order
+    2. ShipmentBatchBuilder.create_shipments() - build and send shipments concurrently
+
+Building XML with lxml, validating input and signing take CPU time, which one Python process can only spend on one
+core. The builder sends chunks of shipment dictionaries to worker processes, which return XML bytes, so inputs and
+outputs are plain picklable data. Each worker process has its own PkMerchant with the credentials of the merchant
+given to the builder. Only a limited number of chunks is in flight, so input can be a generator of any length.
+
+Use workers=1 to build in the calling process without a pool. See benchmarks/bench_batch_builder.py.
+"""
+from __future__ import absolute_import
+
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .bulk import BulkResult, run_bounded
+from .pakettikauppa import PakettikauppaException
+
+# Merchant object of a worker process, created by _init_worker()
+_worker_merchant = None
+
+
+def _init_worker(merchant_class, is_test_mode, api_key, secret):
+    global _worker_merchant
+    _worker_merchant = merchant_class(is_test_mode, api_key=api_key, secret=secret)
+
+
+def _build_one(merchant, shipment):
+    try:
+        return merchant.get_create_shipment_req_data(**shipment), None
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = PakettikauppaException("{}: {}".format(e.__class__.__name__, e))
+        return None, e
+
+
+def _build_chunk(chunk):
+    return [_build_one(_worker_merchant, shipment) for shipment in chunk]
+
+
+class ShipmentBatchBuilder(object):
+    """
+    Builder of create shipment XML in a process pool. The pool is started on first use and kept until close().
+    """
+
+    def __init__(self, merchant, workers=None, chunk_size=50, max_pending_chunks=None):
+        """
+        Constructor for ShipmentBatchBuilder class.
+
+        :param merchant: PkMerchant object. Its class and credentials are used in worker processes and its transport
+                         for sending.
+        :param workers: number of worker processes. Default is number of CPUs.
+        :param chunk_size: number of shipments sent to a worker at a time. Larger chunks mean less overhead of
+                           passing data between processes.
+        :param max_pending_chunks: maximum number of chunks in flight. Default is twice the number of workers.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.merchant = merchant
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_pending_chunks = max_pending_chunks if max_pending_chunks is not None else workers * 2
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            merchant = self.merchant
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker,
+                initargs=(type(merchant), merchant._isInTestMode, merchant._api_key, merchant._secret))
+        return self._executor
+
+    def _iter_chunks(self, shipments):
+        chunk = []
+        for shipment in shipments:
+            chunk.append(shipment)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def build(self, shipments):
+        """
+        Build XML request data of shipments. A shipment with invalid data doesn't stop the others.
+
+        :param shipments: iterable of dictionaries of request data, see PkMerchant.get_xml_shipment_req_data()
+        :return generator: BulkResult objects in input order, 'result' is XML bytes and 'request' the dictionary
+        """
+        index = 0
+        if self.workers == 1:
+            for shipment in shipments:
+                xml_string, error = _build_one(self.merchant, shipment)
+                yield BulkResult(index, shipment, xml_string, error)
+                index += 1
+            return
+
+        executor = self._get_executor()
+        pending = deque()
+        try:
+            for chunk in self._iter_chunks(shipments):
+                pending.append((chunk, executor.submit(_build_chunk, chunk)))
+                if len(pending) < self.max_pending_chunks:
+                    continue
+                for result in self._chunk_results(pending.popleft(), index):
+                    yield result
+                    index += 1
+            while pending:
+                for result in self._chunk_results(pending.popleft(), index):
+                    yield result
+                    index += 1
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _chunk_results(item, index):
+        chunk, future = item
+        for offset, (xml_string, error) in enumerate(future.result()):
+            yield BulkResult(index + offset, chunk[offset], xml_string, error)
+
+    def create_shipments(self, shipments, max_in_flight=10):
+        """
+        Build shipments in the process pool and send them concurrently through the merchant while later shipments are
+        still being built. Requests go through create_shipment_from_xml(), so the idempotency store of the resilience
+        policy of the merchant is used by Routing.Id.
+
+        :param shipments: iterable of dictionaries of request data
+        :param max_in_flight: maximum number of requests sent at the same time
+        :return generator: BulkResult objects in input order, 'result' contains dictionary data of \
+                           parse_xml_create_shipment_res() function
+        """
+        for result in run_bounded(self._send_one, self.build(shipments), max_in_flight):
+            built = result.request
+            yield BulkResult(built.index, built.request, result.result, result.error)
+
+    def _send_one(self, built):
+        if built.error is not None:
+            raise built.error
+        routing_id = self.merchant._get_routing_id_of(built.request)
+        dict_res = self.merchant.create_shipment_from_xml(built.result, routing_id)
+        if dict_res['status'] != 1:
+            raise PakettikauppaException(dict_res['message'])
+        return dict_res
+
+    def close(self):
+        """
+        Stop worker processes.
+
+        :return:
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,121 @@
+"""Bulk operation module for Pakettikauppa integration
+
+The module provides helpers for sending many requests concurrently with bounded number of requests in flight:
+    1. BulkResult - result of one item of bulk operation
+    2. run_bounded() - run function for each item in thread pool and yield results
+    3. split_evenly() - split list into chunks of almost equal size
+"""
+from __future__ import absolute_import
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class BulkResult(object):
+    """
+    Result of one item of bulk operation. Failed item has exception object in 'error' attribute and None in 'result'.
+    """
+    __slots__ = ('index', 'request', 'result', 'error')
+
+    def __init__(self, index, request, result=None, error=None):
+        """
+        :param index: position of the item in input data
+        :param request: input item
+        :param result: return value of the operation
+        :param error: exception raised by the operation
+        """
+        self.index = index
+        self.request = request
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return "BulkResult(index={}, result={!r})".format(self.index, self.result)
+        return "BulkResult(index={}, error={!r})".format(self.index, self.error)
+
+
+def split_evenly(items, chunk_size, min_chunks=1):
+    """
+    Split list into chunks of almost equal size. Number of chunks is the smallest number that keeps chunks within
+    'chunk_size', so 101 items with chunk size 50 become chunks of 34, 34 and 33 items instead of 50, 50 and 1.
+
+    :param items: list of items
+    :param chunk_size: maximum number of items in one chunk
+    :param min_chunks: minimum number of chunks if there are enough items
+    :return list_data: list of lists
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    total = len(items)
+    if total == 0:
+        return []
+
+    chunk_count = max(-(-total // chunk_size), min(min_chunks, total))
+    base_size, remainder = divmod(total, chunk_count)
+
+    chunks = []
+    start = 0
+    for i in range(chunk_count):
+        end = start + base_size + (1 if i < remainder else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+def _call(func, index, item):
+    try:
+        return BulkResult(index, item, result=func(item))
+    except Exception as e:
+        return BulkResult(index, item, error=e)
+
+
+def run_bounded(func, items, max_in_flight=10, ordered=True):
+    """
+    Call function for each item in a thread pool and yield BulkResult objects. Items are read lazily from the
+    iterable, so input can be a generator of any length. An exception of one item doesn't stop the others.
+
+    :param func: function which takes one item
+    :param items: iterable of input items
+    :param max_in_flight: maximum number of function calls running at the same time
+    :param ordered: True = yield results in input order, False = yield results in completion order
+    :return: generator of BulkResult objects
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+
+    iterator = enumerate(items)
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    pending = deque() if ordered else set()
+    try:
+        if ordered:
+            # Results which are ready but wait for earlier items are buffered, so keep the window a bit larger than
+            # number of workers to avoid idle workers behind one slow request.
+            window = max_in_flight * 2
+            for index, item in iterator:
+                pending.append(executor.submit(_call, func, index, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        else:
+            for index, item in iterator:
+                pending.add(executor.submit(_call, func, index, item))
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+    finally:
+        # Consumer may stop iterating early, don't start items which are still waiting
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
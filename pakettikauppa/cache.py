@@ -0,0 +1,486 @@
+"""Cache module for Pakettikauppa integration
+
+The module provides response caching for API calls whose data rarely changes:
+    1. MemoryCacheBackend - in-process LRU dictionary
+    2. FileCacheBackend - JSON files in a local directory, shared between processes
+    3. RedisCacheBackend - any client object with Redis get/set/delete interface
+    4. ResponseCache - TTL cache with stale-while-revalidate refresh on top of a backend
+    5. PickupPointCache - cache for pickup point searches with normalised keys
+
+Backends store entries as dictionaries with 'value' and 'stored_at' keys. Values must be JSON serializable for
+file and Redis backends. ResponseCache and PickupPointCache have get_async() for coroutine loaders of AsyncPkMerchant.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from time import time
+
+
+def make_cache_key(*parts):
+    """
+    Construct cache key string from given parts.
+
+    :param parts: key parts, converted to string
+    :return key: string of cache key
+    """
+    return ':'.join(str(part) for part in parts)
+
+
+class CacheBackend(object):
+    """
+    Base class for cache backends.
+    """
+
+    def get(self, key):
+        """
+        Get entry for the key.
+
+        :param key: string of cache key
+        :return entry: dictionary of entry data or None if not found
+        """
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        """
+        Store entry for the key.
+
+        :param key: string of cache key
+        :param entry: dictionary of entry data
+        :return:
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Remove entry of the key. Missing key is ignored.
+
+        :param key: string of cache key
+        :return:
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Remove all entries.
+
+        :return:
+        """
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process cache backend. Least recently used entries are evicted when the backend is full.
+    """
+
+    def __init__(self, max_entries=1024):
+        """
+        :param max_entries: maximum number of entries
+        """
+        self._max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    Cache backend which stores each entry as JSON file in a directory. Several processes can share the directory.
+    Files are replaced atomically, so readers never see a partially written entry.
+    """
+
+    def __init__(self, directory, max_entries=1024):
+        """
+        :param directory: path of cache directory, created if missing
+        :param max_entries: maximum number of entry files. Least recently used files are removed when exceeded.
+        """
+        self._directory = directory
+        self._max_entries = max_entries
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        file_name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+        return os.path.join(self._directory, file_name)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, entry):
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for file_name in os.listdir(self._directory):
+            if file_name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self._directory, file_name))
+                except OSError:
+                    pass
+
+    def _evict(self):
+        files = [os.path.join(self._directory, name) for name in os.listdir(self._directory) if name.endswith('.json')]
+        if len(files) <= self._max_entries:
+            return
+        files.sort(key=lambda path: os.path.getmtime(path))
+        for path in files[:len(files) - self._max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache backend on top of Redis compatible client object. The client must provide get(key), set(key, value, ex=None)
+    and delete(key) functions. Entries expire in Redis after 'expire' seconds, so old entries don't pile up.
+    """
+
+    def __init__(self, client, prefix='pakettikauppa:', expire=None):
+        """
+        :param client: Redis compatible client object
+        :param prefix: string prepended to every key
+        :param expire: seconds after the entry is removed by Redis, None = never
+        """
+        self._client = client
+        self._prefix = prefix
+        self._expire = expire
+        self._keys = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        data = self._client.get(self._prefix + key)
+        if data is None:
+            return None
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def set(self, key, entry):
+        self._client.set(self._prefix + key, json.dumps(entry), ex=self._expire)
+        with self._lock:
+            self._keys.add(key)
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+        with self._lock:
+            self._keys.discard(key)
+
+    def clear(self):
+        # Only keys written through this object are known, other keys under the prefix are left to expire
+        with self._lock:
+            keys = list(self._keys)
+            self._keys.clear()
+        for key in keys:
+            self._client.delete(self._prefix + key)
+
+
+class ResponseCache(object):
+    """
+    TTL cache for API responses.
+
+    Entry younger than 'ttl' seconds is fresh and returned as it is. Entry older than 'ttl' but younger than
+    'ttl + stale_ttl' seconds is stale: it is returned immediately and refreshed in a background thread. Older
+    entries are loaded again before returning.
+    """
+
+    def __init__(self, backend=None, ttl=3600, stale_ttl=0, clock=time):
+        """
+        Constructor for ResponseCache class.
+
+        :param backend: CacheBackend object. Default is MemoryCacheBackend.
+        :param ttl: seconds an entry is fresh
+        :param stale_ttl: seconds a stale entry may be returned while it is refreshed. Zero disables \\
+                          stale-while-revalidate.
+        :param clock: function returning current time in seconds
+        """
+        self._backend = backend if backend is not None else MemoryCacheBackend()
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._clock = clock
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def get_backend(self):
+        return self._backend
+
+    def get(self, key, loader):
+        """
+        Get cached value or load it with loader function.
+
+        :param key: string of cache key
+        :param loader: function without parameters which returns value for the key
+        :return value: cached or loaded value
+        """
+        entry = self._backend.get(key)
+        if entry is not None:
+            age = self._clock() - entry['stored_at']
+            if age < self._ttl:
+                return entry['value']
+            if age < self._ttl + self._stale_ttl:
+                self._refresh_in_background(key, loader)
+                return entry['value']
+
+        return self._load(key, loader)
+
+    async def get_async(self, key, loader):
+        """
+        Same as get() for asyncio. Stale entry is refreshed in a task of the running event loop.
+
+        :param key: string of cache key
+        :param loader: function without parameters which returns awaitable of value for the key
+        :return value: cached or loaded value
+        """
+        entry = self._backend.get(key)
+        if entry is not None:
+            age = self._clock() - entry['stored_at']
+            if age < self._ttl:
+                return entry['value']
+            if age < self._ttl + self._stale_ttl:
+                self._refresh_in_task(key, loader)
+                return entry['value']
+
+        return await self._load_async(key, loader)
+
+    def invalidate(self, key=None):
+        """
+        Remove entry of the key or all entries if key is not given.
+
+        :param key: string of cache key
+        :return:
+        """
+        if key is None:
+            self._backend.clear()
+        else:
+            self._backend.delete(key)
+
+    def _load(self, key, loader):
+        value = loader()
+        self._backend.set(key, {'value': value, 'stored_at': self._clock()})
+        return value
+
+    async def _load_async(self, key, loader):
+        value = await loader()
+        self._backend.set(key, {'value': value, 'stored_at': self._clock()})
+        return value
+
+    def _refresh_in_task(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                await self._load_async(key, loader)
+            except Exception:
+                self.logger.exception("Refreshing cache key %s failed", key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        asyncio.ensure_future(refresh())
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._load(key, loader)
+            except Exception:
+                # Stale entry is kept, next call after it expires completely raises the error to the caller
+                self.logger.exception("Refreshing cache key %s failed", key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+
+class PickupPointCache(object):
+    """
+    Cache for pickup point search results.
+
+    Search parameters are normalised before building the key, so i.e. '33 100' and '33100' or 'posti' and 'Posti'
+    share one entry. Number of results is not part of the key: an entry fetched with larger 'max_result' answers
+    requests for fewer points, and an entry with fewer points than its limit is complete for any limit.
+    """
+
+    def __init__(self, backend=None, ttl=3600, max_entries=10000, clock=time):
+        """
+        Constructor for PickupPointCache class.
+
+        :param backend: CacheBackend object. Default is MemoryCacheBackend with 'max_entries' limit.
+        :param ttl: seconds an entry is valid
+        :param max_entries: maximum number of entries of default backend
+        :param clock: function returning current time in seconds
+        """
+        self._backend = backend if backend is not None else MemoryCacheBackend(max_entries)
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(**kwargs):
+        """
+        Normalise search parameters.
+
+        :param kwargs: see PkMerchant.get_pickup_point_req_data() function
+        :return tuple: normalised (country_code2, postal_code, service_provider, street_address) and max_result
+        """
+        postal_code = kwargs['postal_code']
+        if postal_code is None or postal_code == '':
+            raise ValueError("Require postal code data")
+        postal_code = ''.join(str(postal_code).split()).upper()
+
+        country_code2 = kwargs.get('country_code2')
+        country_code2 = 'FI' if country_code2 is None or country_code2 == '' else country_code2.strip().upper()
+
+        service_provider = kwargs.get('service_provider')
+        service_provider = '' if service_provider is None else service_provider.strip().lower()
+
+        street_address = kwargs.get('street_address')
+        street_address = '' if street_address is None else ' '.join(street_address.split()).lower()
+
+        max_result = kwargs.get('max_result')
+        max_result = 5 if max_result is None else int(max_result)
+
+        return (country_code2, postal_code, service_provider, street_address), max_result
+
+    def get(self, api_key, loader, **kwargs):
+        """
+        Get cached pickup points or load them with loader function.
+
+        :param api_key: string of API key, results of different accounts are cached separately
+        :param loader: function without parameters which sends the search request
+        :param kwargs: search parameters, see PkMerchant.get_pickup_point_req_data() function
+        :return list_data: list of pickup point data
+        """
+        key, max_result, points = self._find(api_key, **kwargs)
+        if points is not None:
+            return points
+        return self._store(key, max_result, loader())
+
+    async def get_async(self, api_key, loader, **kwargs):
+        """
+        Same as get() for asyncio.
+
+        :param api_key: string of API key, results of different accounts are cached separately
+        :param loader: function without parameters which returns awaitable of search results
+        :param kwargs: search parameters, see PkMerchant.get_pickup_point_req_data() function
+        :return list_data: list of pickup point data
+        """
+        key, max_result, points = self._find(api_key, **kwargs)
+        if points is not None:
+            return points
+        return self._store(key, max_result, await loader())
+
+    def _find(self, api_key, **kwargs):
+        # Return key, max_result and cached points, points are None if the search must be sent
+        search_key, max_result = self.normalize(**kwargs)
+        key = make_cache_key(api_key, 'search_pickup_points', *search_key)
+
+        entry = self._backend.get(key)
+        if entry is not None and self._clock() - entry['stored_at'] < self._ttl:
+            points = entry['value']['points']
+            limit = entry['value']['limit']
+            if limit >= max_result or len(points) < limit:
+                with self._lock:
+                    self.hits += 1
+                return key, max_result, points[:max_result]
+
+        with self._lock:
+            self.misses += 1
+        return key, max_result, None
+
+    def _store(self, key, max_result, points):
+        if points is not None:
+            self._backend.set(key, {'value': {'limit': max_result, 'points': points}, 'stored_at': self._clock()})
+        return points
+
+    def get_stats(self):
+        """
+        Get hit and miss counters.
+
+        :return dict_data: dictionary with 'hits', 'misses' and 'hit_ratio' keys
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / total if total else 0.0,
+            }
+
+    def invalidate(self):
+        """
+        Remove all entries and reset counters.
+
+        :return:
+        """
+        self._backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,110 @@
+"""Request coalescing module for Pakettikauppa integration
+
+The module lets identical concurrent calls share one request:
+    1. SingleFlight - coalescing of calls from many threads
+
+AsyncSingleFlight of aio module does the same for coroutines.
+
+The first call of a key runs the function and later calls with the same key wait for it and get the same result or
+exception. The key is forgotten when the call finishes, so nothing is cached: a call which starts after the first one
+finished sends a new request. Use ResponseCache of cache module to keep results.
+
+PkMerchant and AsyncPkMerchant use it for shipping method list, additional service list and pickup point search when
+given as single_flight. Keys are built from unsigned request parameters, so timestamp and hash don't matter.
+"""
+from __future__ import absolute_import
+
+import threading
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlightBase(object):
+    """
+    Call counters of single flight classes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.saved = 0
+
+    def get_stats(self):
+        """
+        Get call counters.
+
+        :return dict_data: dictionary with 'calls', 'executed', 'saved' and 'saved_ratio' keys
+        """
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'executed': self.calls - self.saved,
+                'saved': self.saved,
+                'saved_ratio': float(self.saved) / self.calls if self.calls else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.saved = 0
+
+
+class SingleFlight(SingleFlightBase):
+    """
+    Coalescing of identical concurrent calls from many threads. One object can be shared by many clients.
+    """
+
+    def __init__(self):
+        super(SingleFlight, self).__init__()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Call function unless a call with the same key is in flight, in which case wait for its result.
+
+        :param key: hashable key of the call
+        :param func: function without parameters
+        :return value: return value of the function. Exception of the function is raised in every waiting thread.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self.saved += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def get_in_flight(self):
+        """
+        Get number of keys in flight.
+
+        :return count: integer
+        """
+        with self._lock:
+            return len(self._calls)
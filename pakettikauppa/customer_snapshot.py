@@ -0,0 +1,113 @@
+"""Customer snapshot module for Pakettikauppa integration
+
+The module remembers customers of a reseller between customer list calls:
+    1. CustomerSnapshot - digest of every customer by customer ID, kept in memory or in a JSON file
+    2. CustomerChange - added, changed or removed customer found by CustomerSnapshot.diff()
+
+Only a digest of each customer is stored, so the snapshot stays small even for tens of thousands of customers. Use
+it with PkReseller.iter_customer_changes() to process only customers which changed since the previous call.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+CustomerChange = namedtuple('CustomerChange', ('change', 'customer_id', 'customer'))
+
+
+def get_customer_digest(customer):
+    """
+    Get digest of customer data. Key order does not change the digest.
+
+    :param customer: dictionary or namedtuple record of customer data
+    :return digest_string: hex string of SHA-1 digest
+    """
+    if hasattr(customer, '_asdict'):
+        customer = customer._asdict()
+    data = json.dumps(customer, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _get_customer_id(customer, id_key):
+    if isinstance(customer, dict):
+        return customer.get(id_key)
+    return getattr(customer, id_key, None)
+
+
+class CustomerSnapshot(object):
+    """
+    Digests of customers by customer ID.
+    """
+
+    def __init__(self, path=None, id_key='customer_id'):
+        """
+        Constructor for CustomerSnapshot class. Existing snapshot file is loaded.
+
+        :param path: string of JSON file path. Snapshot is kept in memory only if not given.
+        :param id_key: key of customer ID in customer data
+        """
+        self.path = path
+        self.id_key = id_key
+        self.digests = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.digests = json.load(f)['digests']
+
+    def __len__(self):
+        return len(self.digests)
+
+    def save(self):
+        """
+        Write snapshot to the file. The file is replaced atomically.
+
+        :return:
+        """
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'id_key': self.id_key, 'digests': self.digests}, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def diff(self, customers):
+        """
+        Compare customers with the snapshot and yield changes. When the customers are exhausted, removed customers are
+        yielded and the snapshot is updated and saved. Snapshot is not updated if the iteration is not finished.
+
+        :param customers: iterable of customer dictionaries or records
+        :return generator: CustomerChange tuples. 'customer' is None for removed customers.
+        """
+        old_digests = self.digests
+        new_digests = {}
+        for customer in customers:
+            customer_id = _get_customer_id(customer, self.id_key)
+            if customer_id is None:
+                raise ValueError("Customer without {}".format(self.id_key))
+            # JSON object keys of the file are strings
+            key = str(customer_id)
+            digest_string = get_customer_digest(customer)
+            new_digests[key] = digest_string
+            old_digest = old_digests.get(key)
+            if old_digest is None:
+                yield CustomerChange(ADDED, customer_id, customer)
+            elif old_digest != digest_string:
+                yield CustomerChange(CHANGED, customer_id, customer)
+
+        for key in old_digests:
+            if key not in new_digests:
+                yield CustomerChange(REMOVED, key, None)
+
+        self.digests = new_digests
+        self.save()
@@ -0,0 +1,400 @@
+"""Instrumentation module for Pakettikauppa integration
+
+The module records where time goes in each API call of PkMerchant and PkReseller:
+    1. RequestMetrics - build, network and parse time, request and response size, status code and attempts of a call
+    2. Instrumentation - hooks which receive RequestMetrics of every call, see Pakettikauppa.set_instrumentation()
+    3. HistogramExporter - hook which keeps Prometheus style histograms and renders them in text exposition format
+    4. SpanEmitter - hook which emits one span per call, to an OpenTelemetry style tracer or to a function
+    5. instrumented() - decorator of client functions which make an API call
+
+A hook is any callable which takes a RequestMetrics object. Hooks are called in the thread which made the call, after
+the response is parsed, so they should be fast. Clients without instrumentation or with an empty Instrumentation only
+check one attribute per call.
+
+Build time is the time from the start of the call until the request is sent, i.e. XML building and signing. Network
+time ends when the response is received, including retries. For streamed responses, i.e. write_shipping_label(), the
+body is read while it is parsed, so reading it is counted in parse time.
+"""
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'perf_counter', time.time)
+_local = threading.local()
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class RequestMetrics(object):
+    """
+    Metrics of one API call. Times are in seconds and sizes in bytes. Value is None if it wasn't measured, i.e.
+    parse_time of a call which failed in network.
+    """
+    __slots__ = ('api_name', 'started_at', 'build_time', 'network_time', 'parse_time', 'request_bytes',
+                 'response_bytes', 'status_code', 'attempts', 'error', '_start', '_network_start', '_network_end')
+
+    def __init__(self, api_name):
+        """
+        :param api_name: string of API name, key of _api_mapping of the client
+        """
+        self.api_name = api_name
+        self.started_at = time.time()
+        self.build_time = None
+        self.network_time = None
+        self.parse_time = None
+        self.request_bytes = None
+        self.response_bytes = None
+        self.status_code = None
+        self.attempts = 0
+        self.error = None
+        self._start = _clock()
+        self._network_start = None
+        self._network_end = None
+
+    @property
+    def retries(self):
+        return max(self.attempts - 1, 0)
+
+    @property
+    def total_time(self):
+        return sum(value for value in (self.build_time, self.network_time, self.parse_time) if value is not None)
+
+    def begin_network(self):
+        self._network_start = _clock()
+        self.build_time = self._network_start - self._start
+
+    def end_network(self, res_obj=None, stream=False):
+        """
+        Record end of network time and sizes of the response.
+
+        :param res_obj: response object, None if the request failed
+        :param stream: True if the response body isn't read yet
+        :return:
+        """
+        self._network_end = _clock()
+        self.network_time = self._network_end - self._network_start
+        if res_obj is None:
+            return
+        self.status_code = res_obj.status_code
+        if self.request_bytes is None:
+            self.request_bytes = _get_body_size(getattr(getattr(res_obj, 'request', None), 'body', None))
+        content_length = res_obj.headers.get('Content-Length') if res_obj.headers else None
+        if content_length is not None and content_length.isdigit():
+            self.response_bytes = int(content_length)
+        elif not stream:
+            self.response_bytes = len(res_obj.content)
+
+    def count_request_bytes(self, chunks):
+        """
+        Count bytes of request body which is sent in chunks.
+
+        :param chunks: iterable of bytes
+        :return generator: the same chunks
+        """
+        self.request_bytes = 0
+        for chunk in chunks:
+            self.request_bytes += len(chunk)
+            yield chunk
+
+    def finish(self):
+        if self._network_end is not None:
+            self.parse_time = _clock() - self._network_end
+
+
+def _get_body_size(body):
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    return None
+
+
+def get_current_metrics():
+    """
+    Get metrics of the API call in progress in this thread.
+
+    :return metrics: RequestMetrics object or None if the call isn't instrumented
+    """
+    return getattr(_local, 'metrics', None)
+
+
+class Instrumentation(object):
+    """
+    Hooks of a client. The same object can be shared by many clients.
+    """
+
+    def __init__(self, hooks=()):
+        """
+        Constructor for Instrumentation class.
+
+        :param hooks: iterable of callables which take RequestMetrics object
+        """
+        self._lock = threading.Lock()
+        self.hooks = tuple(hooks)
+
+    def add_hook(self, hook):
+        """
+        Add hook.
+
+        :param hook: callable which takes RequestMetrics object
+        :return hook: the added hook
+        """
+        with self._lock:
+            self.hooks = self.hooks + (hook,)
+        return hook
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self.hooks = tuple(item for item in self.hooks if item != hook)
+
+    def emit(self, metrics):
+        """
+        Give metrics to every hook. Exceptions of hooks are logged and never raised to the caller of the API.
+
+        :param metrics: RequestMetrics object
+        :return:
+        """
+        for hook in self.hooks:
+            try:
+                hook(metrics)
+            except Exception:
+                logger.exception("Instrumentation hook %r failed", hook)
+
+
+def instrumented(api_name):
+    """
+    Decorator of a client function which builds a request of the API, sends it and parses the response. Nested
+    instrumented calls are measured as part of the outer call.
+
+    :param api_name: string of API name
+    """
+    def decorator(in_function):
+        @wraps(in_function)
+        def decorated_function(self, *args, **kwargs):
+            instrumentation = self._instrumentation
+            if instrumentation is None or not instrumentation.hooks or getattr(_local, 'metrics', None) is not None:
+                return in_function(self, *args, **kwargs)
+
+            metrics = RequestMetrics(api_name)
+            _local.metrics = metrics
+            try:
+                return in_function(self, *args, **kwargs)
+            except Exception as e:
+                metrics.error = e
+                raise
+            finally:
+                _local.metrics = None
+                metrics.finish()
+                # Calls answered without a request, i.e. from idempotency store, aren't reported. Failed calls are,
+                # also when circuit breaker rejected them before the first attempt.
+                if metrics.attempts or metrics.error is not None:
+                    instrumentation.emit(metrics)
+        return decorated_function
+    return decorator
+
+
+class Histogram(object):
+    """
+    Histogram with cumulative bucket counts like Prometheus histogram.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self):
+        """
+        :return list_data: list of (upper bound, count of values less than or equal to the bound) tuples
+        """
+        total = 0
+        list_data = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            list_data.append((bound, total))
+        return list_data
+
+
+class HistogramExporter(object):
+    """
+    Hook which keeps histograms of phase durations and payload sizes per API name, and counters of status codes and
+    retries. render() returns them in Prometheus text exposition format, to be served from a metrics endpoint of the
+    application.
+    """
+    PHASES = ('build', 'network', 'parse')
+
+    def __init__(self, prefix='pakettikauppa', duration_buckets=DURATION_BUCKETS, size_buckets=SIZE_BUCKETS):
+        """
+        Constructor for HistogramExporter class.
+
+        :param prefix: string of metric name prefix
+        :param duration_buckets: tuple of upper bounds of duration buckets in seconds
+        :param size_buckets: tuple of upper bounds of size buckets in bytes
+        """
+        self.prefix = prefix
+        self.duration_buckets = tuple(sorted(duration_buckets))
+        self.size_buckets = tuple(sorted(size_buckets))
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._sizes = {}
+        self._responses = {}
+        self._retries = {}
+
+    def _observe(self, histograms, key, buckets, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def __call__(self, metrics):
+        api_name = metrics.api_name
+        with self._lock:
+            for phase, value in zip(self.PHASES, (metrics.build_time, metrics.network_time, metrics.parse_time)):
+                if value is not None:
+                    self._observe(self._durations, (api_name, phase), self.duration_buckets, value)
+            for direction, value in (('request', metrics.request_bytes), ('response', metrics.response_bytes)):
+                if value is not None:
+                    self._observe(self._sizes, (api_name, direction), self.size_buckets, value)
+            status = str(metrics.status_code) if metrics.status_code is not None else 'error'
+            self._responses[(api_name, status)] = self._responses.get((api_name, status), 0) + 1
+            if metrics.retries:
+                self._retries[api_name] = self._retries.get(api_name, 0) + metrics.retries
+
+    def get_duration_histogram(self, api_name, phase):
+        return self._durations.get((api_name, phase))
+
+    def get_size_histogram(self, api_name, direction):
+        return self._sizes.get((api_name, direction))
+
+    def get_response_count(self, api_name, status):
+        return self._responses.get((api_name, str(status)), 0)
+
+    def get_retry_count(self, api_name):
+        return self._retries.get(api_name, 0)
+
+    @staticmethod
+    def _format_bound(bound):
+        return repr(float(bound)) if not isinstance(bound, int) else str(bound)
+
+    def _render_histograms(self, lines, name, help_text, label_name, histograms):
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} histogram'.format(name))
+        for (api_name, label_value), histogram in sorted(histograms.items()):
+            labels = 'api="{}",{}="{}"'.format(api_name, label_name, label_value)
+            for bound, count in histogram.get_cumulative_counts():
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, self._format_bound(bound), count))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, histogram.count))
+            lines.append('{}_sum{{{}}} {!r}'.format(name, labels, float(histogram.sum)))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, histogram.count))
+
+    def render(self):
+        """
+        Render metrics in Prometheus text exposition format.
+
+        :return string: text of metrics
+        """
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, self.prefix + '_request_duration_seconds',
+                                    'Duration of API call phases', 'phase', self._durations)
+            self._render_histograms(lines, self.prefix + '_payload_size_bytes',
+                                    'Size of request and response bodies', 'direction', self._sizes)
+            name = self.prefix + '_responses_total'
+            lines.append('# HELP {} API calls by status code'.format(name))
+            lines.append('# TYPE {} counter'.format(name))
+            for (api_name, status), count in sorted(self._responses.items()):
+                lines.append('{}{{api="{}",status="{}"}} {}'.format(name, api_name, status, count))
+            name = self.prefix + '_retries_total'
+            lines.append('# HELP {} Retried requests'.format(name))
+            lines.append('# TYPE {} counter'.format(name))
+            for api_name, count in sorted(self._retries.items()):
+                lines.append('{}{{api="{}"}} {}'.format(name, api_name, count))
+        return '\n'.join(lines) + '\n'
+
+
+class SpanEmitter(object):
+    """
+    Hook which emits one span per API call with phase durations, sizes and status code as attributes, and the end of
+    each phase as an event.
+
+    With 'tracer' the spans are started with tracer.start_span(name, start_time=..., attributes=...) and ended with
+    span.end(end_time=...), which is the interface of OpenTelemetry tracer. Times are nanoseconds since epoch.
+    Otherwise the spans are given as dictionaries to 'emit' function, or kept in 'spans' if neither is given.
+    """
+
+    def __init__(self, tracer=None, emit=None, max_spans=1000):
+        """
+        Constructor for SpanEmitter class.
+
+        :param tracer: OpenTelemetry style tracer object
+        :param emit: function which takes span dictionary
+        :param max_spans: number of latest spans kept in 'spans' when neither tracer nor emit is given
+        """
+        if tracer is not None and emit is not None:
+            raise ValueError("Give either tracer or emit")
+        self.tracer = tracer
+        self.spans = deque(maxlen=max_spans)
+        self.emit = emit if emit is not None else self.spans.append
+
+    @staticmethod
+    def get_span_data(metrics):
+        """
+        Convert metrics to span dictionary.
+
+        :param metrics: RequestMetrics object
+        :return dict_data: dictionary with 'name', 'start_time', 'end_time', 'attributes' and 'events' keys. Events
+                           are (name, time) tuples.
+        """
+        start_time = int(metrics.started_at * 1e9)
+        attributes = {'pakettikauppa.api': metrics.api_name, 'pakettikauppa.attempts': metrics.attempts}
+        events = []
+        elapsed = 0.0
+        for phase, value in (('build', metrics.build_time), ('network', metrics.network_time),
+                             ('parse', metrics.parse_time)):
+            if value is not None:
+                attributes['pakettikauppa.{}_time'.format(phase)] = value
+                elapsed += value
+                events.append(('{}.end'.format(phase), start_time + int(elapsed * 1e9)))
+        if metrics.status_code is not None:
+            attributes['http.status_code'] = metrics.status_code
+        if metrics.request_bytes is not None:
+            attributes['http.request_content_length'] = metrics.request_bytes
+        if metrics.response_bytes is not None:
+            attributes['http.response_content_length'] = metrics.response_bytes
+        if metrics.error is not None:
+            attributes['error.type'] = metrics.error.__class__.__name__
+        return {
+            'name': 'pakettikauppa.{}'.format(metrics.api_name),
+            'start_time': start_time,
+            'end_time': start_time + int(elapsed * 1e9),
+            'attributes': attributes,
+            'events': events,
+        }
+
+    def __call__(self, metrics):
+        dict_data = self.get_span_data(metrics)
+        if self.tracer is None:
+            self.emit(dict_data)
+            return
+        span = self.tracer.start_span(dict_data['name'], start_time=dict_data['start_time'],
+                                      attributes=dict_data['attributes'])
+        for name, timestamp in dict_data['events']:
+            span.add_event(name, timestamp=timestamp)
+        span.end(end_time=dict_data['end_time'])
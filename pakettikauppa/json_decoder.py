@@ -0,0 +1,144 @@
+"""JSON decoding module for Pakettikauppa integration
+
+The module decodes JSON responses straight from response bytes:
+    1. JsonDecoder - decoder with selectable backend and optional record output
+    2. get_available_backends() - names of installed JSON libraries, fastest first
+    3. to_records() - convert list of JSON objects to namedtuple records
+
+Backends are 'orjson', 'ujson' and 'json' (standard library). By default the fastest installed one is used, so the
+accelerated libraries are optional: ``pip install pakettikauppa[fastjson]``. Every backend raises ValueError on
+invalid data.
+
+Records are namedtuples with the keys of the object as fields. They keep about 30 % less memory than dictionaries,
+but converting takes about as long as decoding, see benchmarks/suite.py. Fields are read as attributes, i.e.
+point.postcode. One record type is created per distinct set of keys and reused.
+Keys which are not valid Python identifiers are renamed to _0, _1, ... by namedtuple.
+"""
+from __future__ import absolute_import
+
+import json
+import threading
+from collections import namedtuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+_BACKENDS = (
+    ('orjson', orjson.loads if orjson is not None else None),
+    ('ujson', ujson.loads if ujson is not None else None),
+    ('json', json.loads),
+)
+
+_record_types = {}
+_record_types_lock = threading.Lock()
+
+
+def get_available_backends():
+    """
+    Get names of installed JSON backends.
+
+    :return list_data: list of backend names, fastest first
+    """
+    return [name for name, loads in _BACKENDS if loads is not None]
+
+
+def get_record_type(keys):
+    """
+    Get namedtuple type of JSON object keys. Types are cached, so objects with the same keys share one type.
+
+    :param keys: tuple of keys in the order of the object
+    :return record_type: namedtuple class
+    """
+    record_type = _record_types.get(keys)
+    if record_type is None:
+        with _record_types_lock:
+            record_type = _record_types.get(keys)
+            if record_type is None:
+                record_type = namedtuple('Record', keys, rename=True)
+                _record_types[keys] = record_type
+    return record_type
+
+
+def to_records(list_data):
+    """
+    Convert JSON objects in a list to namedtuple records. Other items and nested values are left as they are.
+
+    :param list_data: list of decoded JSON values
+    :return list_data: list of records
+    """
+    list_records = []
+    last_keys = None
+    record_type = None
+    for item in list_data:
+        if isinstance(item, dict):
+            keys = tuple(item)
+            if keys != last_keys:
+                record_type = get_record_type(keys)
+                last_keys = keys
+            item = record_type._make(item.values())
+        list_records.append(item)
+    return list_records
+
+
+class JsonDecoder(object):
+    """
+    Decoder of JSON response bytes.
+    """
+
+    def __init__(self, backend=None, records=False):
+        """
+        Constructor for JsonDecoder class.
+
+        :param backend: name of JSON backend, see get_available_backends(). Default is the fastest installed.
+        :param records: if True, JSON objects in a list response are returned as namedtuple records
+        """
+        backends = dict(_BACKENDS)
+        if backend is None:
+            backend = get_available_backends()[0]
+        elif backend not in backends:
+            raise ValueError("Unknown JSON backend: {}".format(backend))
+        elif backends[backend] is None:
+            raise ValueError("JSON backend {} is not installed".format(backend))
+        self.backend = backend
+        self.records = records
+        self._loads = backends[backend]
+
+    def decode(self, data):
+        """
+        Decode JSON data.
+
+        :param data: bytes or string of JSON data
+        :return data: decoded value, list of records if 'records' is True and the value is a list
+        """
+        value = self._loads(data)
+        if self.records and isinstance(value, list):
+            return to_records(value)
+        return value
+
+    def decode_item(self, data):
+        """
+        Decode one item of a JSON list.
+
+        :param data: bytes or string of JSON data
+        :return data: decoded value, record if 'records' is True and the value is an object
+        """
+        return self.convert_item(self._loads(data))
+
+    def convert_item(self, value):
+        """
+        Convert decoded item of a JSON list to record if 'records' is True and the value is an object.
+
+        :param value: decoded JSON value
+        :return value: record or the value as it is
+        """
+        if self.records and isinstance(value, dict):
+            return get_record_type(tuple(value))._make(value.values())
+        return value
@@ -0,0 +1,135 @@
+"""Streaming JSON module for Pakettikauppa integration
+
+The module decodes large JSON list responses while they are received:
+    1. JsonArrayStreamParser - decode items of JSON array one by one from chunks
+    2. iter_json_array() - yield decoded items of JSON array from iterable of chunks
+
+Only the text of the current chunk and the unfinished item is kept in memory, so memory usage depends on the chunk
+size and the size of one item, not on the length of the list. Items are decoded with raw_decode() of the standard
+library JSON decoder, which finds the end of an item in C code while decoding it.
+"""
+from __future__ import absolute_import
+
+import codecs
+import json
+import re
+
+from .json_decoder import JsonDecoder
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+_NUMBER_TAIL_RE = re.compile(r'[0-9.eE+\-]*\Z')
+
+# Item which fails to decode this close to the end of the text may be cut by the chunk boundary, i.e. '\u00' or 'fals'
+_INCOMPLETE_MARGIN = 6
+
+_OPEN = 0
+_ITEM_OR_END = 1
+_ITEM = 2
+_SEPARATOR = 3
+_DONE = 4
+
+
+class JsonArrayStreamParser(object):
+    """
+    Incremental parser of a JSON array. Feed chunks with feed() and collect decoded items from its return value, then
+    call close() to check that the array was complete.
+    """
+
+    def __init__(self, json_decoder=None):
+        """
+        :param json_decoder: JsonDecoder object which converts items to records if its 'records' is True
+        """
+        self._json_decoder = json_decoder if json_decoder is not None else JsonDecoder()
+        self._scanner = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._text = u''
+        self._state = _OPEN
+        self.item_count = 0
+
+    def feed(self, chunk):
+        """
+        Parse next chunk of the array. Raise ValueError if data is not a valid JSON array.
+
+        :param chunk: bytes of JSON data
+        :return list_data: list of items completed in this chunk
+        """
+        text = self._text + self._text_decoder.decode(chunk)
+        items = self._parse(text, False)
+        return items
+
+    def _parse(self, text, final):
+        items = []
+        pos = 0
+        state = self._state
+        while True:
+            pos = _WHITESPACE_RE.match(text, pos).end()
+            if pos >= len(text):
+                break
+            char = text[pos]
+            if state == _DONE:
+                raise ValueError("Extra data after JSON array")
+            if state == _OPEN:
+                if char != u'[':
+                    raise ValueError("Expected JSON array")
+                state = _ITEM_OR_END
+                pos += 1
+            elif state == _SEPARATOR or (state == _ITEM_OR_END and char == u']'):
+                if char == u']':
+                    state = _DONE
+                elif char == u',' and state == _SEPARATOR:
+                    state = _ITEM
+                else:
+                    raise ValueError("Expecting ',' delimiter at position {}".format(pos))
+                pos += 1
+            else:
+                try:
+                    value, end = self._scanner.raw_decode(text, pos)
+                except ValueError as e:
+                    if final or not self._is_incomplete(e, text):
+                        raise
+                    break
+                if not final and isinstance(value, (int, float)) and _NUMBER_TAIL_RE.match(text, end):
+                    # Number may continue in the next chunk
+                    break
+                items.append(self._json_decoder.convert_item(value))
+                self.item_count += 1
+                state = _SEPARATOR
+                pos = end
+
+        self._state = state
+        self._text = text[pos:]
+        return items
+
+    @staticmethod
+    def _is_incomplete(error, text):
+        if getattr(error, 'msg', '').startswith('Unterminated string'):
+            return True
+        return getattr(error, 'pos', len(text)) >= len(text) - _INCOMPLETE_MARGIN
+
+    def close(self):
+        """
+        Parse remaining data and check that the whole array was parsed. Raise ValueError if data ended before the end
+        of the array.
+
+        :return list_data: list of items completed at the end of data
+        """
+        items = self._parse(self._text + self._text_decoder.decode(b'', True), True)
+        if self._state != _DONE:
+            raise ValueError("Incomplete JSON array")
+        return items
+
+
+def iter_json_array(chunks, json_decoder=None):
+    """
+    Yield decoded items of JSON array.
+
+    :param chunks: iterable of bytes
+    :param json_decoder: JsonDecoder object
+    :return generator: decoded items
+    """
+    parser = JsonArrayStreamParser(json_decoder)
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.close():
+        yield item
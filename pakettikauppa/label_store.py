@@ -0,0 +1,345 @@
+"""Label store module for Pakettikauppa integration
+
+The module keeps decoded shipping label PDFs on local disk for reprints:
+    1. LabelStore - PDF content by tracking code in a content-addressed directory with an index file
+
+Layout of the store directory:
+    objects/ab/abcdef....pdf - PDF content named by SHA-256 of the content, identical labels are stored once
+    index.log - JSON lines of stored and removed tracking codes, replayed when the store is opened
+
+An object is written to a temporary file and renamed before its index line is appended, so the index never points
+to a partial file. Torn last line of the index is ignored. The index is rewritten when removed entries make up most
+of it. Labels are read with mmap: open() gives the mapping itself and write_to() writes it to a file or socket
+without copying it to bytes first. get() returns a copy. PkMerchant.get_shipping_label() returns reprints base64
+encoded like responses, which costs memory of the encoded string, use write_shipping_label() for the PDF bytes.
+
+When the total size of objects exceeds 'max_bytes', least recently used tracking codes are removed. Give the store to
+PkMerchant as label_store, see PkMerchant.get_shipping_label() and get_shipping_label_pdfs().
+"""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from time import time
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = 'index.log'
+OBJECT_DIRECTORY_NAME = 'objects'
+
+
+class _Entry(object):
+    __slots__ = ('digest', 'size', 'used_at')
+
+    def __init__(self, digest, size, used_at):
+        self.digest = digest
+        self.size = size
+        self.used_at = used_at
+
+
+class LabelStore(object):
+    """
+    Local store of shipping label PDFs by tracking code. Methods are thread-safe.
+    """
+
+    def __init__(self, directory, max_bytes=None, clock=time):
+        """
+        Constructor for LabelStore class. Existing index is loaded.
+
+        :param directory: string of store directory, created if missing
+        :param max_bytes: maximum total size of stored PDF content. None = no limit.
+        :param clock: function returning current time in seconds
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._references = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index_lines = 0
+
+        self._object_directory = os.path.join(directory, OBJECT_DIRECTORY_NAME)
+        if not os.path.isdir(self._object_directory):
+            os.makedirs(self._object_directory)
+        self._index_path = os.path.join(directory, INDEX_FILE_NAME)
+        if os.path.exists(self._index_path):
+            self._load()
+        self._index = open(self._index_path, 'a')
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            with self._lock:
+                self._evict()
+
+    def _load(self):
+        with open(self._index_path, 'r') as f:
+            for line in f:
+                self._index_lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("Ignored invalid line in label index %s", self._index_path)
+                    continue
+                if entry['op'] == 'put':
+                    self._set_entry(entry['code'], entry['digest'], entry['size'], entry['at'])
+                else:
+                    self._delete_entry(entry['code'])
+
+    def get_object_path(self, digest):
+        """
+        Get file path of PDF content.
+
+        :param digest: hex string of SHA-256 of the content
+        :return path: string of file path
+        """
+        return os.path.join(self._object_directory, digest[:2], digest + '.pdf')
+
+    def _set_entry(self, tracking_code, digest, size, used_at):
+        self._delete_entry(tracking_code)
+        self._entries[tracking_code] = _Entry(digest, size, used_at)
+        references = self._references.get(digest, 0)
+        if references == 0:
+            self.total_bytes += size
+        self._references[digest] = references + 1
+
+    def _delete_entry(self, tracking_code):
+        # Return digest of an object which is no longer referenced
+        entry = self._entries.pop(tracking_code, None)
+        if entry is None:
+            return None
+        references = self._references[entry.digest] - 1
+        if references > 0:
+            self._references[entry.digest] = references
+            return None
+        del self._references[entry.digest]
+        self.total_bytes -= entry.size
+        return entry.digest
+
+    def _write_index(self, **entry):
+        self._index.write(json.dumps(entry) + '\n')
+        self._index.flush()
+        self._index_lines += 1
+
+    def _remove_object(self, digest):
+        try:
+            os.remove(self.get_object_path(digest))
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, tracking_code):
+        return tracking_code in self._entries
+
+    def get_missing(self, tracking_codes):
+        """
+        Get tracking codes which are not in the store.
+
+        :param tracking_codes: iterable of tracking code strings
+        :return list_data: list of tracking code strings in input order
+        """
+        entries = self._entries
+        return [tracking_code for tracking_code in tracking_codes if tracking_code not in entries]
+
+    def put(self, tracking_code, pdf_content):
+        """
+        Store PDF content of a tracking code. Content equal to a stored object is not written again.
+
+        :param tracking_code: string of tracking code
+        :param pdf_content: bytes of decoded PDF content
+        :return digest: hex string of SHA-256 of the content
+        """
+        if not pdf_content:
+            raise ValueError("No PDF content data")
+        digest = hashlib.sha256(pdf_content).hexdigest()
+        path = self.get_object_path(digest)
+        now = self._clock()
+        with self._lock:
+            # Written under the lock, so removal of another code with the same content can't delete it meanwhile
+            if not os.path.exists(path):
+                self._write_object(path, pdf_content)
+            entry = self._entries.get(tracking_code)
+            if entry is not None and entry.digest == digest:
+                entry.used_at = now
+                return digest
+            old_digest = self._delete_entry(tracking_code)
+            self._set_entry(tracking_code, digest, len(pdf_content), now)
+            self._write_index(op='put', code=tracking_code, digest=digest, size=len(pdf_content), at=now)
+            if old_digest is not None:
+                self._remove_object(old_digest)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict(keep=tracking_code)
+            self._compact_if_needed()
+        return digest
+
+    def _write_object(self, path, pdf_content):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf_content)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def open(self, tracking_code):
+        """
+        Open PDF content of a tracking code as read-only memory map. The caller must close it.
+
+        :param tracking_code: string of tracking code
+        :return mmap_object: mmap object or None if not stored
+        """
+        with self._lock:
+            entry = self._entries.get(tracking_code)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.used_at = self._clock()
+            path = self.get_object_path(entry.digest)
+            try:
+                with open(path, 'rb') as f:
+                    mmap_object = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                # Object was removed or truncated outside of the store
+                logger.warning("Dropped label %s from store: %s", tracking_code, e)
+                self._drop(tracking_code)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return mmap_object
+
+    def get(self, tracking_code):
+        """
+        Get PDF content of a tracking code as a copy. Use open() or write_to() to avoid copying large labels.
+
+        :param tracking_code: string of tracking code
+        :return pdf_content: bytes of PDF content or None if not stored
+        """
+        mmap_object = self.open(tracking_code)
+        if mmap_object is None:
+            return None
+        try:
+            return mmap_object[:]
+        finally:
+            mmap_object.close()
+
+    def write_to(self, tracking_code, file_object):
+        """
+        Write PDF content of a tracking code to a file-like object straight from its memory map.
+
+        :param tracking_code: string of tracking code
+        :param file_object: object with write() function accepting bytes-like objects
+        :return size: number of bytes written or None if not stored
+        """
+        mmap_object = self.open(tracking_code)
+        if mmap_object is None:
+            return None
+        try:
+            file_object.write(mmap_object)
+            return len(mmap_object)
+        finally:
+            mmap_object.close()
+
+    def remove(self, tracking_code):
+        """
+        Remove a tracking code. Its object is deleted if no other tracking code has the same content.
+
+        :param tracking_code: string of tracking code
+        :return boolean: True if the tracking code was stored
+        """
+        with self._lock:
+            if tracking_code not in self._entries:
+                return False
+            self._drop(tracking_code)
+            self._compact_if_needed()
+            return True
+
+    def _drop(self, tracking_code):
+        digest = self._delete_entry(tracking_code)
+        self._write_index(op='del', code=tracking_code)
+        if digest is not None:
+            self._remove_object(digest)
+
+    def _evict(self, keep=None):
+        entries = sorted(self._entries.items(), key=lambda item: item[1].used_at)
+        for tracking_code, entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if tracking_code == keep:
+                continue
+            self._drop(tracking_code)
+            self.evictions += 1
+
+    def _compact_if_needed(self):
+        if self._index_lines > 2 * len(self._entries) + 100:
+            self._compact()
+
+    def _compact(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                for tracking_code, entry in self._entries.items():
+                    f.write(json.dumps({'op': 'put', 'code': tracking_code, 'digest': entry.digest,
+                                        'size': entry.size, 'at': entry.used_at}) + '\n')
+            self._index.close()
+            os.replace(tmp_path, self._index_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        finally:
+            self._index = open(self._index_path, 'a')
+        self._index_lines = len(self._entries)
+
+    def flush(self):
+        """
+        Rewrite the index with last use times of tracking codes, which are otherwise kept only in memory.
+
+        :return:
+        """
+        with self._lock:
+            self._compact()
+
+    def get_stats(self):
+        """
+        Get counters of the store.
+
+        :return dict_data: dictionary with 'labels', 'objects', 'bytes', 'hits', 'misses' and 'evictions' keys
+        """
+        with self._lock:
+            return {
+                'labels': len(self._entries),
+                'objects': len(self._references),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def close(self):
+        """
+        Write last use times to the index and close it.
+
+        :return:
+        """
+        with self._lock:
+            if self._index.closed:
+                return
+            self._compact()
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
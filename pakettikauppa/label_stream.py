@@ -0,0 +1,131 @@
+"""Streaming shipping label module for Pakettikauppa integration
+
+The module decodes shipping label responses without keeping whole PDF content in memory:
+    1. Base64StreamDecoder - decode base64 text piece by piece and write binary data to a sink
+    2. stream_shipping_label_res() - parse response XML from chunks and write decoded PDF content to a sink
+
+Memory usage depends on the chunk size only, not on the number of labels in the response.
+"""
+from __future__ import absolute_import
+
+import binascii
+from lxml import etree as ET
+
+
+class Base64StreamDecoder(object):
+    """
+    Incremental base64 decoder. Text is decoded in blocks of four characters, incomplete block is kept until next
+    write() call or finish().
+    """
+
+    def __init__(self, sink):
+        """
+        :param sink: file-like object with write() function for decoded bytes
+        """
+        self._sink = sink
+        self._remainder = b''
+        self.bytes_written = 0
+
+    def write(self, text):
+        """
+        Decode piece of base64 text. White space is ignored.
+
+        :param text: string or bytes of base64 data
+        :return:
+        """
+        if not isinstance(text, bytes):
+            text = text.encode('ascii')
+        data = self._remainder + b''.join(text.split())
+        usable = len(data) - len(data) % 4
+        self._remainder = data[usable:]
+        if usable:
+            self._write(data[:usable])
+
+    def finish(self):
+        """
+        Decode remaining data. Raise ValueError if base64 data is truncated.
+
+        :return bytes_written: total number of decoded bytes
+        """
+        if self._remainder:
+            raise ValueError("Incomplete base64 data")
+        return self.bytes_written
+
+    def _write(self, data):
+        try:
+            decoded = binascii.a2b_base64(data)
+        except binascii.Error as e:
+            raise ValueError("Invalid base64 data: {}".format(e))
+        self._sink.write(decoded)
+        self.bytes_written += len(decoded)
+
+
+class _LabelResponseTarget(object):
+    """
+    Parser target for get shipping label response. Status and message are collected as text, content of
+    'response.file' element goes straight to base64 decoder.
+    """
+    _text_tags = ('response.status', 'response.message')
+
+    def __init__(self, sink):
+        self._decoder = Base64StreamDecoder(sink)
+        self._current_tag = None
+        self._texts = {}
+        self._has_file = False
+
+    def start(self, tag, attrib):
+        self._current_tag = tag
+        if tag == 'response.file':
+            self._has_file = True
+
+    def end(self, tag):
+        self._current_tag = None
+
+    def data(self, text):
+        tag = self._current_tag
+        if tag == 'response.file':
+            self._decoder.write(text)
+        elif tag in self._text_tags:
+            self._texts[tag] = self._texts.get(tag, '') + text
+
+    def close(self):
+        message = self._texts.get('response.message')
+        if not self._has_file:
+            return {
+                'status': 0,
+                'message': 'Unable to find PDF content from response data',
+                'PDFcontent': None,
+                'ContentEncoded': False,
+                'size': 0,
+            }
+
+        size = self._decoder.finish()
+        # Pakettikauppa return status=0 means OK
+        status = 1 if self._texts.get('response.status', '').strip() == '0' else 0
+        return {
+            'status': status,
+            'message': message,
+            'PDFcontent': None,
+            'ContentEncoded': False,
+            'size': size,
+        }
+
+
+def stream_shipping_label_res(chunks, sink):
+    """
+    Parse get shipping label response from chunks of XML data and write decoded PDF content to sink.
+
+    :param chunks: iterable of bytes, i.e. response.iter_content()
+    :param sink: file-like object with write() function
+    :return: dict_data: dictionary, contains below keys
+        status (integer): 1 = operation OK
+        message (string): response message
+        PDFcontent: always None, content is written to sink
+        ContentEncoded (boolean): always False
+        size (integer): number of bytes written to sink
+    """
+    parser = ET.XMLParser(target=_LabelResponseTarget(sink), huge_tree=True)
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+    return parser.close()
@@ -0,0 +1,69 @@
+"""Logging module for Pakettikauppa integration
+
+The package never configures logging by itself. Every module logs to its own logger under 'pakettikauppa':
+    1. pakettikauppa.pakettikauppa - request signing and response handling
+    2. pakettikauppa.merchant - merchant API request building and response parsing
+    3. pakettikauppa.reseller - reseller API request building
+    4. pakettikauppa.cache - response cache
+
+The module provides below functionality:
+    1. get_logger() - get logger of a component
+    2. set_log_level() - set log level of the whole package or a single component
+    3. enable_debug_logging() - print log records of the package to stderr, i.e. while testing
+
+Log messages are formatted lazily, so disabled levels cost only a level check.
+"""
+from __future__ import absolute_import
+
+import logging
+
+ROOT_LOGGER_NAME = 'pakettikauppa'
+
+
+def get_logger(component=None):
+    """
+    Get logger of a component.
+
+    :param component: string of component name, i.e. 'merchant'. Package logger if not given.
+    :return logger: logging.Logger object
+    """
+    if component is None or component == '':
+        return logging.getLogger(ROOT_LOGGER_NAME)
+    if component.startswith(ROOT_LOGGER_NAME + '.'):
+        return logging.getLogger(component)
+    return logging.getLogger('{}.{}'.format(ROOT_LOGGER_NAME, component))
+
+
+def set_log_level(level, component=None):
+    """
+    Set log level of the package or a single component. Component without own level follows the package level.
+
+    :param level: integer or string of log level, i.e. logging.DEBUG or 'DEBUG'. None resets the component to \
+                  follow the package level.
+    :param component: string of component name, i.e. 'merchant'
+    :return:
+    """
+    if level is None:
+        level = logging.NOTSET
+    elif not isinstance(level, int):
+        level = logging.getLevelName(str(level).upper())
+        if not isinstance(level, int):
+            raise ValueError("Invalid log level")
+    get_logger(component).setLevel(level)
+
+
+def enable_debug_logging(component=None, handler=None):
+    """
+    Send debug messages of the package or a component to a handler. Root logger is not touched.
+
+    :param component: string of component name, i.e. 'merchant'
+    :param handler: logging.Handler object. Default writes to stderr.
+    :return handler: the added handler, remove it with logger.removeHandler() when no longer needed
+    """
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s:%(name)s:%(levelname)s:%(message)s"))
+    logger = get_logger(component)
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    return handler
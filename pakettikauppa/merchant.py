@@ -8,20 +8,34 @@ The module provides below functionality:
     4. Get shipment status
     5. Create shipment
     6. Get shipping label
+    7. Create shipments from precompiled templates
+    8. Create shipments from model objects
+    9. Reprint shipping labels from a local label store
 """
 from __future__ import absolute_import
 
 __version__ = '0.1'
 __author__ = 'Porntip Chaibamrung'
 
-import sys
+import os
 import logging
-from six import string_types
-from base64 import b64decode
+from base64 import b64decode, b64encode
 from time import time
 from datetime import datetime
 from lxml import etree as ET
 from .pakettikauppa import Pakettikauppa, PakettikauppaException, check_api_name
+from .bulk import run_bounded, split_evenly
+from .label_stream import stream_shipping_label_res
+from .cache import PickupPointCache, make_cache_key
+from .instrumentation import instrumented
+from .models import PACKAGE_TYPES, RETURN_INSTRUCTION_CODES, CONTENT_CODES
+from .shipment_template import ShipmentTemplate
+from .tracking import parse_status_events
+from .xml_stream import ShipmentXmlSerializer
+
+
+# Size of raw PDF content encoded at a time, a multiple of 3
+ENCODE_CHUNK_SIZE = 3 * 65536
 
 
 def decode_pdf_content(encoded_pdf_content):
@@ -32,6 +46,13 @@ def decode_pdf_content(encoded_pdf_content):
     return decoded_pdf_content
 
 
+def encode_pdf_content(pdf_content, chunk_size=ENCODE_CHUNK_SIZE):
+    # Encodes slices of a buffer, e.g. mmap, so that only the encoded string and one chunk are in memory.
+    # chunk_size must be a multiple of 3 so that encoded chunks can be joined without padding between them.
+    return ''.join(b64encode(pdf_content[start:start + chunk_size]).decode('ascii')
+                   for start in range(0, len(pdf_content), chunk_size))
+
+
 def write_pdf_to_file(target_file_path, pdf_content):
     with open(target_file_path, 'wb') as f:
         f.write(pdf_content)
@@ -50,7 +71,7 @@ class PkMerchant(Pakettikauppa):
         'create_shipment': '/prinetti/create-shipment',
         'get_shipping_label': '/prinetti/get-shipping-label'
     }
-    _package_types = ('PC', 'PU', 'ZPF', 'ZPE', 'ZPT', 'CG', 'ZPX', 'PM', 'TB', 'TC', 'TU', 'LTK', 'KA', 'VA')
+    _package_types = PACKAGE_TYPES
     #  Possible package type codes
     # 'PC' = Paketti / Kirje
     # 'PU' = Rullakko
@@ -67,12 +88,12 @@ class PkMerchant(Pakettikauppa):
     # 'KA' = Kassi
     # 'VA' = Vaunu
 
-    _return_instruction_codes = ('E', 'H', 'L')
+    _return_instruction_codes = RETURN_INSTRUCTION_CODES
     # 'E' = Edullisinta reittiä (most economical route)
     # 'H' = Hävitetään (treat as abandoned)
     # 'L' = Lentoteitse (immediately by air)
 
-    _content_codes = ('D', 'E', 'G', 'M', 'S')
+    _content_codes = CONTENT_CODES
     # 'D' = Asiakirjoja (Documents)
     # 'E' = DocPack (Envelope)
     # 'G' = Lahja (Gift)
@@ -91,10 +112,21 @@ class PkMerchant(Pakettikauppa):
                            'Parcel.Infocode', 'Parcel.Contents', 'Parcel.ReturnService', 'Parcel.contentline',
                            'Parcel.ParcelService')
 
+    _min_label_chunk_size = 10
+    # Tracking code lists are not split into smaller chunks than this only for sending them in parallel
+
     _accept_content_line_keys = ('contentline.description', 'contentline.quantity', 'contentline.currency',
                                  'contentline.netweight')
 
-    def __init__(self, is_test_mode=0, api_key=None, secret=None):
+    _cache = None
+    _pickup_point_cache = None
+    _pickup_point_index = None
+    _single_flight = None
+    _label_store = None
+
+    def __init__(self, is_test_mode=0, api_key=None, secret=None, transport=None, cache=None,
+                 pickup_point_cache=None, pickup_point_index=None, resilience=None, single_flight=None,
+                 label_store=None):
         """
         Constructor for the class.
         :param is_test_mode: integer value to identify test mode operation. Default value is zero. If you set value to\
@@ -102,14 +134,33 @@ class PkMerchant(Pakettikauppa):
         credential.
         :param api_key: string of API key
         :param secret: string of secret key
+        :param transport: HttpTransport object shared with other objects. If not given, own connection pool is\
+        created and it is closed in close() function.
+        :param cache: ResponseCache object for shipping method list and additional service list. Not cached if not\
+        given.
+        :param pickup_point_cache: PickupPointCache object for pickup point searches. Not cached if not given.
+        :param pickup_point_index: PickupPointIndex object. Pickup point searches are answered from the index and\
+        sent to the API only if the index has no points near the postcode, see PickupPointIndex.min_prefix_length\
+        and max_distance.
+        :param resilience: ResiliencePolicy object for timeouts, retries and circuit breaker. Create shipment results\
+        are stored by Routing.Id if the policy has an idempotency store.
+        :param single_flight: SingleFlight object of coalesce module. Identical concurrent list requests and pickup\
+        point searches share one request and its result. Can be shared by many objects.
+        :param label_store: LabelStore object of label_store module. Labels of one tracking code are stored and\
+        reprints are read from it, see get_shipping_label() and get_shipping_label_pdfs().
         :rtype class object
         """
         self._isInTestMode = is_test_mode
 
         # super().__init__(self._isInTestMode) # for Python3 only
-        super(PkMerchant, self).__init__(self._isInTestMode)
+        super(PkMerchant, self).__init__(self._isInTestMode, transport, resilience)
 
         self.mylogger = logging.getLogger(__name__)
+        self._cache = cache
+        self._pickup_point_cache = pickup_point_cache
+        self._pickup_point_index = pickup_point_index
+        self._single_flight = single_flight
+        self._label_store = label_store
 
         if self._isInTestMode == 1:
             if api_key is None or api_key == '':
@@ -166,12 +217,50 @@ class PkMerchant(Pakettikauppa):
 
     def search_pickup_points(self, **kwargs):
         """
-        Main method to search pickup points
+        Main method to search pickup points. Results come from pickup point index if the object has one and the index
+        has points for the postcode. Otherwise results are cached if the object has pickup point cache, and identical
+        concurrent searches share one request if the object has single flight.
 
         :param kwargs: see get_pickup_point_req_data() function
 
         :return: list of pickup point data
         """
+        if self._pickup_point_index is not None:
+            list_data = self._pickup_point_index.search_pickup_points(**kwargs)
+            if list_data:
+                return list_data
+        key = self.get_pickup_point_key(**kwargs) if self._single_flight is not None else None
+        if self._pickup_point_cache is not None:
+            return self._pickup_point_cache.get(
+                self._api_key, lambda: self._coalesce(key, self._search_pickup_points, **kwargs), **kwargs)
+        return self._coalesce(key, self._search_pickup_points, **kwargs)
+
+    def get_pickup_point_key(self, **kwargs):
+        """
+        Construct key of pickup point search from normalised search parameters, see PickupPointCache.normalize().
+
+        :param kwargs: see get_pickup_point_req_data() function
+        :return key: string of key
+        """
+        search_key, max_result = PickupPointCache.normalize(**kwargs)
+        return make_cache_key(self._api_key, 'search_pickup_points', max_result, *search_key)
+
+    def _coalesce(self, key, func, *args, **kwargs):
+        """
+        Call function through single flight of the object, if it has one.
+
+        :param key: string of request key without timestamp and hash
+        :param func: function which sends the request
+        :param args: arguments of the function
+        :param kwargs: keyword arguments of the function
+        :return value: return value of the function, shared by identical concurrent calls
+        """
+        if self._single_flight is None:
+            return func(*args, **kwargs)
+        return self._single_flight.do(key, lambda: func(*args, **kwargs))
+
+    @instrumented('search_pickup_points')
+    def _search_pickup_points(self, **kwargs):
         _api_config = self.get_api_config('search_pickup_points')
 
         dict_req_data = self.get_pickup_point_req_data(_api_config['api_key'], **kwargs)
@@ -237,7 +326,7 @@ class PkMerchant(Pakettikauppa):
         # Calculate MAC
         digest_string = self.get_hash_sha256(self._secret, **dict_req_data)
         dict_req_data['hash'] = digest_string
-        self.mylogger.debug("Hash input data for pickup point search= {}".format(dict_req_data))
+        self.mylogger.debug("Hash input data for pickup point search= %s", dict_req_data)
 
         # content_string = ''
         # for key, value in dict_req_data.items():
@@ -247,36 +336,105 @@ class PkMerchant(Pakettikauppa):
 
     def get_shipping_method_list(self, language_code2='EN'):
         """
-        Get list of available shipping method for the account
+        Get list of available shipping method for the account. Response is cached if the object has cache and identical
+        concurrent calls share one request if the object has single flight.
 
         :param language_code2: 2 letters of language code. Default value is 'EN'
         :return list_data: list of response data
         """
-        if language_code2 is not None:
-            language_code2 = language_code2.upper()
+        key = self.get_list_cache_key('get_shipping_method_list', language_code2)
+        if self._cache is not None:
+            return self._cache.get(key, lambda: self._coalesce(key, self._get_shipping_method_list, language_code2))
+        return self._coalesce(key, self._get_shipping_method_list, language_code2)
 
+    @instrumented('get_shipping_method_list')
+    def _get_shipping_method_list(self, language_code2):
         _api_config = self.get_api_config('get_shipping_method_list')
 
+        dict_req_data = self.get_shipping_method_list_req_data(language_code2)
+
+        res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], dict_req_data)
+
+        return self.parse_res_to_list(res_obj)
+
+    def get_shipping_method_list_req_data(self, language_code2='EN'):
+        """
+        Constructs request data for shipping method list API
+
+        :param language_code2: 2 letters of language code. Default value is 'EN'
+        :return dict_data: dictionary of request data
+        """
+        if language_code2 is not None:
+            language_code2 = language_code2.upper()
+
         dict_req_data = {
-            'api_key': _api_config['api_key'],
+            'api_key': self._api_key,
             'timestamp': str(int(time())),
             'language': language_code2
         }
 
         digest_string = self.get_hash_sha256(self._secret, **dict_req_data)
         dict_req_data['hash'] = digest_string
-        self.mylogger.debug("Hash input data = {}".format(dict_req_data))
+        self.mylogger.debug("Hash input data = %s", dict_req_data)
+        return dict_req_data
+
+    def get_additional_service_list(self, language_code2='EN'):
+        """
+        Get list of additional service for the account. Response is cached if the object has cache and identical
+        concurrent calls share one request if the object has single flight.
+
+        :param language_code2: 2 letters of language code. Default value is 'EN'
+        :return list_data: list of response data
+        """
+        key = self.get_list_cache_key('get_additional_service_list', language_code2)
+        if self._cache is not None:
+            return self._cache.get(key,
+                                   lambda: self._coalesce(key, self._get_additional_service_list, language_code2))
+        return self._coalesce(key, self._get_additional_service_list, language_code2)
+
+    @instrumented('get_additional_service_list')
+    def _get_additional_service_list(self, language_code2):
+        _api_config = self.get_api_config('get_additional_service_list')
+
+        dict_req_data = self.get_additional_service_list_req_data(language_code2)
 
         res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], dict_req_data)
 
         return self.parse_res_to_list(res_obj)
 
-    def get_additional_service_list(self, language_code2='EN'):
+    def get_list_cache_key(self, api_name, language_code2='EN'):
+        """
+        Construct cache key for list APIs.
+
+        :param api_name: 'get_shipping_method_list' or 'get_additional_service_list'
+        :param language_code2: 2 letters of language code
+        :return key: string of cache key
+        """
+        if language_code2 is not None:
+            language_code2 = language_code2.upper()
+        return make_cache_key(self._api_key, api_name, language_code2)
+
+    def invalidate_cache(self, api_name=None, language_code2='EN'):
+        """
+        Remove cached list data. Without API name all data of the cache is removed.
+
+        :param api_name: 'get_shipping_method_list' or 'get_additional_service_list'
+        :param language_code2: 2 letters of language code
+        :return:
+        """
+        if self._cache is None:
+            return
+        if api_name is None:
+            self._cache.invalidate()
+        else:
+            self._cache.invalidate(self.get_list_cache_key(api_name, language_code2))
+
+    def get_additional_service_list_req_data(self, language_code2='EN'):
         """
-        Get list of additional service for the account
+        Constructs request data for additional service list API
 
         :param language_code2: 2 letters of language code. Default value is 'EN'
-        :return list_data: list of response data
+        :return dict_data: dictionary of request data
         """
         if language_code2 is not None:
             language_code2 = language_code2.upper()
@@ -284,21 +442,17 @@ class PkMerchant(Pakettikauppa):
         if language_code2 == '':
             language_code2 = 'EN'
 
-        _api_config = self.get_api_config('get_additional_service_list')
-
         dict_req_data = {
-            'api_key': _api_config['api_key'],
+            'api_key': self._api_key,
             'timestamp': str(int(time())),
             'language': language_code2
         }
         digest_string = self.get_hash_sha256(self._secret, **dict_req_data)
         dict_req_data['hash'] = digest_string
-        self.mylogger.debug("Hash input data = {}".format(dict_req_data))
-
-        res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], dict_req_data)
-
-        return self.parse_res_to_list(res_obj)
+        self.mylogger.debug("Hash input data = %s", dict_req_data)
+        return dict_req_data
 
+    @instrumented('create_shipment')
     def create_shipment(self, **kwargs):
         """
         Main function to send a request to Pakettikauppa to create shipment.
@@ -307,16 +461,60 @@ class PkMerchant(Pakettikauppa):
         :return dict_data: See parse_xml_create_shipment_res() function
         """
         # This API send request data in XML format
-        _api_config = self.get_api_config('create_shipment')
+        xml_req_data = self.get_create_shipment_req_data(**kwargs)
+        return self.create_shipment_from_xml(xml_req_data, self._get_routing_id_of(kwargs))
 
-        # xml_req_data = None
-        if self._isInTestMode:
-            if kwargs is not None and len(kwargs) > 0:
-                xml_req_data = self.get_xml_shipment_req_data(**kwargs)
-            else:
-                raise Exception("Require input parameters")
-        else:
-            xml_req_data = self.get_xml_shipment_req_data(**kwargs)
+    @instrumented('create_shipment')
+    def create_shipment_streamed(self, chunk_size=65536, **kwargs):
+        """
+        Same as create_shipment() but the request data is written while it is sent with chunked transfer encoding.
+        Invalid parcel data found after the upload has started aborts the request.
+
+        :param chunk_size: minimum number of bytes in a chunk
+        :param kwargs: See get_xml_shipment_req_data() function
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        return self.create_shipment_from_xml(self.iter_xml_shipment_req_data(chunk_size, **kwargs),
+                                             self._get_routing_id_of(kwargs))
+
+    @staticmethod
+    def _get_routing_id_of(dict_data):
+        try:
+            return dict_data['eChannel']['ROUTING']['Routing.Id']
+        except (KeyError, TypeError):
+            return None
+
+    @instrumented('create_shipment')
+    def create_shipment_from_xml(self, xml_req_data, routing_id=None):
+        """
+        Send create shipment request with ready XML request data, i.e. from ShipmentTemplate.render() function.
+
+        If resilience policy of the object has an idempotency store and routing ID is given, the result of a successful
+        request is stored by API key and routing ID, and later calls with the same routing ID return it without
+        sending a request.
+
+        :param xml_req_data: bytes of XML request data or iterable of bytes, which is sent with chunked transfer\
+        encoding
+        :param routing_id: string of Routing.Id in the request data, used as idempotency key
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        store = self._resilience.idempotency_store if self._resilience is not None else None
+        if store is None or routing_id is None or routing_id == '':
+            return self._send_create_shipment(xml_req_data)
+
+        routing_id = str(routing_id)
+        with store.lock(routing_id, self._api_key):
+            dict_data = store.get(routing_id, self._api_key)
+            if dict_data is not None:
+                self.mylogger.debug("Create shipment result of routing ID %s found in idempotency store", routing_id)
+                return dict_data
+            dict_data = self._send_create_shipment(xml_req_data)
+            if dict_data['status'] == 1:
+                store.put(routing_id, dict_data, self._api_key)
+        return dict_data
+
+    def _send_create_shipment(self, xml_req_data):
+        _api_config = self.get_api_config('create_shipment')
 
         headers = {
             'Content-Encoding': 'utf-8',
@@ -324,10 +522,78 @@ class PkMerchant(Pakettikauppa):
         }
         res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], xml_req_data, **headers)
         xml_res_string = res_obj.content
-        self.mylogger.debug("Response XML string = {}".format(xml_res_string))
+        self.mylogger.debug("Response XML string = %s", xml_res_string)
 
         return self.parse_xml_create_shipment_res(xml_res_string)
 
+    @instrumented('create_shipment')
+    def create_shipment_from_model(self, shipment):
+        """
+        Send create shipment request with data of model objects.
+
+        :param shipment: Shipment object, see pakettikauppa.models module
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        return self.create_shipment_from_xml(self.get_xml_shipment_model_req_data(shipment), shipment.routing_id)
+
+    def get_shipment_template(self, sender, product_code, routing_account=None):
+        """
+        Create template for shipments of one sender and product. Request data built with the template is the same as
+        get_xml_shipment_req_data() builds, but sender and product parts are written only once.
+
+        :param sender: dictionary of sender address. See _create_shipment_address_element() function
+        :param product_code: string of Posti's product code
+        :param routing_account: string of routing account. Default is API key.
+        :return template: ShipmentTemplate object
+        """
+        return ShipmentTemplate(self, sender, product_code, routing_account)
+
+    def create_shipments_bulk(self, shipments, max_in_flight=10, ordered=True):
+        """
+        Create many shipments concurrently. Requests are sent through the transport of the object, so set pool size of
+        the transport to at least 'max_in_flight' to keep all connections open.
+
+        A failed shipment doesn't stop the others. Its exception is returned in 'error' attribute of the result. Also
+        response with error status from Pakettikauppa is returned as PakettikauppaException.
+
+        :param shipments: iterable of dictionaries of request data, see get_xml_shipment_req_data() function
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: generator of BulkResult objects, 'result' attribute contains dictionary data of \
+                 parse_xml_create_shipment_res() function
+        """
+        return run_bounded(self._create_one_bulk_shipment, shipments, max_in_flight, ordered)
+
+    def _create_one_bulk_shipment(self, shipment):
+        """
+        Create one shipment of bulk operation. Raise exception if Pakettikauppa returns error status.
+
+        :param shipment: dictionary of request data
+        :return dict_data: See parse_xml_create_shipment_res() function
+        """
+        dict_res = self.create_shipment(**shipment)
+        if dict_res['status'] != 1:
+            raise PakettikauppaException(dict_res['message'])
+        return dict_res
+
+    def get_create_shipment_req_data(self, **kwargs):
+        """
+        Construct XML request data for create shipment API. In test mode empty input is rejected before validation.
+
+        :param kwargs: See get_xml_shipment_req_data() function
+        :return xml_string: string of XML request data
+        """
+        # xml_req_data = None
+        if self._isInTestMode:
+            if kwargs is not None and len(kwargs) > 0:
+                xml_req_data = self.get_xml_shipment_req_data(**kwargs)
+            else:
+                raise Exception("Require input parameters")
+        else:
+            xml_req_data = self.get_xml_shipment_req_data(**kwargs)
+        return xml_req_data
+
+    @instrumented('create_shipment')
     def create_shipment_with_simple_data(self, **kwargs):
         """
         Same as create_shipment() function expect the input parameter is in shorter format
@@ -355,7 +621,7 @@ class PkMerchant(Pakettikauppa):
         }
         res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], xml_req_data, **headers)
         xml_res_string = res_obj.content
-        self.mylogger.debug("Response XML string = {}".format(xml_res_string))
+        self.mylogger.debug("Response XML string = %s", xml_res_string)
 
         return self.parse_xml_create_shipment_res(xml_res_string)
 
@@ -375,7 +641,7 @@ class PkMerchant(Pakettikauppa):
         root = ET.fromstring(xml_string)
         status_element = root.find("response.status")
         status = str(status_element.text)
-        self.mylogger.debug("Response status from Pakettikauppa = {}".format(status))
+        self.mylogger.debug("Response status from Pakettikauppa = %s", status)
         message_element = root.find("response.message")
 
         # Pakettikauppa return status=0 means OK
@@ -398,9 +664,9 @@ class PkMerchant(Pakettikauppa):
                 'reference': None,
                 'trackingcode': None
             }
-            self.mylogger.error("Error code = {}, Message={}".format(status, message_element.text))
+            self.mylogger.error("Error code = %s, Message=%s", status, message_element.text)
 
-        self.mylogger.debug("Hash return data = {}".format(dict_res))
+        self.mylogger.debug("Hash return data = %s", dict_res)
         return dict_res
 
     def get_routing_key(self, routing_id):
@@ -807,12 +1073,8 @@ class PkMerchant(Pakettikauppa):
         routing_id = '1464524676'
         order_alias = 'ORDER001'
 
-        if sys.version_info < (3, 0):
-            additional_info = "å Order no.: 1107-1 -- Reference no.: 284554".decode('utf-8').encode('utf-8')
-            recipient_address = 'Nikinväylä 3 test'.decode('utf-8').encode('utf-8')
-        else:
-            additional_info = "å Order no.: 1107-1 -- Reference no.: 284554"
-            recipient_address = "Nikinväylä 3 test"
+        additional_info = "å Order no.: 1107-1 -- Reference no.: 284554"
+        recipient_address = "Nikinväylä 3 test"
 
         # [2.11.2018 - Tipi] Pickup point service can't have multiple parcels
         # Only following dispatch types support multiple parcel service:
@@ -950,12 +1212,8 @@ class PkMerchant(Pakettikauppa):
         routing_id = '1464524676'
         order_alias = 'ORDER002'
 
-        if sys.version_info < (3, 0):
-            additional_info = "å Order no.: 1108-1 -- Reference no.: 284555".decode('utf-8').encode('utf-8')
-            recipient_address = 'Nikinväylä 3 test'.decode('utf-8').encode('utf-8')
-        else:
-            additional_info = "å Order no.: 1108-1 -- Reference no.: 284555"
-            recipient_address = "Nikinväylä 3 test"
+        additional_info = "å Order no.: 1108-1 -- Reference no.: 284555"
+        recipient_address = "Nikinväylä 3 test"
 
         # [2.11.2018 - Tipi] Pickup point service can't have multiple parcels
         # Only following dispatch types support multiple parcel service:
@@ -1090,7 +1348,7 @@ class PkMerchant(Pakettikauppa):
         if len(kwargs) <= 0:
             raise KeyError("Require input parameters")
 
-        self.mylogger.debug("Root input data = {}".format(kwargs))
+        self.mylogger.debug("Root input data = %s", kwargs)
 
         if 'eChannel' not in kwargs:
             raise KeyError("eChannel key is missing")
@@ -1132,7 +1390,7 @@ class PkMerchant(Pakettikauppa):
         if len(dict_routing) == 0:
             raise ValueError("Missing routing data")
 
-        self.mylogger.debug("Data type for ROUTING key = " + type(dict_routing).__name__)
+        self.mylogger.debug("Data type for ROUTING key = %s", type(dict_routing).__name__)
         if type(dict_routing).__name__ != 'dict':
             raise TypeError("Invalid data type for ROUTING key")
 
@@ -1165,9 +1423,38 @@ class PkMerchant(Pakettikauppa):
         self._create_shipment_elements(root, **kwargs['eChannel']['Shipment'])
 
         xml_string = ET.tostring(root, pretty_print=True, xml_declaration=True, encoding="UTF-8")
-        self.mylogger.debug("XML string = {}".format(xml_string))
+        self.mylogger.debug("XML string = %s", xml_string)
         return xml_string
 
+    def get_xml_shipment_model_req_data(self, shipment, pretty_print=True):
+        """
+        Construct XML string of request data for create shipment API from model objects. Models are validated when
+        they are created, so the data is written without further checks. When 'pretty_print' is set, output of a
+        Shipment.from_dict() object equals get_xml_shipment_req_data() output of the same dictionary if its keys are in
+        the documented order.
+
+        :param shipment: Shipment object, see pakettikauppa.models module. Use Shipment.from_dict() to convert \
+                         dictionary data of get_xml_shipment_req_data() function.
+        :param pretty_print: True = indent elements, False = compact output
+        :return xml_string: UTF-8 encoded bytes of XML request data
+        """
+        xml_string = shipment.to_xml(self.get_routing_key(shipment.routing_id), self._api_key,
+                                     datetime.now().strftime('%Y%m%d%H%M%S'), pretty_print)
+        self.mylogger.debug("XML string = %s", xml_string)
+        return xml_string
+
+    def iter_xml_shipment_req_data(self, chunk_size=65536, pretty_print=False, **kwargs):
+        """
+        Construct request data for create shipment API in chunks without building XML tree. Output is compact unless
+        'pretty_print' is set, then it equals get_xml_shipment_req_data() output.
+
+        :param chunk_size: minimum number of bytes in a chunk
+        :param pretty_print: True = indent elements, False = compact output
+        :param kwargs: See get_xml_shipment_req_data() function. 'Consignment.Parcel' may also be a generator.
+        :return: generator of bytes
+        """
+        return ShipmentXmlSerializer(self, pretty_print, chunk_size).iter_shipment_req_data(**kwargs)
+
     def _create_routing_elements(self, root_element, **kwargs):
         """
         Append 'ROUTING' element to root
@@ -1216,7 +1503,7 @@ class PkMerchant(Pakettikauppa):
         self._create_shipment_address_element(shipment_root, "recipient", **kwargs['Shipment.Recipient'])
         self._create_shipment_address_element(shipment_root, "sender", **kwargs['Shipment.Sender'])
 
-        self.logger.debug("[_create_shipment_elements] Shipment.Consignment={}".format(kwargs['Shipment.Consignment']))
+        self.logger.debug("[_create_shipment_elements] Shipment.Consignment=%s", kwargs['Shipment.Consignment'])
         self._create_shipment_consignment_element(shipment_root, **kwargs['Shipment.Consignment'])
 
     def _create_shipment_address_element(self, root_element, address_type="recipient", **kwargs):
@@ -1276,10 +1563,7 @@ class PkMerchant(Pakettikauppa):
 
             child = ET.SubElement(address_root_element, key)
 
-            if sys.version_info < (3, 0):
-                child.text = kwargs[key].decode('utf-8')
-            else:
-                child.text = str(kwargs[key])
+            child.text = str(kwargs[key])
         return
 
     def _create_shipment_consignment_element(self, root_element, **kwargs):
@@ -1306,7 +1590,7 @@ class PkMerchant(Pakettikauppa):
         if kwargs is None or len(kwargs) == 0:
             raise KeyError("Input parameter cannot be empty.")
 
-        self.logger.debug("[_create_shipment_consignment_element] KWARGS={}".format(kwargs))
+        self.logger.debug("[_create_shipment_consignment_element] KWARGS=%s", kwargs)
 
         root = ET.SubElement(root_element, "Shipment.Consignment")
 
@@ -1363,13 +1647,17 @@ class PkMerchant(Pakettikauppa):
         if type(list_services).__name__ != 'list':
             raise ValueError("Expected data type list")
 
+        # Checked once, this loop runs for every key of every service
+        is_debug = self.mylogger.isEnabledFor(logging.DEBUG)
         for dict_data in list_services:
             additional_service_root_element = ET.SubElement(root, "Consignment.AdditionalService")
-            self.mylogger.debug("Inner Hash= {}".format(dict_data))
+            if is_debug:
+                self.mylogger.debug("Inner Hash= %s", dict_data)
             for key in dict_data:
                 value_data_type = type(dict_data[key]).__name__
                 # self.mylogger.debug("Key= {}, Value={}".format(key, dict_data[key]))
-                self.mylogger.debug("[_create_additional_service_elements] Value data type={}".format(value_data_type))
+                if is_debug:
+                    self.mylogger.debug("[_create_additional_service_elements] Value data type=%s", value_data_type)
                 if value_data_type == 'dict':
                     if key == 'AdditionalService.Specifier':
                         self._create_one_service_specifier(additional_service_root_element, dict_data[key])
@@ -1400,7 +1688,7 @@ class PkMerchant(Pakettikauppa):
                           for content of XML element.
         :return:
         """
-        self.mylogger.debug("[_create_one_service_specifier] dict_data={}".format(dict_data))
+        self.mylogger.debug("[_create_one_service_specifier] dict_data=%s", dict_data)
 
         if dict_data is None:
             return
@@ -1422,7 +1710,7 @@ class PkMerchant(Pakettikauppa):
         :param value: string of invoice number
         :return:
         """
-        self.logger.debug("Invoice number value={}".format(value))
+        self.logger.debug("Invoice number value=%s", value)
         if value is None:
             value = ''
         invoice_number_element = ET.SubElement(root, "Consignment.Invoicenumber")
@@ -1545,7 +1833,7 @@ class PkMerchant(Pakettikauppa):
             else:
                 # expected string value from kwargs[key]
                 # self.mylogger.debug("Key for creating Parcel elements={}, Value={}".format(key, kwargs[key]))
-                if not isinstance(kwargs[key], string_types):
+                if not isinstance(kwargs[key], str):
                     raise PakettikauppaException("Invalid value in key={}".format(key))
 
                 if key == 'Parcel.Packagetype':
@@ -1567,7 +1855,7 @@ class PkMerchant(Pakettikauppa):
             raise PakettikauppaException("Invalid package type code")
 
     def _create_content_line_elements(self, parcel_root_element, **kwargs):
-        self.mylogger.debug("[_create_content_line_elements]Length of data={}".format(len(kwargs)))
+        self.mylogger.debug("[_create_content_line_elements]Length of data=%s", len(kwargs))
         if kwargs is None:
             return
 
@@ -1580,19 +1868,43 @@ class PkMerchant(Pakettikauppa):
             child.text = str(kwargs[key])
 
     # Not yet getting expected result in Test server
+    @instrumented('get_shipment_status')
     def get_shipment_status(self, tracking_code):
         """
         Get shipment status from Pakettikauppa.
 
         :param tracking_code: string of tracking code for checking
-        :return:
+        :return res_obj: response object, see get_shipment_status_events() for parsed data
         """
         _api_config = self.get_api_config('get_shipment_status')
         dict_req_data = self.get_shipment_status_req_data(tracking_code)
         res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], dict_req_data)
-        self.logger.debug("[GetShipment] Response={}".format(res_obj.content))
+        self.logger.debug("[GetShipment] Response=%s", res_obj.content)
         return res_obj
 
+    def get_shipment_status_events(self, tracking_code):
+        """
+        Get shipment status as parsed records.
+
+        :param tracking_code: string of tracking code
+        :return list_data: list of StatusEvent records, oldest first, see pakettikauppa.tracking module
+        """
+        res_obj = self.get_shipment_status(tracking_code)
+        return parse_status_events(self.parse_res_to_list(res_obj), tracking_code)
+
+    def get_shipment_statuses(self, tracking_codes, max_in_flight=10, ordered=True):
+        """
+        Get status of many shipments concurrently. Use ShipmentTracker of pakettikauppa.tracking module to poll the
+        same shipments repeatedly.
+
+        :param tracking_codes: iterable of tracking code strings
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: generator of BulkResult objects, 'request' is the tracking code and 'result' list of StatusEvent \
+                 records
+        """
+        return run_bounded(self.get_shipment_status_events, tracking_codes, max_in_flight, ordered)
+
     def get_shipment_status_req_data(self, tracking_code):
         """
         Construct request data for get shipment status API.
@@ -1613,16 +1925,88 @@ class PkMerchant(Pakettikauppa):
         # Calculate MAC
         digest_string = self.get_hash_sha256(self._secret, **dict_req_data)
         dict_req_data['hash'] = digest_string
-        self.mylogger.debug("Hash data for shipment status= {}".format(dict_req_data))
+        self.mylogger.debug("Hash data for shipment status= %s", dict_req_data)
         return dict_req_data
 
     def get_shipping_label(self, **kwargs):
         """
         Get shipping labels from Pakettikauppa. This API send request data in XML format.
 
+        If the object has label store and the request has one tracking code, the label is read from the store without
+        a request when stored, otherwise its decoded PDF content is stored. A label read from the store is base64
+        encoded again in chunks from its memory map and returned in the same format as a response, so the reprint
+        holds the encoded string, about 1.4 times the PDF size, and briefly the encoded pieces as well. Use
+        write_shipping_label() to write the stored PDF bytes to a file without encoding. Requests of many tracking
+        codes return one PDF of all labels and are not stored, use get_shipping_label_pdfs() for them.
+
         :param kwargs: See get_xml_shipping_label_req_data() function
         :return: See parse_xml_get_shipping_label_res() function
         """
+        tracking_code = self._get_single_label_code(kwargs) if self._label_store is not None else None
+        if tracking_code is not None:
+            dict_data = self._get_stored_label_res(tracking_code)
+            if dict_data is not None:
+                return dict_data
+
+        dict_data = self._get_shipping_label(**kwargs)
+        if tracking_code is not None:
+            self._store_label_res(tracking_code, dict_data)
+        return dict_data
+
+    def _get_stored_label_res(self, tracking_code):
+        """
+        Read label from label store in the format of get shipping label response.
+
+        :param tracking_code: string of tracking code
+        :return dict_data: See parse_xml_get_shipping_label_res() function, None if the label isn't stored
+        """
+        mmap_object = self._label_store.open(tracking_code)
+        if mmap_object is None:
+            return None
+        try:
+            encoded_pdf_content = encode_pdf_content(mmap_object)
+        finally:
+            mmap_object.close()
+        return {'status': 1, 'message': '', 'PDFcontent': encoded_pdf_content, 'ContentEncoded': True}
+
+    def _store_label_res(self, tracking_code, dict_data):
+        if dict_data is not None and dict_data['status'] == 1:
+            self._label_store.put(tracking_code, decode_pdf_content(dict_data['PDFcontent']))
+
+    def _write_stored_label(self, kwargs, target):
+        """
+        Write label of single tracking code request from label store.
+
+        :param kwargs: See get_xml_shipping_label_req_data() function
+        :param target: file path string or file-like object, see write_shipping_label() function
+        :return dict_data: See stream_shipping_label_res() function, None if the label isn't stored
+        """
+        tracking_code = self._get_single_label_code(kwargs) if self._label_store is not None else None
+        if tracking_code is None or tracking_code not in self._label_store:
+            return None
+        if hasattr(target, 'write'):
+            size = self._label_store.write_to(tracking_code, target)
+        else:
+            with open(target, 'wb') as f:
+                size = self._label_store.write_to(tracking_code, f)
+        if size is None:
+            return None
+        return {'status': 1, 'message': '', 'PDFcontent': None, 'ContentEncoded': False, 'size': size}
+
+    @staticmethod
+    def _get_single_label_code(dict_data):
+        try:
+            codes = dict_data['eChannel']['PrintLabel']['content']['TrackingCode']
+        except (KeyError, TypeError):
+            return None
+        if isinstance(codes, dict):
+            codes = [codes]
+        if len(codes) != 1:
+            return None
+        return codes[0].get('Code') or None
+
+    @instrumented('get_shipping_label')
+    def _get_shipping_label(self, **kwargs):
         _api_config = self.get_api_config('get_shipping_label')
 
         if self._isInTestMode:
@@ -1642,10 +2026,172 @@ class PkMerchant(Pakettikauppa):
         res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], xml_req_data, **headers)
 
         xml_res_string = res_obj.content
-        self.mylogger.debug("Response XML string = {}".format(xml_res_string))
+        self.mylogger.debug("Response XML string = %s", xml_res_string)
 
         return self.parse_xml_get_shipping_label_res(xml_res_string)
 
+    @instrumented('get_shipping_label')
+    def write_shipping_label(self, target, chunk_size=65536, **kwargs):
+        """
+        Get shipping labels from Pakettikauppa and write decoded PDF content to file while the response is received.
+        Unlike get_shipping_label(), neither the response nor the PDF content is kept in memory as a whole.
+
+        If the object has label store and the request has one tracking code which is stored, the label is written
+        from the store without a request.
+
+        :param target: file path string or file-like object with write() function. File is removed if the response \
+                       has error status or doesn't contain PDF content. Content written to file-like object is \
+                       left for the caller to discard, check 'status' of the result.
+        :param chunk_size: number of bytes read from the response at a time
+        :param kwargs: See get_xml_shipping_label_req_data() function
+        :return: See stream_shipping_label_res() function
+        """
+        dict_data = self._write_stored_label(kwargs, target)
+        if dict_data is not None:
+            return dict_data
+
+        _api_config = self.get_api_config('get_shipping_label')
+
+        xml_req_data = self.get_xml_shipping_label_req_data(**kwargs)
+
+        headers = {
+            'Content-Encoding': 'utf-8',
+            'Content-Type': 'application/xml'
+        }
+
+        res_obj = super(PkMerchant, self).send_request('POST', _api_config['api_post_url'], xml_req_data, stream=True,
+                                                       **headers)
+        try:
+            return self._write_shipping_label_res(res_obj.iter_content(chunk_size), target)
+        finally:
+            res_obj.close()
+
+    @staticmethod
+    def _write_shipping_label_res(chunks, target):
+        """
+        Write decoded PDF content of get shipping label response to target.
+
+        :param chunks: iterable of bytes of the response body
+        :param target: file path string or file-like object, see write_shipping_label() function
+        :return: See stream_shipping_label_res() function
+        """
+        if hasattr(target, 'write'):
+            return stream_shipping_label_res(chunks, target)
+
+        try:
+            with open(target, 'wb') as f:
+                dict_data = stream_shipping_label_res(chunks, f)
+        except Exception:
+            os.remove(target)
+            raise
+        # Error response may still contain content, which isn't a usable label
+        if dict_data['status'] != 1 or dict_data['size'] == 0:
+            os.remove(target)
+        return dict_data
+
+    def get_shipping_labels(self, tracking_codes, chunk_size=50, max_in_flight=4, routing_id=None,
+                            routing_name=None, ordered=True):
+        """
+        Get shipping labels of many tracking codes. The codes are split into chunks of almost equal size, one request
+        per chunk, and the requests are sent concurrently.
+
+        :param tracking_codes: iterable of tracking code strings
+        :param chunk_size: maximum number of tracking codes in one request
+        :param max_in_flight: maximum number of requests sent at the same time. Short lists are split into this many \
+                              chunks when chunks still have at least _min_label_chunk_size codes.
+        :param routing_id: string of routing ID. Default is current timestamp.
+        :param routing_name: string of routing name. Default is routing ID.
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: generator of BulkResult objects. 'request' attribute contains list of tracking codes of the chunk \
+                 and 'result' attribute contains decoded PDF content.
+        """
+        tracking_codes = list(tracking_codes)
+        min_chunks = min(max_in_flight, len(tracking_codes) // self._min_label_chunk_size)
+        chunks = split_evenly(tracking_codes, chunk_size, min_chunks)
+
+        def get_one_chunk(codes):
+            dict_data = self.get_shipping_label_req_data(codes, routing_id, routing_name)
+            return self._decode_shipping_label_res(self.get_shipping_label(**dict_data))
+
+        return run_bounded(get_one_chunk, chunks, max_in_flight, ordered)
+
+    def get_shipping_label_pdfs(self, tracking_codes, only_missing=True, max_in_flight=4, routing_id=None,
+                                routing_name=None, ordered=True):
+        """
+        Get a separate label PDF of each tracking code. Labels are fetched one tracking code per request, concurrently,
+        and stored if the object has label store.
+
+        :param tracking_codes: iterable of tracking code strings
+        :param only_missing: True = labels in the label store are read from it and only missing labels are fetched, \
+                             False = all labels are fetched and the store is updated
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param routing_id: string of routing ID. Default is current timestamp.
+        :param routing_name: string of routing name. Default is routing ID.
+        :param ordered: True = results come in input order, False = results come in completion order
+        :return: generator of BulkResult objects. 'request' attribute contains the tracking code and 'result' \
+                 attribute contains decoded PDF content.
+        """
+        store = self._label_store
+
+        def get_one_label(tracking_code):
+            if only_missing and store is not None:
+                pdf_content = store.get(tracking_code)
+                if pdf_content is not None:
+                    return pdf_content
+            dict_data = self.get_shipping_label_req_data([tracking_code], routing_id, routing_name)
+            pdf_content = self._decode_shipping_label_res(self._get_shipping_label(**dict_data))
+            if store is not None:
+                store.put(tracking_code, pdf_content)
+            return pdf_content
+
+        return run_bounded(get_one_label, tracking_codes, max_in_flight, ordered)
+
+    def get_shipping_label_req_data(self, tracking_codes, routing_id=None, routing_name=None, response_format='File'):
+        """
+        Construct dictionary of request data for getting shipping labels. See get_xml_shipping_label_req_data() for
+        the format.
+
+        :param tracking_codes: list of tracking code strings
+        :param routing_id: string of routing ID. Default is current timestamp.
+        :param routing_name: string of routing name. Default is routing ID.
+        :param response_format: "File" or "inline". "File" is default.
+        :return dict_data: dictionary of request data
+        """
+        if routing_id is None or routing_id == '':
+            routing_id = str(int(time()))
+        if routing_name is None:
+            routing_name = routing_id
+
+        return {
+            'eChannel': {
+                'ROUTING': {
+                    'Routing.Account': self._api_key,
+                    'Routing.Key': self.get_routing_key(routing_id),
+                    'Routing.Id': routing_id,
+                    'Routing.Name': routing_name,
+                    'Routing.Time': datetime.now().strftime('%Y%m%d%H%M%S'),
+                },
+                'PrintLabel': {
+                    'responseFormat': response_format,
+                    'content': {
+                        'TrackingCode': [{'Code': code} for code in tracking_codes]
+                    }
+                }
+            }
+        }
+
+    def _decode_shipping_label_res(self, dict_data):
+        """
+        Get decoded PDF content from parsed response data. Raise exception if Pakettikauppa returns error status.
+
+        :param dict_data: See parse_xml_get_shipping_label_res() function
+        :return pdf_content: binary data of PDF content
+        """
+        if dict_data is None or dict_data['status'] != 1:
+            message = dict_data['message'] if dict_data is not None else 'Empty response'
+            raise PakettikauppaException(message)
+        return decode_pdf_content(dict_data['PDFcontent'])
+
     def parse_xml_get_shipping_label_res(self, xml_string):
         """
         Construct dictionary from response data.
@@ -1664,7 +2210,7 @@ class PkMerchant(Pakettikauppa):
         root = ET.fromstring(xml_string)
         status_element = root.find("response.status")
         status = str(status_element.text)
-        self.mylogger.debug("Response status from Pakettikauppa = {}".format(status))
+        self.mylogger.debug("Response status from Pakettikauppa = %s", status)
         message_element = root.find("response.message")
 
         pdf_content_element = root.find("response.file")
@@ -1688,7 +2234,7 @@ class PkMerchant(Pakettikauppa):
                     'ContentEncoded': True,
                 }
 
-            self.mylogger.debug("Return dict data= {}".format(dict_data))
+            self.mylogger.debug("Return dict data= %s", dict_data)
             return dict_data
         else:
             self.logger.error("Unable to find PDF content from response")
@@ -1798,10 +2344,22 @@ class PkMerchant(Pakettikauppa):
 
         # xml_string = minidom.parseString(ET.tostring(root)).toprettyxml(indent="   ", encoding="utf-8")
         xml_string = ET.tostring(root, pretty_print=True, xml_declaration=True, encoding="UTF-8")
-        self.mylogger.debug("XML string = {}".format(xml_string))
+        self.mylogger.debug("XML string = %s", xml_string)
 
         return xml_string
 
+    def iter_xml_shipping_label_req_data(self, chunk_size=65536, pretty_print=False, **kwargs):
+        """
+        Construct request data for get shipping label API in chunks without building XML tree. Output is compact
+        unless 'pretty_print' is set, then it equals get_xml_shipping_label_req_data() output.
+
+        :param chunk_size: minimum number of bytes in a chunk
+        :param pretty_print: True = indent elements, False = compact output
+        :param kwargs: See get_xml_shipping_label_req_data() function
+        :return: generator of bytes
+        """
+        return ShipmentXmlSerializer(self, pretty_print, chunk_size).iter_shipping_label_req_data(**kwargs)
+
     def _create_print_label_element(self, root, **dict_data):
         """
         Append 'PrintLabel' element and its child elements to given root object.
@@ -1829,7 +2387,7 @@ class PkMerchant(Pakettikauppa):
         if 'TrackingCode' not in dict_data['content']:
             raise KeyError("Missing TrackingCode -key")
 
-        self.logger.debug("[CreatePrintLabelElement] Dict data={}".format(dict_data))
+        self.logger.debug("[CreatePrintLabelElement] Dict data=%s", dict_data)
         print_label_element = ET.SubElement(root, "PrintLabel")
         for key in dict_data:
             if key != 'content':
@@ -1854,9 +2412,9 @@ class PkMerchant(Pakettikauppa):
             else:
                 if key == 'TrackingCode':
                     if value_type == 'list':
-                        self.logger.debug("Child dict:{}".format(child_dict[key]))
+                        self.logger.debug("Child dict:%s", child_dict[key])
                         for dict_code in child_dict[key]:
-                            self.logger.debug("dict_code={}".format(dict_code))
+                            self.logger.debug("dict_code=%s", dict_code)
                             _create_one_tracking_code_element(print_label_element, dict_code['Code'])
                     else:
                         # Hash data type
@@ -1880,18 +2438,15 @@ class PkMerchant(Pakettikauppa):
         if text_value is None:
             return None
 
-        self.mylogger.debug("Additional text value type = {}".format(type(text_value).__name__))
+        self.mylogger.debug("Additional text value type = %s", type(text_value).__name__)
         # Have to find better to check data type String because it can be unicode, byte
-        #if not isinstance(text_value, string_types):
+        #if not isinstance(text_value, str):
         #    raise PakettikauppaException("Expect string value in 'AdditionalInfo.Text' parameter")
 
         additional_info_root_element = ET.SubElement(root, "Consignment.AdditionalInfo")
         additional_info_element = ET.SubElement(additional_info_root_element, "AdditionalInfo.Text")
 
-        if sys.version_info < (3, 0):
-            additional_info_element.text = text_value.decode('utf-8')
-        else:
-            additional_info_element.text = str(text_value)
+        additional_info_element.text = str(text_value)
 
     def _create_parcel_service_elements(self, root, list_services):
         """
@@ -0,0 +1,551 @@
+"""Model module for Pakettikauppa integration
+
+The module provides classes for create shipment request data:
+    1. Shipment - routing data, sender, recipient and consignment
+    2. Address - sender or recipient address
+    3. Consignment - consignment data with additional services and parcels
+    4. Parcel - one parcel of consignment
+    5. ContentLine - customs declaration data of parcel
+    6. AdditionalService - additional service code and its specifiers
+
+Objects are validated when they are created and write themselves to XmlWriter. Every class has from_dict() function
+which converts dictionary data used by PkMerchant.get_xml_shipment_req_data() into the object. Like PkMerchant,
+from_dict() keeps keys given with None value and writes them as 'None', and parcel services are written with the keys
+of their dictionaries. Output equals get_xml_shipment_req_data() output when keys are in the documented order, as in
+PkMerchant test data.
+"""
+from __future__ import absolute_import
+
+from .pakettikauppa import PakettikauppaException
+from .xml_stream import to_text
+from .xmlwriter import XmlWriter, XML_DECLARATION
+
+PACKAGE_TYPES = ('PC', 'PU', 'ZPF', 'ZPE', 'ZPT', 'CG', 'ZPX', 'PM', 'TB', 'TC', 'TU', 'LTK', 'KA', 'VA')
+RETURN_INSTRUCTION_CODES = ('E', 'H', 'L')
+CONTENT_CODES = ('D', 'E', 'G', 'M', 'S')
+
+
+def _optional_text(value):
+    return None if value is None else to_text(value)
+
+
+def _dict_text(dict_data, key):
+    # Like PkMerchant, a key given with None value is written as 'None', only missing keys are left out
+    if key not in dict_data:
+        return None
+    return to_text(dict_data[key])
+
+
+def _check_keys(dict_data, accept_keys):
+    for key in dict_data:
+        if key not in accept_keys:
+            raise KeyError("Invalid key: {}".format(key))
+
+
+class Address(object):
+    """
+    Sender or recipient address. Fields with None value are left out from XML.
+    """
+    __slots__ = ('code', 'name1', 'name2', 'addr1', 'addr2', 'addr3', 'postcode', 'city', 'country', 'phone',
+                 'vatcode', 'email')
+
+    # XML tag suffixes in output order, 'code' is 'Recipient.Code' or 'Sender.Contractid'
+    _tag_suffixes = ('Name1', 'Name2', 'Addr1', 'Addr2', 'Addr3', 'Postcode', 'City', 'Country', 'Phone', 'Vatcode',
+                     'Email')
+
+    def __init__(self, name1, addr1, postcode, city, country='FI', name2=None, addr2=None, addr3=None, phone=None,
+                 vatcode=None, email=None, code=None):
+        """
+        Constructor for Address class.
+
+        :param name1: name of person or company
+        :param addr1: street address
+        :param postcode: postal code
+        :param city: city name
+        :param country: 2 letter of country code. Default is 'FI', None leaves the element out
+        :param code: recipient code or sender contract ID, not really in used
+        """
+        for name, value in (('name1', name1), ('addr1', addr1), ('postcode', postcode), ('city', city)):
+            if value is None or value == '':
+                raise ValueError("Missing mandatory address data: {}".format(name))
+
+        self.code = _optional_text(code)
+        self.name1 = to_text(name1)
+        self.name2 = _optional_text(name2)
+        self.addr1 = to_text(addr1)
+        self.addr2 = _optional_text(addr2)
+        self.addr3 = _optional_text(addr3)
+        self.postcode = to_text(postcode)
+        self.city = to_text(city)
+        self.country = _optional_text(country)
+        self.phone = _optional_text(phone)
+        self.vatcode = _optional_text(vatcode)
+        self.email = _optional_text(email)
+
+    @classmethod
+    def from_dict(cls, dict_data, address_type='recipient'):
+        """
+        Create address from dictionary with 'Recipient.' or 'Sender.' prefixed keys.
+
+        :param dict_data: dictionary of address data. See PkMerchant._create_shipment_address_element() function
+        :param address_type: 'recipient' or 'sender'
+        :return address: Address object
+        """
+        if address_type == 'recipient':
+            prefix, code_key = 'Recipient.', 'Recipient.Code'
+        elif address_type == 'sender':
+            prefix, code_key = 'Sender.', 'Sender.Contractid'
+        else:
+            raise ValueError("Invalid value. Possible value are 'recipient' and 'sender'.")
+
+        accept_keys = (code_key,) + tuple(prefix + suffix for suffix in cls._tag_suffixes)
+        _check_keys(dict_data, accept_keys)
+        values = [_dict_text(dict_data, prefix + suffix) for suffix in cls._tag_suffixes]
+        name1, name2, addr1, addr2, addr3, postcode, city, country, phone, vatcode, email = values
+        return cls(name1, addr1, postcode, city, country, name2, addr2, addr3, phone, vatcode, email,
+                   _dict_text(dict_data, code_key))
+
+    def write(self, writer, address_type='recipient'):
+        """
+        Write 'Shipment.Recipient' or 'Shipment.Sender' element.
+
+        :param writer: XmlWriter object
+        :param address_type: 'recipient' or 'sender'
+        :return:
+        """
+        if address_type == 'recipient':
+            writer.start('Shipment.Recipient')
+            if self.code is not None:
+                writer.element('Recipient.Code', self.code)
+            prefix = 'Recipient.'
+        else:
+            writer.start('Shipment.Sender')
+            if self.code is not None:
+                writer.element('Sender.Contractid', self.code)
+            prefix = 'Sender.'
+
+        values = (self.name1, self.name2, self.addr1, self.addr2, self.addr3, self.postcode, self.city, self.country,
+                  self.phone, self.vatcode, self.email)
+        for suffix, value in zip(self._tag_suffixes, values):
+            if value is not None:
+                writer.element(prefix + suffix, value)
+        writer.end()
+
+
+class ContentLine(object):
+    """
+    Customs declaration data of parcel. Fields with None value are left out from XML.
+    """
+    __slots__ = ('description', 'quantity', 'currency', 'netweight', 'value', 'countryoforigin', 'tariffcode')
+
+    def __init__(self, description=None, quantity=None, currency=None, netweight=None, value=None,
+                 countryoforigin=None, tariffcode=None):
+        self.description = _optional_text(description)
+        self.quantity = _optional_text(quantity)
+        self.currency = _optional_text(currency)
+        self.netweight = _optional_text(netweight)
+        self.value = _optional_text(value)
+        self.countryoforigin = _optional_text(countryoforigin)
+        self.tariffcode = _optional_text(tariffcode)
+
+    @classmethod
+    def from_dict(cls, dict_data):
+        """
+        Create content line from dictionary with 'contentline.' prefixed keys.
+
+        :param dict_data: dictionary of content line data
+        :return content_line: ContentLine object
+        """
+        _check_keys(dict_data, tuple('contentline.' + name for name in cls.__slots__))
+        return cls(*[_dict_text(dict_data, 'contentline.' + name) for name in cls.__slots__])
+
+    def is_empty(self):
+        return all(getattr(self, name) is None for name in self.__slots__)
+
+    def write(self, writer):
+        """
+        Write 'Parcel.contentline' element. Nothing is written if all fields are None.
+
+        :param writer: XmlWriter object
+        :return:
+        """
+        if self.is_empty():
+            return
+        writer.start('Parcel.contentline')
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                writer.element('contentline.' + name, value)
+        writer.end()
+
+
+class AdditionalService(object):
+    """
+    Additional service of consignment, i.e. pickup point (2106) or cash on delivery (3101).
+    """
+    __slots__ = ('service_code', 'specifiers')
+
+    def __init__(self, service_code, specifiers=()):
+        """
+        Constructor for AdditionalService class.
+
+        :param service_code: string of additional service code
+        :param specifiers: iterable of (name, value) tuples, i.e. [('pickup_point_id', '8547')]
+        """
+        if service_code is None or service_code == '':
+            raise ValueError("Missing additional service code")
+        self.service_code = str(service_code)
+        self.specifiers = tuple((str(name), str(value)) for name, value in specifiers)
+
+    @classmethod
+    def from_dict(cls, dict_data):
+        """
+        Create additional service from dictionary with 'AdditionalService.ServiceCode' and
+        'AdditionalService.Specifier' keys. Specifier is a dictionary with 'name' and 'value' keys or list of them.
+
+        :param dict_data: dictionary of additional service data
+        :return service: AdditionalService object
+        """
+        _check_keys(dict_data, ('AdditionalService.ServiceCode', 'AdditionalService.Specifier'))
+        specifier_data = dict_data.get('AdditionalService.Specifier')
+        if specifier_data is None:
+            specifier_data = []
+        elif isinstance(specifier_data, dict):
+            specifier_data = [specifier_data]
+
+        specifiers = []
+        for one_specifier in specifier_data:
+            _check_keys(one_specifier, ('name', 'value'))
+            specifiers.append((one_specifier['name'], one_specifier['value']))
+        return cls(dict_data.get('AdditionalService.ServiceCode'), specifiers)
+
+    def write(self, writer):
+        """
+        Write 'Consignment.AdditionalService' element.
+
+        :param writer: XmlWriter object
+        :return:
+        """
+        writer.start('Consignment.AdditionalService')
+        writer.element('AdditionalService.ServiceCode', self.service_code)
+        for name, value in self.specifiers:
+            writer.element('AdditionalService.Specifier', value, [('name', name)])
+        writer.end()
+
+
+def _parcel_service_items(service):
+    # Tuple of (tag, text) pairs of one 'Parcel.ParcelService' element
+    if isinstance(service, dict):
+        return tuple((str(key), to_text(value)) for key, value in service.items())
+    return (('ServiceCode', str(service)),)
+
+
+class Parcel(object):
+    """
+    One parcel of consignment.
+    """
+    __slots__ = ('reference', 'package_type', 'weight', 'weight_unit', 'volume', 'volume_unit', 'info_code',
+                 'contents', 'return_service', 'content_line', 'services')
+
+    def __init__(self, weight=None, weight_unit='kg', reference=None, package_type='PC', volume=None,
+                 volume_unit='m3', info_code=None, contents=None, return_service=None, content_line=None,
+                 services=()):
+        """
+        Constructor for Parcel class.
+
+        :param weight: parcel weight
+        :param weight_unit: unit of weight. Default is 'kg'
+        :param reference: parcel reference
+        :param package_type: code of package type. See PkMerchant._package_types. Default is 'PC'
+        :param volume: parcel volume
+        :param volume_unit: unit of volume. Default is 'm3'
+        :param info_code: parcel info code
+        :param contents: product description
+        :param return_service: return service code
+        :param content_line: ContentLine object
+        :param services: iterable of parcel services. A service is a service code string, written as 'ServiceCode'
+                         element, or a dictionary of element names and values like in PkMerchant request data.
+        """
+        if package_type is None or package_type == '':
+            package_type = 'PC'
+        if package_type not in PACKAGE_TYPES:
+            raise PakettikauppaException("Invalid package type code")
+        if weight is not None:
+            if weight == '':
+                raise PakettikauppaException("Require parcel weight in 'value' parameter")
+            if weight_unit is None or weight_unit == '':
+                raise PakettikauppaException("Expect value in weight_unit parameter")
+        if volume == '':
+            raise PakettikauppaException("Require parcel volume in 'value' parameter")
+
+        self.reference = _optional_text(reference)
+        self.package_type = package_type
+        self.weight = _optional_text(weight)
+        self.weight_unit = str(weight_unit)
+        self.volume = _optional_text(volume)
+        self.volume_unit = 'm3' if volume_unit is None or volume_unit == '' else str(volume_unit)
+        self.info_code = _optional_text(info_code)
+        self.contents = _optional_text(contents)
+        self.return_service = _optional_text(return_service)
+        self.content_line = content_line
+        self.services = tuple(_parcel_service_items(service) for service in services)
+
+    @classmethod
+    def from_dict(cls, dict_data):
+        """
+        Create parcel from dictionary with 'Parcel.' prefixed keys.
+
+        :param dict_data: dictionary of parcel data. See PkMerchant._create_parcel_elements() function
+        :return parcel: Parcel object
+        """
+        _check_keys(dict_data, ('Parcel.Reference', 'Parcel.Packagetype', 'Parcel.Weight', 'Parcel.Volume',
+                                'Parcel.Infocode', 'Parcel.Contents', 'Parcel.ReturnService', 'Parcel.contentline',
+                                'Parcel.ParcelService'))
+        for key in ('Parcel.Reference', 'Parcel.Packagetype', 'Parcel.Infocode', 'Parcel.Contents',
+                    'Parcel.ReturnService'):
+            if key in dict_data and not isinstance(dict_data[key], str):
+                raise PakettikauppaException("Invalid value in key={}".format(key))
+
+        weight = dict_data.get('Parcel.Weight') or {}
+        volume = dict_data.get('Parcel.Volume') or {}
+        if 'Parcel.Weight' in dict_data and weight.get('value') is None:
+            raise PakettikauppaException("Require parcel weight in 'value' parameter")
+        if 'Parcel.Volume' in dict_data and volume.get('value') is None:
+            raise PakettikauppaException("Require parcel volume in 'value' parameter")
+
+        content_line = dict_data.get('Parcel.contentline')
+        services = dict_data.get('Parcel.ParcelService') or []
+
+        return cls(weight=weight.get('value'), weight_unit=weight.get('weight_unit', 'kg'),
+                   reference=dict_data.get('Parcel.Reference'), package_type=dict_data.get('Parcel.Packagetype'),
+                   volume=volume.get('value'), volume_unit=volume.get('unit'),
+                   info_code=dict_data.get('Parcel.Infocode'), contents=dict_data.get('Parcel.Contents'),
+                   return_service=dict_data.get('Parcel.ReturnService'),
+                   content_line=ContentLine.from_dict(content_line) if content_line else None, services=services)
+
+    def write(self, writer):
+        """
+        Write 'Consignment.Parcel' element. Like PkMerchant, an empty 'Parcel.Reference' element is written first.
+
+        :param writer: XmlWriter object
+        :return:
+        """
+        writer.start('Consignment.Parcel', [('type', 'normal')])
+        writer.element('Parcel.Reference')
+        if self.reference is not None:
+            writer.element('Parcel.Reference', self.reference)
+        writer.element('Parcel.Packagetype', self.package_type)
+        if self.weight is not None:
+            writer.element('Parcel.Weight', self.weight, [('unit', self.weight_unit)])
+        if self.volume is not None:
+            writer.element('Parcel.Volume', self.volume, [('unit', self.volume_unit)])
+        if self.info_code is not None:
+            writer.element('Parcel.Infocode', self.info_code)
+        if self.contents is not None:
+            writer.element('Parcel.Contents', self.contents)
+        if self.return_service is not None:
+            writer.element('Parcel.ReturnService', self.return_service)
+        if self.content_line is not None:
+            self.content_line.write(writer)
+        for service_items in self.services:
+            writer.start('Parcel.ParcelService')
+            for tag, value in service_items:
+                writer.element(tag, value)
+            writer.end()
+        writer.end()
+
+
+class Consignment(object):
+    """
+    Consignment data of shipment.
+    """
+    __slots__ = ('product', 'reference', 'invoice_number', 'currency', 'content_code', 'return_instruction',
+                 'merchandise_value', 'additional_info', 'additional_services', 'parcels')
+
+    def __init__(self, product, parcels, reference=None, invoice_number=None, currency='EUR', content_code=None,
+                 return_instruction=None, merchandise_value=None, additional_info=None, additional_services=()):
+        """
+        Constructor for Consignment class.
+
+        :param product: string of Posti's product code
+        :param parcels: iterable of Parcel objects
+        :param reference: consignment reference string
+        :param invoice_number: consignment invoice number string
+        :param currency: currency code. Default is 'EUR'
+        :param content_code: content code. Possible values: 'D', 'E', 'G', 'M' and 'S'
+        :param return_instruction: return instruction code. Possible values: 'E', 'H' and 'L'
+        :param merchandise_value: merchandise price value
+        :param additional_info: additional info text
+        :param additional_services: iterable of AdditionalService objects
+        """
+        if product is None or product == '':
+            raise PakettikauppaException("Require product code in 'Consignment.Product'")
+        if content_code is not None and content_code != '':
+            content_code = str(content_code)
+            if content_code not in CONTENT_CODES:
+                raise PakettikauppaException("Invalid content code. Possible values:'D', 'E', 'G', 'M' and 'S'")
+        if return_instruction is not None and return_instruction != '' and \
+                return_instruction not in RETURN_INSTRUCTION_CODES:
+            raise PakettikauppaException("Invalid return instruction code. Possible value are 'E', 'H' and 'L'")
+
+        self.product = str(product)
+        self.parcels = list(parcels)
+        self.reference = '' if reference is None else str(reference)
+        self.invoice_number = '' if invoice_number is None else str(invoice_number)
+        self.currency = 'EUR' if currency is None else str(currency.upper())
+        self.content_code = content_code
+        self.return_instruction = _optional_text(return_instruction)
+        self.merchandise_value = _optional_text(merchandise_value)
+        self.additional_info = _optional_text(additional_info)
+        self.additional_services = tuple(additional_services)
+
+    @classmethod
+    def from_dict(cls, dict_data):
+        """
+        Create consignment from dictionary with 'Consignment.' prefixed keys.
+
+        :param dict_data: dictionary of consignment data. See PkMerchant._create_shipment_consignment_element()
+        :return consignment: Consignment object
+        """
+        if dict_data is None or len(dict_data) == 0:
+            raise KeyError("Input parameter cannot be empty.")
+
+        parcel_data = dict_data['Consignment.Parcel']
+        if isinstance(parcel_data, dict):
+            parcel_data = [parcel_data]
+        elif not isinstance(parcel_data, list):
+            raise PakettikauppaException("Invalid argument type for 'Consignment.Parcel' key")
+
+        service_data = dict_data.get('Consignment.AdditionalService') or []
+        if not isinstance(service_data, list):
+            raise ValueError("Expected data type list")
+
+        additional_info = dict_data.get('Consignment.AdditionalInfo') or {}
+        return cls(dict_data['Consignment.Product'],
+                   [Parcel.from_dict(one_parcel) for one_parcel in parcel_data if one_parcel],
+                   reference=dict_data.get('Consignment.Reference'),
+                   invoice_number=dict_data.get('Consignment.Invoicenumber'),
+                   currency=dict_data.get('Consignment.Currency'),
+                   content_code=dict_data.get('Consignment.Contentcode'),
+                   return_instruction=dict_data.get('Consignment.ReturnInstruction'),
+                   merchandise_value=dict_data.get('Consignment.Merchandisevalue'),
+                   additional_info=additional_info.get('AdditionalInfo.Text'),
+                   additional_services=[AdditionalService.from_dict(service) for service in service_data if service])
+
+    def write(self, writer):
+        """
+        Write 'Shipment.Consignment' element.
+
+        :param writer: XmlWriter object
+        :return:
+        """
+        writer.start('Shipment.Consignment')
+        writer.element('Consignment.Currency', self.currency)
+        writer.element('Consignment.Product', self.product)
+        writer.element('Consignment.Reference', self.reference)
+        writer.element('Consignment.Invoicenumber', self.invoice_number)
+        if self.additional_info is not None:
+            writer.start('Consignment.AdditionalInfo')
+            writer.element('AdditionalInfo.Text', self.additional_info)
+            writer.end()
+        writer.element('Consignment.Contentcode', self.content_code)
+        writer.element('Consignment.Infocode', '')
+        if self.return_instruction is not None:
+            writer.element('Consignment.ReturnInstruction', self.return_instruction)
+        if self.merchandise_value is not None:
+            writer.element('Consignment.Merchandisevalue', self.merchandise_value)
+        for service in self.additional_services:
+            service.write(writer)
+        for parcel in self.parcels:
+            parcel.write(writer)
+        writer.end()
+
+
+class Shipment(object):
+    """
+    Create shipment request data.
+    """
+    __slots__ = ('routing_id', 'routing_name', 'routing_time', 'sender', 'recipient', 'consignment',
+                 'routing_account')
+
+    def __init__(self, routing_id, routing_name, sender, recipient, consignment, routing_time=None,
+                 routing_account=None):
+        """
+        Constructor for Shipment class.
+
+        :param routing_id: string of routing ID, could be order id or shop id
+        :param routing_name: string of routing name, could be order alias or shop alias
+        :param sender: Address object of sender
+        :param recipient: Address object of recipient
+        :param consignment: Consignment object
+        :param routing_time: datetime string in following format '%Y%m%d%H%M%S'. Default is time of writing XML.
+        :param routing_account: string of routing account. Default is API key of the merchant.
+        """
+        if routing_id is None or routing_id == '':
+            raise ValueError("Need routing id parameter")
+        self.routing_id = str(routing_id)
+        self.routing_name = str(routing_name)
+        self.routing_time = None if routing_time is None else str(routing_time)
+        self.sender = sender
+        self.recipient = recipient
+        self.consignment = consignment
+        self.routing_account = None if routing_account is None else str(routing_account)
+
+    @classmethod
+    def from_dict(cls, dict_data):
+        """
+        Create shipment from dictionary data of PkMerchant.get_xml_shipment_req_data() function.
+
+        :param dict_data: dictionary with 'eChannel' key
+        :return shipment: Shipment object
+        """
+        if 'eChannel' not in dict_data:
+            raise KeyError("eChannel key is missing")
+        routing = dict_data['eChannel']['ROUTING']
+        shipment = dict_data['eChannel']['Shipment']
+        return cls(routing['Routing.Id'], routing['Routing.Name'],
+                   Address.from_dict(shipment['Shipment.Sender'], 'sender'),
+                   Address.from_dict(shipment['Shipment.Recipient'], 'recipient'),
+                   Consignment.from_dict(shipment['Shipment.Consignment']),
+                   routing.get('Routing.Time'), routing.get('Routing.Account'))
+
+    def write(self, writer, routing_key, routing_account, routing_time):
+        """
+        Write 'eChannel' element.
+
+        :param writer: XmlWriter object
+        :param routing_key: string of routing key
+        :param routing_account: routing account used if the shipment has none
+        :param routing_time: routing time used if the shipment has none
+        :return:
+        """
+        writer.start('eChannel')
+        writer.start('ROUTING')
+        writer.element('Routing.Account', self.routing_account if self.routing_account is not None
+                       else str(routing_account))
+        writer.element('Routing.Id', self.routing_id)
+        writer.element('Routing.Key', routing_key)
+        writer.element('Routing.Name', self.routing_name)
+        writer.element('Routing.Time', self.routing_time if self.routing_time is not None else routing_time)
+        writer.end()
+        writer.start('Shipment')
+        self.recipient.write(writer, 'recipient')
+        self.sender.write(writer, 'sender')
+        self.consignment.write(writer)
+        writer.end()
+        writer.end()
+
+    def to_xml(self, routing_key, routing_account, routing_time, pretty_print=True):
+        """
+        Construct XML string of request data for create shipment API.
+
+        :param routing_key: string of routing key
+        :param routing_account: routing account used if the shipment has none
+        :param routing_time: routing time used if the shipment has none
+        :param pretty_print: True = indent elements like PkMerchant, False = compact output
+        :return xml_string: UTF-8 encoded bytes
+        """
+        writer = XmlWriter(pretty_print=pretty_print)
+        writer.raw(XML_DECLARATION)
+        self.write(writer, routing_key, routing_account, routing_time)
+        return writer.fragment().encode('utf-8')
@@ -0,0 +1,173 @@
+"""Customer onboarding module for Pakettikauppa integration
+
+The module keeps track of bulk customer creation of PkReseller.create_customers_bulk():
+    1. CustomerCheckpoint - append-only JSON lines file of started, created and failed customers
+    2. OnboardingReport - summary of a bulk run with counts, errors and created customer IDs
+
+Every customer is written to the checkpoint as 'started' before its request is sent and as 'created' or 'failed'
+after the response. A run which is started again with the same checkpoint skips created customers. Customers which
+were started but have no result, i.e. the process crashed while the request was in flight, are looked up from the
+customer list before anything is sent, so they are not created twice.
+
+API keys of created customers are not written to the checkpoint, only customer IDs.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STARTED = 'started'
+CREATED = 'created'
+FAILED = 'failed'
+
+
+class CustomerCheckpoint(object):
+    """
+    Checkpoint file of bulk customer creation. Lines are flushed one by one, so a crash loses at most the line which
+    was being written. Torn last line is ignored when the file is loaded.
+    """
+
+    def __init__(self, path, fsync=False):
+        """
+        Constructor for CustomerCheckpoint class. Existing file is loaded.
+
+        :param path: string of file path
+        :param fsync: if True, every line is synced to disk. Protects against power loss, not only process crash.
+        """
+        self.path = path
+        self.fsync = fsync
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, 'a')
+
+    def _load(self):
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("Ignored invalid line in checkpoint %s", self.path)
+                    continue
+                self.entries[entry['key']] = entry
+
+    def get_state(self, key):
+        entry = self.entries.get(key)
+        return entry['state'] if entry is not None else None
+
+    def get_in_doubt_keys(self):
+        """
+        Get keys of customers which were started but have no result.
+
+        :return list_data: list of keys
+        """
+        return [key for key, entry in self.entries.items() if entry['state'] == STARTED]
+
+    def record(self, key, state, **kwargs):
+        """
+        Append state of a customer.
+
+        :param key: string of customer key, i.e. business ID
+        :param state: STARTED, CREATED or FAILED
+        :param kwargs: other JSON serializable data of the entry, i.e. customer_id or error
+        :return:
+        """
+        entry = dict(kwargs, key=key, state=state)
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.entries[key] = entry
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class OnboardingReport(object):
+    """
+    Summary of bulk customer creation.
+
+    Counts:
+        total: number of input records
+        created: customers created in this run
+        recovered: customers found in the customer list after an interrupted run
+        skipped: customers created in an earlier run according to the checkpoint
+        invalid: records rejected by validation, nothing was sent
+        failed: requests which failed
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.recovered = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.failed = 0
+        self.errors = []
+        self.customer_ids = {}
+        self.results = {}
+        self.started_at = time.time()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.time() - self.started_at
+
+    def add_error(self, index, key, error):
+        self.errors.append({'index': index, 'key': key, 'error': '{}: {}'.format(error.__class__.__name__, error)})
+
+    @property
+    def ok(self):
+        return self.invalid == 0 and self.failed == 0
+
+    def to_dict(self):
+        """
+        Get report as dictionary.
+
+        :return dict_data: dictionary of counts, elapsed seconds, errors sorted by index and customer IDs by key
+        """
+        return {
+            'total': self.total,
+            'created': self.created,
+            'recovered': self.recovered,
+            'skipped': self.skipped,
+            'invalid': self.invalid,
+            'failed': self.failed,
+            'elapsed': self.elapsed,
+            'errors': sorted(self.errors, key=lambda error: error['index']),
+            'customer_ids': self.customer_ids,
+        }
+
+    def format(self, max_errors=20):
+        """
+        Get report as text.
+
+        :param max_errors: maximum number of error lines
+        :return string: text of the report
+        """
+        lines = ["{} records in {:.1f} s: {} created, {} recovered, {} skipped, {} invalid, {} failed".format(
+            self.total, self.elapsed, self.created, self.recovered, self.skipped, self.invalid, self.failed)]
+        errors = sorted(self.errors, key=lambda error: error['index'])
+        for error in errors[:max_errors]:
+            lines.append("  row {} ({}): {}".format(error['index'], error['key'], error['error']))
+        if len(errors) > max_errors:
+            lines.append("  ... {} more errors".format(len(errors) - max_errors))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format()
@@ -6,13 +6,12 @@ This module provides base functionality for Pakettikauppa integration
 __version__ = '0.1'
 __author__ = 'Porntip Chaibamrung'
 
-import hashlib
-import hmac
-import requests
 import logging
-import sys
-from six import string_types
 from functools import wraps
+from .instrumentation import get_current_metrics
+from .json_decoder import JsonDecoder
+from .signer import Signer
+from .transport import HttpTransport
 
 
 def check_api_name(in_function):
@@ -26,7 +25,7 @@ def check_api_name(in_function):
             raise PakettikauppaException("Missing API name")
 
         # if str(type(param).__name__) != 'str':
-        if not isinstance(param, string_types):
+        if not isinstance(param, str):
             raise PakettikauppaException("Invalid parameter type")
         else:
             return in_function(self, param)
@@ -39,25 +38,43 @@ class PakettikauppaException(Exception):
     pass
 
 
+class PakettikauppaHttpError(PakettikauppaException):
+    """
+    Unexpected HTTP status code of Pakettikauppa API response.
+    """
+
+    def __init__(self, message, status_code):
+        super(PakettikauppaHttpError, self).__init__(message)
+        self.status_code = status_code
+
+
 class Pakettikauppa(object):
     """
     Base class for Pakettikauppa integration.
 
     """
     _base_api_end_point = None
+    _transport = None
+    _owns_transport = False
+    _api_key = None
+    _secret = None
+    _signer = None
+    _resilience = None
+    _instrumentation = None
+    _json_decoder = JsonDecoder()
     logger = None
 
-    def __init__(self, is_test_mode=0):
+    def __init__(self, is_test_mode=0, transport=None, resilience=None):
         """
-        Constructor for Pakettikauppa class. Initial base API end point and logger object
+        Constructor for Pakettikauppa class. Initial base API end point, logger and transport object
 
         :param is_test_mode: integer value to identify test mode
+        :param transport: HttpTransport object for sending requests. If not given, the object creates its own \
+                          transport and closes it in close() function.
+        :param resilience: ResiliencePolicy object for timeouts per API, retries and circuit breaker. See \
+                           resilience module. If not given, requests are sent once with timeout of the transport.
         """
-        logging.basicConfig(
-            #    filename="pakettikauppa.log",
-            #    format="%(asctime)s:%(levelname)s:%(message)s",
-            level=logging.DEBUG,
-        )
+        # Logging configuration is left to the application, see pakettikauppa.log module
         self.set_logger()
 
         if is_test_mode == 1:
@@ -65,6 +82,64 @@ class Pakettikauppa(object):
         else:
             self._base_api_end_point = 'https://api.pakettikauppa.fi'
 
+        if transport is None:
+            self._transport = HttpTransport()
+            self._owns_transport = True
+        else:
+            self._transport = transport
+            self._owns_transport = False
+        self._resilience = resilience
+
+    def get_transport(self):
+        """
+        Get transport object used for sending requests.
+
+        :return transport: HttpTransport object
+        """
+        return self._transport
+
+    def set_instrumentation(self, instrumentation):
+        """
+        Set instrumentation of API calls. See instrumentation module.
+
+        :param instrumentation: Instrumentation object or None to turn instrumentation off
+        :return:
+        """
+        self._instrumentation = instrumentation
+
+    def get_instrumentation(self):
+        return self._instrumentation
+
+    def set_json_decoder(self, json_decoder):
+        """
+        Set decoder of JSON responses, i.e. JsonDecoder(records=True) for namedtuple records instead of dictionaries.
+        See json_decoder module. Records are stored as lists by file and Redis cache backends, so use records only
+        with memory cache backend or without cache.
+
+        :param json_decoder: JsonDecoder object
+        :return:
+        """
+        self._json_decoder = json_decoder
+
+    def get_json_decoder(self):
+        return self._json_decoder
+
+    def close(self):
+        """
+        Close pooled connections of own transport. Transport given to the constructor is left open because it may be
+        shared with other objects.
+
+        :return:
+        """
+        if self._owns_transport:
+            self._transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def set_logger(self):
         """
         Set logger object.
@@ -95,6 +170,17 @@ class Pakettikauppa(object):
         _api_post_url = self._base_api_end_point + api_suffix
         return _api_post_url
 
+    def set_api_end_point(self, base_end_point):
+        """
+        Set API base end point, i.e. URL of a local stand-in server. See pakettikauppa.standin module.
+
+        :param base_end_point: string of base URL without trailing slash
+        :return:
+        """
+        if base_end_point is None or base_end_point == '':
+            raise ValueError("Need API end point")
+        self._base_api_end_point = str(base_end_point).rstrip('/')
+
     def get_api_end_point(self):
         """
         Get API base end point string
@@ -103,6 +189,23 @@ class Pakettikauppa(object):
         """
         return self._base_api_end_point
 
+    def get_signer(self):
+        """
+        Get Signer object of API key and secret of the object. Signer is created again if credentials are changed.
+
+        :return signer: Signer object
+        """
+        signer = self._signer
+        if signer is None or not signer.matches(self._api_key, self._secret):
+            signer = Signer(self._api_key, self._secret)
+            self._signer = signer
+        return signer
+
+    def _get_signer_for(self, api_key, secret_key):
+        if secret_key == self._secret and (api_key is None or api_key == self._api_key):
+            return self.get_signer()
+        return Signer(api_key, secret_key, routing_key_cache_size=0)
+
     def get_hash_sha256(self, secret_key, **kwargs):
         """
         Calculate SHA256 digest string.
@@ -114,30 +217,12 @@ class Pakettikauppa(object):
         if kwargs is None or len(kwargs) == 0:
             raise KeyError("Expect input parameters")
 
-        secret_key = str(secret_key)
-        self.logger.debug("Secret key: {}".format(secret_key))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Plain text=%s", '&'.join([str(kwargs[key]) for key in sorted(kwargs)]))
 
-        my_lst = []
-        for key in sorted(kwargs):
-            self.logger.debug("Key={}, Value={}".format(key, kwargs[key]))
-            my_lst.append(str(kwargs[key]))
-        plain_text = '&'.join(map(str, my_lst))
-        self.logger.debug("Plain text={}".format(plain_text))
-
-        if sys.version_info < (3, 0):
-            # plain_text.decode('utf-8')
-            message_bytes = bytes(plain_text)
-            secret_bytes = bytes(secret_key)
-        else:
-            message_bytes = bytes(plain_text, 'utf-8')
-            secret_bytes = bytes(secret_key, 'utf-8')
-
-        hash_string = hmac.new(secret_bytes, message_bytes, hashlib.sha256)
-
-        # to lowercase hexits
-        digest_string = hash_string.hexdigest()
-        self.logger.debug("Digest string={}".format(digest_string))
-        return str(digest_string)
+        digest_string = self._get_signer_for(None, secret_key).sign(kwargs)
+        self.logger.debug("Digest string=%s", digest_string)
+        return digest_string
 
     def get_md5_hash(self, api_key=None, secret_key=None, routing_id=None):
         """
@@ -157,19 +242,18 @@ class Pakettikauppa(object):
         if routing_id is None or routing_id == '':
             raise ValueError("Need routing id parameter")
 
-        routing_key_data = str(api_key) + str(routing_id) + str(secret_key)
-        self.logger.debug("Routing key data={}".format(routing_key_data))
-        digest_string = hashlib.md5(routing_key_data.encode('utf-8')).hexdigest()
-        self.logger.debug("MD5 Digest string={}".format(digest_string))
+        digest_string = self._get_signer_for(api_key, secret_key).get_routing_key(routing_id)
+        self.logger.debug("MD5 Digest string=%s", digest_string)
         return digest_string
 
-    def send_request(self, send_method='POST', _api_post_url=None, req_input=None, **headers):
+    def send_request(self, send_method='POST', _api_post_url=None, req_input=None, stream=False, **headers):
         """
         Send a request to Pakettikauppa.
 
         :param send_method: type of request method. Possible value are 'POST' and 'GET', 'POST' is default value.
         :param _api_post_url: string of post URL
         :param req_input: request input data
+        :param stream: if True, response body is not read in advance. Caller must read or close the response.
         :param headers: dictionary of header data
         :return res_obj: response object
         """
@@ -182,29 +266,75 @@ class Pakettikauppa(object):
                 'Content-Encoding': 'utf-8'
             }
 
-        if send_method == 'POST':
-            if req_input is None:
-                res_obj = requests.post(_api_post_url, headers=headers)
+        metrics = get_current_metrics() if self._instrumentation is not None else None
+        if metrics is not None and req_input is not None and \
+                not isinstance(req_input, (dict, bytes, str)):
+            req_input = metrics.count_request_bytes(req_input)
+
+        kwargs = {'headers': headers, 'stream': stream}
+        if req_input is not None:
+            kwargs['data'] = req_input
+            if send_method != 'POST':
+                kwargs['params'] = req_input
+        method = 'POST' if send_method == 'POST' else 'GET'
+
+        def send():
+            if metrics is not None:
+                metrics.attempts += 1
+            return self._transport.request(method, _api_post_url, **kwargs)
+
+        if metrics is not None:
+            metrics.begin_network()
+
+        try:
+            policy = self._resilience
+            if policy is None:
+                res_obj = send()
             else:
-                res_obj = requests.post(_api_post_url, data=req_input, headers=headers)
-
-        else:
-            if req_input is None:
-                res_obj = requests.get(_api_post_url, headers=headers)
-            else:
-                res_obj = requests.get(_api_post_url, headers=headers, data=req_input, params=req_input)
+                api_name = self.get_api_name_of_url(_api_post_url)
+                kwargs['timeout'] = policy.get_timeout(api_name)
+                # Generator body is consumed by the first attempt
+                replayable = req_input is None or isinstance(req_input, (dict, bytes, str))
+                res_obj = policy.call(api_name, send, replayable)
+        except Exception:
+            if metrics is not None:
+                metrics.end_network()
+            raise
+        if metrics is not None:
+            metrics.end_network(res_obj, stream)
 
         # self.logger.debug("Request headers={}".format(res_obj.request.headers))
 
+        return self.check_response(res_obj)
+
+    def get_api_name_of_url(self, api_post_url):
+        """
+        Find API name of post URL from API mapping of the class.
+
+        :param api_post_url: string of post URL
+        :return api_name: string of API name or None if not found
+        """
+        for api_name, api_suffix in getattr(self, '_api_mapping', {}).items():
+            if api_post_url.endswith(api_suffix):
+                return api_name
+        return None
+
+    def check_response(self, res_obj):
+        """
+        Check status code of response object. Raise PakettikauppaHttpError if the request failed.
+
+        :param res_obj: response object
+        :return res_obj: response object
+        """
         # Response data object is in 'res_obj' variable
         res_status_code = res_obj.status_code
-        self.logger.debug("Response status code={}".format(res_status_code))
+        self.logger.debug("Response status code=%s", res_status_code)
         # self.logger.debug("Response content={}".format(res_obj.content))
 
         if res_status_code != 200 and res_status_code != 201:
             error_text = res_obj.content
-            self.logger.error("Unexpected response text={}".format(error_text))
-            raise PakettikauppaException(error_text)
+            self.logger.error("Unexpected response text=%s", error_text)
+            raise PakettikauppaHttpError(error_text, res_status_code)
 
         return res_obj
 
@@ -216,28 +346,30 @@ class Pakettikauppa(object):
         :return:
         """
         list_data = res_obj.json()
-        self.logger.debug("Response JSON data={}".format(list_data))
+        self.logger.debug("Response JSON data=%s", list_data)
 
         # self.logger.debug("data item={}".format(json.loads(list_data)))
         for item in list_data:
-            self.logger.debug("item={}".format(item))
+            self.logger.debug("item=%s", item)
             self.logger.debug("\n")
 
     def parse_res_to_list(self, res_obj=None):
         """
-        Parse response object to list data.
+        Parse response object to list data. JSON is decoded from response bytes with the JSON decoder of the object.
 
         :param res_obj: response object
         :return list_data: list data of response data from Pakettikauppa
         """
-        if res_obj is not None:
-            list_data = None
-            try:
-                list_data = res_obj.json()
-                self.logger.debug("Response: {}".format(list_data))
-            except Exception:
-                raise PakettikauppaException("Unable to parse JSON data")
-            finally:
-                return list_data
-        else:
+        if res_obj is None:
             return None
+
+        content = res_obj.content
+        try:
+            list_data = self._json_decoder.decode(content)
+        except ValueError as e:
+            self.logger.error("Invalid JSON response: %s", e)
+            raise PakettikauppaException("Unable to parse JSON data: {}".format(e))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Response: %s bytes, %s items", len(content),
+                              len(list_data) if isinstance(list_data, (list, dict)) else 1)
+        return list_data
@@ -0,0 +1,449 @@
+"""Offline pickup point index for Pakettikauppa integration
+
+The module answers pickup point searches from local data instead of calling the search API:
+    1. PickupPointIndex - index of pickup points, queried by postcode prefix or by coordinates
+    2. PickupPointIndex.populate() - fill the index with search_pickup_points() results of many postcodes
+    3. PickupPointIndex.save() / PickupPointIndex.load() - store the index in a compact gzip compressed file
+
+Pickup points are kept as the dictionaries search_pickup_points() returns, so results of the index can be used in
+place of API results. Nearest neighbour queries use k-d tree over points on unit sphere.
+"""
+from __future__ import absolute_import
+
+import gzip
+import heapq
+import io
+import json
+import math
+import threading
+from bisect import bisect_left
+
+from .bulk import run_bounded
+
+EARTH_RADIUS_KM = 6371.0088
+
+_FILE_FORMAT_VERSION = 1
+
+_latitude_keys = ('map_latitude', 'latitude', 'lat')
+_longitude_keys = ('map_longitude', 'longitude', 'lng', 'lon')
+
+
+def _get_first(point, keys):
+    for key in keys:
+        value = point.get(key)
+        if value is not None and value != '':
+            return value
+    return None
+
+
+def get_point_coordinates(point):
+    """
+    Get coordinates of pickup point data.
+
+    :param point: dictionary of pickup point data
+    :return tuple: latitude and longitude as floats or None if the point has no valid coordinates
+    """
+    latitude = _get_first(point, _latitude_keys)
+    longitude = _get_first(point, _longitude_keys)
+    if latitude is None or longitude is None:
+        return None
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not -90.0 <= latitude <= 90.0 or not -180.0 <= longitude <= 180.0:
+        return None
+    return latitude, longitude
+
+
+def _to_unit_vector(latitude, longitude):
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def _chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2.0))
+
+
+def _km_to_chord(distance):
+    return 2.0 * math.sin(min(math.pi, distance / EARTH_RADIUS_KM) / 2.0)
+
+
+def _normalize_postcode(postal_code):
+    return ''.join(str(postal_code).split()).upper()
+
+
+def _normalize_country(country_code2):
+    return 'FI' if country_code2 is None or country_code2 == '' else country_code2.strip().upper()
+
+
+class _KdTree(object):
+    """
+    Static k-d tree over 3D unit vectors. Euclidean (chord) distance between unit vectors grows with great circle
+    distance, so nearest points by chord are nearest points on the globe too.
+    """
+
+    def __init__(self, vectors, ids):
+        """
+        :param vectors: list of (x, y, z) tuples
+        :param ids: list of identifiers with same length as 'vectors'
+        """
+        # Nodes are stored in flat lists, children of a node are found by index
+        self._vectors = []
+        self._ids = []
+        self._axes = []
+        self._left = []
+        self._right = []
+        self._root = self._build(list(zip(vectors, ids)), 0)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _build(self, items, depth):
+        if not items:
+            return -1
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        median = len(items) // 2
+        node = len(self._ids)
+        self._vectors.append(items[median][0])
+        self._ids.append(items[median][1])
+        self._axes.append(axis)
+        self._left.append(-1)
+        self._right.append(-1)
+        self._left[node] = self._build(items[:median], depth + 1)
+        self._right[node] = self._build(items[median + 1:], depth + 1)
+        return node
+
+    def nearest(self, vector, k, max_chord=None, predicate=None):
+        """
+        Find nearest items.
+
+        :param vector: (x, y, z) tuple of query point
+        :param k: maximum number of items
+        :param max_chord: maximum chord distance of items, None = no limit
+        :param predicate: function taking item identifier, only items it accepts are returned
+        :return list_data: list of (chord distance, identifier) tuples, nearest first
+        """
+        if k <= 0 or self._root < 0:
+            return []
+        limit_sq = float('inf') if max_chord is None else max_chord * max_chord
+        # Max-heap of k best items as (-distance_sq, -node) tuples
+        best = []
+        # Stack of (node, squared distance from query to the region of the node)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, region_sq = stack.pop()
+            if node < 0 or region_sq > (-best[0][0] if len(best) == k else limit_sq):
+                continue
+            point = self._vectors[node]
+            dx = point[0] - vector[0]
+            dy = point[1] - vector[1]
+            dz = point[2] - vector[2]
+            distance_sq = dx * dx + dy * dy + dz * dz
+            bound_sq = -best[0][0] if len(best) == k else limit_sq
+            if distance_sq <= bound_sq and (predicate is None or predicate(self._ids[node])):
+                if len(best) == k:
+                    heapq.heapreplace(best, (-distance_sq, -node))
+                else:
+                    heapq.heappush(best, (-distance_sq, -node))
+                bound_sq = -best[0][0] if len(best) == k else limit_sq
+
+            diff = vector[self._axes[node]] - point[self._axes[node]]
+            near, far = (self._left[node], self._right[node]) if diff < 0 else (self._right[node], self._left[node])
+            # Far side is visited only if the splitting plane is closer than current bound
+            if diff * diff <= bound_sq:
+                stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+
+        return [(math.sqrt(-distance_sq), self._ids[-node]) for distance_sq, node in sorted(best, reverse=True)]
+
+
+class PickupPointIndex(object):
+    """
+    Local index of pickup points.
+
+    Points are identified by provider and pickup point ID, adding a point again replaces the old data. Search
+    structures are rebuilt lazily on the first query after points have changed.
+    """
+
+    def __init__(self, points=None, min_prefix_length=3, max_distance=None):
+        """
+        Constructor for PickupPointIndex class.
+
+        :param points: iterable of pickup point dictionaries
+        :param min_prefix_length: shortest postcode prefix used for locating an unknown postcode. Postcode not sharing\
+        this many characters with indexed points has no results, so PkMerchant sends the search to the API.
+        :param max_distance: maximum distance in kilometres of search_pickup_points() results, None = no limit
+        """
+        self.min_prefix_length = min_prefix_length
+        self.max_distance = max_distance
+        self._points = []
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._postcode_keys = []
+        self._postcode_ids = []
+        self._tree = None
+        self._dirty = False
+        if points is not None:
+            self.add(points)
+
+    def __len__(self):
+        return len(self._points)
+
+    @staticmethod
+    def get_point_key(point):
+        """
+        Get identity of pickup point data.
+
+        :param point: dictionary of pickup point data
+        :return tuple: provider and pickup point ID, or all data items if the point has no ID
+        """
+        point_id = _get_first(point, ('pickup_point_id', 'id'))
+        if point_id is None:
+            return tuple(sorted((key, str(value)) for key, value in point.items()))
+        return str(point.get('provider', '')).lower(), str(point_id)
+
+    def add(self, points):
+        """
+        Add pickup points to the index.
+
+        :param points: iterable of pickup point dictionaries, i.e. result of search_pickup_points()
+        :return count: number of points added or replaced
+        """
+        count = 0
+        with self._lock:
+            for point in points:
+                key = self.get_point_key(point)
+                position = self._positions.get(key)
+                if position is None:
+                    self._positions[key] = len(self._points)
+                    self._points.append(dict(point))
+                else:
+                    self._points[position] = dict(point)
+                count += 1
+            if count:
+                self._dirty = True
+        return count
+
+    def populate(self, merchant, postal_codes, country_code2='FI', service_provider=None, max_result=20,
+                 max_in_flight=4):
+        """
+        Fill the index with search results of given postcodes. Searches are sent concurrently.
+
+        :param merchant: PkMerchant object
+        :param postal_codes: iterable of postcode strings
+        :param country_code2: 2 letters of country code
+        :param service_provider: limits searches to a single service provider
+        :param max_result: maximum number of results per postcode
+        :param max_in_flight: maximum number of concurrent searches
+        :return list_data: list of BulkResult objects of the searches
+        """
+        def search(postal_code):
+            points = merchant.search_pickup_points(**{
+                'postal_code': postal_code,
+                'country_code2': country_code2,
+                'street_address': None,
+                'service_provider': service_provider,
+                'max_result': max_result,
+                'timestamp': None,
+            })
+            return self.add(points or [])
+
+        return list(run_bounded(search, postal_codes, max_in_flight))
+
+    def _ensure_built(self):
+        with self._lock:
+            if not self._dirty and self._tree is not None:
+                return self._points, self._postcode_keys, self._postcode_ids, self._tree
+
+            postcode_items = []
+            vectors = []
+            ids = []
+            for position, point in enumerate(self._points):
+                postcode = point.get('postcode')
+                if postcode is not None and postcode != '':
+                    postcode_items.append(((_normalize_country(point.get('country')),
+                                            _normalize_postcode(postcode)), position))
+                coordinates = get_point_coordinates(point)
+                if coordinates is not None:
+                    vectors.append(_to_unit_vector(*coordinates))
+                    ids.append(position)
+            postcode_items.sort()
+
+            self._postcode_keys = [item[0] for item in postcode_items]
+            self._postcode_ids = [item[1] for item in postcode_items]
+            self._tree = _KdTree(vectors, ids)
+            self._dirty = False
+            return self._points, self._postcode_keys, self._postcode_ids, self._tree
+
+    @staticmethod
+    def _make_filter(points, country_code2=None, service_provider=None):
+        if country_code2 is None and service_provider is None:
+            return None
+        country = None if country_code2 is None else _normalize_country(country_code2)
+        provider = None if service_provider is None else service_provider.strip().lower()
+
+        def accept(position):
+            point = points[position]
+            if country is not None and _normalize_country(point.get('country')) != country:
+                return False
+            if provider is not None and str(point.get('provider', '')).strip().lower() != provider:
+                return False
+            return True
+        return accept
+
+    def find_by_postcode(self, prefix, country_code2='FI', service_provider=None, limit=None):
+        """
+        Find pickup points whose postcode starts with the prefix.
+
+        :param prefix: string of postcode prefix, i.e. '331' or '33100'
+        :param country_code2: 2 letters of country code. Default is 'FI'
+        :param service_provider: limits results to a single service provider, case insensitive
+        :param limit: maximum number of results, None = no limit
+        :return list_data: list of pickup point dictionaries ordered by postcode
+        """
+        points, keys, ids, _ = self._ensure_built()
+        country = _normalize_country(country_code2)
+        prefix = _normalize_postcode(prefix)
+        accept = self._make_filter(points, service_provider=service_provider)
+
+        list_data = []
+        i = bisect_left(keys, (country, prefix))
+        while i < len(keys) and keys[i][0] == country and keys[i][1].startswith(prefix):
+            if limit is not None and len(list_data) >= limit:
+                break
+            if accept is None or accept(ids[i]):
+                list_data.append(dict(points[ids[i]]))
+            i += 1
+        return list_data
+
+    def find_nearest(self, latitude, longitude, limit=5, country_code2=None, service_provider=None,
+                     max_distance=None):
+        """
+        Find pickup points nearest to the coordinates.
+
+        :param latitude: float of latitude in degrees
+        :param longitude: float of longitude in degrees
+        :param limit: maximum number of results
+        :param country_code2: limits results to a single country
+        :param service_provider: limits results to a single service provider, case insensitive
+        :param max_distance: maximum distance in kilometres, None = no limit
+        :return list_data: list of (distance in kilometres, pickup point dictionary) tuples, nearest first
+        """
+        points, _, _, tree = self._ensure_built()
+        max_chord = None if max_distance is None else _km_to_chord(max_distance)
+        accept = self._make_filter(points, country_code2, service_provider)
+        found = tree.nearest(_to_unit_vector(float(latitude), float(longitude)), int(limit), max_chord, accept)
+        return [(_chord_to_km(chord), dict(points[position])) for chord, position in found]
+
+    def get_postcode_location(self, postal_code, country_code2='FI', min_prefix_length=None):
+        """
+        Estimate location of postcode as centre of pickup points with the longest matching postcode prefix.
+
+        :param postal_code: string of postcode
+        :param country_code2: 2 letters of country code. Default is 'FI'
+        :param min_prefix_length: shortest prefix to try. Default is min_prefix_length of the index.
+        :return tuple: latitude and longitude, or None if no point shares a long enough prefix with the postcode
+        """
+        if min_prefix_length is None:
+            min_prefix_length = self.min_prefix_length
+        postal_code = _normalize_postcode(postal_code)
+        for length in range(len(postal_code), max(min_prefix_length, 1) - 1, -1):
+            vectors = [_to_unit_vector(*coordinates)
+                       for coordinates in (get_point_coordinates(point)
+                                           for point in self.find_by_postcode(postal_code[:length], country_code2))
+                       if coordinates is not None]
+            if vectors:
+                x = sum(vector[0] for vector in vectors)
+                y = sum(vector[1] for vector in vectors)
+                z = sum(vector[2] for vector in vectors)
+                return math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))
+        return None
+
+    def search_pickup_points(self, **kwargs):
+        """
+        Search pickup points nearest to the postcode, a local counterpart of PkMerchant.search_pickup_points().
+        Street address is not used, the search location is estimated from the postcode.
+
+        :param kwargs: see PkMerchant.get_pickup_point_req_data() function
+        :return list_data: list of pickup point data, empty if no indexed postcode shares min_prefix_length characters\
+        with the postcode or no point is within max_distance
+        """
+        postal_code = kwargs['postal_code']
+        if postal_code is None or postal_code == '':
+            raise ValueError("Require postal code data")
+        country_code2 = _normalize_country(kwargs.get('country_code2'))
+        service_provider = kwargs.get('service_provider')
+        max_result = kwargs.get('max_result')
+        max_result = 5 if max_result is None else int(max_result)
+
+        location = self.get_postcode_location(postal_code, country_code2)
+        if location is None:
+            return []
+        found = self.find_nearest(location[0], location[1], max_result, country_code2, service_provider,
+                                  self.max_distance)
+        return [point for _, point in found]
+
+    def save(self, file_path):
+        """
+        Write the index to gzip compressed JSON file.
+
+        :param file_path: string of file path
+        :return count: number of points written
+        """
+        with self._lock:
+            points = list(self._points)
+
+        # Points with the same keys share one key list, a row holds index of its key list and the values
+        shapes = []
+        shape_positions = {}
+        rows = []
+        for point in points:
+            keys = tuple(point)
+            if keys not in shape_positions:
+                shape_positions[keys] = len(shapes)
+                shapes.append(list(keys))
+            rows.append([shape_positions[keys]] + [point[key] for key in keys])
+
+        data = {'version': _FILE_FORMAT_VERSION, 'shapes': shapes, 'rows': rows}
+        with gzip.open(file_path, 'wb') as f:
+            f.write(json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        return len(points)
+
+    @classmethod
+    def load(cls, file_path, **kwargs):
+        """
+        Read index from a file written by save().
+
+        :param file_path: string of file path
+        :param kwargs: min_prefix_length and max_distance, see constructor
+        :return index: PickupPointIndex object
+        """
+        with gzip.open(file_path, 'rb') as f:
+            data = json.load(io.TextIOWrapper(f, encoding='utf-8'))
+        if data.get('version') != _FILE_FORMAT_VERSION:
+            raise ValueError("Unsupported pickup point index version: {}".format(data.get('version')))
+
+        shapes = data['shapes']
+        return cls((dict(zip(shapes[row[0]], row[1:])) for row in data['rows']), **kwargs)
+
+    @classmethod
+    def from_dump(cls, file_path):
+        """
+        Create index from JSON dump, either a list of pickup point dictionaries or one dictionary per line.
+
+        :param file_path: string of file path, gzip compressed if it ends with '.gz'
+        :return index: PickupPointIndex object
+        """
+        opener = gzip.open if file_path.endswith('.gz') else io.open
+        with opener(file_path, 'rb') as f:
+            text = f.read().decode('utf-8').strip()
+        if text.startswith('['):
+            points = json.loads(text)
+        else:
+            points = [json.loads(line) for line in text.splitlines() if line.strip()]
+        return cls(points)
@@ -5,6 +5,8 @@ The module provides below functionality:
     2. Update customer
     3. Get list of customer
     4. De-activate customer
+    5. Iterate customers while the list is received, or as changes since previous call
+    6. Create customers in bulk with validation before sending and checkpointing
 
 """
 from __future__ import absolute_import
@@ -16,6 +18,12 @@ import re
 import logging
 from time import time
 from .pakettikauppa import Pakettikauppa, PakettikauppaException, check_api_name
+from .instrumentation import instrumented
+from .json_stream import iter_json_array
+from .bulk import run_bounded
+from .onboarding import CREATED, FAILED, STARTED, CustomerCheckpoint, OnboardingReport
+
+_NON_DIGIT_RE = re.compile(r'\D')
 
 
 class PkReseller(Pakettikauppa):
@@ -42,19 +50,25 @@ class PkReseller(Pakettikauppa):
                       'customer_service_phone', 'customer_service_email'
                       )
     _all_accepted_keys_length = len(_accepted_keys)
+    _accepted_key_set = frozenset(_accepted_keys)
+    _mandatory_keys = ('name', 'business_id', 'street_address', 'post_office', 'postcode', 'country', 'phone',
+                       'email', 'contact_person_name', 'contact_person_phone', 'contact_person_email')
 
-    def __init__(self, is_test_mode=0, api_key=None, secret=None):
+    def __init__(self, is_test_mode=0, api_key=None, secret=None, transport=None, resilience=None):
         """
         Constructor for Pakettikauppa reseller class. Initial API and secret key included logger.
         :param is_test_mode: integer value to identify test mode. Zero is default value. If you set '1' to the \
                              parameter, you may skip passing API key and secret key
         :param api_key: API key string
         :param secret: secret key string
+        :param transport: HttpTransport object shared with other objects. If not given, own connection pool is \
+                          created and it is closed in close() function.
+        :param resilience: ResiliencePolicy object for timeouts, retries and circuit breaker
         """
         self._isInTestMode = is_test_mode
 
         # super().__init__(self._isInTestMode) # for Python3 only
-        super(PkReseller, self).__init__(self._isInTestMode)
+        super(PkReseller, self).__init__(self._isInTestMode, transport, resilience)
 
         self.mylogger = logging.getLogger(__name__)
 
@@ -88,7 +102,7 @@ class PkReseller(Pakettikauppa):
         """
         if api_name in self._api_mapping:
             retval = str(self._api_mapping[api_name])
-            self.mylogger.debug("Api suffix: {}".format(retval))
+            self.mylogger.debug("Api suffix: %s", retval)
             return retval
         else:
             raise PakettikauppaException("Invalid API name. Possible value are 'create_customer', 'update_customer',\
@@ -125,13 +139,11 @@ class PkReseller(Pakettikauppa):
         if phone_string is None or phone_string == '':
             return ''
         else:
-            phone_string = str(phone_string)
-            # self.mylogger.debug("Original phone string={}".format(phone_string))
-
-            formatted_string = re.sub('\D', '', phone_string)
-            self.mylogger.debug("[clean_up_phone_data] Formatted phone={}".format(formatted_string))
+            formatted_string = _NON_DIGIT_RE.sub('', str(phone_string))
+            self.mylogger.debug("[clean_up_phone_data] Formatted phone=%s", formatted_string)
             return formatted_string
 
+    @instrumented('list_customer')
     def get_customer_list(self):
         """
         Get list of customer for your account.
@@ -140,6 +152,56 @@ class PkReseller(Pakettikauppa):
         """
         _api_config = self.get_api_config('list_customer')
 
+        input_req_data = self.get_customer_list_req_data()
+
+        res_obj = super(PkReseller, self).send_request('POST', _api_config['api_post_url'], input_req_data)
+        return self.parse_res_to_list(res_obj)
+
+    def iter_customers(self, chunk_size=65536):
+        """
+        Yield customers of your account while the customer list is received. The whole list is fetched with one
+        request, as the customer list API has no paging, and customers are decoded one by one from the response body,
+        so memory usage doesn't grow with the number of customers. Customers are dictionaries or records depending on
+        the JSON decoder of the object, see set_json_decoder().
+
+        :param chunk_size: number of bytes read from the response at a time
+        :return generator: customer data
+        """
+        _api_config = self.get_api_config('list_customer')
+
+        input_req_data = self.get_customer_list_req_data()
+
+        res_obj = super(PkReseller, self).send_request('POST', _api_config['api_post_url'], input_req_data,
+                                                       stream=True)
+        count = 0
+        try:
+            for customer in iter_json_array(res_obj.iter_content(chunk_size), self._json_decoder):
+                count += 1
+                yield customer
+        except ValueError as e:
+            raise PakettikauppaException("Unable to parse JSON data: {}".format(e))
+        finally:
+            res_obj.close()
+        self.mylogger.debug("Received %s customers", count)
+
+    def iter_customer_changes(self, snapshot, chunk_size=65536):
+        """
+        Yield customers which were added, changed or removed since the previous call with the same snapshot. The
+        customer list is still received completely, but only changes are yielded and the snapshot keeps only a digest
+        of each customer. Snapshot is updated when the iteration finishes.
+
+        :param snapshot: CustomerSnapshot object, see customer_snapshot module
+        :param chunk_size: see iter_customers() function
+        :return generator: CustomerChange tuples
+        """
+        return snapshot.diff(self.iter_customers(chunk_size))
+
+    def get_customer_list_req_data(self):
+        """
+        Construct request data for customer list API.
+
+        :return dict_data: dictionary of request data
+        """
         input_req_data = {
             'api_key': self._api_key,
             'timestamp': str(int(time())),
@@ -148,11 +210,11 @@ class PkReseller(Pakettikauppa):
         # Calculate MAC
         digest_string = self.get_hash_sha256(self._secret, **input_req_data)
         input_req_data['hash'] = digest_string
-        self.mylogger.debug("Hash input data={}".format(input_req_data))
+        self.mylogger.debug("Hash input data=%s", input_req_data)
 
-        res_obj = super(PkReseller, self).send_request('POST', _api_config['api_post_url'], input_req_data)
-        return self.parse_res_to_list(res_obj)
+        return input_req_data
 
+    @instrumented('create_customer')
     def create_customer(self, **kwargs):
         """
         Create customer in Pakettikauppa's system.
@@ -160,11 +222,21 @@ class PkReseller(Pakettikauppa):
         :param kwargs: See get_create_customer_req_data() function
         :return list_data: list of response data
         """
-        h_config = self.get_api_config('create_customer')
-
         _hInputData = self.get_create_customer_req_data(**kwargs)
 
-        res_obj = super(PkReseller, self).send_request('POST', h_config['api_post_url'], _hInputData)
+        return self._send_create_customer(_hInputData)
+
+    @instrumented('create_customer')
+    def _send_create_customer(self, req_data):
+        """
+        Send request data of create customer API.
+
+        :param req_data: dictionary of request data, see get_create_customer_req_data() function
+        :return list_data: list of response data
+        """
+        h_config = self.get_api_config('create_customer')
+
+        res_obj = super(PkReseller, self).send_request('POST', h_config['api_post_url'], req_data)
 
         return self.parse_res_to_list(res_obj)
 
@@ -196,36 +268,14 @@ class PkReseller(Pakettikauppa):
         if kwargs is None:
             raise PakettikauppaException("Require input parameters")
 
-        key_length = len(kwargs)
-        self.logger.debug("Kwargs length={}".format(key_length))
-
-        if key_length == 0:
-            raise KeyError("Require input parameters")
+        self.validate_customer_data(kwargs)
 
-        _mandatory_keys = ('name', 'business_id', 'street_address', 'post_office', 'postcode', 'country', 'phone',
-                           'email', 'contact_person_name', 'contact_person_phone', 'contact_person_email')
-        mandatory_key_length = len(_mandatory_keys)
-
-        self.logger.debug("Mandatory key length={}".format(mandatory_key_length))
-        if key_length != self._all_accepted_keys_length:
-            raise KeyError("Too short parameter")
-
-        for key in kwargs:
-            if key not in self._accepted_keys:
-                raise KeyError("Invalid key")
-            else:
-                if key in _mandatory_keys:
-                    if kwargs[key] is None or kwargs[key] == '':
-                        raise ValueError("Mandatory field data is missing")
+        return self._build_create_customer_req_data(kwargs)
 
+    def _build_create_customer_req_data(self, kwargs):
+        # Request data of customer data which is already validated
         payment_service_provider = kwargs['payment_service_provider']
         checkout_account_id = kwargs['psp_merchant_id']
-        if payment_service_provider is not None and payment_service_provider != '':
-            if payment_service_provider not in self.accept_payment_service_provider:
-                raise ValueError("Invalid payment service provider option")
-            else:
-                if checkout_account_id is None or checkout_account_id == '':
-                    raise ValueError("Require checkout account id")
 
         _hInputData = {
             'api_key': self._api_key,
@@ -250,10 +300,208 @@ class PkReseller(Pakettikauppa):
         # Calculate MAC
         digest_string = self.get_hash_sha256(self._secret, **_hInputData)
         _hInputData['hash'] = digest_string
-        self.mylogger.debug("Hash input data={}".format(_hInputData))
+        self.mylogger.debug("Hash input data=%s", _hInputData)
 
         return _hInputData
 
+    def validate_customer_data(self, dict_data):
+        """
+        Validate create customer data. Raise KeyError if keys are missing or unknown and ValueError if values are
+        invalid.
+
+        :param dict_data: dictionary of customer data, see get_create_customer_req_data() function
+        :return:
+        """
+        key_length = len(dict_data)
+        if key_length == 0:
+            raise KeyError("Require input parameters")
+        if key_length != self._all_accepted_keys_length:
+            raise KeyError("Too short parameter")
+        if not self._accepted_key_set.issuperset(dict_data):
+            raise KeyError("Invalid key")
+
+        for key in self._mandatory_keys:
+            value = dict_data[key]
+            if value is None or value == '':
+                raise ValueError("Mandatory field data is missing")
+
+        payment_service_provider = dict_data['payment_service_provider']
+        if payment_service_provider is not None and payment_service_provider != '':
+            if payment_service_provider not in self.accept_payment_service_provider:
+                raise ValueError("Invalid payment service provider option")
+            checkout_account_id = dict_data['psp_merchant_id']
+            if checkout_account_id is None or checkout_account_id == '':
+                raise ValueError("Require checkout account id")
+
+    def validate_customers(self, records, key_field='business_id'):
+        """
+        Validate all create customer records before anything is sent. Records with the same key are also rejected.
+
+        :param records: list of dictionaries of customer data
+        :param key_field: field which identifies a customer, one of the create customer keys
+        :return list_data: list of (index, exception) tuples of invalid records
+        """
+        if key_field not in self._accepted_key_set:
+            raise KeyError("Invalid key field {}".format(key_field))
+
+        list_errors = []
+        seen_keys = set()
+        for index, record in enumerate(records):
+            try:
+                self.validate_customer_data(record)
+            except (KeyError, ValueError) as e:
+                list_errors.append((index, e))
+                continue
+            key = record[key_field]
+            if key is None or key == '':
+                list_errors.append((index, ValueError("Missing {}".format(key_field))))
+                continue
+            key = str(key)
+            if key in seen_keys:
+                list_errors.append((index, ValueError("Duplicate {} {}".format(key_field, key))))
+            seen_keys.add(key)
+        return list_errors
+
+    def create_customers_bulk(self, records, max_in_flight=10, checkpoint=None, key_field='business_id'):
+        """
+        Create many customers concurrently. All records are validated first and invalid records are not sent. A failed
+        request doesn't stop the others.
+
+        With checkpoint, the run can be started again with the same records after a crash or failures. Customers
+        created earlier are skipped, and customers whose request was in flight during the crash are looked up from the
+        customer list by key field, so they are not created twice. Failed customers are sent again.
+
+        :param records: list of dictionaries of customer data, see get_create_customer_req_data() function
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param checkpoint: string of checkpoint file path or CustomerCheckpoint object, see onboarding module
+        :param key_field: field which identifies a customer in the checkpoint and in the customer list
+        :return report: OnboardingReport object, 'results' contains create customer responses by key
+        """
+        records, report = self._validate_bulk_customers(records, key_field)
+        own_checkpoint = checkpoint is not None and not isinstance(checkpoint, CustomerCheckpoint)
+        if own_checkpoint:
+            checkpoint = CustomerCheckpoint(checkpoint)
+        try:
+            if checkpoint is not None:
+                self._recover_customers(checkpoint, key_field, report)
+
+            pending = self._get_pending_customers(records, key_field, checkpoint, report)
+            for bulk_result in run_bounded(lambda item: self._create_one_bulk_customer(item, checkpoint), pending,
+                                           max_in_flight, ordered=False):
+                self._add_bulk_customer_result(bulk_result, report)
+        finally:
+            if own_checkpoint:
+                checkpoint.close()
+            report.finish()
+
+        self.mylogger.info("Bulk customer creation: %s", report.format(0))
+        return report
+
+    def _validate_bulk_customers(self, records, key_field):
+        """
+        Validate records of bulk operation and start its report.
+
+        :param records: iterable of dictionaries of customer data
+        :param key_field: field which identifies a customer
+        :return tuple: list of records and OnboardingReport object with invalid records
+        """
+        records = list(records)
+        invalid_records = self.validate_customers(records, key_field)
+        report = OnboardingReport()
+        report.total = len(records)
+        for index, error in invalid_records:
+            report.invalid += 1
+            report.add_error(index, records[index].get(key_field), error)
+        return records, report
+
+    @staticmethod
+    def _get_pending_customers(records, key_field, checkpoint, report):
+        """
+        Get valid records of bulk operation which are not created yet. Customers created earlier are counted as skipped.
+
+        :param records: list of dictionaries of customer data
+        :param key_field: field which identifies a customer
+        :param checkpoint: CustomerCheckpoint object or None
+        :param report: OnboardingReport object
+        :return list_data: list of tuples of index, key and customer data
+        """
+        invalid_indexes = set(error['index'] for error in report.errors)
+        pending = []
+        for index, record in enumerate(records):
+            if index in invalid_indexes:
+                continue
+            key = str(record[key_field])
+            if checkpoint is not None and checkpoint.get_state(key) == CREATED:
+                if key not in report.customer_ids:
+                    report.skipped += 1
+                    report.customer_ids[key] = checkpoint.entries[key].get('customer_id')
+                continue
+            pending.append((index, key, record))
+        return pending
+
+    @staticmethod
+    def _add_bulk_customer_result(bulk_result, report):
+        index, key, _ = bulk_result.request
+        if bulk_result.ok:
+            report.created += 1
+            report.results[key] = bulk_result.result
+            report.customer_ids[key] = bulk_result.result.get('customer_id')
+        else:
+            report.failed += 1
+            report.add_error(index, key, bulk_result.error)
+
+    def _recover_customers(self, checkpoint, key_field, report, customers=None):
+        # Customers started before a crash may have been created, look them up instead of creating them again
+        in_doubt_keys = set(checkpoint.get_in_doubt_keys())
+        if not in_doubt_keys:
+            return
+        if customers is None:
+            customers = self.iter_customers()
+        for customer in customers:
+            if isinstance(customer, dict):
+                key = customer.get(key_field)
+                customer_id = customer.get('customer_id')
+            else:
+                key = getattr(customer, key_field, None)
+                customer_id = getattr(customer, 'customer_id', None)
+            if key is not None and str(key) in in_doubt_keys:
+                checkpoint.record(str(key), CREATED, customer_id=customer_id, recovered=True)
+                report.recovered += 1
+                report.customer_ids[str(key)] = customer_id
+                in_doubt_keys.discard(str(key))
+                if not in_doubt_keys:
+                    break
+
+    def _create_one_bulk_customer(self, item, checkpoint):
+        """
+        Create one customer of bulk operation. Raise exception if the request fails or Pakettikauppa returns error.
+
+        :param item: tuple of index, key and customer data
+        :param checkpoint: CustomerCheckpoint object or None
+        :return dict_data: response data of create customer API
+        """
+        _, key, record = item
+        if checkpoint is not None:
+            checkpoint.record(key, STARTED)
+        try:
+            # Records are validated by create_customers_bulk()
+            dict_res = self._check_bulk_customer_res(
+                self._send_create_customer(self._build_create_customer_req_data(record)))
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.record(key, FAILED, error=str(e))
+            raise
+        if checkpoint is not None:
+            checkpoint.record(key, CREATED, customer_id=dict_res.get('customer_id'))
+        return dict_res
+
+    @staticmethod
+    def _check_bulk_customer_res(dict_res):
+        if not isinstance(dict_res, dict) or 'error' in dict_res:
+            raise PakettikauppaException(dict_res.get('error') if isinstance(dict_res, dict) else dict_res)
+        return dict_res
+
+    @instrumented('update_customer')
     def update_customer(self, customer_id=None, **kwargs):
         """
         Update customer details in Pakettikauppa's system.
@@ -270,12 +518,12 @@ class PkReseller(Pakettikauppa):
             raise PakettikauppaException("Customer id is empty")
 
         length_arguments = len(kwargs)
-        self.mylogger.debug("Length of input params={}".format(length_arguments))
+        self.mylogger.debug("Length of input params=%s", length_arguments)
 
         if kwargs is None or len(kwargs) == 0:
             return
 
-        self.mylogger.debug("Updating customer id={}".format(customer_id))
+        self.mylogger.debug("Updating customer id=%s", customer_id)
 
         _api_config = self.get_api_config('update_customer')
 
@@ -314,10 +562,11 @@ class PkReseller(Pakettikauppa):
         # Calculate MAC
         digest_string = self.get_hash_sha256(self._secret, **update_req_data)
         update_req_data['hash'] = digest_string
-        self.mylogger.debug("Hash update input data={}".format(update_req_data))
+        self.mylogger.debug("Hash update input data=%s", update_req_data)
 
         return update_req_data
 
+    @instrumented('deactivate_customer')
     def deactivate_customer(self, customer_id):
         """
         De-activate customer account in Pakettikauppa's system.
@@ -332,10 +581,22 @@ class PkReseller(Pakettikauppa):
         if customer_id == '':
             raise ValueError("Require customer id")
 
-        self.mylogger.debug("De-activating customer id={}".format(customer_id))
+        self.mylogger.debug("De-activating customer id=%s", customer_id)
 
         _api_config = self.get_api_config('deactivate_customer')
 
+        input_req_data = self.get_deactivate_customer_req_data(customer_id)
+
+        res_obj = super(PkReseller, self).send_request('POST', _api_config['api_post_url'], input_req_data)
+        return self.parse_res_to_list(res_obj)
+
+    def get_deactivate_customer_req_data(self, customer_id):
+        """
+        Construct request data for de-activating customer account.
+
+        :param customer_id: Pakettikauppa's customer id
+        :return dict_data: dictionary of request data
+        """
         input_req_data = {
             'api_key': self._api_key,
             'customer_id': customer_id,
@@ -345,7 +606,6 @@ class PkReseller(Pakettikauppa):
         # Calculate MAC
         digest_string = self.get_hash_sha256(self._secret, **input_req_data)
         input_req_data['hash'] = digest_string
-        self.mylogger.debug("Hash de-activate input data={}".format(input_req_data))
+        self.mylogger.debug("Hash de-activate input data=%s", input_req_data)
 
-        res_obj = super(PkReseller, self).send_request('POST', _api_config['api_post_url'], input_req_data)
-        return self.parse_res_to_list(res_obj)
+        return input_req_data
@@ -0,0 +1,362 @@
+"""Resilience module for Pakettikauppa integration
+
+The module keeps API calls responsive while Pakettikauppa is slow or unavailable:
+    1. DEFAULT_TIMEOUT, DEFAULT_TIMEOUTS - connect and read timeouts of all APIs and per API name
+    2. RetryPolicy - retry with jittered exponential backoff
+    3. CircuitBreaker - fail fast with CircuitOpenError after repeated failures
+    4. IdempotencyStore - results of create shipment requests by Routing.Id
+    5. ResiliencePolicy - combination of the above, given to PkMerchant or PkReseller as 'resilience'
+
+Only requests which are safe to send again are retried. Read-only APIs (lists, search, status, label) are retried
+after connection errors, timeouts and 429/5xx responses. Other APIs are retried only when the request never reached
+the server: connect timeout or 429 response. Create shipment is made safe to call again with IdempotencyStore, a
+second call with the same Routing.Id returns the stored result instead of creating another shipment.
+"""
+from __future__ import absolute_import
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from .cache import MemoryCacheBackend, make_cache_key
+from .pakettikauppa import PakettikauppaException
+from .transport import DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# (connect timeout, read timeout) in seconds. Labels of many tracking codes take long to generate.
+DEFAULT_TIMEOUTS = {
+    'get_shipping_label': (DEFAULT_TIMEOUT[0], 120.0),
+    'create_shipment': (DEFAULT_TIMEOUT[0], 60.0),
+}
+
+IDEMPOTENT_APIS = ('get_shipping_method_list', 'get_additional_service_list', 'search_pickup_points',
+                   'get_shipment_status', 'get_shipping_label', 'list_customer')
+
+
+class CircuitOpenError(PakettikauppaException):
+    pass
+
+
+class RetryPolicy(object):
+    """
+    Retry with jittered exponential backoff. Delay before retry n (starting from zero) is a random value between zero
+    and min(max_delay, base_delay * 2 ** n).
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.2, max_delay=10.0, retry_statuses=(429, 500, 502, 503, 504),
+                 seed=None, sleep=time.sleep):
+        """
+        Constructor for RetryPolicy class.
+
+        :param max_attempts: maximum number of attempts including the first one. 1 = no retries.
+        :param base_delay: delay in seconds before the first retry, before jitter
+        :param max_delay: maximum delay in seconds
+        :param retry_statuses: HTTP status codes retried for read-only APIs. Only 429 is retried for other APIs.
+        :param seed: seed of random number generator for jitter
+        :param sleep: function which waits given seconds
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.sleep = sleep
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Get delay before next attempt.
+
+        :param attempt: number of failed attempts so far minus one
+        :param retry_after: seconds from Retry-After header, used as minimum delay
+        :return seconds: float
+        """
+        with self._lock:
+            delay = self._random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def can_retry_error(self, api_name, error):
+        """
+        Check whether request which raised exception can be sent again.
+
+        :param api_name: string of API name
+        :param error: requests exception object
+        :return boolean:
+        """
+        if api_name in IDEMPOTENT_APIS:
+            return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                      requests.exceptions.ChunkedEncodingError))
+        # Connection was never established, so the server didn't get the request
+        return isinstance(error, requests.exceptions.ConnectTimeout)
+
+    def can_retry_status(self, api_name, status_code):
+        """
+        Check whether request which got response with the status code can be sent again.
+
+        :param api_name: string of API name
+        :param status_code: integer of HTTP status code
+        :return boolean:
+        """
+        if api_name in IDEMPOTENT_APIS:
+            return status_code in self.retry_statuses
+        return status_code == 429 and 429 in self.retry_statuses
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker shared by all calls of a client. After 'failure_threshold' failures in a row calls fail
+    immediately with CircuitOpenError. After 'reset_timeout' seconds one trial call is let through, the circuit
+    closes if it succeeds and opens again if it fails.
+
+    Connection errors, timeouts and 5xx responses are failures. Other responses are successes.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.time):
+        """
+        Constructor for CircuitBreaker class.
+
+        :param failure_threshold: number of failures in a row which opens the circuit
+        :param reset_timeout: seconds the circuit stays open before a trial call
+        :param clock: function which returns current time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """
+        Check whether a call is allowed. Raise CircuitOpenError if not.
+
+        :return:
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("Circuit is open, Pakettikauppa API calls are failing")
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                raise CircuitOpenError("Circuit is half-open, waiting for result of trial call")
+            self._trial_in_flight = True
+
+    def cancel_call(self):
+        """
+        Forget a call allowed by before_call() which ended without response or connection error, so a half-open
+        circuit allows another trial call.
+
+        :return:
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Circuit opened after %s failures", self._failures)
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class IdempotencyStore(object):
+    """
+    Store of create shipment results by account and Routing.Id. Calls with the same key are serialized inside the
+    process, so concurrent retries of one shipment send at most one request. Keys include the account, so clients of
+    many accounts can share one store and its backend.
+    """
+
+    def __init__(self, backend=None, ttl=86400):
+        """
+        Constructor for IdempotencyStore class.
+
+        :param backend: CacheBackend object, see cache module. Default is MemoryCacheBackend with 10000 entries. Use \
+                        FileCacheBackend or RedisCacheBackend to remember results between processes.
+        :param ttl: seconds a result is kept
+        """
+        self._backend = backend if backend is not None else MemoryCacheBackend(10000)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def _make_key(key, account):
+        return make_cache_key('idempotency', account, key)
+
+    def get(self, key, account=None):
+        """
+        Get stored result.
+
+        :param key: string of idempotency key, i.e. Routing.Id
+        :param account: string of account, i.e. API key of the client
+        :return value: stored value or None if not found or expired
+        """
+        entry = self._backend.get(self._make_key(key, account))
+        if entry is None or time.time() - entry['stored_at'] > self._ttl:
+            return None
+        return entry['value']
+
+    def put(self, key, value, account=None):
+        """
+        Store result.
+
+        :param key: string of idempotency key
+        :param value: JSON serializable value
+        :param account: string of account, i.e. API key of the client
+        :return:
+        """
+        self._backend.set(self._make_key(key, account), {'value': value, 'stored_at': time.time()})
+
+    @contextmanager
+    def lock(self, key, account=None):
+        """
+        Hold lock of the key inside the process.
+
+        :param key: string of idempotency key
+        :param account: string of account, i.e. API key of the client
+        """
+        key = self._make_key(key, account)
+        with self._lock:
+            key_lock, users = self._key_locks.get(key, (None, 0))
+            if key_lock is None:
+                key_lock = threading.Lock()
+            self._key_locks[key] = (key_lock, users + 1)
+        try:
+            with key_lock:
+                yield
+        finally:
+            with self._lock:
+                key_lock, users = self._key_locks[key]
+                if users == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (key_lock, users - 1)
+
+
+class ResiliencePolicy(object):
+    """
+    Timeouts, retries, circuit breaker and idempotency store of a client.
+    """
+
+    def __init__(self, timeouts=None, default_timeout=DEFAULT_TIMEOUT, retry=None, circuit_breaker=None,
+                 idempotency_store=None):
+        """
+        Constructor for ResiliencePolicy class.
+
+        :param timeouts: dictionary of API name to (connect, read) timeout tuple, added to DEFAULT_TIMEOUTS
+        :param default_timeout: (connect, read) timeout tuple of other APIs
+        :param retry: RetryPolicy object. Default is RetryPolicy(). Use RetryPolicy(max_attempts=1) for no retries.
+        :param circuit_breaker: CircuitBreaker object. No circuit breaker if not given.
+        :param idempotency_store: IdempotencyStore object for create shipment. Not used if not given.
+        """
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.default_timeout = default_timeout
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.idempotency_store = idempotency_store
+
+    def get_timeout(self, api_name):
+        return self.timeouts.get(api_name, self.default_timeout)
+
+    def call(self, api_name, send, replayable=True):
+        """
+        Send request with retries and circuit breaker.
+
+        :param api_name: string of API name, decides timeout and whether the request may be retried
+        :param send: function without arguments which sends the request and returns response object
+        :param replayable: False if request body can be sent only once, i.e. generator. Then it isn't retried.
+        :return res_obj: response object of the last attempt
+        """
+        retry = self.retry
+        breaker = self.circuit_breaker
+        attempt = 0
+        while True:
+            try:
+                res_obj = send() if breaker is None else self._send_with_breaker(send, breaker)
+            except requests.exceptions.RequestException as e:
+                if not replayable or attempt + 1 >= retry.max_attempts or not retry.can_retry_error(api_name, e):
+                    raise
+                delay = retry.get_delay(attempt)
+                logger.warning("Retrying %s in %.2f s after %s", api_name, delay, e.__class__.__name__)
+            else:
+                status_code = res_obj.status_code
+                if not replayable or attempt + 1 >= retry.max_attempts or \
+                        not retry.can_retry_status(api_name, status_code):
+                    return res_obj
+                delay = retry.get_delay(attempt, self._get_retry_after(res_obj))
+                res_obj.close()
+                logger.warning("Retrying %s in %.2f s after HTTP %s", api_name, delay, status_code)
+            retry.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _send_with_breaker(send, breaker):
+        """
+        Send one attempt and record its result in circuit breaker. Attempt which ends with other exception than request
+        error is cancelled, so it doesn't block trial calls of half-open circuit.
+
+        :param send: function which sends the request
+        :param breaker: CircuitBreaker object
+        :return res_obj: response object
+        """
+        breaker.before_call()
+        recorded = False
+        try:
+            try:
+                res_obj = send()
+            except requests.exceptions.RequestException:
+                breaker.record_failure()
+                recorded = True
+                raise
+            if res_obj.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            recorded = True
+            return res_obj
+        finally:
+            if not recorded:
+                breaker.cancel_call()
+
+    @staticmethod
+    def _get_retry_after(res_obj):
+        value = res_obj.headers.get('Retry-After') if res_obj.headers else None
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
@@ -0,0 +1,144 @@
+"""Shipment template module for Pakettikauppa integration
+
+The module builds create shipment request XML from a precompiled template:
+    1. ShipmentTemplate - sender address, routing account and product code are written once when the template is
+       created, only per-order data is written for each shipment
+
+Output is byte-identical to PkMerchant.get_xml_shipment_req_data() for the same data and input is validated with
+the same rules.
+"""
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from .pakettikauppa import PakettikauppaException
+from .xml_stream import ShipmentXmlSerializer
+from .xmlwriter import XmlWriter, XML_DECLARATION
+
+
+class ShipmentTemplate(object):
+    """
+    Template for create shipment requests of one sender and product.
+
+    Create template with PkMerchant.get_shipment_template() and build request data with render(). The template
+    doesn't change after it is created, so one template can be shared between threads.
+    """
+
+    def __init__(self, merchant, sender, product_code, routing_account=None):
+        """
+        Constructor for ShipmentTemplate class.
+
+        :param merchant: PkMerchant object, its signer is used for routing key
+        :param sender: dictionary of sender address. See PkMerchant._create_shipment_address_element() function
+        :param product_code: string of Posti's product code
+        :param routing_account: string of routing account. Default is API key of the merchant.
+        """
+        if sender is None or 'Sender.Email' not in sender:
+            raise KeyError("Missing mandatory key in Shipment.Sender element")
+        if product_code is None or product_code == '':
+            raise PakettikauppaException("Require product code in 'Consignment.Product'")
+
+        self._merchant = merchant
+        self._sender = dict(sender)
+        self._product_code = str(product_code)
+        if routing_account is None:
+            routing_account = merchant._api_key
+        self._routing_account = str(routing_account)
+
+        self._signer = merchant.get_signer()
+
+        writer = XmlWriter(depth=2)
+        writer.element('Routing.Account', self._routing_account)
+        self._head = XML_DECLARATION + u'<eChannel>\n  <ROUTING>\n' + writer.fragment()
+
+        self._serializer = ShipmentXmlSerializer(merchant, pretty_print=True)
+
+        writer = XmlWriter(depth=2)
+        self._serializer.write_address(writer, 'sender', self._sender)
+        self._sender_xml = writer.fragment()
+
+        writer = XmlWriter(depth=3)
+        writer.element('Consignment.Product', self._product_code)
+        self._product_xml = writer.fragment()
+
+    def get_sender(self):
+        return dict(self._sender)
+
+    def get_product_code(self):
+        return self._product_code
+
+    def get_routing_key(self, routing_id):
+        """
+        Calculate routing key, same as PkMerchant.get_routing_key().
+
+        :param routing_id: string of routing ID
+        :return digest_string: string of MD5 digest
+        """
+        return self._signer.get_routing_key(routing_id)
+
+    def render(self, routing_id, routing_name, recipient, consignment, routing_time=None):
+        """
+        Construct XML string of request data for create shipment API.
+
+        :param routing_id: string of routing ID, could be order id or shop id
+        :param routing_name: string of routing name, could be order alias or shop alias
+        :param recipient: dictionary of recipient address. See PkMerchant._create_shipment_address_element() function
+        :param consignment: dictionary of consignment data. See PkMerchant._create_shipment_consignment_element() \
+                            function. 'Consignment.Product' key can be left out, product code of the template is used.
+        :param routing_time: datetime string in following format '%Y%m%d%H%M%S'. Default is current time.
+        :return xml_string: UTF-8 encoded bytes of XML request data
+        """
+        if recipient is None or 'Recipient.Email' not in recipient:
+            raise KeyError("Missing mandatory key in Shipment.Recipient element")
+        if consignment is None or 'Consignment.Parcel' not in consignment:
+            raise KeyError("Missing mandatory key in Shipment.Consignment element")
+        product_code = consignment.get('Consignment.Product')
+        if product_code is not None and str(product_code) != self._product_code:
+            raise ValueError("Consignment.Product differs from product code of the template")
+        if routing_id is None or routing_id == '':
+            raise ValueError("Need routing id parameter")
+        if routing_time is None:
+            routing_time = datetime.now().strftime('%Y%m%d%H%M%S')
+
+        writer = XmlWriter(depth=2)
+        writer.raw(self._head)
+        writer.element('Routing.Id', str(routing_id))
+        writer.element('Routing.Key', self.get_routing_key(routing_id))
+        writer.element('Routing.Name', str(routing_name))
+        writer.element('Routing.Time', str(routing_time))
+        writer.raw(u'  </ROUTING>\n  <Shipment>\n')
+
+        serializer = self._serializer
+        serializer.write_address(writer, 'recipient', recipient)
+        writer.raw(self._sender_xml)
+
+        serializer.write_consignment_head(writer, consignment, self._product_xml)
+        for parcel in serializer.iter_parcels(consignment):
+            serializer.write_parcel(writer, parcel)
+        writer.end()
+        writer.raw(u'  </Shipment>\n</eChannel>\n')
+        return writer.fragment().encode('utf-8')
+
+    def render_request(self, **kwargs):
+        """
+        Construct XML string from the same input as PkMerchant.get_xml_shipment_req_data(). Sender must be the same
+        as sender of the template.
+
+        :param kwargs: see PkMerchant.get_xml_shipment_req_data() function
+        :return xml_string: UTF-8 encoded bytes of XML request data
+        """
+        if 'eChannel' not in kwargs:
+            raise KeyError("eChannel key is missing")
+        self._merchant.validate_routing_data(**kwargs)
+        if 'Shipment' not in kwargs['eChannel']:
+            raise KeyError("Shipment key is missing")
+
+        routing = kwargs['eChannel']['ROUTING']
+        shipment = kwargs['eChannel']['Shipment']
+        if shipment.get('Shipment.Sender') != self._sender:
+            raise ValueError("Shipment.Sender differs from sender of the template")
+        if str(routing['Routing.Account']) != self._routing_account:
+            raise ValueError("Routing.Account differs from routing account of the template")
+
+        return self.render(routing['Routing.Id'], routing['Routing.Name'], shipment.get('Shipment.Recipient'),
+                           shipment.get('Shipment.Consignment'), routing['Routing.Time'])
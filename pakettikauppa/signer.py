@@ -0,0 +1,120 @@
+"""Signer module for Pakettikauppa integration
+
+The module calculates request signatures for one credential set:
+    1. Signer.sign() - HMAC-SHA256 digest of request parameters, same as Pakettikauppa.get_hash_sha256()
+    2. Signer.sign_many() - digests of many parameter dictionaries for bulk operations
+    3. Signer.get_routing_key() - MD5 routing key of create shipment and get shipping label requests, same as
+       Pakettikauppa.get_md5_hash()
+
+HMAC state keyed with the secret and MD5 state of the API key are created once and copied for each digest. Routing
+keys are kept in a bounded LRU cache because the same routing ID is often signed several times, i.e. when a shipment
+is created and its label is fetched.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+class Signer(object):
+    """
+    Signer of one API key and secret. Signer can be shared between threads.
+    """
+
+    def __init__(self, api_key, secret, routing_key_cache_size=1024):
+        """
+        Constructor for Signer class.
+
+        :param api_key: string of API key. Routing keys can't be calculated without it.
+        :param secret: string of secret key
+        :param routing_key_cache_size: maximum number of routing keys kept in the cache, zero disables the cache
+        """
+        if secret is None or secret == '':
+            raise ValueError("Need Secret key parameter")
+
+        self._api_key = api_key
+        self._secret = secret
+        self._hmac = hmac.new(_to_bytes(str(secret)), digestmod=hashlib.sha256)
+
+        if api_key is None or api_key == '':
+            self._routing_key_hash = None
+        else:
+            self._routing_key_hash = hashlib.md5(_to_bytes(str(api_key)))
+        self._routing_key_suffix = str(secret)
+
+        self._routing_keys = OrderedDict()
+        self._routing_key_cache_size = routing_key_cache_size
+        self._lock = threading.Lock()
+
+    def matches(self, api_key, secret):
+        """
+        Check whether the signer was created for the credentials.
+
+        :param api_key: string of API key
+        :param secret: string of secret key
+        :return boolean:
+        """
+        return self._api_key == api_key and self._secret == secret
+
+    def sign(self, dict_data):
+        """
+        Calculate HMAC-SHA256 digest of request parameters. Values are converted to strings and joined with '&' in
+        sorted key order.
+
+        :param dict_data: dictionary of request parameters
+        :return digest_string: string of lowercase hex digest
+        """
+        if dict_data is None or len(dict_data) == 0:
+            raise KeyError("Expect input parameters")
+
+        plain_text = '&'.join([str(dict_data[key]) for key in sorted(dict_data)])
+        hash_object = self._hmac.copy()
+        hash_object.update(_to_bytes(plain_text))
+        return str(hash_object.hexdigest())
+
+    def sign_many(self, list_data):
+        """
+        Calculate digests of many request parameter dictionaries.
+
+        :param list_data: iterable of dictionaries of request parameters
+        :return list_digest: list of digest strings in input order
+        """
+        return [self.sign(dict_data) for dict_data in list_data]
+
+    def get_routing_key(self, routing_id):
+        """
+        Calculate routing key, MD5 digest of API key, routing ID and secret.
+
+        :param routing_id: string of routing ID
+        :return digest_string: string of MD5 digest
+        """
+        if self._routing_key_hash is None:
+            raise ValueError("Need API key parameter")
+        if routing_id is None or routing_id == '':
+            raise ValueError("Need routing id parameter")
+
+        routing_id = str(routing_id)
+        with self._lock:
+            digest_string = self._routing_keys.get(routing_id)
+            if digest_string is not None:
+                self._routing_keys[routing_id] = self._routing_keys.pop(routing_id)
+                return digest_string
+
+        hash_object = self._routing_key_hash.copy()
+        hash_object.update(_to_bytes(routing_id + self._routing_key_suffix))
+        digest_string = hash_object.hexdigest()
+
+        if self._routing_key_cache_size > 0:
+            with self._lock:
+                self._routing_keys[routing_id] = digest_string
+                while len(self._routing_keys) > self._routing_key_cache_size:
+                    self._routing_keys.popitem(last=False)
+        return digest_string
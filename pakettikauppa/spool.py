@@ -0,0 +1,655 @@
+"""Shipment spool module for Pakettikauppa integration
+
+The module lets checkout store shipments locally and create them in Pakettikauppa in the background:
+    1. ShipmentSpool - durable queue of shipments with background drain workers
+    2. SpoolResult - result of one spooled shipment given to the result callback
+
+Shipments are appended to a write-ahead log in segment files. Appending only writes to the file, fsync is done by a
+background thread every 'fsync_interval' seconds for all appends in between (group commit). append(durable=True)
+waits for the fsync which covers the shipment.
+
+Drain workers build request data with PkMerchant.get_create_shipment_req_data() and send it with
+create_shipment_from_xml(). Progress is written to an ack file next to each segment: 'sending' is synced to disk
+before the request is sent, 'done' or 'failed' after the response. A segment is deleted when all its shipments are
+done or failed.
+
+Recovery on start continues from the logs. Shipments without 'sending' are sent. A shipment which was 'sending' when
+the process stopped may have been created, so it is not sent again. It is reported as 'in_doubt' unless the
+idempotency store of the merchant's resilience policy has its result, and can be sent again with requeue() after
+checking. Appending a Routing.Id which is already in the spool returns the existing record instead of a new one. Use
+the idempotency store with a file or Redis backend to remember Routing.Ids of deleted segments between processes.
+
+Retries: requests which failed before reaching Pakettikauppa (connect timeout, connection refused, open circuit) and
+HTTP 429 responses are retried with backoff. Other connection errors, read timeouts and 5xx responses may have created
+the shipment, so they end as 'in_doubt'. Invalid shipment data, other HTTP error responses and error status in create
+shipment response are 'failed'.
+"""
+from __future__ import absolute_import
+
+import heapq
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+import requests
+
+try:
+    from urllib3.exceptions import NewConnectionError
+except ImportError:
+    NewConnectionError = None
+
+from .pakettikauppa import PakettikauppaHttpError
+from .resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENDING = 'sending'
+DONE = 'done'
+FAILED = 'failed'
+IN_DOUBT = 'in_doubt'
+_RETRY = 'retry'
+_REQUEUED = 'requeued'
+
+_TERMINAL_STATES = (DONE, FAILED)
+
+# Frame of a log record: payload length and CRC-32 of payload
+_HEADER = struct.Struct('>II')
+
+WAL_SUFFIX = '.wal'
+ACK_SUFFIX = '.ack'
+
+
+def _encode_frame(dict_data):
+    payload = json.dumps(dict_data, separators=(',', ':')).encode('utf-8')
+    return _HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def read_frames(path):
+    """
+    Read records of a log file. Reading stops at a torn or corrupted record, i.e. after a crash during write.
+
+    :param path: string of file path
+    :return tuple: list of record dictionaries and byte length of valid data
+    """
+    list_records = []
+    valid_length = 0
+    with open(path, 'rb') as f:
+        data = f.read()
+    while valid_length + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, valid_length)
+        start = valid_length + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+            break
+        try:
+            list_records.append(json.loads(payload.decode('utf-8')))
+        except ValueError:
+            break
+        valid_length = start + length
+    return list_records, valid_length
+
+
+class _LogFile(object):
+    """
+    Append-only log file with group commit. Writes are numbered, sync_until() returns when the write of given
+    number is on disk. Concurrent callers share one fsync.
+    """
+
+    def __init__(self, path, stats):
+        self.path = path
+        self._stats = stats
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self.size = self._file.tell()
+
+    def write(self, dict_data):
+        frame = _encode_frame(dict_data)
+        with self._lock:
+            self._file.write(frame)
+            self._file.flush()
+            self._written += 1
+            self.size += len(frame)
+            return self._written
+
+    def sync_until(self, number=None):
+        if number is None:
+            number = self._written
+        if self._synced >= number:
+            return
+        with self._sync_lock:
+            if self._synced >= number:
+                return
+            with self._lock:
+                if self._file.closed:
+                    return
+                target = self._written
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self._stats['fsyncs'] += 1
+            self._synced = target
+
+    @property
+    def dirty(self):
+        return self._synced < self._written
+
+    def close(self):
+        self.sync_until()
+        with self._lock:
+            self._file.close()
+
+
+class _Segment(object):
+    """
+    WAL segment with its ack file. 'open_ids' contains records which are not done or failed.
+    """
+
+    def __init__(self, directory, first_id, stats):
+        self.first_id = first_id
+        name = '{:016d}'.format(first_id)
+        self.wal_path = os.path.join(directory, name + WAL_SUFFIX)
+        self.ack_path = os.path.join(directory, name + ACK_SUFFIX)
+        self._stats = stats
+        self.wal = None
+        self.ack = None
+        self.open_ids = set()
+
+    def get_wal(self):
+        if self.wal is None:
+            self.wal = _LogFile(self.wal_path, self._stats)
+        return self.wal
+
+    def get_ack(self):
+        if self.ack is None:
+            self.ack = _LogFile(self.ack_path, self._stats)
+        return self.ack
+
+    def close(self):
+        for log_file in (self.wal, self.ack):
+            if log_file is not None:
+                log_file.close()
+
+    def delete(self):
+        self.close()
+        for path in (self.wal_path, self.ack_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SpoolResult(object):
+    """
+    Result of one spooled shipment.
+    """
+    __slots__ = ('record_id', 'shipment', 'state', 'result', 'error', 'attempts')
+
+    def __init__(self, record_id, shipment, state, result=None, error=None, attempts=0):
+        """
+        :param record_id: integer ID of the record in the spool
+        :param shipment: dictionary of create shipment request data
+        :param state: DONE, FAILED or IN_DOUBT
+        :param result: dictionary of create shipment response, see PkMerchant.parse_xml_create_shipment_res()
+        :param error: string of error message
+        :param attempts: number of requests sent by this process
+        """
+        self.record_id = record_id
+        self.shipment = shipment
+        self.state = state
+        self.result = result
+        self.error = error
+        self.attempts = attempts
+
+    def __repr__(self):
+        return "SpoolResult(record_id={}, state={!r})".format(self.record_id, self.state)
+
+
+class _Record(object):
+    __slots__ = ('record_id', 'segment', 'shipment', 'routing_id', 'state', 'attempts', 'result', 'error')
+
+    def __init__(self, record_id, segment, shipment, routing_id):
+        self.record_id = record_id
+        self.segment = segment
+        self.shipment = shipment
+        self.routing_id = routing_id
+        self.state = PENDING
+        self.attempts = 0
+        self.result = None
+        self.error = None
+
+
+def _get_routing_id(shipment):
+    try:
+        return str(shipment['eChannel']['ROUTING']['Routing.Id'])
+    except (KeyError, TypeError):
+        raise ValueError("Shipment without Routing.Id")
+
+
+def _is_not_sent(error):
+    # Request never reached the server or was rejected before processing, so sending it again can't create a second
+    # shipment
+    if isinstance(error, (requests.exceptions.ConnectTimeout, CircuitOpenError)):
+        return True
+    if isinstance(error, PakettikauppaHttpError):
+        return error.status_code == 429
+    if isinstance(error, requests.exceptions.ConnectionError) and NewConnectionError is not None:
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+class ShipmentSpool(object):
+    """
+    Durable queue of create shipment requests drained by background workers.
+    """
+
+    def __init__(self, directory, merchant, workers=4, on_result=None, fsync_interval=0.01,
+                 segment_size=16 * 1024 * 1024, max_attempts=5, base_delay=0.5, max_delay=60.0):
+        """
+        Constructor for ShipmentSpool class. Existing logs in the directory are recovered.
+
+        :param directory: string of spool directory, created if missing
+        :param merchant: PkMerchant object which sends the shipments
+        :param workers: number of drain workers, i.e. maximum number of requests in flight
+        :param on_result: function which takes SpoolResult when a shipment is done, failed or in doubt. Called in a
+                          worker thread.
+        :param fsync_interval: seconds between fsyncs of appended records
+        :param segment_size: bytes of WAL segment before a new segment is started
+        :param max_attempts: maximum number of requests of a shipment
+        :param base_delay: seconds before first retry, doubled for each retry
+        :param max_delay: maximum seconds between retries
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.directory = directory
+        self.merchant = merchant
+        self.workers = workers
+        self.on_result = on_result
+        self.fsync_interval = fsync_interval
+        self.segment_size = segment_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {'appended': 0, 'sent': 0, 'done': 0, 'failed': 0, 'in_doubt': 0, 'retries': 0, 'fsyncs': 0}
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._records = {}
+        self._routing_ids = {}
+        self._segments = {}
+        self._ready = deque()
+        self._delayed = []
+        self._in_flight = 0
+        self._threads = []
+        self._running = False
+        self._stopped = threading.Event()
+        self._next_id = 1
+        self._active = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._recover()
+
+    # Recovery
+
+    def _recover(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(WAL_SUFFIX))
+        for name in names:
+            first_id = int(name[:-len(WAL_SUFFIX)])
+            segment = _Segment(self.directory, first_id, self.stats)
+            self._segments[first_id] = segment
+            list_records, valid_length = read_frames(segment.wal_path)
+            self._truncate(segment.wal_path, valid_length)
+            for dict_data in list_records:
+                record = _Record(dict_data['id'], segment, dict_data['shipment'], dict_data['routing_id'])
+                self._records[record.record_id] = record
+                self._next_id = max(self._next_id, record.record_id + 1)
+            if os.path.exists(segment.ack_path):
+                list_acks, valid_length = read_frames(segment.ack_path)
+                self._truncate(segment.ack_path, valid_length)
+                for ack in list_acks:
+                    record = self._records.get(ack['id'])
+                    if record is not None:
+                        self._apply_ack(record, ack)
+
+        store = self._get_idempotency_store()
+        for record in sorted(self._records.values(), key=lambda item: item.record_id):
+            if record.state in (SENDING, IN_DOUBT):
+                result = store.get(record.routing_id, self.merchant._api_key) if store is not None else None
+                if result is not None:
+                    record.state = DONE
+                    record.result = result
+                    self._write_ack(record, DONE, result=result)
+                else:
+                    if record.state == SENDING:
+                        logger.warning("Shipment %s with Routing.Id %s was being sent when the spool stopped",
+                                       record.record_id, record.routing_id)
+                    record.state = IN_DOUBT
+                    self.stats['in_doubt'] += 1
+            if record.state not in _TERMINAL_STATES:
+                record.segment.open_ids.add(record.record_id)
+                self._routing_ids[record.routing_id] = record.record_id
+            elif record.state == DONE:
+                self._routing_ids[record.routing_id] = record.record_id
+            if record.state == PENDING:
+                self._ready.append(record.record_id)
+
+        for first_id in sorted(self._segments)[:-1]:
+            self._delete_segment_if_finished(self._segments[first_id])
+        if self._segments:
+            last = self._segments[max(self._segments)]
+            if os.path.getsize(last.wal_path) < self.segment_size:
+                self._active = last
+        logger.debug("Recovered %s records, %s pending", len(self._records), len(self._ready))
+
+    @staticmethod
+    def _truncate(path, valid_length):
+        if os.path.getsize(path) > valid_length:
+            logger.warning("Truncated torn record at end of %s", path)
+            with open(path, 'r+b') as f:
+                f.truncate(valid_length)
+
+    @staticmethod
+    def _apply_ack(record, ack):
+        state = ack['state']
+        if state in (_RETRY, _REQUEUED):
+            record.state = PENDING
+        else:
+            record.state = state
+        record.attempts = ack.get('attempts', record.attempts)
+        record.result = ack.get('result')
+        record.error = ack.get('error')
+
+    def _get_idempotency_store(self):
+        policy = getattr(self.merchant, '_resilience', None)
+        return policy.idempotency_store if policy is not None else None
+
+    # Appending
+
+    def append(self, shipment, durable=False):
+        """
+        Append shipment to the spool. Appending a Routing.Id which is already pending, in doubt or done returns the
+        existing record ID without adding the shipment again. Routing.Ids of deleted segments are forgotten.
+
+        :param shipment: dictionary of create shipment request data, see PkMerchant.get_xml_shipment_req_data()
+        :param durable: if True, wait until the record is synced to disk
+        :return record_id: integer ID of the record
+        """
+        routing_id = _get_routing_id(shipment)
+        with self._lock:
+            record_id = self._routing_ids.get(routing_id)
+            if record_id is not None:
+                return record_id
+            record_id = self._next_id
+            self._next_id += 1
+            segment = self._get_active_segment(record_id)
+            number = segment.get_wal().write({'id': record_id, 'routing_id': routing_id, 'shipment': shipment})
+            record = _Record(record_id, segment, shipment, routing_id)
+            self._records[record_id] = record
+            self._routing_ids[routing_id] = record_id
+            segment.open_ids.add(record_id)
+            self._ready.append(record_id)
+            self.stats['appended'] += 1
+            self._cond.notify()
+        if durable:
+            segment.get_wal().sync_until(number)
+        return record_id
+
+    def _get_active_segment(self, record_id):
+        active = self._active
+        if active is not None and active.get_wal().size < self.segment_size:
+            return active
+        if active is not None:
+            active.get_wal().sync_until()
+            self._delete_segment_if_finished(active, force_inactive=True)
+        segment = _Segment(self.directory, record_id, self.stats)
+        self._segments[record_id] = segment
+        self._active = segment
+        return segment
+
+    def _delete_segment_if_finished(self, segment, force_inactive=False):
+        if segment.open_ids or (segment is self._active and not force_inactive):
+            return
+        segment.delete()
+        del self._segments[segment.first_id]
+        for record_id in [record_id for record_id, record in self._records.items() if record.segment is segment]:
+            record = self._records.pop(record_id)
+            if self._routing_ids.get(record.routing_id) == record_id:
+                del self._routing_ids[record.routing_id]
+        if segment is self._active:
+            self._active = None
+
+    def flush(self):
+        """
+        Sync all appended records and acks to disk.
+
+        :return:
+        """
+        with self._lock:
+            segments = list(self._segments.values())
+        for segment in segments:
+            for log_file in (segment.wal, segment.ack):
+                if log_file is not None:
+                    log_file.sync_until()
+
+    # Draining
+
+    def start(self):
+        """
+        Start drain workers and fsync thread.
+
+        :return self:
+        """
+        with self._lock:
+            if self._running:
+                return self
+            self._running = True
+            self._stopped.clear()
+        for i in range(self.workers):
+            self._start_thread(self._work, 'pakettikauppa-spool-worker-{}'.format(i))
+        self._start_thread(self._sync_loop, 'pakettikauppa-spool-sync')
+        return self
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _sync_loop(self):
+        while not self._stopped.wait(self.fsync_interval):
+            self.flush()
+
+    def _take(self):
+        with self._lock:
+            while self._running:
+                now = time.time()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[1])
+                if self._ready:
+                    self._in_flight += 1
+                    return self._records[self._ready.popleft()]
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
+            return None
+
+    def _work(self):
+        while True:
+            record = self._take()
+            if record is None:
+                return
+            try:
+                self._send(record)
+            except Exception:
+                logger.exception("Spool worker failed with shipment %s", record.record_id)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _write_ack(self, record, state, **kwargs):
+        ack = dict(kwargs, id=record.record_id, state=state, attempts=record.attempts)
+        return record.segment.get_ack().write(ack)
+
+    def _send(self, record):
+        try:
+            xml_req_data = self.merchant.get_create_shipment_req_data(**record.shipment)
+        except Exception as e:
+            # Invalid shipment data, nothing is sent
+            self._finish(record, FAILED, error='{}: {}'.format(e.__class__.__name__, e))
+            return
+
+        record.attempts += 1
+        record.state = SENDING
+        # 'sending' must be on disk before the request, otherwise a crash could send the shipment twice
+        number = self._write_ack(record, SENDING)
+        record.segment.get_ack().sync_until(number)
+        self.stats['sent'] += 1
+
+        try:
+            dict_res = self.merchant.create_shipment_from_xml(xml_req_data, record.routing_id)
+        except Exception as e:
+            if _is_not_sent(e):
+                self._retry_or_fail(record, str(e))
+            elif isinstance(e, PakettikauppaHttpError) and e.status_code < 500:
+                # Request was rejected, the shipment wasn't created
+                self._finish(record, FAILED, error='HTTP {}: {}'.format(e.status_code, e))
+            else:
+                self._finish(record, IN_DOUBT, error='{}: {}'.format(e.__class__.__name__, e))
+            return
+
+        if dict_res['status'] == 1:
+            self._finish(record, DONE, result=dict_res)
+        else:
+            self._finish(record, FAILED, result=dict_res, error=dict_res.get('message'))
+
+    def _retry_or_fail(self, record, error):
+        if record.attempts >= self.max_attempts:
+            self._finish(record, FAILED, error=error)
+            return
+        delay = min(self.max_delay, self.base_delay * (2 ** (record.attempts - 1)))
+        self._write_ack(record, _RETRY, error=error)
+        logger.warning("Retrying shipment %s in %.1f s: %s", record.record_id, delay, error)
+        with self._lock:
+            record.state = PENDING
+            record.error = error
+            self.stats['retries'] += 1
+            heapq.heappush(self._delayed, (time.time() + delay, record.record_id))
+            self._cond.notify()
+
+    def _finish(self, record, state, result=None, error=None):
+        self._write_ack(record, state, result=result, error=error)
+        with self._lock:
+            record.state = state
+            record.result = result
+            record.error = error
+            self.stats[state] += 1
+            if state in _TERMINAL_STATES:
+                record.segment.open_ids.discard(record.record_id)
+                if state == FAILED:
+                    # Failed Routing.Id can be appended again with corrected data
+                    self._routing_ids.pop(record.routing_id, None)
+                self._delete_segment_if_finished(record.segment)
+        if self.on_result is not None:
+            try:
+                self.on_result(SpoolResult(record.record_id, record.shipment, state, result, error, record.attempts))
+            except Exception:
+                logger.exception("Spool result callback failed")
+
+    def requeue(self, record_id):
+        """
+        Send a shipment in doubt again, after checking that it wasn't created.
+
+        :param record_id: integer ID of the record
+        :return:
+        """
+        with self._lock:
+            record = self._records.get(record_id)
+            if record is None or record.state != IN_DOUBT:
+                raise ValueError("Record {} is not in doubt".format(record_id))
+            self._write_ack(record, _REQUEUED)
+            record.state = PENDING
+            self._ready.append(record_id)
+            self._cond.notify()
+
+    def get_state(self, record_id):
+        """
+        Get state of a record.
+
+        :param record_id: integer ID of the record
+        :return state: PENDING, SENDING, DONE, FAILED or IN_DOUBT, None if the record was removed with its segment
+        """
+        record = self._records.get(record_id)
+        return record.state if record is not None else None
+
+    def get_in_doubt(self):
+        """
+        Get records in doubt.
+
+        :return list_data: list of SpoolResult objects
+        """
+        with self._lock:
+            return [SpoolResult(record.record_id, record.shipment, IN_DOUBT, error=record.error,
+                                attempts=record.attempts)
+                    for record in self._records.values() if record.state == IN_DOUBT]
+
+    def get_pending_count(self):
+        with self._lock:
+            return len(self._ready) + len(self._delayed) + self._in_flight
+
+    def wait_idle(self, timeout=None):
+        """
+        Wait until there are no pending shipments or requests in flight.
+
+        :param timeout: maximum seconds to wait
+        :return boolean: True if the spool is idle
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            while self._ready or self._delayed or self._in_flight:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout=None):
+        """
+        Stop workers after their current requests and sync logs. Pending shipments stay in the spool.
+
+        :param timeout: maximum seconds to wait for each thread
+        :return:
+        """
+        with self._lock:
+            self._running = False
+            self._cond.notify_all()
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.flush()
+
+    def close(self):
+        """
+        Stop workers and close log files.
+
+        :return:
+        """
+        self.stop()
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+                segment.wal = None
+                segment.ack = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
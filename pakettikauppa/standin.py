@@ -0,0 +1,471 @@
+"""Stand-in server module for Pakettikauppa integration
+
+The module provides a local HTTP server which answers like Pakettikauppa API for load and latency testing:
+    1. StandInServer - implements every endpoint of PkMerchant and PkReseller, verifies HMAC hash of form requests
+       and routing key of XML requests
+    2. Simulated latency, error rate and throttling, see StandInServer constructor
+
+Point a client to the server with set_api_end_point():
+
+    with StandInServer(latency=0.05) as server:
+        merchant = PkMerchant(1)
+        merchant.set_api_end_point(server.url)
+
+Or run it from command line: python -m pakettikauppa.standin --port 8000 --latency 0.05 --error-rate 0.01
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from lxml import etree as ET
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl, urlsplit
+
+from .merchant import PkMerchant
+from .reseller import PkReseller
+from .signer import Signer
+
+# Test credentials of PkMerchant and PkReseller
+DEFAULT_CREDENTIALS = {
+    '00000000-0000-0000-0000-000000000000': '1234567890ABCDEF',
+    '11111111-1111-1111-1111-111111111111': 'FEDCBA0987654321',
+}
+
+_PDF_HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+_PDF_TRAILER = b'%%EOF\n'
+
+
+def _xml_response(status, message, children=()):
+    root = ET.Element('Response')
+    ET.SubElement(root, 'response.status').text = str(status)
+    ET.SubElement(root, 'response.message').text = message
+    for tag, text, attrib in children:
+        ET.SubElement(root, tag, attrib).text = text
+    return ET.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+
+def _make_label_page(size):
+    # Length is multiple of 3, so base64 of repeated pages is repeated base64 of one page
+    prefix = b'1 0 obj\n<< /Type /Page >>\nstream\n'
+    suffix = b'\nendstream\nendobj\n'
+    size = max(size, len(prefix) + len(suffix) + 3)
+    size -= size % 3
+    filler = size - len(prefix) - len(suffix)
+    return prefix + (b'0123456789ABCDEF' * (filler // 16 + 1))[:filler] + suffix
+
+
+def _form_route(function):
+    # Verify API key and hash of form request and answer with JSON of the function result
+    def route(self, body):
+        dict_data = self._verify_form(body)
+        if dict_data is None:
+            return self._json(401, {'error': 'Invalid API key or hash'})
+        return self._json(200, function(self, dict_data))
+    return route
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, Nagle's algorithm would delay the body until the client acks
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        url = urlsplit(self.path)
+        if url.query:
+            body = body + b'&' + url.query.encode('utf-8') if body else url.query.encode('utf-8')
+
+        status, content_type, content, headers = self.server.stand_in.handle(url.path, body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if size == 0:
+                while self.rfile.readline().strip():
+                    pass
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        return b''.join(chunks)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(object):
+    """
+    Local stand-in for Pakettikauppa API. The server runs in a background thread and answers requests in own threads.
+
+    Form requests are accepted when 'api_key' is in credentials and 'hash' is HMAC-SHA256 of the other fields.
+    XML requests are accepted when Routing.Account is in credentials and Routing.Key matches. Created shipments and
+    customers are kept in memory, so shipment status and customer list return them.
+    """
+
+    def __init__(self, credentials=None, latency=0.0, latency_jitter=0.0, error_rate=0.0, rate_limit=None,
+                 burst=None, label_size=200000, seed=None, host='127.0.0.1', port=0):
+        """
+        Constructor for StandInServer class.
+
+        :param credentials: dictionary of API key to secret. Default is test credentials of PkMerchant and PkReseller
+        :param latency: seconds added to every response
+        :param latency_jitter: random seconds between zero and this value added to latency
+        :param error_rate: probability of answering with HTTP 500, between 0.0 and 1.0
+        :param rate_limit: maximum requests per second, extra requests are answered with HTTP 429. None = no limit
+        :param burst: number of requests allowed at once above rate limit. Default is rate limit.
+        :param label_size: bytes of PDF content per tracking code in shipping label responses
+        :param seed: seed of random number generator for jitter and errors
+        :param host: address to listen
+        :param port: port to listen, zero picks a free port
+        """
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate must be between 0.0 and 1.0")
+        if rate_limit is not None and rate_limit <= 0:
+            raise ValueError("rate_limit must be positive")
+
+        self._signers = {}
+        for api_key, secret in (DEFAULT_CREDENTIALS if credentials is None else credentials).items():
+            self._signers[api_key] = Signer(api_key, secret)
+
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+        self._rate_limit = rate_limit
+        self._burst = float(burst if burst is not None else rate_limit or 0)
+        self._tokens = self._burst
+        self._token_time = time.time()
+
+        self._label_page = _make_label_page(label_size)
+        self._label_page_base64 = base64.b64encode(self._label_page)
+
+        self._lock = threading.Lock()
+        self._shipments = {}
+        self._status_events = {}
+        self._customers = []
+        self._tracking_number = 0
+        self.stats = {}
+
+        self._routes = {}
+        for api_name, path in PkMerchant._api_mapping.items():
+            self._routes[path] = getattr(self, '_' + api_name)
+        for api_name, path in PkReseller._api_mapping.items():
+            self._routes[path] = getattr(self, '_' + api_name)
+
+        self._server = _ThreadingServer((host, port), _Handler)
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Start serving in a background thread.
+
+        :return self:
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.1,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _count(self, path, status):
+        with self._lock:
+            counts = self.stats.setdefault(path, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def _take_token(self):
+        # Token bucket of rate limit, returns False if request must be throttled
+        if self._rate_limit is None:
+            return True
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self._burst, self._tokens + (now - self._token_time) * self._rate_limit)
+            self._token_time = now
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    def handle(self, path, body):
+        """
+        Answer one request.
+
+        :param path: URL path of request
+        :param body: bytes of request body
+        :return tuple: status code, content type, response body and list of (name, value) header tuples
+        """
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+
+        route = self._routes.get(path)
+        if route is None:
+            response = (404, 'text/plain', b'Not found', [])
+        elif not self._take_token():
+            response = (429, 'text/plain', b'Too many requests', [('Retry-After', '1')])
+        elif failed:
+            response = (500, 'text/plain', b'Internal server error', [])
+        else:
+            try:
+                response = route(body)
+            except (ValueError, KeyError, ET.XMLSyntaxError) as e:
+                response = (400, 'text/plain', 'Bad request: {}'.format(e).encode('utf-8'), [])
+        self._count(path, response[0])
+        return response
+
+    # Form requests
+
+    def _verify_form(self, body):
+        dict_data = dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+        signer = self._signers.get(dict_data.get('api_key'))
+        digest_string = dict_data.pop('hash', None)
+        if signer is None or digest_string != signer.sign(dict_data):
+            return None
+        return dict_data
+
+    @staticmethod
+    def _json(status, data):
+        return status, 'application/json', json.dumps(data).encode('utf-8'), []
+
+    @_form_route
+    def _get_shipping_method_list(self, dict_data):
+        return [
+            {'shipping_method_code': '2103', 'name': 'Postipaketti', 'service_provider': 'Posti',
+             'description': '', 'additional_services': [{'service_code': '3101', 'name': 'Postiennakko'}]},
+            {'shipping_method_code': '2104', 'name': 'Kotipaketti', 'service_provider': 'Posti',
+             'description': '', 'additional_services': []},
+            {'shipping_method_code': '90010', 'name': 'Bussipaketti', 'service_provider': 'Matkahuolto',
+             'description': '', 'additional_services': [{'service_code': '3102', 'name': 'Monipakettilahetys'}]},
+        ]
+
+    @_form_route
+    def _get_additional_service_list(self, dict_data):
+        return [
+            {'service_code': '2106', 'name': 'Noutopistepalvelu', 'specifiers': ['pickup_point_id']},
+            {'service_code': '3101', 'name': 'Postiennakko',
+             'specifiers': ['amount', 'account', 'codbic', 'reference']},
+            {'service_code': '3102', 'name': 'Monipakettilahetys', 'specifiers': ['count']},
+        ]
+
+    @_form_route
+    def _search_pickup_points(self, dict_data):
+        postcode = dict_data.get('postcode', '')
+        limit = int(dict_data.get('limit') or 5)
+        provider = dict_data.get('service_provider') or None
+        number = int(postcode) if postcode.isdigit() else 0
+        list_points = []
+        for i in range(limit):
+            point_provider = provider or ('Posti', 'Matkahuolto', 'DB Schenker')[i % 3]
+            list_points.append({
+                'provider': point_provider,
+                'pickup_point_id': '{}{:02d}'.format(postcode, i),
+                'name': '{} pickup point {}'.format(point_provider, i + 1),
+                'street_address': 'Testikatu {}'.format(i + 1),
+                'postcode': postcode,
+                'city': 'Tampere',
+                'country': dict_data.get('country', 'FI'),
+                'map_latitude': round(60.0 + (number % 1000) / 1000.0 + i * 0.001, 6),
+                'map_longitude': round(24.0 + (number % 997) / 997.0 + i * 0.001, 6),
+                'description': '',
+            })
+        return list_points
+
+    def set_shipment_status(self, tracking_code, status_code, description='', timestamp=None):
+        """
+        Add status event of a shipment. Shipment status returns added events instead of the 'Created' event.
+
+        :param tracking_code: string of tracking code
+        :param status_code: string of status code, i.e. '22' for delivered
+        :param description: string of status description
+        :param timestamp: string of event time, default is now
+        :return:
+        """
+        event = {'tracking_code': tracking_code, 'status_code': str(status_code), 'description': description,
+                 'timestamp': timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        with self._lock:
+            self._status_events.setdefault(tracking_code, []).append(event)
+
+    @_form_route
+    def _get_shipment_status(self, dict_data):
+        tracking_code = dict_data.get('tracking_code')
+        with self._lock:
+            if tracking_code in self._status_events:
+                return [dict(event) for event in self._status_events[tracking_code]]
+            created = self._shipments.get(tracking_code)
+        list_status = [{'tracking_code': tracking_code, 'status_code': '13', 'description': 'Created',
+                        'timestamp': created or datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]
+        return list_status
+
+    @_form_route
+    def _list_customer(self, dict_data):
+        with self._lock:
+            return [dict(customer) for customer in self._customers]
+
+    @_form_route
+    def _create_customer(self, dict_data):
+        customer = dict((key, value) for key, value in dict_data.items() if key not in ('api_key', 'timestamp'))
+        with self._lock:
+            customer['customer_id'] = len(self._customers) + 1
+            customer['api_key'] = str(uuid.uuid4())
+            customer['active'] = True
+            self._customers.append(customer)
+        return {'customer_id': customer['customer_id'], 'api_key': customer['api_key']}
+
+    @_form_route
+    def _update_customer(self, dict_data):
+        customer = self._find_customer(dict_data.get('customer_id'))
+        if customer is None:
+            return {'error': 'Customer not found'}
+        with self._lock:
+            for key, value in dict_data.items():
+                if key not in ('api_key', 'customer_id', 'timestamp'):
+                    customer[key] = value
+        return {'customer_id': customer['customer_id'], 'status': 'updated'}
+
+    @_form_route
+    def _deactivate_customer(self, dict_data):
+        customer = self._find_customer(dict_data.get('customer_id'))
+        if customer is None:
+            return {'error': 'Customer not found'}
+        with self._lock:
+            customer['active'] = False
+        return {'customer_id': customer['customer_id'], 'status': 'deactivated'}
+
+    def _find_customer(self, customer_id):
+        with self._lock:
+            for customer in self._customers:
+                if str(customer['customer_id']) == str(customer_id):
+                    return customer
+        return None
+
+    # XML requests
+
+    def _verify_routing(self, root):
+        signer = self._signers.get(root.findtext('ROUTING/Routing.Account'))
+        routing_id = root.findtext('ROUTING/Routing.Id')
+        if signer is None or not routing_id or root.findtext('ROUTING/Routing.Key') != \
+                signer.get_routing_key(routing_id):
+            return False
+        return True
+
+    @staticmethod
+    def _xml(content):
+        return 200, 'application/xml', content, []
+
+    def _create_shipment(self, body):
+        root = ET.fromstring(body)
+        if not self._verify_routing(root):
+            return self._xml(_xml_response(1, 'Invalid routing'))
+        parcels = root.findall('Shipment/Shipment.Consignment/Consignment.Parcel')
+        if not parcels:
+            return self._xml(_xml_response(1, 'Shipment has no parcels'))
+
+        with self._lock:
+            self._tracking_number += 1
+            tracking_code = 'JJFI{:014d}'.format(self._tracking_number)
+            self._shipments[tracking_code] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        reference = root.findtext('Shipment/Shipment.Consignment/Consignment.Reference') or ''
+        return self._xml(_xml_response(0, '', [
+            ('response.reference', reference, {'uuid': str(uuid.uuid4())}),
+            ('response.trackingcode', tracking_code,
+             {'tracking_url': 'https://www.pakettikauppa.fi/seuranta/?{}'.format(tracking_code)}),
+        ]))
+
+    def _get_shipping_label(self, body):
+        root = ET.fromstring(body)
+        if not self._verify_routing(root):
+            return self._xml(_xml_response(1, 'Invalid routing'))
+        codes = root.findall('PrintLabel/TrackingCode')
+        if not codes:
+            return self._xml(_xml_response(1, 'Missing tracking code'))
+
+        # Base64 is written without parsing it into a tree, labels can be many megabytes
+        content = base64.b64encode(_PDF_HEADER) + self._label_page_base64 * len(codes) + \
+            base64.b64encode(_PDF_TRAILER)
+        return self._xml(b'<?xml version="1.0" encoding="UTF-8"?>\n<Response><response.status>0</response.status>'
+                         b'<response.message></response.message><response.file>' + content +
+                         b'</response.file></Response>')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in server of Pakettikauppa API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="random extra latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probability of HTTP 500 response")
+    parser.add_argument('--rate-limit', type=float, default=None, help="maximum requests per second")
+    parser.add_argument('--burst', type=float, default=None, help="requests allowed at once above rate limit")
+    parser.add_argument('--label-size', type=int, default=200000, help="PDF bytes per tracking code")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    server = StandInServer(latency=args.latency, latency_jitter=args.latency_jitter, error_rate=args.error_rate,
+                           rate_limit=args.rate_limit, burst=args.burst, label_size=args.label_size,
+                           seed=args.seed, host=args.host, port=args.port)
+    print("Pakettikauppa stand-in server at {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
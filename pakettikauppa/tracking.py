@@ -0,0 +1,331 @@
+"""Shipment tracking module for Pakettikauppa integration
+
+The module follows status of many shipments with shipment status API:
+    1. StatusEvent - one status event of a shipment, see parse_status_events()
+    2. StatusChange - latest status of a shipment changed, emitted by ShipmentTracker
+    3. PollingPolicy - how often a shipment is polled depending on its age and status
+    4. ShipmentTracker - poll shipments which are due, concurrently, and emit changes
+
+Shipment status API takes one tracking code per request. The tracker keeps shipments in a heap by next poll time, so
+a poll only touches shipments which are due. Fresh and recently changed shipments are polled often, shipments in
+transit less often and stale or delivered shipments rarely. A digest of each response body is kept and a response
+which equals the previous one is not decoded at all, so decoding and change handling cost depends on the number of
+shipments which changed.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from .bulk import run_bounded
+
+logger = logging.getLogger(__name__)
+
+# Status code of 'Item has been handed over to the recipient'
+DELIVERED_STATUS_CODES = ('22',)
+
+StatusEvent = namedtuple('StatusEvent', ('tracking_code', 'status_code', 'description', 'timestamp', 'postcode',
+                                         'post_office'))
+
+StatusChange = namedtuple('StatusChange', ('tracking_code', 'previous', 'current', 'events'))
+
+
+def parse_status_events(list_data, tracking_code=None):
+    """
+    Convert response data of shipment status API to StatusEvent records, oldest first.
+
+    :param list_data: list of dictionaries of status data
+    :param tracking_code: tracking code of the request, used when an event doesn't have one
+    :return list_data: list of StatusEvent records
+    """
+    if isinstance(list_data, dict):
+        list_data = [list_data]
+    list_events = []
+    for dict_data in list_data or []:
+        list_events.append(StatusEvent(
+            tracking_code=dict_data.get('tracking_code') or tracking_code,
+            status_code=str(dict_data.get('status_code', '')),
+            description=dict_data.get('description'),
+            timestamp=dict_data.get('timestamp'),
+            postcode=dict_data.get('postcode'),
+            post_office=dict_data.get('post_office'),
+        ))
+    # Timestamps are 'YYYY-MM-DD HH:MM:SS' strings, sort is stable for events of the same second
+    list_events.sort(key=lambda event: event.timestamp or '')
+    return list_events
+
+
+class PollingPolicy(object):
+    """
+    Poll intervals of ShipmentTracker in seconds.
+    """
+
+    def __init__(self, fresh_interval=600, transit_interval=1800, stale_interval=6 * 3600,
+                 delivered_interval=24 * 3600, fresh_period=24 * 3600, stale_after=3 * 24 * 3600,
+                 expire_after=7 * 24 * 3600, error_interval=300, final_status_codes=DELIVERED_STATUS_CODES):
+        """
+        Constructor for PollingPolicy class.
+
+        :param fresh_interval: interval of shipments added or changed within 'fresh_period'
+        :param transit_interval: interval of other shipments which are not delivered
+        :param stale_interval: interval of shipments which haven't changed in 'stale_after' seconds
+        :param delivered_interval: interval of delivered shipments. None = stop tracking when delivered.
+        :param fresh_period: seconds a shipment is fresh after it was added or changed
+        :param stale_after: seconds without change after which a shipment is stale
+        :param expire_after: seconds without change after which a delivered or stale shipment is no longer tracked.
+                             None = track until removed.
+        :param error_interval: interval after a failed request
+        :param final_status_codes: status codes of delivered shipments
+        """
+        self.fresh_interval = fresh_interval
+        self.transit_interval = transit_interval
+        self.stale_interval = stale_interval
+        self.delivered_interval = delivered_interval
+        self.fresh_period = fresh_period
+        self.stale_after = stale_after
+        self.expire_after = expire_after
+        self.error_interval = error_interval
+        self.final_status_codes = frozenset(final_status_codes)
+
+    def is_delivered(self, event):
+        return event is not None and event.status_code in self.final_status_codes
+
+    def get_interval(self, shipment, now):
+        """
+        Get seconds to the next poll of a shipment.
+
+        :param shipment: TrackedShipment object
+        :param now: current time
+        :return seconds: seconds to next poll or None if the shipment is no longer tracked
+        """
+        quiet = now - shipment.changed_at
+        if self.expire_after is not None and quiet >= self.expire_after and (
+                self.is_delivered(shipment.current) or quiet >= self.stale_after):
+            return None
+        if self.is_delivered(shipment.current):
+            return self.delivered_interval
+        if quiet < self.fresh_period:
+            return self.fresh_interval
+        if quiet >= self.stale_after:
+            return self.stale_interval
+        return self.transit_interval
+
+
+class TrackedShipment(object):
+    """
+    State of one tracked shipment.
+    """
+    __slots__ = ('tracking_code', 'digest', 'current', 'changed_at', 'due', 'polls', 'errors')
+
+    def __init__(self, tracking_code, added_at):
+        self.tracking_code = tracking_code
+        self.digest = None
+        self.current = None
+        self.changed_at = added_at
+        self.due = added_at
+        self.polls = 0
+        self.errors = 0
+
+
+class ShipmentTracker(object):
+    """
+    Adaptive poller of shipment status. Methods are thread-safe, but only one poll() runs at a time.
+    """
+
+    def __init__(self, merchant, policy=None, max_in_flight=10, on_change=None, clock=time.time):
+        """
+        Constructor for ShipmentTracker class.
+
+        :param merchant: PkMerchant object
+        :param policy: PollingPolicy object. Default is PollingPolicy().
+        :param max_in_flight: maximum number of requests sent at the same time
+        :param on_change: function which takes StatusChange, called in the thread of poll()
+        :param clock: function which returns current time in seconds
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.merchant = merchant
+        self.policy = policy if policy is not None else PollingPolicy()
+        self.max_in_flight = max_in_flight
+        self.on_change = on_change
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._shipments = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self.stats = {'requests': 0, 'unchanged': 0, 'changed': 0, 'errors': 0, 'expired': 0}
+
+    def __len__(self):
+        return len(self._shipments)
+
+    def __contains__(self, tracking_code):
+        return tracking_code in self._shipments
+
+    def _schedule(self, shipment, due):
+        shipment.due = due
+        heapq.heappush(self._heap, (due, next(self._counter), shipment.tracking_code))
+
+    def add(self, tracking_code, added_at=None):
+        """
+        Start tracking a shipment. It is due immediately. Adding a tracked shipment again does nothing.
+
+        :param tracking_code: string of tracking code
+        :param added_at: time the shipment was created, default is now
+        :return:
+        """
+        if tracking_code is None or tracking_code == '':
+            raise ValueError("Require tracking code string")
+        now = self._clock()
+        with self._lock:
+            if tracking_code in self._shipments:
+                return
+            shipment = TrackedShipment(tracking_code, added_at if added_at is not None else now)
+            self._shipments[tracking_code] = shipment
+            self._schedule(shipment, now)
+
+    def remove(self, tracking_code):
+        """
+        Stop tracking a shipment.
+
+        :param tracking_code: string of tracking code
+        :return boolean: True if the shipment was tracked
+        """
+        with self._lock:
+            # Heap entry is skipped when it is popped
+            return self._shipments.pop(tracking_code, None) is not None
+
+    def get_status(self, tracking_code):
+        """
+        Get latest known status of a shipment.
+
+        :param tracking_code: string of tracking code
+        :return event: StatusEvent record or None if not polled yet or not tracked
+        """
+        shipment = self._shipments.get(tracking_code)
+        return shipment.current if shipment is not None else None
+
+    def get_next_due(self):
+        """
+        Get time of the next poll.
+
+        :return due: time in seconds or None if nothing is tracked
+        """
+        with self._lock:
+            self._drop_removed()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_removed(self):
+        heap = self._heap
+        while heap:
+            due, _, tracking_code = heap[0]
+            shipment = self._shipments.get(tracking_code)
+            if shipment is not None and shipment.due == due:
+                return
+            heapq.heappop(heap)
+
+    def _pop_due(self, now, max_codes):
+        list_due = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now and (max_codes is None or len(list_due) < max_codes):
+                due, _, tracking_code = heapq.heappop(heap)
+                shipment = self._shipments.get(tracking_code)
+                # Skip removed shipments and entries replaced by a later schedule
+                if shipment is not None and shipment.due == due:
+                    list_due.append(shipment)
+        return list_due
+
+    def _fetch(self, shipment):
+        return self.merchant.get_shipment_status(shipment.tracking_code)
+
+    def poll(self, max_codes=None):
+        """
+        Poll shipments which are due. Requests are sent concurrently.
+
+        :param max_codes: maximum number of shipments polled, the rest stay due. None = all due shipments.
+        :return list_data: list of StatusChange tuples
+        """
+        with self._poll_lock:
+            list_due = self._pop_due(self._clock(), max_codes)
+            if not list_due:
+                return []
+            list_changes = []
+            for bulk_result in run_bounded(self._fetch, list_due, self.max_in_flight, ordered=False):
+                change = self._handle_result(bulk_result.request, bulk_result.result, bulk_result.error)
+                if change is not None:
+                    list_changes.append(change)
+                    if self.on_change is not None:
+                        try:
+                            self.on_change(change)
+                        except Exception:
+                            logger.exception("Shipment tracker change callback failed")
+            return list_changes
+
+    def _handle_result(self, shipment, res_obj, error):
+        now = self._clock()
+        self.stats['requests'] += 1
+        shipment.polls += 1
+        change = None
+        if error is not None:
+            self.stats['errors'] += 1
+            shipment.errors += 1
+            logger.warning("Status of %s failed: %s", shipment.tracking_code, error)
+            interval = self.policy.error_interval
+        else:
+            digest = hashlib.sha1(res_obj.content).digest()
+            if digest == shipment.digest:
+                self.stats['unchanged'] += 1
+            else:
+                shipment.digest = digest
+                change = self._parse_change(shipment, res_obj, now)
+            interval = self.policy.get_interval(shipment, now)
+
+        with self._lock:
+            if self._shipments.get(shipment.tracking_code) is not shipment:
+                return change
+            if interval is None:
+                del self._shipments[shipment.tracking_code]
+                self.stats['expired'] += 1
+            else:
+                self._schedule(shipment, now + interval)
+        return change
+
+    def _parse_change(self, shipment, res_obj, now):
+        try:
+            list_events = parse_status_events(self.merchant.parse_res_to_list(res_obj), shipment.tracking_code)
+        except Exception as e:
+            self.stats['errors'] += 1
+            shipment.digest = None
+            logger.warning("Invalid status of %s: %s", shipment.tracking_code, e)
+            return None
+        current = list_events[-1] if list_events else None
+        previous = shipment.current
+        if current == previous:
+            self.stats['unchanged'] += 1
+            return None
+        self.stats['changed'] += 1
+        shipment.current = current
+        shipment.changed_at = now
+        return StatusChange(shipment.tracking_code, previous, current, list_events)
+
+    def run(self, stop_event, max_codes=None, max_wait=60.0):
+        """
+        Poll until stop event is set. Sleeps until the next shipment is due, at most 'max_wait' seconds, so shipments
+        added meanwhile are noticed.
+
+        :param stop_event: threading.Event object
+        :param max_codes: maximum number of shipments in one poll
+        :param max_wait: maximum seconds between polls
+        :return:
+        """
+        while not stop_event.is_set():
+            self.poll(max_codes)
+            due = self.get_next_due()
+            wait = max_wait if due is None else min(max_wait, max(0.0, due - self._clock()))
+            stop_event.wait(wait)
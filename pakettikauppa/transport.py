@@ -0,0 +1,153 @@
+"""Transport module for Pakettikauppa integration
+
+The module provides HTTP transport classes which keep connections to Pakettikauppa open between API calls:
+    1. HttpTransport - connection pooled transport built on top of requests
+
+Transport for asyncio is in aio module.
+"""
+from __future__ import absolute_import
+
+import threading
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect timeout, read timeout) in seconds used when a request is sent without timeout
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+
+class HttpTransport(object):
+    """
+    Connection pooled HTTP transport.
+
+    One transport object is meant to be owned by one PkMerchant or PkReseller object and reused for every API call
+    of that object. Connections are kept alive and returned to the pool after each response, so following calls to
+    the same host skip the TCP and TLS handshake.
+
+    The connection pool is shared between threads. Each thread gets its own requests session, but all sessions are
+    mounted on the same adapter and therefore use the same pool of connections. Sessions are referenced weakly, so a
+    session is released when its thread exits.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=10, max_retries=0, pool_block=False, keep_alive=True,
+                 timeout=DEFAULT_TIMEOUT):
+        """
+        Constructor for HttpTransport class.
+
+        :param pool_connections: number of host pools to keep. Pakettikauppa uses one host per mode, so the default \
+                                 value is more than enough.
+        :param pool_maxsize: maximum number of connections kept open per host. Set it to the number of threads \
+                             that call the API at the same time.
+        :param max_retries: number of retries for connections which could not be established. Requests which \
+                            already reached the server are never retried.
+        :param pool_block: if True, callers wait for a free connection when the per-host limit is reached instead \
+                           of opening an extra connection which is discarded afterwards.
+        :param keep_alive: if False, connections are closed after each response
+        :param timeout: (connect, read) timeout tuple or seconds for both. Used when request has no own timeout. \
+                        None waits forever. ResiliencePolicy of the client sets timeouts per API, with longer read \
+                        timeouts for shipping labels and create shipment.
+        """
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._max_retries = max_retries
+        self._pool_block = pool_block
+        self._keep_alive = keep_alive
+        self._timeout = timeout
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions = weakref.WeakSet()
+        self._adapter = None
+        self._closed = False
+
+    def get_adapter(self):
+        """
+        Get shared HTTP adapter object. Adapter is created on first use.
+
+        :return adapter: requests HTTPAdapter object
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Transport is closed")
+
+            if self._adapter is None:
+                self._adapter = HTTPAdapter(
+                    pool_connections=self._pool_connections,
+                    pool_maxsize=self._pool_maxsize,
+                    max_retries=self._max_retries,
+                    pool_block=self._pool_block
+                )
+            return self._adapter
+
+    def get_session(self):
+        """
+        Get requests session object for the calling thread.
+
+        :return session: requests Session object
+        """
+        # Cached session of a thread must not be used after close()
+        if self._closed:
+            raise RuntimeError("Transport is closed")
+        session = getattr(self._local, 'session', None)
+        if session is not None:
+            return session
+
+        adapter = self.get_adapter()
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self._keep_alive:
+            session.headers['Connection'] = 'close'
+
+        with self._lock:
+            self._sessions.add(session)
+        self._local.session = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the connection pool.
+
+        :param method: HTTP method name i.e. 'POST'
+        :param url: string of request URL
+        :param kwargs: keyword arguments for requests Session.request() function
+        :return res_obj: response object
+        """
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self._timeout
+        return self.get_session().request(method, url, **kwargs)
+
+    def close(self):
+        """
+        Close all pooled connections. Transport can't be used after closing.
+
+        :return:
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            sessions = list(self._sessions)
+            self._sessions = weakref.WeakSet()
+            adapter = self._adapter
+            self._adapter = None
+
+        for session in sessions:
+            session.close()
+        if adapter is not None:
+            adapter.close()
+
+    def is_closed(self):
+        """
+        Check whether transport is closed.
+
+        :return boolean: True if transport is closed
+        """
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
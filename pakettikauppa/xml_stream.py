@@ -0,0 +1,368 @@
+"""Streaming XML serializer module for Pakettikauppa integration
+
+The module writes request XML piece by piece without building an element tree:
+    1. ShipmentXmlSerializer.iter_shipment_req_data() - create shipment request data as chunks of bytes
+    2. ShipmentXmlSerializer.iter_shipping_label_req_data() - get shipping label request data as chunks of bytes
+
+Chunks are produced while parcels and tracking codes are written, so the whole document is never kept in memory.
+Pass the generator as request body to send it with chunked transfer encoding. Output is compact by default and
+describes the same elements as PkMerchant.get_xml_shipment_req_data() and get_xml_shipping_label_req_data().
+With 'pretty_print' the output is byte-identical to them.
+"""
+from __future__ import absolute_import
+
+import types
+
+from .pakettikauppa import PakettikauppaException
+from .xmlwriter import XmlWriter, XML_DECLARATION
+
+
+def to_text(value):
+    """
+    Convert value to element text like PkMerchant does for address and additional info values.
+
+    :param value: value of any type
+    :return text: string
+    """
+    return str(value)
+
+
+class ShipmentXmlSerializer(object):
+    """
+    Serializer for create shipment and get shipping label request XML. Input is validated with the same rules as
+    PkMerchant element builders use.
+    """
+
+    def __init__(self, merchant, pretty_print=False, chunk_size=65536):
+        """
+        Constructor for ShipmentXmlSerializer class.
+
+        :param merchant: PkMerchant object, its API key and secret are used for routing key
+        :param pretty_print: True = indent elements like PkMerchant, False = compact output
+        :param chunk_size: minimum number of bytes in a chunk, last chunk can be shorter
+        """
+        self._merchant = merchant
+        self._pretty_print = pretty_print
+        self._chunk_size = chunk_size
+
+    def create_writer(self, depth=0):
+        return XmlWriter(depth, self._pretty_print)
+
+    def iter_shipment_req_data(self, **kwargs):
+        """
+        Construct request data for create shipment API in chunks. 'Consignment.Parcel' may also be a generator, then
+        parcels are written as the generator produces them.
+
+        :param kwargs: see PkMerchant.get_xml_shipment_req_data() function
+        :return: generator of bytes
+        """
+        self._merchant.validate_input_params_create_shipment(**kwargs)
+        return self._iter_shipment(kwargs['eChannel'])
+
+    def _iter_shipment(self, echannel):
+        writer = self.create_writer()
+        writer.raw(XML_DECLARATION)
+        writer.start('eChannel')
+        self.write_routing(writer, echannel['ROUTING'])
+
+        shipment = echannel['Shipment']
+        writer.start('Shipment')
+        self.write_address(writer, 'recipient', shipment['Shipment.Recipient'])
+        self.write_address(writer, 'sender', shipment['Shipment.Sender'])
+
+        consignment = shipment['Shipment.Consignment']
+        self.write_consignment_head(writer, consignment)
+        buffered = bytearray()
+        for parcel in self.iter_parcels(consignment):
+            self.write_parcel(writer, parcel)
+            buffered += writer.take()
+            if len(buffered) >= self._chunk_size:
+                yield bytes(buffered)
+                buffered = bytearray()
+        writer.end()
+        writer.end()
+        writer.end()
+
+        buffered += writer.take()
+        yield bytes(buffered)
+
+    def iter_shipping_label_req_data(self, **kwargs):
+        """
+        Construct request data for get shipping label API in chunks.
+
+        :param kwargs: see PkMerchant.get_xml_shipping_label_req_data() function
+        :return: generator of bytes
+        """
+        if kwargs is None or len(kwargs) == 0:
+            raise KeyError("Expect input parameters")
+        if 'eChannel' not in kwargs:
+            raise KeyError("eChannel key is missing")
+        self._merchant.validate_routing_data(**kwargs)
+        if 'PrintLabel' not in kwargs['eChannel']:
+            raise KeyError("Missing PrintLabel key")
+        self.validate_print_label(kwargs['eChannel']['PrintLabel'])
+        return self._iter_shipping_label(kwargs['eChannel'])
+
+    def _iter_shipping_label(self, echannel):
+        writer = self.create_writer()
+        writer.raw(XML_DECLARATION)
+        writer.start('eChannel')
+        self.write_routing(writer, echannel['ROUTING'])
+
+        print_label = echannel['PrintLabel']
+        writer.start('PrintLabel', [(key, print_label[key]) for key in print_label if key != 'content'])
+        buffered = bytearray()
+        for key, value in print_label['content'].items():
+            if type(value).__name__ == 'str':
+                writer.element(key, value)
+            elif key == 'TrackingCode':
+                codes = value if type(value) is list else [value]
+                for dict_code in codes:
+                    writer.element('TrackingCode', str(dict_code['Code']))
+                    buffered += writer.take()
+                    if len(buffered) >= self._chunk_size:
+                        yield bytes(buffered)
+                        buffered = bytearray()
+            else:
+                raise PakettikauppaException("Unexpected key for creating child element of PrintLabel")
+        writer.end()
+        writer.end()
+
+        buffered += writer.take()
+        yield bytes(buffered)
+
+    @staticmethod
+    def validate_print_label(dict_data):
+        """
+        Validate 'PrintLabel' data. Raise exception if data is invalid.
+
+        :param dict_data: dictionary of PrintLabel data
+        :return:
+        """
+        if dict_data is None or len(dict_data) == 0:
+            raise KeyError("Missing data in PrintLabel key")
+        if 'responseFormat' not in dict_data:
+            raise KeyError("Missing responseFormat -key")
+        if dict_data['responseFormat'] not in ('File', 'inline'):
+            raise ValueError("Invalid value for responseFormat key")
+        if 'content' not in dict_data:
+            raise KeyError("Missing content -key")
+        if 'TrackingCode' not in dict_data['content']:
+            raise KeyError("Missing TrackingCode -key")
+
+    def write_routing(self, writer, routing):
+        """
+        Write 'ROUTING' element. Routing key is calculated from API key, secret and routing ID.
+
+        :param writer: XmlWriter object
+        :param routing: dictionary of routing data. See PkMerchant._create_routing_elements() function
+        :return:
+        """
+        merchant = self._merchant
+        writer.start('ROUTING')
+        writer.element('Routing.Account', str(routing['Routing.Account']))
+        writer.element('Routing.Id', str(routing['Routing.Id']))
+        writer.element('Routing.Key', merchant.get_md5_hash(merchant._api_key, merchant._secret, routing['Routing.Id']))
+        writer.element('Routing.Name', str(routing['Routing.Name']))
+        writer.element('Routing.Time', str(routing['Routing.Time']))
+        writer.end()
+
+    def write_address(self, writer, address_type, address):
+        """
+        Write 'Shipment.Recipient' or 'Shipment.Sender' element.
+
+        :param writer: XmlWriter object
+        :param address_type: 'recipient' or 'sender'
+        :param address: dictionary of address data. See PkMerchant._create_shipment_address_element() function
+        :return:
+        """
+        if address_type == 'recipient':
+            tag = 'Shipment.Recipient'
+            accept_keys = self._merchant._accept_recipient_keys
+        elif address_type == 'sender':
+            tag = 'Shipment.Sender'
+            accept_keys = self._merchant._accept_sender_keys
+        else:
+            raise ValueError("Invalid value. Possible value are 'recipient' and 'sender'.")
+
+        writer.start(tag)
+        for key in address:
+            if key not in accept_keys:
+                raise KeyError("Invalid key")
+            writer.element(key, to_text(address[key]))
+        writer.end()
+
+    def write_consignment_head(self, writer, consignment, product_xml=None):
+        """
+        Open 'Shipment.Consignment' element and write its children except parcels. Caller writes parcels and closes
+        the element.
+
+        :param writer: XmlWriter object
+        :param consignment: dictionary of consignment data. See PkMerchant._create_shipment_consignment_element()
+        :param product_xml: ready text of 'Consignment.Product' element. Written from consignment data if not given.
+        :return:
+        """
+        if consignment is None or len(consignment) == 0:
+            raise KeyError("Input parameter cannot be empty.")
+        merchant = self._merchant
+
+        writer.start('Shipment.Consignment')
+
+        currency = consignment['Consignment.Currency']
+        writer.element('Consignment.Currency', 'EUR' if currency is None else str(currency.upper()))
+
+        if product_xml is None:
+            product_code = consignment['Consignment.Product']
+            if product_code is None or product_code == '':
+                raise PakettikauppaException("Require product code in 'Consignment.Product'")
+            writer.element('Consignment.Product', str(product_code))
+        else:
+            writer.raw(product_xml)
+
+        reference = consignment['Consignment.Reference']
+        writer.element('Consignment.Reference', '' if reference is None else str(reference))
+
+        invoice_number = consignment['Consignment.Invoicenumber']
+        writer.element('Consignment.Invoicenumber', '' if invoice_number is None else str(invoice_number))
+
+        additional_info = consignment['Consignment.AdditionalInfo']
+        if additional_info and additional_info['AdditionalInfo.Text'] is not None:
+            writer.start('Consignment.AdditionalInfo')
+            writer.element('AdditionalInfo.Text', to_text(additional_info['AdditionalInfo.Text']))
+            writer.end()
+
+        content_code = consignment['Consignment.Contentcode']
+        if content_code is not None and content_code != '':
+            content_code = str(content_code)
+            merchant._validate_content_code_value(content_code)
+        writer.element('Consignment.Contentcode', content_code)
+
+        writer.element('Consignment.Infocode', '')
+
+        return_instruction = consignment['Consignment.ReturnInstruction']
+        if return_instruction is not None:
+            if return_instruction != '':
+                merchant._validate_return_instruction_code(return_instruction)
+            writer.element('Consignment.ReturnInstruction', str(return_instruction))
+
+        merchandise_value = consignment['Consignment.Merchandisevalue']
+        if merchandise_value is not None:
+            writer.element('Consignment.Merchandisevalue', str(merchandise_value))
+
+        self.write_additional_services(writer, consignment['Consignment.AdditionalService'])
+
+    @staticmethod
+    def iter_parcels(consignment):
+        """
+        Iterate parcels of consignment data.
+
+        :param consignment: dictionary of consignment data
+        :return: iterable of parcel dictionaries
+        """
+        parcels = consignment['Consignment.Parcel']
+        # Exact types are checked like PkMerchant does, i.e. OrderedDict is not accepted as parcel data
+        if type(parcels) is dict:
+            return [parcels]
+        if type(parcels) is list or isinstance(parcels, types.GeneratorType):
+            return parcels
+        raise PakettikauppaException("Invalid argument type for 'Consignment.Parcel' key")
+
+    @staticmethod
+    def _write_element_with_attributes(writer, tag, dict_data):
+        # 'value' key is element text, other keys are attributes
+        text = None
+        attrib = []
+        for key in dict_data:
+            if key == 'value':
+                text = str(dict_data[key])
+            else:
+                attrib.append((key, str(dict_data[key])))
+        writer.element(tag, text, attrib)
+
+    def write_additional_services(self, writer, list_services):
+        """
+        Write 'Consignment.AdditionalService' elements.
+
+        :param writer: XmlWriter object
+        :param list_services: list of dictionaries of additional services
+        :return:
+        """
+        if list_services is None or len(list_services) == 0:
+            return
+        if type(list_services) is not list:
+            raise ValueError("Expected data type list")
+
+        for dict_data in list_services:
+            writer.start('Consignment.AdditionalService')
+            for key in dict_data:
+                value = dict_data[key]
+                if type(value) is dict:
+                    if key == 'AdditionalService.Specifier':
+                        if value:
+                            self._write_element_with_attributes(writer, 'AdditionalService.Specifier', value)
+                    else:
+                        self._write_element_with_attributes(writer, key, value)
+                elif type(value) is list:
+                    for one_dict_data in value:
+                        if one_dict_data:
+                            self._write_element_with_attributes(writer, 'AdditionalService.Specifier',
+                                                                one_dict_data)
+                elif value is not None:
+                    writer.element(key, str(value))
+            writer.end()
+
+    def write_parcel(self, writer, parcel):
+        """
+        Write one 'Consignment.Parcel' element.
+
+        :param writer: XmlWriter object
+        :param parcel: dictionary of parcel data. See PkMerchant._create_parcel_elements() function
+        :return:
+        """
+        if parcel is None or len(parcel) == 0:
+            return
+        merchant = self._merchant
+        accept_parcel_keys = merchant._accept_parcel_keys
+
+        writer.start('Consignment.Parcel', [('type', 'normal')])
+        writer.element('Parcel.Reference')
+        for key in parcel:
+            if key not in accept_parcel_keys:
+                raise KeyError("Invalid key parameter")
+            value = parcel[key]
+
+            if key == 'Parcel.contentline':
+                if len(value) > 0:
+                    writer.start('Parcel.contentline')
+                    for line_key in value:
+                        writer.element(line_key, str(value[line_key]))
+                    writer.end()
+            elif key == 'Parcel.ParcelService':
+                if value is not None:
+                    for dict_data in value:
+                        writer.start('Parcel.ParcelService')
+                        for service_key in dict_data:
+                            writer.element(service_key, str(dict_data[service_key]))
+                        writer.end()
+            elif key == 'Parcel.Weight':
+                if value['weight_unit'] is None or value['weight_unit'] == '':
+                    raise PakettikauppaException("Expect value in weight_unit parameter")
+                if value['value'] is None or value['value'] == '':
+                    raise PakettikauppaException("Require parcel weight in 'value' parameter")
+                writer.element(key, str(value['value']), [('unit', value['weight_unit'])])
+            elif key == 'Parcel.Volume':
+                volume_unit = value['unit']
+                if volume_unit is None or volume_unit == '':
+                    volume_unit = 'm3'
+                if value['value'] is None or value['value'] == '':
+                    raise PakettikauppaException("Require parcel volume in 'value' parameter")
+                writer.element(key, str(value['value']), [('unit', str(volume_unit))])
+            else:
+                if not isinstance(value, str):
+                    raise PakettikauppaException("Invalid value in key={}".format(key))
+                if key == 'Parcel.Packagetype':
+                    if value == '':
+                        value = 'PC'
+                    merchant._validate_package_type(value)
+                writer.element(key, str(value))
+        writer.end()
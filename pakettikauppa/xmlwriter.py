@@ -0,0 +1,182 @@
+"""XML writer module for Pakettikauppa integration
+
+The module writes request XML as text pieces instead of building an element tree:
+    1. escape_text() / escape_attribute() - escape values like lxml serializer does
+    2. XmlWriter - write elements indented like lxml 'pretty_print' output or without white space
+
+Output of XmlWriter is byte-identical to ET.tostring(root, pretty_print=True, xml_declaration=True,
+encoding="UTF-8") of the same tree, as long as no element has both text and child elements. Compact output equals
+the same call without 'pretty_print'.
+"""
+from __future__ import absolute_import
+
+import re
+
+XML_DECLARATION = u"<?xml version='1.0' encoding='UTF-8'?>\n"
+
+_INDENT = u'  '
+
+_invalid_chars = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+_text_escape = re.compile(u'[&<>\r]')
+_text_entities = {u'&': u'&amp;', u'<': u'&lt;', u'>': u'&gt;', u'\r': u'&#13;'}
+
+_attribute_escape = re.compile(u'[&<>"\n\r\t]')
+_attribute_entities = {u'&': u'&amp;', u'<': u'&lt;', u'>': u'&gt;', u'"': u'&quot;', u'\n': u'&#10;',
+                       u'\r': u'&#13;', u'\t': u'&#9;'}
+
+
+# Characters which need escaping or are invalid in text, most values have none of them
+_text_special = re.compile(u'[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def _check_value(value):
+    if _invalid_chars.search(value) is not None:
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+
+
+def escape_text(value):
+    """
+    Escape element text.
+
+    :param value: unicode string
+    :return text: escaped unicode string
+    """
+    if _text_special.search(value) is None:
+        return value
+    _check_value(value)
+    return _text_escape.sub(lambda match: _text_entities[match.group()], value)
+
+
+def escape_attribute(value):
+    """
+    Escape attribute value.
+
+    :param value: unicode string
+    :return text: escaped unicode string without surrounding quotes
+    """
+    _check_value(value)
+    return _attribute_escape.sub(lambda match: _attribute_entities[match.group()], value)
+
+
+class XmlWriter(object):
+    """
+    Writer for indented XML documents.
+
+    Elements are opened with start(), closed with end() and leaf elements are written with element(). Element
+    without text and children is written as '<tag/>' like lxml does. Text fragments written once by fragment() can
+    be inserted again with raw(). Written text can be taken out piece by piece with take() for streaming.
+    """
+
+    def __init__(self, depth=0, pretty_print=True):
+        """
+        :param depth: indentation level of the first element
+        :param pretty_print: True = indent elements like lxml, False = compact output without white space
+        """
+        self._pieces = []
+        self._stack = []
+        self._depth = depth
+        self._indent = _INDENT if pretty_print else u''
+        self._newline = u'\n' if pretty_print else u''
+        # Start tag of the latest element is left open until it is known whether the element has children
+        self._pending = None
+
+    def _flush_pending(self):
+        if self._pending is not None:
+            self._pieces.append(self._pending + u'>' + self._newline)
+            self._pending = None
+
+    @staticmethod
+    def _open_tag(tag, attrib):
+        if not attrib:
+            return u'<' + tag
+        return u'<' + tag + u''.join(u' {}="{}"'.format(name, escape_attribute(value))
+                                     for name, value in attrib)
+
+    def start(self, tag, attrib=None):
+        """
+        Open element which will have child elements.
+
+        :param tag: string of tag name
+        :param attrib: list of (name, value) tuples of attributes in output order
+        :return:
+        """
+        self._flush_pending()
+        self._pending = self._indent * self._depth + self._open_tag(tag, attrib)
+        self._stack.append(tag)
+        self._depth += 1
+
+    def end(self):
+        """
+        Close the latest element opened with start().
+
+        :return:
+        """
+        tag = self._stack.pop()
+        self._depth -= 1
+        if self._pending is not None:
+            self._pieces.append(self._pending + u'/>' + self._newline)
+            self._pending = None
+        else:
+            self._pieces.append(self._indent * self._depth + u'</' + tag + u'>' + self._newline)
+
+    def element(self, tag, text=None, attrib=None):
+        """
+        Write element without children.
+
+        :param tag: string of tag name
+        :param text: unicode string of element text. None writes empty element tag, empty string writes start and \
+                     end tags.
+        :param attrib: list of (name, value) tuples of attributes in output order
+        :return:
+        """
+        if self._pending is not None:
+            self._flush_pending()
+        if attrib:
+            open_tag = self._indent * self._depth + self._open_tag(tag, attrib)
+        else:
+            open_tag = self._indent * self._depth + u'<' + tag
+        if text is None:
+            self._pieces.append(open_tag + u'/>' + self._newline)
+        else:
+            self._pieces.append(open_tag + u'>' + escape_text(text) + u'</' + tag + u'>' + self._newline)
+
+    def raw(self, text):
+        """
+        Insert text written by another writer. Text must contain complete elements at the current depth.
+
+        :param text: unicode string
+        :return:
+        """
+        self._flush_pending()
+        self._pieces.append(text)
+
+    def take(self):
+        """
+        Get text written since the previous call and remove it from the writer. Start tag of the latest element is
+        kept until it is known whether the element is empty.
+
+        :return text: UTF-8 encoded bytes
+        """
+        pieces = self._pieces
+        self._pieces = []
+        return u''.join(pieces).encode('utf-8')
+
+    def fragment(self):
+        """
+        Get text written so far. All elements must be closed.
+
+        :return text: unicode string
+        """
+        self._flush_pending()
+        if self._stack:
+            raise ValueError("Unclosed element: {}".format(self._stack[-1]))
+        return u''.join(self._pieces)
+
+    def getvalue(self):
+        """
+        Get whole document with XML declaration.
+
+        :return xml_string: UTF-8 encoded bytes
+        """
+        return (XML_DECLARATION + self.fragment()).encode('utf-8')
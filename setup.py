@@ -20,6 +20,11 @@ setup_requirements = [
     # TODO(atipi): put setup requirements (distutils extensions, etc.) here
 ]
 
+extras_requirements = {
+    'async': ['aiohttp'],
+    'fastjson': ['orjson'],
+}
+
 test_requirements = [
     # TODO: put package test requirements here
 ]
@@ -35,6 +40,7 @@ setup(
     packages=find_packages(include=['pakettikauppa']),
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     zip_safe=False,
     keywords='pakettikauppa',
@@ -43,9 +49,10 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.6',
     ],
+    python_requires='>=3.6',
     test_suite='tests',
     tests_require=test_requirements,
     setup_requires=setup_requirements,
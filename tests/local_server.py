@@ -0,0 +1,140 @@
+"""Minimal local HTTP server for tests which must not call Pakettikauppa's test server."""
+import threading
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+CREATE_SHIPMENT_RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Response><response.status>0</response.status><response.message></response.message>
+<response.reference uuid="8dfd5ad5-1a30-4f2b-b3e2-2a6b1e4ba2c5">123</response.reference>
+<response.trackingcode tracking_url="https://www.pakettikauppa.fi/seuranta/?JJFI1">JJFI1</response.trackingcode>
+</Response>"""
+
+SHIPPING_LABEL_RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Response><response.status>0</response.status><response.message></response.message>
+<response.file>JVBERi0xLjQKJcOkw7zDtsOf</response.file></Response>"""
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, body))
+            server.client_ports.append(self.client_address[1])
+
+        response = server.routes.get(self.path)
+        if response is None:
+            status, content_type, content = 404, 'text/plain', b'Not found'
+        elif callable(response):
+            status, content_type, content = response(self.path, body)
+        else:
+            status, content_type, content = response
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if size == 0:
+                # Skip trailer headers up to the empty line
+                while self.rfile.readline().strip():
+                    pass
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        with self.server.lock:
+            self.server.chunk_counts.append(len(chunks))
+        return b''.join(chunks)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer(object):
+    """
+    Serve canned responses by request path in a background thread.
+
+    Routes map path to tuple of (status code, content type, body) or to a function which takes path and request body
+    and returns such tuple.
+    """
+
+    def __init__(self, routes=None):
+        self._server = _ThreadingServer(('127.0.0.1', 0), _Handler)
+        self._server.routes = routes if routes is not None else default_routes()
+        self._server.requests = []
+        self._server.client_ports = []
+        self._server.chunk_counts = []
+        self._server.lock = threading.Lock()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    @property
+    def routes(self):
+        return self._server.routes
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    @property
+    def client_ports(self):
+        return self._server.client_ports
+
+    @property
+    def chunk_counts(self):
+        # Number of chunks in each request sent with chunked transfer encoding
+        return self._server.chunk_counts
+
+    def reset(self):
+        with self._server.lock:
+            del self._server.requests[:]
+            del self._server.client_ports[:]
+            del self._server.chunk_counts[:]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def default_routes():
+    json_ok = (200, 'application/json', b'[{"id": 1, "name": "test"}]')
+    return {
+        '/shipping-methods/list': json_ok,
+        '/additional-services/list': json_ok,
+        '/pickup-points/search': json_ok,
+        '/shipment/status': json_ok,
+        '/customer/list': json_ok,
+        '/customer/create': json_ok,
+        '/customer/update': json_ok,
+        '/customer/deactivate': json_ok,
+        '/prinetti/create-shipment': (200, 'application/xml', CREATE_SHIPMENT_RESPONSE),
+        '/prinetti/get-shipping-label': (200, 'application/xml', SHIPPING_LABEL_RESPONSE),
+    }
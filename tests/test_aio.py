@@ -0,0 +1,219 @@
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from pakettikauppa.models import Shipment
+
+from pakettikauppa.aio import AsyncPkMerchant, AsyncPkReseller, AsyncHttpTransport, aiohttp
+from pakettikauppa.cache import PickupPointCache, ResponseCache
+from pakettikauppa.label_store import LabelStore
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.standin import StandInServer
+from tests.local_server import LocalServer
+from tests.test_standin import CUSTOMER_DATA
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncClients(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._server = LocalServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.stop()
+
+    def setUp(self):
+        self._server.reset()
+
+    def _merchant(self, transport=None, **kwargs):
+        merchant = AsyncPkMerchant(1, transport=transport, **kwargs)
+        merchant._base_api_end_point = self._server.url
+        return merchant
+
+    def _reseller(self):
+        reseller = AsyncPkReseller(1)
+        reseller._base_api_end_point = self._server.url
+        return reseller
+
+    def test_merchant_list_calls(self):
+        async def run():
+            async with self._merchant() as merchant:
+                methods = await merchant.get_shipping_method_list('fi')
+                services = await merchant.get_additional_service_list()
+                points = await merchant.search_pickup_points(**{
+                    'postal_code': '33100',
+                    'country_code2': 'FI',
+                    'street_address': None,
+                    'service_provider': None,
+                    'max_result': 3,
+                    'timestamp': None
+                })
+                return methods, services, points
+
+        methods, services, points = asyncio.run(run())
+        self.assertEqual(methods, [{'id': 1, 'name': 'test'}])
+        self.assertEqual(services, [{'id': 1, 'name': 'test'}])
+        self.assertEqual(points, [{'id': 1, 'name': 'test'}])
+        self.assertIn(b'language=FI', self._server.requests[0][1])
+
+    def test_create_shipment(self):
+        async def run():
+            async with self._merchant() as merchant:
+                return await merchant.create_shipment(**merchant.get_create_shipment_test_data())
+
+        res = asyncio.run(run())
+        self.assertEqual(res['status'], 1)
+        self.assertEqual(res['trackingcode']['value'], 'JJFI1')
+        self.assertTrue(self._server.requests[0][1].startswith(b"<?xml"))
+
+    def test_get_shipping_label(self):
+        async def run():
+            async with self._merchant() as merchant:
+                return await merchant.get_shipping_label(**merchant.get_shipping_label_req_test_data())
+
+        res = asyncio.run(run())
+        self.assertEqual(res['status'], 1)
+        self.assertIsNotNone(res['PDFcontent'])
+
+    def test_get_shipment_status(self):
+        async def run():
+            async with self._merchant() as merchant:
+                return await merchant.get_shipment_status('JJFI1')
+
+        res_obj = asyncio.run(run())
+        self.assertEqual(res_obj.status_code, 200)
+
+    def test_error_status(self):
+        self._server.routes['/customer/list'] = (500, 'text/plain', b'Internal error')
+
+        async def run():
+            async with self._reseller() as reseller:
+                return await reseller.get_customer_list()
+
+        try:
+            with self.assertRaises(PakettikauppaException):
+                asyncio.run(run())
+        finally:
+            self._server.routes['/customer/list'] = (200, 'application/json', b'[{"id": 1, "name": "test"}]')
+
+    def test_reseller_calls(self):
+        async def run():
+            async with self._reseller() as reseller:
+                customers = await reseller.get_customer_list()
+                updated = await reseller.update_customer(12, name='New name')
+                deactivated = await reseller.deactivate_customer(12)
+                return customers, updated, deactivated
+
+        customers, updated, deactivated = asyncio.run(run())
+        self.assertEqual(customers, [{'id': 1, 'name': 'test'}])
+        self.assertIsNotNone(updated)
+        self.assertIsNotNone(deactivated)
+
+    def test_inherited_merchant_calls(self):
+        async def run():
+            async with self._merchant() as merchant:
+                from_model = await merchant.create_shipment_from_model(
+                    Shipment.from_dict(merchant.get_create_shipment_test_data()))
+                simple = await merchant.create_shipment_with_simple_data()
+                events = await merchant.get_shipment_status_events('JJFI1')
+                statuses = [result async for result in merchant.get_shipment_statuses(['JJFI1', 'JJFI2'])]
+                target = io.BytesIO()
+                written = await merchant.write_shipping_label(target, **merchant.get_shipping_label_req_test_data())
+                pdfs = [result async for result in merchant.get_shipping_label_pdfs(['JJFI1'])]
+                streamed = await merchant.create_shipment_streamed(chunk_size=256,
+                                                                   **merchant.get_create_shipment_test_data())
+                return from_model, simple, events, statuses, target, written, pdfs, streamed
+
+        from_model, simple, events, statuses, target, written, pdfs, streamed = asyncio.run(run())
+        self.assertEqual(from_model['status'], 1)
+        self.assertEqual(simple['status'], 1)
+        self.assertIsInstance(events, list)
+        self.assertEqual([result.request for result in statuses], ['JJFI1', 'JJFI2'])
+        self.assertTrue(all(result.ok for result in statuses))
+        self.assertEqual(written['size'], len(target.getvalue()))
+        self.assertGreater(written['size'], 0)
+        self.assertTrue(pdfs[0].ok)
+        self.assertEqual(streamed['status'], 1)
+        self.assertGreater(self._server.chunk_counts[-1], 1)
+        self.assertTrue(self._server.requests[-1][1].startswith(b"<?xml"))
+
+    def test_caches(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        search = {'postal_code': '33100', 'country_code2': 'FI', 'street_address': None, 'service_provider': None,
+                  'max_result': 3, 'timestamp': None}
+
+        async def run():
+            with LabelStore(directory) as store:
+                async with self._merchant(cache=ResponseCache(), pickup_point_cache=PickupPointCache(),
+                                          label_store=store) as merchant:
+                    for _ in range(2):
+                        await merchant.get_shipping_method_list()
+                        await merchant.search_pickup_points(**search)
+                        label = await merchant.get_shipping_label(**merchant.get_shipping_label_req_data(['JJFI1']))
+                    target = io.BytesIO()
+                    await merchant.write_shipping_label(target, **merchant.get_shipping_label_req_data(['JJFI1']))
+                    return label, target.getvalue()
+
+        label, written = asyncio.run(run())
+        self.assertEqual(len(self._server.requests), 3)
+        self.assertTrue(label['ContentEncoded'])
+        self.assertGreater(len(written), 0)
+
+    def test_iter_customers(self):
+        async def run():
+            async with self._reseller() as reseller:
+                return [customer async for customer in reseller.iter_customers()]
+
+        self.assertEqual(asyncio.run(run()), [{'id': 1, 'name': 'test'}])
+
+    def test_scalar_timeout(self):
+        async def run():
+            async with AsyncHttpTransport(timeout=5) as transport:
+                return await self._merchant(transport).get_shipping_method_list()
+
+        self.assertEqual(asyncio.run(run()), [{'id': 1, 'name': 'test'}])
+
+    def test_many_requests_in_flight(self):
+        async def run():
+            transport = AsyncHttpTransport(limit=10)
+            merchant = self._merchant(transport)
+            results = await asyncio.gather(*[merchant.get_shipping_method_list() for _ in range(100)])
+            await transport.close()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 100)
+        self.assertLessEqual(len(set(self._server.client_ports)), 10)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncCreateCustomersBulk(unittest.TestCase):
+    def test_create_and_resume(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'checkpoint.jsonl')
+        records = [dict(CUSTOMER_DATA, name='Customer {}'.format(i), business_id='{:07d}-1'.format(i))
+                   for i in range(5)]
+        records[1]['email'] = ''
+
+        async def run(url):
+            async with AsyncPkReseller(1) as reseller:
+                reseller.set_api_end_point(url)
+                first = await reseller.create_customers_bulk(records, max_in_flight=3, checkpoint=path)
+                second = await reseller.create_customers_bulk(records, checkpoint=path)
+                return first, second
+
+        with StandInServer() as server:
+            first, second = asyncio.run(run(server.url))
+        self.assertEqual((first.total, first.created, first.invalid, first.failed), (5, 4, 1, 0))
+        self.assertEqual((second.created, second.skipped), (0, 4))
+        self.assertEqual(server.stats['/customer/create'], {200: 4})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,79 @@
+import unittest
+
+from pakettikauppa.batch_builder import ShipmentBatchBuilder
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.resilience import IdempotencyStore, ResiliencePolicy
+from pakettikauppa.standin import StandInServer
+
+
+class TestShipmentBatchBuilder(unittest.TestCase):
+    def setUp(self):
+        self.merchant = PkMerchant(1)
+        self.addCleanup(self.merchant.close)
+
+    def _shipments(self, count, invalid=()):
+        shipments = []
+        for i in range(count):
+            dict_data = self.merchant.get_create_shipment_test_data()
+            routing = dict_data['eChannel']['ROUTING']
+            routing['Routing.Id'] = 'ORDER{}'.format(i)
+            if i in invalid:
+                del dict_data['eChannel']['Shipment']
+            shipments.append(dict_data)
+        return shipments
+
+    def test_build_in_order(self):
+        shipments = self._shipments(23, invalid=(5,))
+        expected = [self.merchant.get_create_shipment_req_data(**shipment) if i != 5 else None
+                    for i, shipment in enumerate(shipments)]
+        for workers in (1, 3):
+            with ShipmentBatchBuilder(self.merchant, workers=workers, chunk_size=4, max_pending_chunks=2) as builder:
+                results = list(builder.build(iter(shipments)))
+            self.assertEqual([result.index for result in results], list(range(23)))
+            self.assertEqual([result.result for result in results], expected)
+            self.assertIs(results[0].request, shipments[0])
+            self.assertIsNotNone(results[5].error)
+            self.assertTrue(all(result.ok for i, result in enumerate(results) if i != 5))
+
+    def test_stop_early(self):
+        with ShipmentBatchBuilder(self.merchant, workers=2, chunk_size=2) as builder:
+            results = builder.build(self._shipments(20))
+            self.assertEqual(next(results).index, 0)
+            results.close()
+            # Pool can be used again
+            self.assertEqual(len(list(builder.build(self._shipments(3)))), 3)
+
+    def test_create_shipments(self):
+        self.merchant = PkMerchant(1, resilience=ResiliencePolicy(idempotency_store=IdempotencyStore()))
+        self.addCleanup(self.merchant.close)
+        shipments = self._shipments(12, invalid=(3,))
+        with StandInServer(latency=0.01) as server:
+            self.merchant.set_api_end_point(server.url)
+            with ShipmentBatchBuilder(self.merchant, workers=2, chunk_size=3) as builder:
+                results = list(builder.create_shipments(shipments, max_in_flight=4))
+                # Same routing IDs again, results come from idempotency store
+                again = list(builder.create_shipments(shipments, max_in_flight=4))
+        self.assertEqual([result.index for result in results], list(range(12)))
+        self.assertIsInstance(results[3].error, Exception)
+        tracking_codes = [result.result['trackingcode']['value'] for result in results if result.ok]
+        self.assertEqual(len(set(tracking_codes)), 11)
+        self.assertEqual([result.result['trackingcode']['value'] for result in again if result.ok], tracking_codes)
+        self.assertEqual(server.stats['/prinetti/create-shipment'], {200: 11})
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ShipmentBatchBuilder(self.merchant, workers=0)
+        with self.assertRaises(ValueError):
+            ShipmentBatchBuilder(self.merchant, chunk_size=0)
+
+    def test_error_is_picklable(self):
+        shipments = self._shipments(1)
+        shipments[0]['eChannel']['Shipment']['Shipment.Consignment']['Consignment.Product'] = None
+        with ShipmentBatchBuilder(self.merchant, workers=2) as builder:
+            result = next(builder.build(shipments))
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.result)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import suite
+
+
+def _results(ops_per_sec, peak_kb):
+    return {'version': suite.RESULT_VERSION,
+            'cases': {'case': {'ops_per_sec': ops_per_sec, 'us_per_op': 1e6 / ops_per_sec, 'peak_kb': peak_kb}}}
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_compare(self):
+        baseline = _results(1000.0, 100.0)
+        self.assertEqual(suite.compare(_results(800.0, 120.0), baseline), [])
+        regressions = suite.compare(_results(700.0, 100.0), baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('ops/s', regressions[0])
+        regressions = suite.compare(_results(1000.0, 200.0), baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('peak', regressions[0])
+        self.assertEqual(suite.compare(_results(700.0, 100.0), baseline, tolerance=0.5), [])
+        # Cases not in baseline are skipped
+        self.assertEqual(suite.compare(_results(1.0, None), {'version': suite.RESULT_VERSION, 'cases': {}}), [])
+        with self.assertRaises(ValueError):
+            suite.compare(_results(1.0, None), {'version': 0, 'cases': {}})
+
+    def test_run_and_compare_with_baseline(self):
+        baseline_path = os.path.join(self.directory, 'baseline.json')
+        output_path = os.path.join(self.directory, 'out', 'results.json')
+        args = ['--filter', 'hash_sha256', '--repeat', '1', '--min-time', '0.001', '--baseline', baseline_path]
+        # Missing baseline fails instead of passing without comparison
+        self.assertEqual(suite.main(args), 2)
+        self.assertEqual(suite.main(args + ['--save-baseline']), 0)
+        with open(baseline_path) as file_object:
+            baseline = json.load(file_object)
+        self.assertEqual(list(baseline['cases']), ['hash_sha256'])
+        self.assertGreater(baseline['cases']['hash_sha256']['ops_per_sec'], 0)
+
+        self.assertEqual(suite.main(args + ['--tolerance', '0.99', '--output', output_path]), 0)
+        self.assertTrue(os.path.exists(output_path))
+
+        baseline['cases']['hash_sha256']['ops_per_sec'] *= 1000
+        with open(baseline_path, 'w') as file_object:
+            json.dump(baseline, file_object)
+        self.assertEqual(suite.main(args), 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import unittest
+from lxml import etree as ET
+
+from pakettikauppa.bulk import run_bounded
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.aio import AsyncPkMerchant, aiohttp
+from tests.local_server import LocalServer, CREATE_SHIPMENT_RESPONSE
+
+ERROR_RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Response><response.status>1</response.status><response.message>Invalid routing</response.message></Response>"""
+
+
+def _create_shipment_route(path, body):
+    routing_id = ET.fromstring(body).find('ROUTING/Routing.Id').text
+    time.sleep(0.05)
+    if routing_id == 'fail':
+        return 200, 'application/xml', ERROR_RESPONSE
+    return 200, 'application/xml', CREATE_SHIPMENT_RESPONSE
+
+
+class TestRunBounded(unittest.TestCase):
+    def test_ordered_results(self):
+        def func(item):
+            time.sleep(0.01 * (5 - item))
+            if item == 2:
+                raise ValueError("bad item")
+            return item * 10
+
+        results = list(run_bounded(func, range(5), max_in_flight=3))
+        self.assertEqual([r.index for r in results], [0, 1, 2, 3, 4])
+        self.assertEqual([r.result for r in results], [0, 10, None, 30, 40])
+        self.assertIsInstance(results[2].error, ValueError)
+        self.assertFalse(results[2].ok)
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max': 0}
+
+        def func(item):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+            return item
+
+        results = list(run_bounded(func, iter(range(40)), max_in_flight=4, ordered=False))
+        self.assertEqual(sorted(r.result for r in results), list(range(40)))
+        self.assertLessEqual(state['max'], 4)
+
+    def test_invalid_max_in_flight(self):
+        with self.assertRaises(ValueError):
+            list(run_bounded(lambda x: x, [1], max_in_flight=0))
+
+
+class TestCreateShipmentsBulk(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._server = LocalServer().start()
+        cls._server.routes['/prinetti/create-shipment'] = _create_shipment_route
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.stop()
+
+    def _shipments(self, merchant, routing_ids):
+        for routing_id in routing_ids:
+            data = merchant.get_create_shipment_test_data()
+            data['eChannel']['ROUTING']['Routing.Id'] = routing_id
+            yield data
+
+    def test_failed_shipment_does_not_abort_batch(self):
+        with PkMerchant(1) as merchant:
+            merchant._base_api_end_point = self._server.url
+            shipments = list(self._shipments(merchant, ['1', 'fail', '3']))
+            shipments.append({'eChannel': {}})
+            results = list(merchant.create_shipments_bulk(shipments, max_in_flight=4))
+
+        self.assertEqual([r.ok for r in results], [True, False, True, False])
+        self.assertEqual(results[0].result['trackingcode']['value'], 'JJFI1')
+        self.assertIsInstance(results[1].error, PakettikauppaException)
+        self.assertIsInstance(results[3].error, KeyError)
+
+    def test_requests_are_concurrent(self):
+        with PkMerchant(1) as merchant:
+            merchant._base_api_end_point = self._server.url
+            start = time.time()
+            results = list(merchant.create_shipments_bulk(self._shipments(merchant, [str(i) for i in range(20)]),
+                                                          max_in_flight=10, ordered=False))
+            elapsed = time.time() - start
+
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(r.ok for r in results))
+        # 20 requests of 50 ms each, serial sending would take at least one second
+        self.assertLess(elapsed, 0.8)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async_bulk(self):
+        async def run():
+            async with AsyncPkMerchant(1) as merchant:
+                merchant._base_api_end_point = self._server.url
+                shipments = self._shipments(merchant, ['1', 'fail', '3'])
+                return [r async for r in merchant.create_shipments_bulk(shipments, max_in_flight=2)]
+
+        results = asyncio.run(run())
+        self.assertEqual([r.index for r in results], [0, 1, 2])
+        self.assertEqual([r.ok for r in results], [True, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
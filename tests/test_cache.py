@@ -0,0 +1,251 @@
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pakettikauppa.cache import (MemoryCacheBackend, FileCacheBackend, RedisCacheBackend, ResponseCache,
+                                 PickupPointCache, make_cache_key)
+from pakettikauppa.merchant import PkMerchant
+from tests.local_server import LocalServer
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _DictRedis(object):
+    """Redis compatible stand-in which keeps data in a dictionary."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode('utf-8')
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _check_backend(self, backend):
+        self.assertIsNone(backend.get('a'))
+        backend.set('a', {'value': [1, 2], 'stored_at': 1.0})
+        self.assertEqual(backend.get('a'), {'value': [1, 2], 'stored_at': 1.0})
+        backend.delete('a')
+        self.assertIsNone(backend.get('a'))
+        backend.set('b', {'value': 'x', 'stored_at': 1.0})
+        backend.clear()
+        self.assertIsNone(backend.get('b'))
+
+    def test_memory_backend(self):
+        self._check_backend(MemoryCacheBackend())
+
+    def test_file_backend(self):
+        self._check_backend(FileCacheBackend(self._directory))
+
+    def test_redis_backend(self):
+        self._check_backend(RedisCacheBackend(_DictRedis()))
+
+    def test_memory_backend_lru_eviction(self):
+        backend = MemoryCacheBackend(max_entries=2)
+        backend.set('a', {'value': 1, 'stored_at': 0})
+        backend.set('b', {'value': 2, 'stored_at': 0})
+        backend.get('a')
+        backend.set('c', {'value': 3, 'stored_at': 0})
+        self.assertIsNotNone(backend.get('a'))
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(len(backend), 2)
+
+    def test_file_backend_eviction(self):
+        backend = FileCacheBackend(self._directory, max_entries=3)
+        for i in range(5):
+            backend.set(str(i), {'value': i, 'stored_at': 0})
+        self.assertEqual(len([k for k in map(str, range(5)) if backend.get(k) is not None]), 3)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.calls = []
+
+    def _loader(self, value):
+        def load():
+            self.calls.append(value)
+            return value
+        return load
+
+    def test_fresh_entry(self):
+        cache = ResponseCache(ttl=60, clock=self.clock)
+        self.assertEqual(cache.get('k', self._loader(1)), 1)
+        self.clock.now += 59
+        self.assertEqual(cache.get('k', self._loader(2)), 1)
+        self.assertEqual(self.calls, [1])
+
+    def test_expired_entry(self):
+        cache = ResponseCache(ttl=60, clock=self.clock)
+        cache.get('k', self._loader(1))
+        self.clock.now += 61
+        self.assertEqual(cache.get('k', self._loader(2)), 2)
+        self.assertEqual(self.calls, [1, 2])
+
+    def test_stale_while_revalidate(self):
+        cache = ResponseCache(ttl=60, stale_ttl=60, clock=self.clock)
+        cache.get('k', self._loader(1))
+        self.clock.now += 90
+        refreshed = threading.Event()
+
+        def load():
+            refreshed.set()
+            return 2
+
+        self.assertEqual(cache.get('k', load), 1)
+        self.assertTrue(refreshed.wait(5))
+        for _ in range(100):
+            if cache.get_backend().get('k')['value'] == 2:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(cache.get('k', self._loader(3)), 2)
+
+    def test_invalidate(self):
+        cache = ResponseCache(ttl=60, clock=self.clock)
+        cache.get('a', self._loader(1))
+        cache.get('b', self._loader(2))
+        cache.invalidate('a')
+        self.assertEqual(cache.get('a', self._loader(3)), 3)
+        cache.invalidate()
+        self.assertEqual(cache.get('b', self._loader(4)), 4)
+
+    def test_make_cache_key(self):
+        self.assertEqual(make_cache_key('key', 'list', 'FI'), 'key:list:FI')
+
+
+class TestMerchantListCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._server = LocalServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.stop()
+
+    def setUp(self):
+        self._server.reset()
+        self._merchant = PkMerchant(1, cache=ResponseCache(ttl=3600))
+        self._merchant._base_api_end_point = self._server.url
+
+    def tearDown(self):
+        self._merchant.close()
+
+    def test_list_calls_are_cached(self):
+        for _ in range(3):
+            self.assertEqual(self._merchant.get_shipping_method_list('fi'), [{'id': 1, 'name': 'test'}])
+            self._merchant.get_shipping_method_list('FI')
+            self._merchant.get_additional_service_list('FI')
+        self.assertEqual(len(self._server.requests), 2)
+
+        self._merchant.get_shipping_method_list('EN')
+        self.assertEqual(len(self._server.requests), 3)
+
+    def test_invalidate_cache(self):
+        self._merchant.get_shipping_method_list('FI')
+        self._merchant.get_additional_service_list('FI')
+        self._merchant.invalidate_cache('get_shipping_method_list', 'fi')
+        self._merchant.get_shipping_method_list('FI')
+        self._merchant.get_additional_service_list('FI')
+        self.assertEqual(len(self._server.requests), 3)
+
+        self._merchant.invalidate_cache()
+        self._merchant.get_additional_service_list('FI')
+        self.assertEqual(len(self._server.requests), 4)
+
+
+def _search(postal_code='33100', max_result=None, **kwargs):
+    params = {
+        'postal_code': postal_code,
+        'country_code2': None,
+        'street_address': None,
+        'service_provider': None,
+        'max_result': max_result,
+        'timestamp': None,
+    }
+    params.update(kwargs)
+    return params
+
+
+class TestPickupPointCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.cache = PickupPointCache(ttl=60, max_entries=2, clock=self.clock)
+        self.calls = []
+
+    def _loader(self, count):
+        def load():
+            self.calls.append(count)
+            return [{'pickup_point_id': i} for i in range(count)]
+        return load
+
+    def test_normalize(self):
+        a = PickupPointCache.normalize(**_search(' 33 100', 3, country_code2='fi', service_provider='Posti ',
+                                                 street_address='Hämeenkatu   1'))
+        b = PickupPointCache.normalize(**_search('33100', '3', country_code2='FI', service_provider='posti',
+                                                 street_address='hämeenkatu 1'))
+        self.assertEqual(a, b)
+        self.assertEqual(PickupPointCache.normalize(**_search())[0][0], 'FI')
+        self.assertEqual(PickupPointCache.normalize(**_search())[1], 5)
+
+    def test_empty_postal_code(self):
+        with self.assertRaises(ValueError):
+            self.cache.get('key', self._loader(1), **_search(''))
+
+    def test_larger_result_answers_smaller_request(self):
+        self.assertEqual(len(self.cache.get('key', self._loader(10), **_search(max_result=10))), 10)
+        self.assertEqual(len(self.cache.get('key', self._loader(3), **_search('33 100', max_result=3))), 3)
+        self.assertEqual(len(self.cache.get('key', self._loader(20), **_search(max_result=20))), 20)
+        self.assertEqual(self.calls, [10, 20])
+        self.assertEqual(self.cache.get_stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 1.0 / 3})
+
+    def test_complete_result_answers_larger_request(self):
+        self.cache.get('key', self._loader(2), **_search(max_result=5))
+        self.assertEqual(len(self.cache.get('key', self._loader(2), **_search(max_result=10))), 2)
+        self.assertEqual(self.calls, [2])
+
+    def test_ttl_and_eviction(self):
+        self.cache.get('key', self._loader(1), **_search('00100'))
+        self.clock.now += 61
+        self.cache.get('key', self._loader(1), **_search('00100'))
+        self.assertEqual(len(self.calls), 2)
+
+        self.cache.get('key', self._loader(1), **_search('00200'))
+        self.cache.get('key', self._loader(1), **_search('00300'))
+        self.cache.get('key', self._loader(1), **_search('00100'))
+        self.assertEqual(len(self.calls), 5)
+
+    def test_merchant_search(self):
+        server = LocalServer().start()
+        try:
+            with PkMerchant(1, pickup_point_cache=self.cache) as merchant:
+                merchant._base_api_end_point = server.url
+                for _ in range(3):
+                    self.assertEqual(merchant.search_pickup_points(**_search(max_result=1)),
+                                     [{'id': 1, 'name': 'test'}])
+        finally:
+            server.stop()
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(self.cache.get_stats()['hits'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import unittest
+
+from pakettikauppa.aio import AsyncPkMerchant, AsyncSingleFlight, aiohttp
+from pakettikauppa.cache import ResponseCache
+from pakettikauppa.coalesce import SingleFlight
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.standin import StandInServer
+
+
+def _search(postal_code='33100', max_result=5, service_provider=None):
+    return {'postal_code': postal_code, 'country_code2': 'FI', 'street_address': None,
+            'service_provider': service_provider, 'max_result': max_result, 'timestamp': None}
+
+
+class TestSingleFlight(unittest.TestCase):
+    def _run_threads(self, count, target):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def run(index):
+            barrier.wait()
+            try:
+                results[index] = target(index)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_share_result(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ['result']
+
+        leader = threading.Thread(target=lambda: single_flight.do('key', func))
+        leader.start()
+        started.wait(5)
+        results = []
+        waiters = [threading.Thread(target=lambda: results.append(single_flight.do('key', func))) for _ in range(5)]
+        for thread in waiters:
+            thread.start()
+        while single_flight.get_stats()['saved'] < 5:
+            release.wait(0.01)
+        self.assertEqual(single_flight.get_in_flight(), 1)
+        release.set()
+        for thread in [leader] + waiters:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['result']] * 5)
+        self.assertEqual(single_flight.get_stats(),
+                         {'calls': 6, 'executed': 1, 'saved': 5, 'saved_ratio': 5 / 6.0})
+        self.assertEqual(single_flight.get_in_flight(), 0)
+
+        # Finished call is not cached
+        self.assertEqual(single_flight.do('key', lambda: 'new'), 'new')
+
+    def test_exception_is_shared(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def func():
+            release.wait(0.2)
+            raise ValueError("failed")
+
+        results = self._run_threads(4, lambda index: single_flight.do('key', func))
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(single_flight.get_in_flight(), 0)
+
+    def test_merchant_calls(self):
+        single_flight = SingleFlight()
+        with StandInServer(latency=0.2) as server:
+            merchant = PkMerchant(1, single_flight=single_flight)
+            merchant.set_api_end_point(server.url)
+            self.addCleanup(merchant.close)
+
+            def call(index):
+                if index % 3 == 0:
+                    return merchant.get_shipping_method_list('fi')
+                if index % 3 == 1:
+                    return merchant.get_additional_service_list('FI')
+                return merchant.search_pickup_points(**_search(postal_code='33 100'))
+
+            results = self._run_threads(12, call)
+            # Different parameters are not coalesced
+            other = self._run_threads(2, lambda index: merchant.search_pickup_points(**_search(max_result=index + 1)))
+
+        self.assertTrue(all(isinstance(result, list) for result in results))
+        self.assertEqual(server.stats['/shipping-methods/list'], {200: 1})
+        self.assertEqual(server.stats['/additional-services/list'], {200: 1})
+        self.assertEqual(server.stats['/pickup-points/search'], {200: 3})
+        self.assertEqual(sorted(len(points) for points in other), [1, 2])
+        self.assertEqual(single_flight.get_stats()['saved'], 9)
+
+    def test_with_cache(self):
+        single_flight = SingleFlight()
+        with StandInServer(latency=0.2) as server:
+            merchant = PkMerchant(1, cache=ResponseCache(), single_flight=single_flight)
+            merchant.set_api_end_point(server.url)
+            self.addCleanup(merchant.close)
+            self._run_threads(6, lambda index: merchant.get_shipping_method_list())
+            merchant.get_shipping_method_list()
+        self.assertEqual(server.stats['/shipping-methods/list'], {200: 1})
+
+    def test_get_pickup_point_key(self):
+        merchant = PkMerchant(1)
+        self.assertEqual(merchant.get_pickup_point_key(**_search('33 100', service_provider='Posti ')),
+                         merchant.get_pickup_point_key(**_search('33100', service_provider='posti')))
+        self.assertNotEqual(merchant.get_pickup_point_key(**_search(max_result=5)),
+                            merchant.get_pickup_point_key(**_search(max_result=6)))
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncSingleFlight(unittest.TestCase):
+    def test_concurrent_coroutines(self):
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        async def run():
+            return await asyncio.gather(*[single_flight.do('key', func) for _ in range(10)])
+
+        self.assertEqual(asyncio.run(run()), ['result'] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.get_stats()['saved'], 9)
+        self.assertEqual(single_flight.get_in_flight(), 0)
+
+    def test_cancelled_waiter(self):
+        single_flight = AsyncSingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        async def run():
+            first = asyncio.ensure_future(single_flight.do('key', func))
+            second = asyncio.ensure_future(single_flight.do('key', func))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), 'result')
+
+    def test_merchant_calls(self):
+        single_flight = AsyncSingleFlight()
+
+        async def run(url):
+            async with AsyncPkMerchant(1, single_flight=single_flight) as merchant:
+                merchant.set_api_end_point(url)
+                calls = [merchant.get_shipping_method_list('FI') for _ in range(5)]
+                calls += [merchant.search_pickup_points(**_search()) for _ in range(5)]
+                return await asyncio.gather(*calls)
+
+        with StandInServer(latency=0.2) as server:
+            results = asyncio.run(run(server.url))
+        self.assertEqual(len(results), 10)
+        self.assertEqual(server.stats['/shipping-methods/list'], {200: 1})
+        self.assertEqual(server.stats['/pickup-points/search'], {200: 1})
+        self.assertEqual(single_flight.get_stats()['saved'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
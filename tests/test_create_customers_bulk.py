@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pakettikauppa.onboarding import CREATED, FAILED, STARTED, CustomerCheckpoint
+from pakettikauppa.reseller import PkReseller
+from pakettikauppa.standin import StandInServer
+
+from tests.test_standin import CUSTOMER_DATA
+
+
+def _records(count):
+    return [dict(CUSTOMER_DATA, name='Customer {}'.format(i), business_id='{:07d}-1'.format(i)) for i in range(count)]
+
+
+class TestCreateCustomersBulk(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'checkpoint.jsonl')
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        self.reseller = PkReseller(1)
+        self.reseller.set_api_end_point(self.server.url)
+        self.addCleanup(self.reseller.close)
+
+    def test_validation_before_sending(self):
+        records = _records(5)
+        records[1]['email'] = ''
+        records[2]['unknown'] = 'x'
+        records[3]['payment_service_provider'] = 'CASH'
+        records.append(dict(records[0]))
+        errors = self.reseller.validate_customers(records)
+        self.assertEqual([index for index, _ in errors], [1, 2, 3, 5])
+        self.assertIn('Duplicate business_id', str(errors[3][1]))
+
+        report = self.reseller.create_customers_bulk(records, max_in_flight=4)
+        self.assertEqual((report.total, report.created, report.invalid, report.failed), (6, 2, 4, 0))
+        self.assertFalse(report.ok)
+        self.assertEqual(set(report.customer_ids), {'0000000-1', '0000004-1'})
+        self.assertEqual(self.server.stats['/customer/create'], {200: 2})
+        self.assertIn('row 1 (0000001-1): ValueError: Mandatory field data is missing', report.format())
+
+    def test_key_field(self):
+        records = _records(3)
+        records[1]['marketing_name'] = 'Shop'
+        records[2]['marketing_name'] = 'Shop'
+        with self.assertRaises(KeyError):
+            self.reseller.validate_customers(records, key_field='customer_id')
+        errors = self.reseller.validate_customers(records, key_field='marketing_name')
+        self.assertEqual([(index, str(error)) for index, error in errors],
+                         [(0, 'Missing marketing_name'), (2, 'Duplicate marketing_name Shop')])
+
+    def test_records_are_validated_once(self):
+        validated = []
+
+        class CountingReseller(PkReseller):
+            def validate_customer_data(self, dict_data):
+                validated.append(dict_data['business_id'])
+                return super(CountingReseller, self).validate_customer_data(dict_data)
+
+        reseller = CountingReseller(1)
+        reseller.set_api_end_point(self.server.url)
+        self.addCleanup(reseller.close)
+        report = reseller.create_customers_bulk(_records(3))
+        self.assertEqual(report.created, 3)
+        self.assertEqual(sorted(validated), ['0000000-1', '0000001-1', '0000002-1'])
+
+    def test_resume_after_failures(self):
+        records = _records(30)
+        self.server.error_rate = 0.3
+        report = self.reseller.create_customers_bulk(records, max_in_flight=8, checkpoint=self.path)
+        self.assertGreater(report.failed, 0)
+        self.assertEqual(report.created + report.failed, 30)
+
+        self.server.error_rate = 0.0
+        second = self.reseller.create_customers_bulk(records, max_in_flight=8, checkpoint=self.path)
+        self.assertTrue(second.ok)
+        self.assertEqual(second.created, report.failed)
+        self.assertEqual(second.skipped, report.created)
+        self.assertEqual(len(second.customer_ids), 30)
+        self.assertEqual(len(self.reseller.get_customer_list()), 30)
+
+        with CustomerCheckpoint(self.path) as checkpoint:
+            self.assertEqual(set(entry['state'] for entry in checkpoint.entries.values()), {CREATED})
+
+    def test_resume_after_crash(self):
+        records = _records(4)
+        # Request of the first customer was sent but the process crashed before the response was recorded
+        self.reseller.create_customer(**records[0])
+        with CustomerCheckpoint(self.path) as checkpoint:
+            checkpoint.record('0000000-1', STARTED)
+            checkpoint.record('0000001-1', STARTED)
+            checkpoint.record('0000002-1', FAILED, error='HTTP 500')
+        with open(self.path, 'a') as f:
+            f.write('{"key": "0000003-1", "sta')
+
+        report = self.reseller.create_customers_bulk(records, checkpoint=self.path)
+        self.assertEqual((report.recovered, report.created, report.skipped), (1, 3, 0))
+        self.assertEqual(report.customer_ids['0000000-1'], 1)
+        customers = self.reseller.get_customer_list()
+        self.assertEqual(sorted(customer['business_id'] for customer in customers),
+                         [record['business_id'] for record in records])
+
+    def test_phone_clean_up(self):
+        self.assertEqual(self.reseller.clean_up_phone_data('+358 (0)40-123 4567'), '3580401234567')
+        self.assertEqual(self.reseller.clean_up_phone_data(None), '')
+        self.assertEqual(self.reseller.clean_up_phone_data(12345), '12345')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+from base64 import b64encode
+from lxml import etree as ET
+
+from pakettikauppa.bulk import split_evenly
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.aio import AsyncPkMerchant, aiohttp
+from tests.local_server import LocalServer
+
+
+def _label_route(path, body):
+    codes = [e.text for e in ET.fromstring(body).findall('PrintLabel/TrackingCode')]
+    if 'BROKEN' in codes:
+        content = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Response><response.status>1</response.status><response.message>Unknown code</response.message>
+<response.file></response.file></Response>"""
+        return 200, 'application/xml', content
+
+    pdf = b'%PDF-1.4 ' + ','.join(codes).encode('ascii')
+    content = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Response><response.status>0</response.status><response.message></response.message>
+<response.file>""" + b64encode(pdf) + b"""</response.file></Response>"""
+    return 200, 'application/xml', content
+
+
+class TestSplitEvenly(unittest.TestCase):
+    def test_balanced_chunks(self):
+        chunks = split_evenly(list(range(101)), 50)
+        self.assertEqual([len(c) for c in chunks], [34, 34, 33])
+        self.assertEqual(sum(chunks, []), list(range(101)))
+
+    def test_min_chunks(self):
+        chunks = split_evenly(list(range(40)), 50, min_chunks=4)
+        self.assertEqual([len(c) for c in chunks], [10, 10, 10, 10])
+
+    def test_empty(self):
+        self.assertEqual(split_evenly([], 10), [])
+
+
+class TestGetShippingLabels(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._server = LocalServer().start()
+        cls._server.routes['/prinetti/get-shipping-label'] = _label_route
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.stop()
+
+    def setUp(self):
+        self._server.reset()
+
+    def test_labels_are_fetched_in_chunks(self):
+        codes = ['JJFI{:05d}'.format(i) for i in range(120)]
+        with PkMerchant(1) as merchant:
+            merchant._base_api_end_point = self._server.url
+            results = list(merchant.get_shipping_labels(codes, chunk_size=50, max_in_flight=3))
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(self._server.requests), 3)
+        self.assertEqual(sum([r.request for r in results], []), codes)
+        for result in results:
+            self.assertTrue(result.ok)
+            self.assertEqual(result.result, b'%PDF-1.4 ' + ','.join(result.request).encode('ascii'))
+
+    def test_failed_chunk(self):
+        with PkMerchant(1) as merchant:
+            merchant._base_api_end_point = self._server.url
+            results = list(merchant.get_shipping_labels(['JJFI1', 'BROKEN', 'JJFI2'], chunk_size=1))
+
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertEqual(str(results[1].error), 'Unknown code')
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async_labels(self):
+        codes = ['JJFI{:05d}'.format(i) for i in range(25)]
+
+        async def run():
+            async with AsyncPkMerchant(1) as merchant:
+                merchant._base_api_end_point = self._server.url
+                return [r async for r in merchant.get_shipping_labels(codes, chunk_size=10)]
+
+        results = asyncio.run(run())
+        self.assertEqual([len(r.request) for r in results], [9, 8, 8])
+        self.assertTrue(all(r.ok for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
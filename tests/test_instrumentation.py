@@ -0,0 +1,209 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pakettikauppa.instrumentation import HistogramExporter, Instrumentation, RequestMetrics, SpanEmitter, \
+    get_current_metrics
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.reseller import PkReseller
+from pakettikauppa.resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy, RetryPolicy
+from pakettikauppa.standin import StandInServer
+
+
+class FakeSpan(object):
+    def __init__(self, name, start_time, attributes):
+        self.name = name
+        self.start_time = start_time
+        self.attributes = attributes
+        self.events = []
+        self.end_time = None
+
+    def add_event(self, name, timestamp=None):
+        self.events.append((name, timestamp))
+
+    def end(self, end_time=None):
+        self.end_time = end_time
+
+
+class FakeTracer(object):
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, start_time=None, attributes=None):
+        span = FakeSpan(name, start_time, attributes)
+        self.spans.append(span)
+        return span
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.records = []
+        self.instrumentation = Instrumentation([self.records.append])
+
+    def _merchant(self, server, **kwargs):
+        merchant = PkMerchant(1, **kwargs)
+        merchant.set_api_end_point(server.url)
+        merchant.set_instrumentation(self.instrumentation)
+        self.addCleanup(merchant.close)
+        return merchant
+
+    def test_form_api(self):
+        with StandInServer(latency=0.05) as server:
+            merchant = self._merchant(server)
+            merchant.get_shipping_method_list()
+        self.assertEqual(len(self.records), 1)
+        metrics = self.records[0]
+        self.assertEqual(metrics.api_name, 'get_shipping_method_list')
+        self.assertEqual(metrics.status_code, 200)
+        self.assertEqual(metrics.attempts, 1)
+        self.assertEqual(metrics.retries, 0)
+        self.assertGreaterEqual(metrics.network_time, 0.05)
+        self.assertGreaterEqual(metrics.build_time, 0)
+        self.assertGreaterEqual(metrics.parse_time, 0)
+        self.assertGreater(metrics.request_bytes, 0)
+        self.assertGreater(metrics.response_bytes, 0)
+        self.assertIsNone(metrics.error)
+        self.assertIsNone(get_current_metrics())
+
+    def test_nested_and_streamed_create_shipment(self):
+        with StandInServer() as server:
+            merchant = self._merchant(server)
+            merchant.create_shipment(**merchant.get_create_shipment_test_data())
+            merchant.create_shipment_streamed(chunk_size=100, **merchant.get_create_shipment_test_data())
+        self.assertEqual([metrics.api_name for metrics in self.records], ['create_shipment', 'create_shipment'])
+        # Streamed request body is counted while it is sent
+        self.assertGreater(self.records[1].request_bytes, 100)
+        self.assertGreater(self.records[0].build_time, 0)
+
+    def test_streamed_label(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with StandInServer(label_size=20000) as server:
+            merchant = self._merchant(server)
+            merchant.write_shipping_label(os.path.join(directory, 'label.pdf'),
+                                          **merchant.get_shipping_label_req_test_data())
+        metrics = self.records[0]
+        self.assertEqual(metrics.api_name, 'get_shipping_label')
+        self.assertEqual(metrics.status_code, 200)
+        self.assertIsNotNone(metrics.parse_time)
+
+    def test_failed_call_and_retries(self):
+        exporter = HistogramExporter()
+        self.instrumentation.add_hook(exporter)
+        policy = ResiliencePolicy(retry=RetryPolicy(max_attempts=3, sleep=lambda seconds: None))
+        with StandInServer(error_rate=1.0) as server:
+            merchant = self._merchant(server, resilience=policy)
+            with self.assertRaises(PakettikauppaException):
+                merchant.get_additional_service_list()
+        metrics = self.records[0]
+        self.assertEqual(metrics.status_code, 500)
+        self.assertEqual(metrics.attempts, 3)
+        self.assertIsInstance(metrics.error, PakettikauppaException)
+        self.assertEqual(exporter.get_response_count('get_additional_service_list', 500), 1)
+        self.assertEqual(exporter.get_retry_count('get_additional_service_list'), 2)
+
+    def test_call_rejected_by_circuit_breaker(self):
+        exporter = HistogramExporter()
+        self.instrumentation.add_hook(exporter)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+        policy = ResiliencePolicy(retry=RetryPolicy(max_attempts=1), circuit_breaker=breaker)
+        with StandInServer(error_rate=1.0) as server:
+            merchant = self._merchant(server, resilience=policy)
+            with self.assertRaises(PakettikauppaException):
+                merchant.get_additional_service_list()
+            with self.assertRaises(CircuitOpenError):
+                merchant.get_additional_service_list()
+        self.assertEqual(len(self.records), 2)
+        metrics = self.records[1]
+        self.assertEqual(metrics.attempts, 0)
+        self.assertIsInstance(metrics.error, CircuitOpenError)
+        self.assertIsNone(metrics.status_code)
+        self.assertEqual(exporter.get_response_count('get_additional_service_list', 'error'), 1)
+
+    def test_reseller(self):
+        with StandInServer() as server:
+            reseller = PkReseller(1)
+            reseller.set_api_end_point(server.url)
+            reseller.set_instrumentation(self.instrumentation)
+            self.addCleanup(reseller.close)
+            reseller.get_customer_list()
+        self.assertEqual(self.records[0].api_name, 'list_customer')
+
+    def test_without_hooks(self):
+        with StandInServer() as server:
+            merchant = self._merchant(server)
+            self.instrumentation.remove_hook(self.records.append)
+            self.assertEqual(self.instrumentation.hooks, ())
+            merchant.get_shipping_method_list()
+            merchant.set_instrumentation(None)
+            merchant.get_shipping_method_list()
+        self.assertEqual(self.records, [])
+
+    def test_failing_hook_is_ignored(self):
+        def broken_hook(metrics):
+            raise RuntimeError("broken")
+
+        self.instrumentation.add_hook(broken_hook)
+        self.instrumentation.add_hook(self.records.append)
+        with StandInServer() as server:
+            merchant = self._merchant(server)
+            self.assertTrue(merchant.get_shipping_method_list())
+        self.assertEqual(len(self.records), 2)
+
+    def test_histogram_exporter(self):
+        exporter = HistogramExporter(duration_buckets=(0.1, 1.0), size_buckets=(100, 1000))
+        for network_time, response_bytes in ((0.05, 50), (0.5, 500), (5.0, 5000)):
+            metrics = RequestMetrics('get_shipment_status')
+            metrics.build_time = 0.01
+            metrics.network_time = network_time
+            metrics.parse_time = 0.01
+            metrics.response_bytes = response_bytes
+            metrics.status_code = 200
+            metrics.attempts = 1
+            exporter(metrics)
+        histogram = exporter.get_duration_histogram('get_shipment_status', 'network')
+        self.assertEqual(histogram.get_cumulative_counts(), [(0.1, 1), (1.0, 2)])
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(exporter.get_size_histogram('get_shipment_status', 'response').count, 3)
+        self.assertIsNone(exporter.get_size_histogram('get_shipment_status', 'request'))
+
+        text = exporter.render()
+        self.assertIn('# TYPE pakettikauppa_request_duration_seconds histogram', text)
+        self.assertIn('pakettikauppa_request_duration_seconds_bucket{api="get_shipment_status",phase="network",'
+                      'le="1.0"} 2', text)
+        self.assertIn('pakettikauppa_request_duration_seconds_bucket{api="get_shipment_status",phase="network",'
+                      'le="+Inf"} 3', text)
+        self.assertIn('pakettikauppa_payload_size_bytes_bucket{api="get_shipment_status",direction="response",'
+                      'le="100"} 1', text)
+        self.assertIn('pakettikauppa_responses_total{api="get_shipment_status",status="200"} 3', text)
+
+    def test_span_emitter(self):
+        metrics = RequestMetrics('create_shipment')
+        metrics.build_time = 0.001
+        metrics.network_time = 0.002
+        metrics.parse_time = 0.003
+        metrics.status_code = 200
+        metrics.attempts = 1
+
+        emitter = SpanEmitter()
+        emitter(metrics)
+        span = emitter.spans[0]
+        self.assertEqual(span['name'], 'pakettikauppa.create_shipment')
+        self.assertEqual(span['attributes']['http.status_code'], 200)
+        self.assertEqual([name for name, _ in span['events']], ['build.end', 'network.end', 'parse.end'])
+        self.assertAlmostEqual(span['end_time'] - span['start_time'], 6000000, delta=10)
+
+        tracer = FakeTracer()
+        SpanEmitter(tracer=tracer)(metrics)
+        self.assertEqual(tracer.spans[0].name, 'pakettikauppa.create_shipment')
+        self.assertEqual(tracer.spans[0].end_time, span['end_time'])
+        self.assertEqual(len(tracer.spans[0].events), 3)
+
+        with self.assertRaises(ValueError):
+            SpanEmitter(tracer=tracer, emit=print)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
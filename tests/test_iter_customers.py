@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pakettikauppa.customer_snapshot import ADDED, CHANGED, REMOVED, CustomerSnapshot
+from pakettikauppa.json_decoder import JsonDecoder
+from pakettikauppa.json_stream import JsonArrayStreamParser, iter_json_array
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.reseller import PkReseller
+from pakettikauppa.standin import StandInServer
+
+from tests.test_standin import CUSTOMER_DATA
+
+
+class TestJsonArrayStream(unittest.TestCase):
+    def test_any_chunk_size(self):
+        data = [{'name': 'a"]},[{\\', 'list': [1, {'b': None}], 'text': u'Tampere ä'}, 1, 's,]', [], {}, None,
+                True, -1.5e3]
+        raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        for size in range(1, len(raw) + 1):
+            chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+            self.assertEqual(list(iter_json_array(chunks)), data)
+        self.assertEqual(list(iter_json_array([b' \n', b'[', b' ]', b'\n'])), [])
+
+    def test_buffer_keeps_only_current_item(self):
+        parser = JsonArrayStreamParser()
+        self.assertEqual(parser.feed(b'[{"a": 1}, {"a": 2}, {"a"'), [{'a': 1}, {'a': 2}])
+        self.assertEqual(parser._text, u'{"a"')
+        self.assertEqual(parser.feed(b': 3}, 4'), [{'a': 3}])
+        self.assertEqual(parser.feed(b'5]'), [45])
+        self.assertEqual(parser.close(), [])
+        self.assertEqual(parser.item_count, 4)
+
+        parser = JsonArrayStreamParser()
+        self.assertEqual(parser.feed(b'[1, 2'), [1])
+        with self.assertRaises(ValueError):
+            parser.close()
+
+    def test_invalid_data(self):
+        for data in (b'{"a": 1}', b'[1,,2]', b'[1,2', b'[1] x', b'[1,]', b'[{"a": 1]', b'[nul]', b'', b'[1 2]',
+                     b'["a\\x"]', b'[' + b'1' * 100 + b'x, 2]'):
+            with self.assertRaises(ValueError):
+                list(iter_json_array([data]))
+
+    def test_records(self):
+        items = list(iter_json_array([b'[{"a": 1}, 2]'], JsonDecoder(records=True)))
+        self.assertEqual(items[0].a, 1)
+        self.assertEqual(items[1], 2)
+
+
+class TestIterCustomers(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        self.reseller = PkReseller(1)
+        self.reseller.set_api_end_point(self.server.url)
+        self.addCleanup(self.reseller.close)
+        for i in range(7):
+            self.reseller.create_customer(**dict(CUSTOMER_DATA, name='Customer {}'.format(i)))
+
+    def test_iter_customers(self):
+        customers = list(self.reseller.iter_customers(chunk_size=10))
+        self.assertEqual([customer['name'] for customer in customers], ['Customer {}'.format(i) for i in range(7)])
+        self.assertEqual(customers, self.reseller.get_customer_list())
+        self.assertEqual(self.server.stats['/customer/list'], {200: 2})
+
+    def test_one_request(self):
+        customers = list(self.reseller.iter_customers())
+        self.assertEqual([customer['customer_id'] for customer in customers], list(range(1, 8)))
+        self.assertEqual(self.server.stats['/customer/list'], {200: 1})
+        self.assertEqual(sorted(self.reseller.get_customer_list_req_data()), ['api_key', 'hash', 'timestamp'])
+
+    def test_invalid_response(self):
+        reseller = PkReseller(1, secret='WrongSecret')
+        reseller.set_api_end_point(self.server.url)
+        self.addCleanup(reseller.close)
+        with self.assertRaises(PakettikauppaException):
+            list(reseller.iter_customers())
+
+    def test_snapshot(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'customers.json')
+
+        changes = list(self.reseller.iter_customer_changes(CustomerSnapshot(path)))
+        self.assertEqual([change.change for change in changes], [ADDED] * 7)
+        self.assertEqual(changes[0].customer['name'], 'Customer 0')
+        self.assertEqual(list(self.reseller.iter_customer_changes(CustomerSnapshot(path))), [])
+
+        self.reseller.update_customer(3, name='New name')
+        self.reseller.create_customer(**CUSTOMER_DATA)
+        del self.server._customers[0]
+        snapshot = CustomerSnapshot(path)
+        changes = sorted((change.change, str(change.customer_id)) for change in
+                         self.reseller.iter_customer_changes(snapshot))
+        self.assertEqual(changes, [(ADDED, '8'), (CHANGED, '3'), (REMOVED, '1')])
+        self.assertEqual(len(snapshot), 7)
+
+        # Unfinished iteration leaves snapshot unchanged
+        self.reseller.update_customer(4, name='Other name')
+        changes = self.reseller.iter_customer_changes(snapshot)
+        self.assertEqual(next(changes).customer_id, 4)
+        changes.close()
+        self.assertEqual([change.customer_id for change in self.reseller.iter_customer_changes(snapshot)], [4])
+
+    def test_snapshot_with_records(self):
+        self.reseller.set_json_decoder(JsonDecoder(records=True))
+        snapshot = CustomerSnapshot()
+        changes = list(self.reseller.iter_customer_changes(snapshot))
+        self.assertEqual(changes[0].customer.name, 'Customer 0')
+        self.assertEqual(list(self.reseller.iter_customer_changes(snapshot)), [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
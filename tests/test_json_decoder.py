@@ -0,0 +1,62 @@
+import unittest
+
+from pakettikauppa.json_decoder import JsonDecoder, get_available_backends, get_record_type, to_records
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.standin import StandInServer
+
+
+class Response(object):
+    def __init__(self, content):
+        self.content = content
+
+
+class TestJsonDecoder(unittest.TestCase):
+    def setUp(self):
+        self.merchant = PkMerchant(1)
+        self.addCleanup(self.merchant.close)
+
+    def test_backends(self):
+        backends = get_available_backends()
+        self.assertEqual(backends[-1], 'json')
+        data = u'[{"name": "Pääposti", "id": 1}, 2]'.encode('utf-8')
+        for backend in backends:
+            self.assertEqual(JsonDecoder(backend).decode(data), [{'name': u'Pääposti', 'id': 1}, 2])
+        self.assertEqual(JsonDecoder().backend, backends[0])
+        with self.assertRaises(ValueError):
+            JsonDecoder('simplejson2')
+
+    def test_parse_error(self):
+        for backend in get_available_backends():
+            self.merchant.set_json_decoder(JsonDecoder(backend))
+            with self.assertRaises(PakettikauppaException) as context:
+                self.merchant.parse_res_to_list(Response(b'[{"name": '))
+            self.assertIn('Unable to parse JSON data', str(context.exception))
+            with self.assertRaises(PakettikauppaException):
+                self.merchant.parse_res_to_list(Response(b''))
+        self.assertIsNone(self.merchant.parse_res_to_list(None))
+
+    def test_records(self):
+        list_records = to_records([{'a': 1, 'b': {'c': 2}}, {'a': 3, 'b': None}, {'b': 1, 'a': 2}, 'text',
+                                   {'class': 1, 'ok': 2}])
+        self.assertEqual(list_records[0].a, 1)
+        self.assertEqual(list_records[0].b, {'c': 2})
+        self.assertIs(type(list_records[0]), type(list_records[1]))
+        self.assertIsNot(type(list_records[0]), type(list_records[2]))
+        self.assertEqual(list_records[3], 'text')
+        self.assertEqual(list_records[4]._0, 1)
+        self.assertEqual(list_records[4].ok, 2)
+        self.assertIs(get_record_type(('a', 'b')), type(list_records[0]))
+
+    def test_records_from_api(self):
+        with StandInServer() as server:
+            self.merchant.set_api_end_point(server.url)
+            self.merchant.set_json_decoder(JsonDecoder(records=True))
+            points = self.merchant.search_pickup_points(postal_code='33100', country_code2='FI', street_address=None,
+                                                        service_provider=None, max_result=3, timestamp=None)
+        self.assertEqual([point.postcode for point in points], ['33100'] * 3)
+        self.assertEqual(points[0]._asdict()['pickup_point_id'], '3310000')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,185 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from pakettikauppa.label_store import LabelStore
+from pakettikauppa.merchant import ENCODE_CHUNK_SIZE, PkMerchant, encode_pdf_content
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.standin import StandInServer
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class TestLabelStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _store(self, **kwargs):
+        store = LabelStore(self.directory, clock=_Clock(), **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def _object_files(self):
+        return [name for _, _, names in os.walk(os.path.join(self.directory, 'objects')) for name in names]
+
+    def test_put_and_get(self):
+        store = self._store()
+        digest = store.put('JJFI1', b'%PDF-1 label')
+        self.assertEqual(store.get('JJFI1'), b'%PDF-1 label')
+        self.assertTrue(os.path.exists(store.get_object_path(digest)))
+        self.assertIsNone(store.get('JJFI2'))
+        with store.open('JJFI1') as mmap_object:
+            self.assertEqual(mmap_object[:5], b'%PDF-')
+        target = io.BytesIO()
+        self.assertEqual(store.write_to('JJFI1', target), 12)
+        self.assertEqual(target.getvalue(), b'%PDF-1 label')
+        self.assertIsNone(store.write_to('JJFI2', target))
+        self.assertEqual(store.get_missing(['JJFI2', 'JJFI1', 'JJFI3']), ['JJFI2', 'JJFI3'])
+        self.assertEqual(store.get_stats()['hits'], 3)
+        self.assertEqual(store.get_stats()['misses'], 2)
+        with self.assertRaises(ValueError):
+            store.put('JJFI3', b'')
+
+    def test_same_content_is_stored_once(self):
+        store = self._store()
+        store.put('JJFI1', b'%PDF same')
+        store.put('JJFI2', b'%PDF same')
+        self.assertEqual(len(self._object_files()), 1)
+        self.assertEqual(store.get_stats()['bytes'], 9)
+        self.assertTrue(store.remove('JJFI1'))
+        self.assertFalse(store.remove('JJFI1'))
+        self.assertEqual(store.get('JJFI2'), b'%PDF same')
+        store.remove('JJFI2')
+        self.assertEqual(self._object_files(), [])
+
+    def test_reopen(self):
+        store = self._store()
+        store.put('JJFI1', b'%PDF one')
+        store.put('JJFI2', b'%PDF two')
+        store.put('JJFI1', b'%PDF one, updated')
+        store.remove('JJFI2')
+        # Crash in the middle of an index line
+        with open(os.path.join(self.directory, 'index.log'), 'a') as f:
+            f.write('{"op": "put", "code": "JJ')
+
+        reopened = self._store()
+        self.assertEqual(len(reopened), 1)
+        self.assertEqual(reopened.get('JJFI1'), b'%PDF one, updated')
+        self.assertEqual(len(self._object_files()), 1)
+
+    def test_size_eviction(self):
+        store = self._store(max_bytes=250)
+        for i in range(5):
+            store.put('JJFI{}'.format(i), b'%PDF' + str(i).encode('ascii') * 95)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get_stats()['evictions'], 3)
+        self.assertLessEqual(store.total_bytes, 250)
+
+        # Read label is used recently and stays
+        store.get('JJFI3')
+        store.put('JJFI5', b'%PDF' + b'5' * 95)
+        self.assertIn('JJFI3', store)
+        self.assertNotIn('JJFI4', store)
+        self.assertEqual(len(self._object_files()), 2)
+
+    def test_removed_object_is_missing(self):
+        store = self._store()
+        digest = store.put('JJFI1', b'%PDF label')
+        os.remove(store.get_object_path(digest))
+        self.assertIsNone(store.get('JJFI1'))
+        self.assertNotIn('JJFI1', store)
+
+    def test_index_is_compacted(self):
+        store = self._store()
+        for i in range(300):
+            store.put('JJFI1', '%PDF {}'.format(i).encode('ascii'))
+        with open(os.path.join(self.directory, 'index.log')) as f:
+            self.assertLess(len(f.readlines()), 110)
+        self.assertEqual(self._store().get('JJFI1'), b'%PDF 299')
+
+
+class TestMerchantLabelStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.server = StandInServer(label_size=3000).start()
+        self.addCleanup(self.server.stop)
+        self.store = LabelStore(self.directory)
+        self.addCleanup(self.store.close)
+        self.merchant = PkMerchant(1, label_store=self.store)
+        self.merchant.set_api_end_point(self.server.url)
+        self.addCleanup(self.merchant.close)
+
+    def _requests(self):
+        return self.server.stats.get('/prinetti/get-shipping-label', {}).get(200, 0)
+
+    def test_reprint_from_store(self):
+        dict_data = self.merchant.get_shipping_label_req_data(['JJFI1'])
+        first = self.merchant.get_shipping_label(**dict_data)
+        self.assertTrue(first['ContentEncoded'])
+        second = self.merchant.get_shipping_label(**dict_data)
+        self.assertEqual(sorted(second), sorted(first))
+        self.assertEqual(second['PDFcontent'], first['PDFcontent'])
+        self.assertTrue(second['ContentEncoded'])
+        self.assertEqual(self._requests(), 1)
+
+        target = io.BytesIO()
+        dict_res = self.merchant.write_shipping_label(target, **dict_data)
+        self.assertEqual(target.getvalue(), self.merchant._decode_shipping_label_res(first))
+        self.assertEqual(dict_res['size'], len(target.getvalue()))
+        path = os.path.join(self.directory, 'label.pdf')
+        self.merchant.write_shipping_label(path, **dict_data)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), target.getvalue())
+        self.assertEqual(self._requests(), 1)
+
+        # Labels of many tracking codes are one PDF and not stored
+        dict_data = self.merchant.get_shipping_label_req_data(['JJFI1', 'JJFI2'])
+        self.assertTrue(self.merchant.get_shipping_label(**dict_data)['ContentEncoded'])
+        self.assertEqual(len(self.store), 1)
+
+    def test_reprint_is_encoded_in_chunks(self):
+        pdf_content = b'%PDF' + os.urandom(ENCODE_CHUNK_SIZE * 2 + 7)
+        self.store.put('JJFI1', pdf_content)
+        dict_data = self.merchant.get_shipping_label_req_data(['JJFI1'])
+        dict_res = self.merchant.get_shipping_label(**dict_data)
+        self.assertEqual(dict_res['PDFcontent'], base64.b64encode(pdf_content).decode('ascii'))
+        self.assertEqual(self._requests(), 0)
+        for size in range(8):
+            self.assertEqual(encode_pdf_content(pdf_content[:size], chunk_size=3),
+                             base64.b64encode(pdf_content[:size]).decode('ascii'))
+
+    def test_fetch_only_missing(self):
+        codes = ['JJFI{}'.format(i) for i in range(6)]
+        list(self.merchant.get_shipping_label_pdfs(codes[:2]))
+        self.assertEqual(self._requests(), 2)
+
+        results = list(self.merchant.get_shipping_label_pdfs(codes, max_in_flight=3))
+        self.assertEqual([result.request for result in results], codes)
+        self.assertTrue(all(result.ok and result.result.startswith(b'%PDF') for result in results))
+        self.assertEqual(self._requests(), 6)
+        self.assertEqual(self.store.get_missing(codes), [])
+
+        list(self.merchant.get_shipping_label_pdfs(codes[:2], only_missing=False))
+        self.assertEqual(self._requests(), 8)
+
+    def test_failed_label_is_not_stored(self):
+        self.server.error_rate = 1.0
+        results = list(self.merchant.get_shipping_label_pdfs(['JJFI1']))
+        self.assertIsInstance(results[0].error, PakettikauppaException)
+        self.assertEqual(len(self.store), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
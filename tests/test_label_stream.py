@@ -0,0 +1,141 @@
+import hashlib
+import io
+import os
+import tempfile
+import tracemalloc
+import unittest
+from base64 import b64encode
+
+from pakettikauppa.label_stream import Base64StreamDecoder, stream_shipping_label_res
+from pakettikauppa.merchant import PkMerchant
+from tests.local_server import LocalServer
+
+
+def _label_response(pdf_content, status=b'0'):
+    encoded = b64encode(pdf_content)
+    # Pakettikauppa sends base64 content in lines
+    lines = b'\n'.join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    return (b'<?xml version="1.0" encoding="UTF-8"?>\n<Response><response.status>' + status +
+            b'</response.status><response.message>OK</response.message><response.file>' + lines +
+            b'</response.file></Response>')
+
+
+def _chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class _HashSink(object):
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+
+
+class TestBase64StreamDecoder(unittest.TestCase):
+    def test_decode_in_pieces(self):
+        data = os.urandom(1000)
+        encoded = b64encode(data).decode('ascii')
+        sink = io.BytesIO()
+        decoder = Base64StreamDecoder(sink)
+        for i in range(0, len(encoded), 7):
+            decoder.write(encoded[i:i + 7] + '\n')
+        self.assertEqual(decoder.finish(), 1000)
+        self.assertEqual(sink.getvalue(), data)
+
+    def test_truncated_data(self):
+        decoder = Base64StreamDecoder(io.BytesIO())
+        decoder.write('QUJD' + 'QU')
+        with self.assertRaises(ValueError):
+            decoder.finish()
+
+
+class TestStreamShippingLabel(unittest.TestCase):
+    def test_parse_chunks(self):
+        pdf = b'%PDF-1.4' + os.urandom(5000)
+        sink = io.BytesIO()
+        dict_data = stream_shipping_label_res(_chunks(_label_response(pdf), 100), sink)
+        self.assertEqual(dict_data['status'], 1)
+        self.assertEqual(dict_data['message'], 'OK')
+        self.assertEqual(dict_data['size'], len(pdf))
+        self.assertEqual(sink.getvalue(), pdf)
+
+    def test_error_status(self):
+        dict_data = stream_shipping_label_res([_label_response(b'', b'1')], io.BytesIO())
+        self.assertEqual(dict_data['status'], 0)
+
+    def test_missing_file_element(self):
+        xml = b'<Response><response.status>1</response.status><response.message>x</response.message></Response>'
+        dict_data = stream_shipping_label_res([xml], io.BytesIO())
+        self.assertEqual(dict_data['status'], 0)
+        self.assertEqual(dict_data['size'], 0)
+
+    def test_memory_is_bounded(self):
+        pdf = os.urandom(8 * 1024 * 1024)
+        response = _label_response(pdf)
+        sink = _HashSink()
+
+        tracemalloc.start()
+        try:
+            stream_shipping_label_res(_chunks(response, 65536), sink)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(sink.hash.digest(), hashlib.sha256(pdf).digest())
+        self.assertLess(peak, 1024 * 1024)
+
+
+class TestWriteShippingLabel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.PDF = b'%PDF-1.4' + os.urandom(300000)
+        cls._server = LocalServer().start()
+        cls._server.routes['/prinetti/get-shipping-label'] = (200, 'application/xml', _label_response(cls.PDF))
+        cls._merchant = PkMerchant(1)
+        cls._merchant._base_api_end_point = cls._server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._merchant.close()
+        cls._server.stop()
+
+    def test_write_to_path(self):
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            dict_data = self._merchant.write_shipping_label(path, **self._merchant.get_shipping_label_req_test_data())
+            self.assertEqual(dict_data['status'], 1)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.PDF)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_error_status_removes_file(self):
+        route = self._server.routes['/prinetti/get-shipping-label']
+        self._server.routes['/prinetti/get-shipping-label'] = (200, 'application/xml',
+                                                               _label_response(self.PDF, status=b'1'))
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            dict_data = self._merchant.write_shipping_label(path, **self._merchant.get_shipping_label_req_test_data())
+            self.assertNotEqual(dict_data['status'], 1)
+            self.assertGreater(dict_data['size'], 0)
+            self.assertFalse(os.path.exists(path))
+        finally:
+            self._server.routes['/prinetti/get-shipping-label'] = route
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_write_to_file_object(self):
+        sink = io.BytesIO()
+        dict_data = self._merchant.write_shipping_label(sink, chunk_size=1024,
+                                                        **self._merchant.get_shipping_label_req_test_data())
+        self.assertEqual(dict_data['size'], len(self.PDF))
+        self.assertEqual(sink.getvalue(), self.PDF)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
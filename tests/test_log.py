@@ -0,0 +1,80 @@
+import logging
+import unittest
+
+from pakettikauppa.log import get_logger, set_log_level, enable_debug_logging
+from pakettikauppa.merchant import PkMerchant
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super(_ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class _Unprintable(object):
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return 'unprintable'
+
+
+class TestLog(unittest.TestCase):
+    def tearDown(self):
+        set_log_level(None)
+        set_log_level(None, 'merchant')
+
+    def test_root_logger_is_not_configured(self):
+        root = logging.getLogger()
+        handlers = list(root.handlers)
+        level = root.level
+        PkMerchant(1).close()
+        self.assertEqual(root.handlers, handlers)
+        self.assertEqual(root.level, level)
+
+    def test_get_logger(self):
+        self.assertEqual(get_logger().name, 'pakettikauppa')
+        self.assertIs(get_logger('merchant'), logging.getLogger('pakettikauppa.merchant'))
+        self.assertIs(get_logger('pakettikauppa.merchant'), logging.getLogger('pakettikauppa.merchant'))
+
+    def test_component_level(self):
+        set_log_level('warning')
+        set_log_level(logging.DEBUG, 'merchant')
+        self.assertTrue(get_logger('merchant').isEnabledFor(logging.DEBUG))
+        self.assertFalse(get_logger('reseller').isEnabledFor(logging.DEBUG))
+        with self.assertRaises(ValueError):
+            set_log_level('loud')
+
+    def test_messages_are_formatted_lazily(self):
+        value = _Unprintable()
+        set_log_level(logging.INFO)
+        get_logger('merchant').debug("Value=%s", value)
+        self.assertEqual(value.formatted, 0)
+
+        handler = enable_debug_logging('merchant', _ListHandler())
+        try:
+            get_logger('merchant').debug("Value=%s", value)
+        finally:
+            get_logger('merchant').removeHandler(handler)
+        self.assertEqual(handler.records[0].getMessage(), 'Value=unprintable')
+
+    def test_secret_is_not_logged(self):
+        handler = enable_debug_logging(handler=_ListHandler())
+        try:
+            merchant = PkMerchant(1, secret='VerySecretKey123')
+            merchant.get_hash_sha256('VerySecretKey123', api_key='key', timestamp='1')
+            merchant.get_md5_hash('key', 'VerySecretKey123', '1')
+            merchant.close()
+        finally:
+            get_logger().removeHandler(handler)
+        self.assertTrue(handler.records)
+        for record in handler.records:
+            self.assertNotIn('VerySecretKey123', record.getMessage())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,129 @@
+import copy
+import unittest
+
+from lxml import etree as ET
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.models import Address, AdditionalService, Consignment, ContentLine, Parcel, Shipment
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from tests.local_server import LocalServer
+
+
+def _fixed_time(dict_data):
+    dict_data['eChannel']['ROUTING']['Routing.Time'] = '20240101120000'
+    return dict_data
+
+
+def _canonical(xml_string):
+    parser = ET.XMLParser(remove_blank_text=True)
+    return ET.tostring(ET.fromstring(xml_string, parser), method='c14n')
+
+
+class TestModels(unittest.TestCase):
+    def setUp(self):
+        self.merchant = PkMerchant(1)
+
+    def tearDown(self):
+        self.merchant.close()
+
+    def _assert_same_output(self, dict_data):
+        expected = self.merchant.get_xml_shipment_req_data(**copy.deepcopy(dict_data))
+        shipment = Shipment.from_dict(dict_data)
+        self.assertEqual(self.merchant.get_xml_shipment_model_req_data(shipment), expected)
+        compact = self.merchant.get_xml_shipment_model_req_data(shipment, pretty_print=False)
+        self.assertEqual(_canonical(compact), _canonical(expected))
+
+    def test_test_data(self):
+        self._assert_same_output(_fixed_time(self.merchant.get_create_shipment_test_data()))
+        self._assert_same_output(_fixed_time(self.merchant.get_create_multi_parcels_shipment_test_data()))
+
+    def test_simple_test_data(self):
+        dict_data = self.merchant.get_proper_req_data_create_shipment(
+            **self.merchant.get_simple_test_data_create_shipment())
+        self._assert_same_output(_fixed_time(dict_data))
+
+        # Keys given with None value are written like PkMerchant writes them
+        shipment_data = dict_data['eChannel']['Shipment']
+        shipment_data['Shipment.Recipient']['Recipient.Name2'] = None
+        shipment_data['Shipment.Consignment']['Consignment.Parcel'][0]['Parcel.contentline'][
+            'contentline.tariffcode'] = None
+        self._assert_same_output(dict_data)
+        root = ET.fromstring(self.merchant.get_xml_shipment_model_req_data(Shipment.from_dict(dict_data)))
+        self.assertEqual(root.findtext('Shipment/Shipment.Recipient/Recipient.Name2'), 'None')
+        services = root.findall('Shipment/Shipment.Consignment/Consignment.Parcel/Parcel.ParcelService/ServiceCode')
+        self.assertEqual([element.text for element in services], ['parcel service code', 'parcel service code 2'])
+
+    def test_built_models(self):
+        shipment = Shipment(
+            '1464524676', 'ORDER001',
+            Address('Vilkas Group Oy', 'Finlaysoninkuja 19', 33210, 'Tampere', email='tipi@vilkas.fi'),
+            Address(u'Tom & Jerry \xe5', 'Street 1', '33100', 'Tampere', phone=123456789),
+            Consignment('2103', [Parcel(1.2, reference='123', services=['1']),
+                                 Parcel(content_line=ContentLine('Puita', quantity=1))],
+                        currency='eur', content_code='M',
+                        additional_services=[AdditionalService('2106', [('pickup_point_id', 8547)])]),
+            routing_time='20240101120000')
+        root = ET.fromstring(self.merchant.get_xml_shipment_model_req_data(shipment))
+        self.assertEqual(root.findtext('ROUTING/Routing.Account'), str(self.merchant._api_key))
+        self.assertEqual(root.findtext('ROUTING/Routing.Key'), self.merchant.get_routing_key('1464524676'))
+        self.assertEqual(root.findtext('Shipment/Shipment.Recipient/Recipient.Name1'), u'Tom & Jerry \xe5')
+        self.assertEqual(root.findtext('Shipment/Shipment.Recipient/Recipient.Phone'), '123456789')
+        self.assertIsNone(root.find('Shipment/Shipment.Sender/Sender.Name2'))
+        consignment = root.find('Shipment/Shipment.Consignment')
+        self.assertEqual(consignment.findtext('Consignment.Currency'), 'EUR')
+        self.assertEqual(consignment.find('Consignment.AdditionalService/AdditionalService.Specifier').get('name'),
+                         'pickup_point_id')
+        parcels = consignment.findall('Consignment.Parcel')
+        self.assertEqual(len(parcels), 2)
+        self.assertEqual(parcels[0].find('Parcel.Weight').get('unit'), 'kg')
+        self.assertEqual(parcels[0].findtext('Parcel.ParcelService/ServiceCode'), '1')
+        self.assertEqual(parcels[1].findtext('Parcel.contentline/contentline.quantity'), '1')
+
+    def test_validation_errors(self):
+        with self.assertRaises(ValueError):
+            Address('Name', None, '33100', 'Tampere')
+        with self.assertRaises(PakettikauppaException):
+            Parcel(1, package_type='XX')
+        with self.assertRaises(PakettikauppaException):
+            Parcel(1, weight_unit='')
+        with self.assertRaises(PakettikauppaException):
+            Consignment('', [])
+        with self.assertRaises(PakettikauppaException):
+            Consignment('2103', [], content_code='X')
+        with self.assertRaises(PakettikauppaException):
+            Consignment('2103', [], return_instruction='X')
+        with self.assertRaises(ValueError):
+            AdditionalService('')
+        with self.assertRaises(KeyError):
+            Address.from_dict({'Recipient.Unknown': 'x'}, 'recipient')
+        with self.assertRaises(KeyError):
+            Parcel.from_dict({'Parcel.Unknown': 'x'})
+
+        dict_data = self.merchant.get_create_shipment_test_data()
+        dict_data['eChannel']['Shipment']['Shipment.Consignment']['Consignment.Parcel'] = 'parcel'
+        with self.assertRaises(PakettikauppaException):
+            Shipment.from_dict(dict_data)
+
+    def test_slots(self):
+        address = Address('Name', 'Street 1', '33100', 'Tampere')
+        for obj in (address, ContentLine(), Parcel(), AdditionalService('2106'), Consignment('2103', []),
+                    Shipment('1', 'ORDER', address, address, Consignment('2103', []))):
+            self.assertFalse(hasattr(obj, '__dict__'))
+            with self.assertRaises(AttributeError):
+                obj.unknown = 1
+
+    def test_create_shipment_from_model(self):
+        server = LocalServer().start()
+        try:
+            self.merchant._base_api_end_point = server.url
+            shipment = Shipment.from_dict(self.merchant.get_create_shipment_test_data())
+            dict_res = self.merchant.create_shipment_from_model(shipment)
+        finally:
+            server.stop()
+        self.assertEqual(dict_res['status'], 1)
+        root = ET.fromstring(server.requests[0][1])
+        self.assertEqual(root.findtext('ROUTING/Routing.Id'), '1464524676')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,152 @@
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.pickup_index import PickupPointIndex, EARTH_RADIUS_KM
+from tests.local_server import LocalServer
+
+
+def _point(point_id, postcode, latitude, longitude, provider='Posti', country='FI'):
+    return {
+        'pickup_point_id': str(point_id),
+        'provider': provider,
+        'name': 'Point {}'.format(point_id),
+        'street_address': 'Street {}'.format(point_id),
+        'postcode': postcode,
+        'city': 'City',
+        'country': country,
+        'map_latitude': str(latitude),
+        'map_longitude': str(longitude),
+        'description': None,
+    }
+
+
+def _distance(latitude1, longitude1, latitude2, longitude2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _search(postal_code, max_result=None, **kwargs):
+    params = {
+        'postal_code': postal_code,
+        'country_code2': None,
+        'street_address': None,
+        'service_provider': None,
+        'max_result': max_result,
+        'timestamp': None,
+    }
+    params.update(kwargs)
+    return params
+
+
+class TestPickupPointIndex(unittest.TestCase):
+    def setUp(self):
+        self.points = [
+            _point(1, '33100', 61.4978, 23.7610),
+            _point(2, '33100', 61.4990, 23.7700, provider='Matkahuolto'),
+            _point(3, '33200', 61.5000, 23.7400),
+            _point(4, '00100', 60.1699, 24.9384),
+            _point(5, '00120', 60.1620, 24.9400),
+            _point(6, '90100', 65.0121, 25.4651),
+        ]
+        self.index = PickupPointIndex(self.points)
+
+    def test_add_replaces_same_point(self):
+        self.assertEqual(len(self.index), 6)
+        self.index.add([dict(self.points[0], name='Renamed')])
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.find_by_postcode('33100', limit=1)[0]['name'], 'Renamed')
+
+    def test_find_by_postcode(self):
+        self.assertEqual([p['pickup_point_id'] for p in self.index.find_by_postcode('00')], ['4', '5'])
+        self.assertEqual([p['pickup_point_id'] for p in self.index.find_by_postcode('331')], ['1', '2'])
+        self.assertEqual([p['pickup_point_id'] for p in self.index.find_by_postcode('33', service_provider='posti')],
+                         ['1', '3'])
+        self.assertEqual(self.index.find_by_postcode('33', country_code2='SE'), [])
+
+    def test_find_nearest_matches_brute_force(self):
+        rnd = random.Random(1)
+        points = [_point(i, '{:05d}'.format(i), rnd.uniform(59.5, 70.0), rnd.uniform(19.0, 31.5))
+                  for i in range(2000)]
+        index = PickupPointIndex(points)
+        for _ in range(20):
+            latitude, longitude = rnd.uniform(59.5, 70.0), rnd.uniform(19.0, 31.5)
+            expected = sorted(points, key=lambda p: _distance(latitude, longitude, float(p['map_latitude']),
+                                                              float(p['map_longitude'])))[:7]
+            found = index.find_nearest(latitude, longitude, 7)
+            self.assertEqual([p['pickup_point_id'] for _, p in found], [p['pickup_point_id'] for p in expected])
+            self.assertAlmostEqual(found[0][0], _distance(latitude, longitude, float(expected[0]['map_latitude']),
+                                                          float(expected[0]['map_longitude'])), places=6)
+
+    def test_find_nearest_filters(self):
+        found = self.index.find_nearest(61.4978, 23.7610, 10, service_provider='Matkahuolto')
+        self.assertEqual([p['pickup_point_id'] for _, p in found], ['2'])
+        found = self.index.find_nearest(61.4978, 23.7610, 10, max_distance=5)
+        self.assertEqual(sorted(p['pickup_point_id'] for _, p in found), ['1', '2', '3'])
+
+    def test_search_pickup_points(self):
+        list_data = self.index.search_pickup_points(**_search('33 100', 2))
+        self.assertEqual(sorted(p['pickup_point_id'] for p in list_data), ['1', '2'])
+        self.assertEqual(list_data[0], self.points[int(list_data[0]['pickup_point_id']) - 1])
+        # Unknown postcode is located by the longest known prefix
+        list_data = self.index.search_pickup_points(**_search('00180', 1))
+        self.assertIn(list_data[0]['pickup_point_id'], ('4', '5'))
+        self.assertEqual(self.index.search_pickup_points(**_search('12345')), [])
+        # Postcode sharing only 2 characters is unknown unless shorter prefixes are allowed
+        self.assertEqual(self.index.search_pickup_points(**_search('33999')), [])
+        self.assertIsNone(self.index.get_postcode_location('33999'))
+        self.assertIsNotNone(self.index.get_postcode_location('33999', min_prefix_length=2))
+        self.index.max_distance = 1
+        self.assertEqual([p['pickup_point_id'] for p in self.index.search_pickup_points(**_search('33200', 3))],
+                         ['3'])
+        with self.assertRaises(ValueError):
+            self.index.search_pickup_points(**_search(''))
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'points.json.gz')
+            self.index.add([{'pickup_point_id': '7', 'provider': 'Posti', 'postcode': '33100'}])
+            self.assertEqual(self.index.save(path), 7)
+            loaded = PickupPointIndex.load(path)
+            self.assertEqual(self.index.find_by_postcode(''), loaded.find_by_postcode(''))
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestMerchantPickupPointIndex(unittest.TestCase):
+    def setUp(self):
+        self._server = LocalServer().start()
+
+    def tearDown(self):
+        self._server.stop()
+
+    def test_populate_and_search(self):
+        self._server.routes['/pickup-points/search'] = (
+            200, 'application/json', b'[{"pickup_point_id": "1", "provider": "Posti", "postcode": "33100", '
+                                     b'"country": "FI", "map_latitude": "61.5", "map_longitude": "23.76"}]')
+        index = PickupPointIndex()
+        with PkMerchant(1, pickup_point_index=index) as merchant:
+            merchant._base_api_end_point = self._server.url
+            results = index.populate(merchant, ['33100', '33200'])
+            self.assertTrue(all(result.ok for result in results))
+            self.assertEqual(len(index), 1)
+            self.assertEqual(len(self._server.requests), 2)
+
+            self.assertEqual(merchant.search_pickup_points(**_search('33100'))[0]['pickup_point_id'], '1')
+            self.assertEqual(len(self._server.requests), 2)
+            # Index has nothing near postcode starting with 9, the API is called
+            merchant.search_pickup_points(**_search('90100'))
+            self.assertEqual(len(self._server.requests), 3)
+            # Only 1 character of the postcode is known
+            merchant.search_pickup_points(**_search('34100'))
+            self.assertEqual(len(self._server.requests), 4)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,218 @@
+import unittest
+
+import requests
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.resilience import DEFAULT_TIMEOUT, CircuitBreaker, CircuitOpenError, IdempotencyStore, \
+    ResiliencePolicy, RetryPolicy
+from pakettikauppa.standin import StandInServer
+from pakettikauppa.transport import HttpTransport
+
+
+class CountingTransport(HttpTransport):
+    def __init__(self, *args, **kwargs):
+        super(CountingTransport, self).__init__(*args, **kwargs)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((url, kwargs.get('timeout')))
+        return super(CountingTransport, self).request(method, url, **kwargs)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+class TestResilience(unittest.TestCase):
+    def _merchant(self, server, policy):
+        transport = CountingTransport()
+        merchant = PkMerchant(1, transport=transport, resilience=policy)
+        merchant.set_api_end_point(server.url)
+        self.addCleanup(transport.close)
+        return merchant, transport
+
+    def test_retry_after_server_error(self):
+        clock = FakeClock()
+        policy = ResiliencePolicy(retry=RetryPolicy(max_attempts=10, seed=1, sleep=clock.sleep))
+        with StandInServer(error_rate=0.5, seed=3) as server:
+            merchant, transport = self._merchant(server, policy)
+            for _ in range(5):
+                self.assertTrue(merchant.get_shipping_method_list())
+        counts = server.stats['/shipping-methods/list']
+        self.assertEqual(counts[200], 5)
+        self.assertGreater(counts.get(500, 0), 0)
+        self.assertEqual(len(clock.sleeps), counts[500])
+        self.assertEqual(len(transport.calls), 5 + counts[500])
+
+    def test_no_retry_of_create_shipment_after_server_error(self):
+        clock = FakeClock()
+        policy = ResiliencePolicy(retry=RetryPolicy(max_attempts=3, sleep=clock.sleep))
+        with StandInServer(error_rate=1.0) as server:
+            merchant, transport = self._merchant(server, policy)
+            with self.assertRaises(PakettikauppaException):
+                merchant.create_shipment(**merchant.get_create_shipment_test_data())
+        self.assertEqual(len(transport.calls), 1)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_retry_after_throttling(self):
+        clock = FakeClock()
+        policy = ResiliencePolicy(retry=RetryPolicy(max_attempts=2, sleep=clock.sleep))
+        with StandInServer(rate_limit=0.001, burst=1) as server:
+            merchant, transport = self._merchant(server, policy)
+            merchant.get_shipping_method_list()
+            with self.assertRaises(PakettikauppaException):
+                merchant.create_shipment(**merchant.get_create_shipment_test_data())
+        # 429 is retried for all APIs, delay is at least Retry-After
+        self.assertEqual(len(transport.calls), 3)
+        self.assertEqual(len(clock.sleeps), 1)
+        self.assertGreaterEqual(clock.sleeps[0], 1.0)
+
+    def test_timeouts(self):
+        clock = FakeClock()
+        policy = ResiliencePolicy(default_timeout=(1.0, 0.05), timeouts={'create_shipment': (1.0, 0.05)},
+                                  retry=RetryPolicy(max_attempts=3, sleep=clock.sleep))
+        with StandInServer(latency=0.3) as server:
+            merchant, transport = self._merchant(server, policy)
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                merchant.get_shipping_method_list()
+            self.assertEqual(len(transport.calls), 3)
+            self.assertEqual(transport.calls[0][1], (1.0, 0.05))
+
+            # Request may have created the shipment, so it isn't sent again
+            del transport.calls[:]
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                merchant.create_shipment(**merchant.get_create_shipment_test_data())
+            self.assertEqual(len(transport.calls), 1)
+
+        self.assertEqual(ResiliencePolicy().get_timeout('get_shipping_label'), (DEFAULT_TIMEOUT[0], 120.0))
+        self.assertEqual(ResiliencePolicy().get_timeout('get_shipment_status'), DEFAULT_TIMEOUT)
+
+    def test_transport_default_timeout(self):
+        with StandInServer(latency=0.3) as server:
+            transport = HttpTransport(timeout=(1.0, 0.05))
+            self.addCleanup(transport.close)
+            merchant = PkMerchant(1, transport=transport)
+            merchant.set_api_end_point(server.url)
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                merchant.get_shipping_method_list()
+
+    def test_circuit_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0, clock=clock)
+        policy = ResiliencePolicy(retry=RetryPolicy(max_attempts=1), circuit_breaker=breaker)
+        with StandInServer(error_rate=1.0) as server:
+            merchant, transport = self._merchant(server, policy)
+            for _ in range(3):
+                with self.assertRaises(PakettikauppaException) as context:
+                    merchant.get_shipping_method_list()
+                self.assertNotIsInstance(context.exception, CircuitOpenError)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            with self.assertRaises(CircuitOpenError):
+                merchant.get_shipping_method_list()
+            self.assertEqual(len(transport.calls), 3)
+
+            # Failed trial call opens the circuit again
+            clock.now += 30.0
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            with self.assertRaises(PakettikauppaException) as context:
+                merchant.get_shipping_method_list()
+            self.assertNotIsInstance(context.exception, CircuitOpenError)
+            with self.assertRaises(CircuitOpenError):
+                merchant.get_shipping_method_list()
+
+            # Successful trial call closes the circuit
+            clock.now += 30.0
+            server.error_rate = 0.0
+            self.assertTrue(merchant.get_shipping_method_list())
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(len(transport.calls), 5)
+
+    def test_half_open_allows_one_trial_call(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+        breaker.record_failure()
+        clock.now += 10.0
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        breaker.before_call()
+
+    def test_half_open_trial_with_other_error(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+        policy = ResiliencePolicy(circuit_breaker=breaker)
+        breaker.record_failure()
+        clock.now += 10.0
+
+        def send():
+            raise ValueError("invalid request data")
+
+        with self.assertRaises(ValueError):
+            policy.call('get_shipment_status', send)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # Trial call is allowed again
+        breaker.before_call()
+
+    def test_timeout_without_policy(self):
+        merchant = PkMerchant(1)
+        self.addCleanup(merchant.close)
+        self.assertEqual(merchant._transport._timeout, DEFAULT_TIMEOUT)
+        self.assertIsNone(HttpTransport(timeout=None)._timeout)
+
+    def test_idempotent_create_shipment(self):
+        policy = ResiliencePolicy(idempotency_store=IdempotencyStore())
+        with StandInServer() as server:
+            merchant, transport = self._merchant(server, policy)
+            dict_data = merchant.get_create_shipment_test_data()
+            first = merchant.create_shipment(**dict_data)
+            second = merchant.create_shipment(**dict_data)
+            self.assertEqual(first['status'], 1)
+            self.assertEqual(first, second)
+            self.assertEqual(len(transport.calls), 1)
+
+            dict_data['eChannel']['ROUTING']['Routing.Id'] = 'other'
+            dict_data['eChannel']['ROUTING']['Routing.Key'] = merchant.get_routing_key('other')
+            third = merchant.create_shipment(**dict_data)
+            self.assertNotEqual(first['trackingcode']['value'], third['trackingcode']['value'])
+        self.assertEqual(server.stats['/prinetti/create-shipment'], {200: 2})
+
+    def test_failed_create_shipment_is_not_stored(self):
+        store = IdempotencyStore()
+        policy = ResiliencePolicy(idempotency_store=store)
+        with StandInServer(credentials={}) as server:
+            merchant, transport = self._merchant(server, policy)
+            dict_data = merchant.get_create_shipment_test_data()
+            self.assertEqual(merchant.create_shipment(**dict_data)['status'], 0)
+            self.assertEqual(merchant.create_shipment(**dict_data)['status'], 0)
+        self.assertEqual(len(transport.calls), 2)
+        self.assertIsNone(store.get(dict_data['eChannel']['ROUTING']['Routing.Id'], merchant._api_key))
+
+    def test_idempotency_store_accounts(self):
+        store = IdempotencyStore()
+        store.put('ORDER1', {'status': 1}, 'account1')
+        self.assertEqual(store.get('ORDER1', 'account1'), {'status': 1})
+        self.assertIsNone(store.get('ORDER1', 'account2'))
+        self.assertIsNone(store.get('ORDER1'))
+
+    def test_retry_delay(self):
+        retry = RetryPolicy(base_delay=1.0, max_delay=5.0, seed=1)
+        for attempt in range(10):
+            self.assertLessEqual(retry.get_delay(attempt), min(5.0, 2 ** attempt))
+        self.assertEqual(retry.get_delay(0, retry_after=3), 3)
+        self.assertEqual(retry.get_delay(0, retry_after=60), 5.0)
+        with self.assertRaises(ValueError):
+            RetryPolicy(max_attempts=0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
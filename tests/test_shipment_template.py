@@ -0,0 +1,152 @@
+import copy
+import random
+import unittest
+
+from lxml import etree as ET
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.xmlwriter import XmlWriter
+from tests.local_server import LocalServer
+
+
+def _fixed_time(dict_data):
+    dict_data['eChannel']['ROUTING']['Routing.Time'] = '20240101120000'
+    return dict_data
+
+
+class TestXmlWriter(unittest.TestCase):
+    def _write_random(self, rnd, parent, writer, depth):
+        for i in range(rnd.randint(0, 3)):
+            tag = 'e{}'.format(i)
+            attrib = [('a', rnd.choice(['', 'x"y', '<&>', 'tab\tnew\nline\r', u'\xe5']))] if rnd.random() < 0.3 else []
+            child = ET.SubElement(parent, tag)
+            for name, value in attrib:
+                child.set(name, value)
+            if depth < 3 and rnd.random() < 0.5:
+                writer.start(tag, attrib)
+                self._write_random(rnd, child, writer, depth + 1)
+                writer.end()
+            else:
+                text = rnd.choice([None, '', 'plain', 'a<b>&c', 'cr\r\nlf', u'\xe5€', ']]>', "'\""])
+                child.text = text
+                writer.element(tag, text, attrib)
+
+    def test_output_matches_lxml(self):
+        rnd = random.Random(3)
+        for _ in range(200):
+            root = ET.Element('root')
+            writer = XmlWriter()
+            writer.start('root')
+            self._write_random(rnd, root, writer, 0)
+            writer.end()
+            self.assertEqual(writer.getvalue(),
+                             ET.tostring(root, pretty_print=True, xml_declaration=True, encoding="UTF-8"))
+
+    def test_invalid_characters(self):
+        writer = XmlWriter()
+        with self.assertRaises(ValueError):
+            writer.element('a', 'null\x00byte')
+        with self.assertRaises(ValueError):
+            writer.element('a', 'ok', [('b', '\x1f')])
+
+    def test_unclosed_element(self):
+        writer = XmlWriter()
+        writer.start('a')
+        with self.assertRaises(ValueError):
+            writer.fragment()
+
+
+class TestShipmentTemplate(unittest.TestCase):
+    def setUp(self):
+        self.merchant = PkMerchant(1)
+
+    def tearDown(self):
+        self.merchant.close()
+
+    def _template_for(self, dict_data):
+        shipment = dict_data['eChannel']['Shipment']
+        return self.merchant.get_shipment_template(shipment['Shipment.Sender'],
+                                                   shipment['Shipment.Consignment']['Consignment.Product'])
+
+    def _assert_same_output(self, dict_data):
+        expected = self.merchant.get_xml_shipment_req_data(**copy.deepcopy(dict_data))
+        self.assertEqual(self._template_for(dict_data).render_request(**dict_data), expected)
+
+    def test_test_data(self):
+        self._assert_same_output(_fixed_time(self.merchant.get_create_shipment_test_data()))
+        self._assert_same_output(_fixed_time(self.merchant.get_create_multi_parcels_shipment_test_data()))
+
+    def test_optional_and_special_values(self):
+        dict_data = _fixed_time(self.merchant.get_create_shipment_test_data())
+        shipment = dict_data['eChannel']['Shipment']
+        shipment['Shipment.Sender']['Sender.Name2'] = u'Tom & Jerry <\xe5\xe4\xf6>'
+        shipment['Shipment.Recipient']['Recipient.Addr2'] = 'Line\r\nbreak'
+        consignment = shipment['Shipment.Consignment']
+        consignment['Consignment.Currency'] = 'eur'
+        consignment['Consignment.Contentcode'] = None
+        consignment['Consignment.ReturnInstruction'] = ''
+        consignment['Consignment.Merchandisevalue'] = None
+        consignment['Consignment.Reference'] = None
+        consignment['Consignment.AdditionalInfo'] = {}
+        consignment['Consignment.AdditionalService'] = [
+            {},
+            {'AdditionalService.ServiceCode': '3101', 'AdditionalService.Specifier': {'name': 'no value'},
+             'AdditionalService.Other': {'value': 'x', 'code': '"q"'}, 'AdditionalService.Empty': None},
+        ]
+        parcel = consignment['Consignment.Parcel'][0]
+        parcel['Parcel.Packagetype'] = ''
+        parcel['Parcel.Volume'] = {'unit': None, 'value': 2}
+        parcel['Parcel.ParcelService'] = [{'ParcelService.Servicecode': '1'}, {}]
+        consignment['Consignment.Parcel'] = parcel
+        self._assert_same_output(dict_data)
+
+    def test_validation_errors(self):
+        template = self._template_for(self.merchant.get_create_shipment_test_data())
+        cases = [
+            (('Consignment.Contentcode', 'X'), PakettikauppaException),
+            (('Consignment.ReturnInstruction', 'X'), PakettikauppaException),
+            (('Consignment.Parcel', 'parcel'), PakettikauppaException),
+            (('Consignment.AdditionalService', {'a': 1}), ValueError),
+            (('Consignment.Product', '9999'), ValueError),
+        ]
+        for (key, value), error in cases:
+            dict_data = self.merchant.get_create_shipment_test_data()
+            dict_data['eChannel']['Shipment']['Shipment.Consignment'][key] = value
+            with self.assertRaises(error):
+                template.render_request(**dict_data)
+
+        dict_data = self.merchant.get_create_shipment_test_data()
+        dict_data['eChannel']['Shipment']['Shipment.Recipient']['Recipient.Unknown'] = 'x'
+        with self.assertRaises(KeyError):
+            template.render_request(**dict_data)
+
+        with self.assertRaises(KeyError):
+            self.merchant.get_shipment_template({'Sender.Unknown': 'x', 'Sender.Email': 'x'}, '2103')
+        with self.assertRaises(PakettikauppaException):
+            self.merchant.get_shipment_template({'Sender.Email': 'x'}, '')
+
+    def test_render(self):
+        dict_data = _fixed_time(self.merchant.get_create_shipment_test_data())
+        shipment = dict_data['eChannel']['Shipment']
+        consignment = dict(shipment['Shipment.Consignment'])
+        del consignment['Consignment.Product']
+        xml_string = self._template_for(dict_data).render('1464524676', 'ORDER001', shipment['Shipment.Recipient'],
+                                                          consignment, '20240101120000')
+        self.assertEqual(xml_string, self.merchant.get_xml_shipment_req_data(**dict_data))
+
+    def test_create_shipment_from_xml(self):
+        server = LocalServer().start()
+        try:
+            self.merchant._base_api_end_point = server.url
+            dict_data = self.merchant.get_create_shipment_test_data()
+            xml_string = self._template_for(dict_data).render_request(**dict_data)
+            dict_res = self.merchant.create_shipment_from_xml(xml_string)
+        finally:
+            server.stop()
+        self.assertEqual(dict_res['status'], 1)
+        self.assertEqual(server.requests[0][1], xml_string)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
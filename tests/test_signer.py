@@ -0,0 +1,102 @@
+import hashlib
+import hmac
+import threading
+import unittest
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.signer import Signer
+
+API_KEY = '00000000-0000-0000-0000-000000000000'
+SECRET = '1234567890ABCDEF'
+
+
+def _expected_sha256(secret, dict_data):
+    plain_text = '&'.join(str(dict_data[key]) for key in sorted(dict_data))
+    return hmac.new(secret.encode('utf-8'), plain_text.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _expected_md5(api_key, secret, routing_id):
+    return hashlib.md5((api_key + str(routing_id) + secret).encode('utf-8')).hexdigest()
+
+
+class TestSigner(unittest.TestCase):
+    def test_sign(self):
+        signer = Signer(API_KEY, SECRET)
+        dict_data = {'api_key': API_KEY, 'timestamp': 1700000000, 'postcode': '33100', 'city': u'H\xe4meenlinna'}
+        self.assertEqual(signer.sign(dict_data), _expected_sha256(SECRET, dict_data))
+        # Pre-keyed state is copied, so signing again gives the same digest
+        self.assertEqual(signer.sign(dict_data), _expected_sha256(SECRET, dict_data))
+        with self.assertRaises(KeyError):
+            signer.sign({})
+
+    def test_sign_many(self):
+        signer = Signer(API_KEY, SECRET)
+        list_data = [{'api_key': API_KEY, 'timestamp': i} for i in range(10)]
+        self.assertEqual(signer.sign_many(list_data), [_expected_sha256(SECRET, d) for d in list_data])
+        self.assertEqual(signer.sign_many(iter([])), [])
+
+    def test_routing_key_cache(self):
+        signer = Signer(API_KEY, SECRET, routing_key_cache_size=2)
+        for routing_id in ('1', '2', '1', '3', 2, '1'):
+            self.assertEqual(signer.get_routing_key(routing_id), _expected_md5(API_KEY, SECRET, routing_id))
+        self.assertEqual(list(signer._routing_keys), ['2', '1'])
+
+        signer = Signer(API_KEY, SECRET, routing_key_cache_size=0)
+        self.assertEqual(signer.get_routing_key('1'), _expected_md5(API_KEY, SECRET, '1'))
+        self.assertEqual(len(signer._routing_keys), 0)
+
+    def test_routing_key_from_threads(self):
+        signer = Signer(API_KEY, SECRET, routing_key_cache_size=16)
+        errors = []
+
+        def sign():
+            for i in range(500):
+                if signer.get_routing_key(i % 32) != _expected_md5(API_KEY, SECRET, i % 32):
+                    errors.append(i)
+
+        threads = [threading.Thread(target=sign) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(signer._routing_keys), 16)
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            Signer(API_KEY, '')
+        with self.assertRaises(ValueError):
+            Signer(None, SECRET).get_routing_key('1')
+        with self.assertRaises(ValueError):
+            Signer(API_KEY, SECRET).get_routing_key('')
+
+
+class TestMerchantSigner(unittest.TestCase):
+    def setUp(self):
+        self.merchant = PkMerchant(1)
+
+    def tearDown(self):
+        self.merchant.close()
+
+    def test_signer_is_reused(self):
+        signer = self.merchant.get_signer()
+        self.assertIs(self.merchant.get_signer(), signer)
+        self.merchant._secret = 'OtherSecret'
+        self.assertIsNot(self.merchant.get_signer(), signer)
+        self.assertTrue(self.merchant.get_signer().matches(self.merchant._api_key, 'OtherSecret'))
+
+    def test_hash_functions(self):
+        dict_data = {'api_key': API_KEY, 'timestamp': 1700000000}
+        self.assertEqual(self.merchant.get_hash_sha256(SECRET, **dict_data), _expected_sha256(SECRET, dict_data))
+        self.assertEqual(self.merchant.get_hash_sha256('Other', **dict_data), _expected_sha256('Other', dict_data))
+        self.assertEqual(self.merchant.get_md5_hash(API_KEY, SECRET, '1'), _expected_md5(API_KEY, SECRET, '1'))
+        self.assertEqual(self.merchant.get_md5_hash('key', 'Other', '1'), _expected_md5('key', 'Other', '1'))
+        self.assertEqual(self.merchant.get_routing_key('1'), _expected_md5(API_KEY, SECRET, '1'))
+        with self.assertRaises(KeyError):
+            self.merchant.get_hash_sha256(SECRET)
+        with self.assertRaises(ValueError):
+            self.merchant.get_md5_hash(API_KEY, SECRET, None)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
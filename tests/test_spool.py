@@ -0,0 +1,243 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import requests
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.resilience import IdempotencyStore, ResiliencePolicy
+from pakettikauppa.spool import DONE, FAILED, IN_DOUBT, PENDING, SENDING, ShipmentSpool, read_frames
+from pakettikauppa.standin import StandInServer
+
+
+class _TimeoutMerchant(PkMerchant):
+    """
+    Merchant whose requests time out after the request was sent.
+    """
+    def create_shipment_from_xml(self, xml_req_data, routing_id=None):
+        raise requests.exceptions.ReadTimeout("Read timed out")
+
+
+class TestShipmentSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        self.merchant = self._merchant()
+        self.results = []
+        self._results_lock = threading.Lock()
+
+    def _merchant(self, merchant_class=PkMerchant, **kwargs):
+        merchant = merchant_class(1, **kwargs)
+        merchant.set_api_end_point(self.server.url)
+        self.addCleanup(merchant.close)
+        return merchant
+
+    def _spool(self, merchant=None, **kwargs):
+        kwargs.setdefault('base_delay', 0.01)
+        spool = ShipmentSpool(self.directory, merchant or self.merchant, on_result=self._on_result, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def _on_result(self, result):
+        with self._results_lock:
+            self.results.append(result)
+
+    def _shipments(self, count, start=0):
+        shipments = []
+        for i in range(start, start + count):
+            dict_data = self.merchant.get_create_shipment_test_data()
+            dict_data['eChannel']['ROUTING']['Routing.Id'] = 'ORDER{}'.format(i)
+            shipments.append(dict_data)
+        return shipments
+
+    def _created(self):
+        return self.server.stats.get('/prinetti/create-shipment', {}).get(200, 0)
+
+    def test_drain(self):
+        spool = self._spool(workers=4)
+        record_ids = [spool.append(shipment) for shipment in self._shipments(20)]
+        self.assertEqual(record_ids, list(range(1, 21)))
+        self.assertEqual(spool.get_state(1), PENDING)
+        spool.start()
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(self._created(), 20)
+        self.assertEqual(sorted(result.record_id for result in self.results), record_ids)
+        self.assertTrue(all(result.state == DONE for result in self.results))
+        self.assertEqual(len(set(result.result['trackingcode']['value'] for result in self.results)), 20)
+        self.assertEqual(spool.stats['done'], 20)
+
+    def test_retry_throttled(self):
+        self.server.stop()
+        self.server = StandInServer(rate_limit=50, burst=2).start()
+        self.addCleanup(self.server.stop)
+        spool = self._spool(merchant=self._merchant(), workers=4, max_attempts=50).start()
+        for shipment in self._shipments(15):
+            spool.append(shipment)
+        self.assertTrue(spool.wait_idle(20))
+        self.assertEqual(self._created(), 15)
+        self.assertGreater(self.server.stats['/prinetti/create-shipment'].get(429, 0), 0)
+        self.assertGreater(spool.stats['retries'], 0)
+        self.assertTrue(all(result.state == DONE for result in self.results))
+
+    def test_server_error_is_in_doubt(self):
+        self.server.error_rate = 1.0
+        spool = self._spool().start()
+        spool.append(self._shipments(1)[0])
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(self.results[0].state, IN_DOUBT)
+        self.assertEqual(self.server.stats['/prinetti/create-shipment'], {500: 1})
+        self.assertEqual(spool.stats['retries'], 0)
+
+    def test_invalid_shipment_fails(self):
+        spool = self._spool().start()
+        shipment = self._shipments(1)[0]
+        shipment['eChannel']['Shipment']['Shipment.Consignment']['Consignment.Contentcode'] = 'X'
+        spool.append(shipment)
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(self.results[0].state, FAILED)
+        self.assertEqual(self.results[0].attempts, 0)
+        self.assertEqual(self._created(), 0)
+
+    def test_error_status_fails(self):
+        self.server.stop()
+        self.server = StandInServer(credentials={}).start()
+        self.addCleanup(self.server.stop)
+        spool = self._spool(merchant=self._merchant()).start()
+        record_id = spool.append(self._shipments(1)[0])
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(self.results[0].state, FAILED)
+        self.assertEqual(self.results[0].result['status'], 0)
+        # Failed Routing.Id can be appended again
+        self.assertNotEqual(spool.append(self._shipments(1)[0]), record_id)
+
+    def test_routing_id_is_appended_once(self):
+        spool = self._spool()
+        shipment = self._shipments(1)[0]
+        self.assertEqual(spool.append(shipment), spool.append(shipment))
+        spool.start()
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(spool.append(shipment), 1)
+        spool.stop()
+        self.assertEqual(self._created(), 1)
+        with self.assertRaises(ValueError):
+            spool.append({'eChannel': {}})
+
+    def test_recover_pending(self):
+        spool = self._spool()
+        for shipment in self._shipments(5):
+            spool.append(shipment, durable=True)
+        # Process dies before anything is sent, the new spool continues
+        recovered = self._spool().start()
+        self.assertTrue(recovered.wait_idle(10))
+        self.assertEqual(self._created(), 5)
+        self.assertEqual(recovered.append(self._shipments(1)[0]), 1)
+        self.assertEqual(recovered.append(self._shipments(1, start=5)[0]), 6)
+
+    def test_recover_sending_is_in_doubt(self):
+        spool = self._spool()
+        spool.append(self._shipments(1)[0])
+        record = spool._records[1]
+        record.attempts = 1
+        spool._write_ack(record, SENDING)
+        spool.flush()
+
+        recovered = self._spool().start()
+        self.assertTrue(recovered.wait_idle(10))
+        self.assertEqual(recovered.get_state(1), IN_DOUBT)
+        self.assertEqual([result.record_id for result in recovered.get_in_doubt()], [1])
+        self.assertEqual(self._created(), 0)
+        # Not appended again while in doubt
+        self.assertEqual(recovered.append(self._shipments(1)[0]), 1)
+
+        recovered.requeue(1)
+        self.assertTrue(recovered.wait_idle(10))
+        self.assertEqual(self._created(), 1)
+        with self.assertRaises(ValueError):
+            recovered.requeue(1)
+
+    def test_recover_sending_from_idempotency_store(self):
+        store = IdempotencyStore()
+        merchant = self._merchant(resilience=ResiliencePolicy(idempotency_store=store))
+        shipment = self._shipments(1)[0]
+        dict_res = merchant.create_shipment(**shipment)
+        spool = self._spool(merchant)
+        spool.append(shipment)
+        spool._write_ack(spool._records[1], SENDING)
+        spool.flush()
+
+        recovered = self._spool(merchant)
+        self.assertEqual(recovered.get_state(1), DONE)
+        self.assertEqual(recovered._records[1].result, dict_res)
+        self.assertEqual(self._created(), 1)
+
+    def test_read_timeout_is_in_doubt(self):
+        spool = self._spool(merchant=self._merchant(_TimeoutMerchant)).start()
+        spool.append(self._shipments(1)[0])
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(self.results[0].state, IN_DOUBT)
+        self.assertIn('ReadTimeout', self.results[0].error)
+        self.assertEqual(spool.stats['retries'], 0)
+        spool.close()
+        self.assertEqual(self._spool().get_state(1), IN_DOUBT)
+
+    def test_connection_refused_is_retried(self):
+        merchant = self._merchant()
+        self.server.stop()
+        spool = self._spool(merchant, max_attempts=2).start()
+        spool.append(self._shipments(1)[0])
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(self.results[0].state, FAILED)
+        self.assertEqual(self.results[0].attempts, 2)
+        self.assertEqual(spool.stats['retries'], 1)
+
+    def test_torn_tail(self):
+        spool = self._spool()
+        for shipment in self._shipments(3):
+            spool.append(shipment)
+        spool.close()
+        path = os.path.join(self.directory, '{:016d}.wal'.format(1))
+        size = os.path.getsize(path)
+        with open(path, 'r+b') as f:
+            f.truncate(size - 10)
+
+        recovered = self._spool()
+        self.assertEqual(recovered.get_pending_count(), 2)
+        self.assertIsNone(recovered.get_state(3))
+        self.assertEqual(len(read_frames(path)[0]), 2)
+        self.assertEqual(recovered.append(self._shipments(1, start=2)[0]), 3)
+
+    def test_segments_are_rotated_and_deleted(self):
+        spool = self._spool(segment_size=4096)
+        for shipment in self._shipments(20):
+            spool.append(shipment)
+        self.assertGreater(len([name for name in os.listdir(self.directory) if name.endswith('.wal')]), 2)
+        spool.start()
+        self.assertTrue(spool.wait_idle(10))
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith('.wal')]), 1)
+        self.assertEqual(self._created(), 20)
+        # Routing.Ids of deleted segments are forgotten
+        self.assertEqual(set(spool._routing_ids.values()), set(spool._records))
+        self.assertLess(len(spool._routing_ids), 20)
+
+    def test_group_commit(self):
+        spool = self._spool()
+        for shipment in self._shipments(200):
+            spool.append(shipment)
+        self.assertEqual(spool.stats['fsyncs'], 0)
+        spool.flush()
+        self.assertEqual(spool.stats['fsyncs'], 1)
+        spool.append(self._shipments(1, start=200)[0], durable=True)
+        self.assertEqual(spool.stats['fsyncs'], 2)
+        self.assertEqual(len(read_frames(spool._active.wal_path)[0]), 201)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ShipmentSpool(self.directory, self.merchant, workers=0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,146 @@
+import base64
+import time
+import unittest
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.pakettikauppa import PakettikauppaException
+from pakettikauppa.reseller import PkReseller
+from pakettikauppa.standin import StandInServer
+
+CUSTOMER_DATA = {
+    'name': 'Vilkas Group Oy',
+    'business_id': '12345678-9',
+    'payment_service_provider': '',
+    'psp_merchant_id': '',
+    'marketing_name': '',
+    'street_address': 'Finlaysoninkuja 19',
+    'post_office': 'Tampere',
+    'postcode': '33210',
+    'country': 'Finland',
+    'phone': '+358 12 345 678',
+    'email': 'tipi@vilkas.fi',
+    'contact_person_name': 'Porntip Chaibamrung',
+    'contact_person_phone': '0123456789',
+    'contact_person_email': 'tipi+test@vilkas.fi',
+    'customer_service_phone': '',
+    'customer_service_email': '',
+}
+
+
+def _search(merchant, postal_code='33100', max_result=5):
+    return merchant.search_pickup_points(postal_code=postal_code, country_code2='FI', street_address=None,
+                                         service_provider=None, max_result=max_result, timestamp=None)
+
+
+class TestStandInServer(unittest.TestCase):
+    def _clients(self, server, secret=None):
+        merchant = PkMerchant(1, secret=secret)
+        reseller = PkReseller(1, secret=secret)
+        merchant.set_api_end_point(server.url)
+        reseller.set_api_end_point(server.url + '/')
+        self.addCleanup(merchant.close)
+        self.addCleanup(reseller.close)
+        return merchant, reseller
+
+    def test_all_endpoints(self):
+        with StandInServer(label_size=3000) as server:
+            merchant, reseller = self._clients(server)
+            self.assertTrue(merchant.get_shipping_method_list())
+            self.assertTrue(merchant.get_additional_service_list())
+            points = _search(merchant, max_result=3)
+            self.assertEqual(len(points), 3)
+            self.assertEqual(points[0]['postcode'], '33100')
+
+            dict_res = merchant.create_shipment(**merchant.get_create_shipment_test_data())
+            self.assertEqual(dict_res['status'], 1)
+            tracking_code = dict_res['trackingcode']['value']
+            status = merchant.get_shipment_status(tracking_code).json()
+            self.assertEqual(status[0]['tracking_code'], tracking_code)
+
+            dict_label = merchant.get_shipping_label(**merchant.get_shipping_label_req_test_data())
+            self.assertEqual(dict_label['status'], 1)
+            pdf = base64.b64decode(dict_label['PDFcontent'])
+            self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+            self.assertTrue(pdf.endswith(b'%%EOF\n'))
+            self.assertGreater(len(pdf), 2 * 3000 - 10)
+
+            created = reseller.create_customer(**CUSTOMER_DATA)
+            customer_id = created['customer_id']
+            reseller.update_customer(customer_id, name='New name')
+            customers = reseller.get_customer_list()
+            self.assertEqual(customers[0]['name'], 'New name')
+            self.assertEqual(reseller.deactivate_customer(customer_id)['status'], 'deactivated')
+
+        paths = set(PkMerchant._api_mapping.values()) | set(PkReseller._api_mapping.values())
+        self.assertEqual(set(server.stats), paths)
+        for path in paths:
+            self.assertEqual(list(server.stats[path]), [200])
+
+    def test_invalid_credentials(self):
+        with StandInServer() as server:
+            merchant, reseller = self._clients(server, secret='WrongSecret')
+            with self.assertRaises(PakettikauppaException):
+                merchant.get_shipping_method_list()
+            with self.assertRaises(PakettikauppaException):
+                reseller.get_customer_list()
+            dict_res = merchant.create_shipment(**merchant.get_create_shipment_test_data())
+            self.assertEqual(dict_res['status'], 0)
+            self.assertEqual(dict_res['message'], 'Invalid routing')
+        self.assertEqual(server.stats['/shipping-methods/list'], {401: 1})
+
+    def test_latency(self):
+        with StandInServer(latency=0.2) as server:
+            merchant, _ = self._clients(server)
+            start = time.time()
+            merchant.get_shipping_method_list()
+            self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_error_rate(self):
+        with StandInServer(error_rate=0.5, seed=1) as server:
+            merchant, _ = self._clients(server)
+            failed = 0
+            for _ in range(40):
+                try:
+                    merchant.get_shipping_method_list()
+                except PakettikauppaException:
+                    failed += 1
+        self.assertTrue(5 < failed < 35)
+        self.assertEqual(server.stats['/shipping-methods/list'][500], failed)
+
+        with self.assertRaises(ValueError):
+            StandInServer(error_rate=2)
+
+    def test_throttling(self):
+        with StandInServer(rate_limit=1, burst=3) as server:
+            merchant, _ = self._clients(server)
+            results = []
+            for _ in range(5):
+                try:
+                    merchant.get_shipping_method_list()
+                    results.append(200)
+                except PakettikauppaException:
+                    results.append(429)
+        self.assertEqual(results, [200, 200, 200, 429, 429])
+
+    def test_concurrent_shipments(self):
+        with StandInServer(latency=0.05) as server:
+            merchant, _ = self._clients(server)
+            shipments = [merchant.get_create_shipment_test_data() for _ in range(20)]
+            start = time.time()
+            results = list(merchant.create_shipments_bulk(shipments, max_in_flight=10))
+            elapsed = time.time() - start
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(len(set(result.result['trackingcode']['value'] for result in results)), 20)
+        self.assertLess(elapsed, 20 * 0.05)
+
+    def test_set_api_end_point(self):
+        merchant = PkMerchant(1)
+        self.addCleanup(merchant.close)
+        merchant.set_api_end_point('http://127.0.0.1:8000/')
+        self.assertEqual(merchant.get_api_end_point(), 'http://127.0.0.1:8000')
+        with self.assertRaises(ValueError):
+            merchant.set_api_end_point('')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
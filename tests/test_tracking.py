@@ -0,0 +1,149 @@
+import threading
+import unittest
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.standin import StandInServer
+from pakettikauppa.tracking import PollingPolicy, ShipmentTracker, StatusEvent, parse_status_events
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestShipmentTracker(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        self.merchant = PkMerchant(1)
+        self.merchant.set_api_end_point(self.server.url)
+        self.addCleanup(self.merchant.close)
+        self.clock = _Clock()
+        self.policy = PollingPolicy(fresh_interval=10, transit_interval=100, stale_interval=1000,
+                                    delivered_interval=5000, fresh_period=50, stale_after=500, expire_after=20000,
+                                    error_interval=5)
+        self.changes = []
+        self.tracker = ShipmentTracker(self.merchant, self.policy, max_in_flight=4, on_change=self.changes.append,
+                                       clock=self.clock)
+
+    def _add(self, count):
+        codes = ['JJFI{:05d}'.format(i) for i in range(count)]
+        for code in codes:
+            self.server.set_shipment_status(code, '13', 'Created', '2019-05-01 10:00:00')
+            self.tracker.add(code)
+        return codes
+
+    def _requests(self):
+        return self.server.stats.get('/shipment/status', {}).get(200, 0)
+
+    def test_parse_status_events(self):
+        list_events = parse_status_events([
+            {'status_code': 22, 'description': 'Delivered', 'timestamp': '2019-05-03 12:00:00'},
+            {'status_code': '13', 'description': 'Created', 'timestamp': '2019-05-01 10:00:00', 'postcode': '00100'},
+        ], 'JJFI1')
+        self.assertEqual([event.status_code for event in list_events], ['13', '22'])
+        self.assertEqual(list_events[0], StatusEvent('JJFI1', '13', 'Created', '2019-05-01 10:00:00', '00100', None))
+        self.assertEqual(parse_status_events(None), [])
+
+    def test_get_shipment_statuses(self):
+        codes = self._add(5)
+        results = list(self.merchant.get_shipment_statuses(codes, max_in_flight=3))
+        self.assertEqual([result.request for result in results], codes)
+        self.assertEqual([result.result[-1].tracking_code for result in results], codes)
+        self.assertTrue(all(result.result[-1].status_code == '13' for result in results))
+
+    def test_poll_only_due_and_changed(self):
+        codes = self._add(20)
+        changes = self.tracker.poll()
+        self.assertEqual(len(changes), 20)
+        self.assertIsNone(changes[0].previous)
+        self.assertEqual(self.changes, changes)
+        self.assertEqual(self.tracker.get_next_due(), self.clock.now + 10)
+
+        # Nothing is due
+        self.assertEqual(self.tracker.poll(), [])
+        self.assertEqual(self._requests(), 20)
+
+        self.server.set_shipment_status(codes[3], '31', 'In transit', '2019-05-01 12:00:00')
+        self.clock.now += 10
+        changes = self.tracker.poll()
+        self.assertEqual(self._requests(), 40)
+        self.assertEqual([change.tracking_code for change in changes], [codes[3]])
+        self.assertEqual(changes[0].previous.status_code, '13')
+        self.assertEqual(changes[0].current.status_code, '31')
+        self.assertEqual(len(changes[0].events), 2)
+        self.assertEqual(self.tracker.stats['unchanged'], 19)
+        self.assertEqual(self.tracker.get_status(codes[3]).description, 'In transit')
+
+    def test_adaptive_intervals(self):
+        fresh, delivered = self._add(2)
+        self.tracker.poll()
+        self.server.set_shipment_status(delivered, '22', 'Delivered', '2019-05-02 10:00:00')
+        self.clock.now += 10
+        self.tracker.poll()
+        self.assertEqual(self.tracker._shipments[delivered].due, self.clock.now + 5000)
+        self.assertEqual(self.tracker._shipments[fresh].due, self.clock.now + 10)
+
+        # Fresh period ends, then the shipment becomes stale
+        self.clock.now += 60
+        self.tracker.poll()
+        self.assertEqual(self.tracker._shipments[fresh].due, self.clock.now + 100)
+        self.clock.now += 500
+        self.tracker.poll()
+        self.assertEqual(self.tracker._shipments[fresh].due, self.clock.now + 1000)
+
+        # Delivered and stale shipments expire
+        self.clock.now += 20000
+        self.tracker.poll()
+        self.assertEqual(len(self.tracker), 0)
+        self.assertEqual(self.tracker.stats['expired'], 2)
+        self.assertIsNone(self.tracker.get_next_due())
+
+    def test_max_codes_and_remove(self):
+        codes = self._add(10)
+        self.assertEqual(len(self.tracker.poll(max_codes=4)), 4)
+        self.assertTrue(self.tracker.remove(codes[5]))
+        self.assertFalse(self.tracker.remove(codes[5]))
+        self.assertEqual(len(self.tracker.poll()), 5)
+        self.assertNotIn(codes[5], self.tracker)
+        self.assertEqual(self._requests(), 9)
+
+    def test_error_is_polled_again(self):
+        self._add(3)
+        self.server.error_rate = 1.0
+        self.assertEqual(self.tracker.poll(), [])
+        self.assertEqual(self.tracker.stats['errors'], 3)
+        self.assertEqual(self.tracker.get_next_due(), self.clock.now + 5)
+        self.server.error_rate = 0.0
+        self.clock.now += 5
+        self.assertEqual(len(self.tracker.poll()), 3)
+
+    def test_run(self):
+        tracker = ShipmentTracker(self.merchant, self.policy, on_change=self.changes.append)
+        self.tracker = tracker
+        self._add(3)
+        stop_event = threading.Event()
+        thread = threading.Thread(target=tracker.run, args=(stop_event,), kwargs={'max_wait': 0.05})
+        thread.start()
+        try:
+            for _ in range(100):
+                if len(self.changes) == 3:
+                    break
+                stop_event.wait(0.05)
+        finally:
+            stop_event.set()
+            thread.join()
+        self.assertEqual(len(self.changes), 3)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ShipmentTracker(self.merchant, max_in_flight=0)
+        with self.assertRaises(ValueError):
+            self.tracker.add('')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,97 @@
+import gc
+import threading
+import unittest
+
+from pakettikauppa.merchant import PkMerchant
+from pakettikauppa.reseller import PkReseller
+from pakettikauppa.transport import HttpTransport
+from tests.local_server import LocalServer
+
+
+class TestHttpTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._server = LocalServer().start()
+        cls.URL = cls._server.url + '/shipping-methods/list'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.stop()
+
+    def setUp(self):
+        self._server.reset()
+
+    def test_connection_is_reused(self):
+        with PkMerchant(1) as merchant:
+            for _ in range(3):
+                res_obj = merchant.send_request('POST', self.URL, {'api_key': 'test'})
+                self.assertEqual(res_obj.status_code, 200)
+        self.assertEqual(len(set(self._server.client_ports)), 1)
+
+    def test_keep_alive_disabled(self):
+        transport = HttpTransport(keep_alive=False)
+        with PkReseller(1, transport=transport) as reseller:
+            for _ in range(3):
+                reseller.send_request('POST', self.URL, {'api_key': 'test'})
+        self.assertEqual(len(set(self._server.client_ports)), 3)
+        transport.close()
+
+    def test_shared_between_threads(self):
+        transport = HttpTransport(pool_maxsize=2, pool_block=True)
+        merchant = PkMerchant(1, transport=transport)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    merchant.send_request('POST', self.URL, {'api_key': 'test'})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        transport.close()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self._server.client_ports), 20)
+        self.assertLessEqual(len(set(self._server.client_ports)), 2)
+
+    def test_close_own_transport(self):
+        merchant = PkMerchant(1)
+        merchant.close()
+        self.assertTrue(merchant.get_transport().is_closed())
+        with self.assertRaises(RuntimeError):
+            merchant.send_request('POST', self.URL, {'api_key': 'test'})
+
+    def test_closed_transport_rejects_cached_session(self):
+        transport = HttpTransport()
+        transport.request('POST', self.URL, data={'api_key': 'test'})
+        transport.close()
+        with self.assertRaises(RuntimeError):
+            transport.request('POST', self.URL, data={'api_key': 'test'})
+
+    def test_session_of_finished_thread_is_released(self):
+        transport = HttpTransport()
+        self.addCleanup(transport.close)
+        thread = threading.Thread(target=transport.get_session)
+        thread.start()
+        thread.join()
+        gc.collect()
+        self.assertEqual(len(transport._sessions), 0)
+        transport.get_session()
+        self.assertEqual(len(transport._sessions), 1)
+
+    def test_shared_transport_is_left_open(self):
+        transport = HttpTransport()
+        with PkMerchant(1, transport=transport):
+            pass
+        self.assertFalse(transport.is_closed())
+        transport.close()
+        self.assertTrue(transport.is_closed())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
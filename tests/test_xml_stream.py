@@ -0,0 +1,108 @@
+import copy
+import tracemalloc
+import unittest
+
+from lxml import etree as ET
+
+from pakettikauppa.merchant import PkMerchant
+from tests.local_server import LocalServer
+
+
+def _canonical(xml_string):
+    root = ET.fromstring(xml_string, ET.XMLParser(remove_blank_text=True))
+    return ET.tostring(root, method='c14n')
+
+
+def _freight_data(merchant, count):
+    dict_data = merchant.get_create_multi_parcels_shipment_test_data()
+    dict_data['eChannel']['ROUTING']['Routing.Time'] = '20240101120000'
+    parcel = dict_data['eChannel']['Shipment']['Shipment.Consignment']['Consignment.Parcel'][0]
+    parcels = []
+    for i in range(count):
+        one_parcel = copy.deepcopy(parcel)
+        one_parcel['Parcel.Reference'] = str(i)
+        parcels.append(one_parcel)
+    dict_data['eChannel']['Shipment']['Shipment.Consignment']['Consignment.Parcel'] = parcels
+    return dict_data
+
+
+class TestShipmentXmlSerializer(unittest.TestCase):
+    def setUp(self):
+        self.merchant = PkMerchant(1)
+
+    def tearDown(self):
+        self.merchant.close()
+
+    def test_shipment_output(self):
+        for dict_data in (self.merchant.get_create_shipment_test_data(), _freight_data(self.merchant, 300)):
+            expected = self.merchant.get_xml_shipment_req_data(**copy.deepcopy(dict_data))
+            chunks = list(self.merchant.iter_xml_shipment_req_data(4096, **dict_data))
+            self.assertTrue(all(len(chunk) >= 4096 for chunk in chunks[:-1]))
+            self.assertEqual(_canonical(b''.join(chunks)), _canonical(expected))
+            self.assertEqual(b''.join(self.merchant.iter_xml_shipment_req_data(pretty_print=True, **dict_data)),
+                             expected)
+
+    def test_parcel_generator(self):
+        dict_data = _freight_data(self.merchant, 5)
+        expected = self.merchant.get_xml_shipment_req_data(**copy.deepcopy(dict_data))
+        consignment = dict_data['eChannel']['Shipment']['Shipment.Consignment']
+        consignment['Consignment.Parcel'] = (parcel for parcel in consignment['Consignment.Parcel'])
+        xml_string = b''.join(self.merchant.iter_xml_shipment_req_data(**dict_data))
+        self.assertEqual(_canonical(xml_string), _canonical(expected))
+
+    def test_shipping_label_output(self):
+        dict_data = self.merchant.get_shipping_label_req_data(['code{}'.format(i) for i in range(500)], '123')
+        expected = self.merchant.get_xml_shipping_label_req_data(**dict_data)
+        chunks = list(self.merchant.iter_xml_shipping_label_req_data(1024, **dict_data))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(_canonical(b''.join(chunks)), _canonical(expected))
+        self.assertEqual(b''.join(self.merchant.iter_xml_shipping_label_req_data(pretty_print=True, **dict_data)),
+                         expected)
+
+        dict_data = self.merchant.get_shipping_label_req_test_data()
+        self.assertEqual(b''.join(self.merchant.iter_xml_shipping_label_req_data(pretty_print=True, **dict_data)),
+                         self.merchant.get_xml_shipping_label_req_data(**dict_data))
+
+    def test_invalid_input_is_rejected_before_writing(self):
+        dict_data = self.merchant.get_create_shipment_test_data()
+        del dict_data['eChannel']['Shipment']['Shipment.Recipient']
+        with self.assertRaises(KeyError):
+            self.merchant.iter_xml_shipment_req_data(**dict_data)
+        dict_data = self.merchant.get_shipping_label_req_data(['code'])
+        dict_data['eChannel']['PrintLabel']['responseFormat'] = 'pdf'
+        with self.assertRaises(ValueError):
+            self.merchant.iter_xml_shipping_label_req_data(**dict_data)
+
+    def test_memory_is_bounded(self):
+        parcel = _freight_data(self.merchant, 1)['eChannel']['Shipment']['Shipment.Consignment']['Consignment.Parcel']
+        dict_data = _freight_data(self.merchant, 0)
+        dict_data['eChannel']['Shipment']['Shipment.Consignment']['Consignment.Parcel'] = (
+            copy.deepcopy(parcel[0]) for _ in range(5000))
+        size = 0
+        tracemalloc.start()
+        try:
+            for chunk in self.merchant.iter_xml_shipment_req_data(65536, **dict_data):
+                size += len(chunk)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, 2 * 1024 * 1024)
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_create_shipment_streamed(self):
+        server = LocalServer().start()
+        try:
+            self.merchant._base_api_end_point = server.url
+            dict_data = _freight_data(self.merchant, 200)
+            expected = self.merchant.get_xml_shipment_req_data(**copy.deepcopy(dict_data))
+            dict_res = self.merchant.create_shipment_streamed(8192, **dict_data)
+        finally:
+            server.stop()
+        self.assertEqual(dict_res['status'], 1)
+        self.assertEqual(_canonical(server.requests[0][1]), _canonical(expected))
+        self.assertNotIn(b'\n  <', server.requests[0][1])
+        self.assertGreater(server.chunk_counts[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)